@@ -0,0 +1,8 @@
+"""
+Статический анализ контента. Решатель запускается модулем:
+
+    cd src && python -m analysis.solver --goal ITEM
+"""
+from .canonical import StateKey, key_hash, state_from_key, state_key
+
+__all__ = ["StateKey", "key_hash", "state_from_key", "state_key"]
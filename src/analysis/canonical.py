@@ -0,0 +1,70 @@
+"""
+Каноническое представление GameState для поиска по пространству состояний.
+
+Ключ - кортеж из строк и чисел: текущая локация, инвентарь, только отличия
+оверлеев от значений по умолчанию и запущенные таймеры. Порядок предметов
+в списках не важен для выборов, поэтому списки сортируются. Посещенные
+локации влияют лишь на подробность описания и в ключ не входят.
+
+Номер хода сам по себе тоже не входит: таймеры в ходах хранятся числом
+ходов до срабатывания, а при восстановлении часы начинаются с нуля. Таймеры
+в секундах - только отметкой, что они запущены: решатель не знает, сколько
+игрок будет ждать, и дает сработать им в любой момент.
+"""
+import hashlib
+from typing import TYPE_CHECKING
+
+from definitions import GameState, Inventory
+from overlay import LocationItems, ObjectStates
+from persistent import PersistentDict, PMap
+
+if TYPE_CHECKING:
+    from content_parts import GameContent
+
+
+StateKey = tuple
+
+
+def state_key(state: GameState, content: "GameContent") -> StateKey:
+    objects = state.objects
+    locations_items = state.locations_items
+    if not isinstance(objects, ObjectStates) or not isinstance(locations_items, LocationItems):
+        raise TypeError("state_key expects a state created by GameState.from_content")
+    return (
+        state.current_location,
+        tuple(sorted(state.inventory.items.items())),
+        tuple(sorted(objects.changed_bits.items())),
+        tuple(sorted((index, tuple(sorted(items))) for index, items in objects.contents.changed.items())),
+        tuple(sorted((lid, tuple(sorted(items))) for lid, items in locations_items.contents.changed.items())),
+        tuple(sorted(state.flags.items())),
+        tuple(sorted(
+            (tid, int(due) - state.clock if content.timers[tid].ticks is not None else None)
+            for tid, due in state.timers.items()
+        )),
+    )
+
+
+def state_from_key(content: "GameContent", key: StateKey) -> GameState:
+    location, inventory, bits, object_items, location_items, flags, timers = key
+    state = GameState.from_content(content)
+    state.current_location = location
+    state.inventory = Inventory(items=dict(inventory))
+    state.objects.restore((PMap(bits), PMap((index, list(items)) for index, items in object_items)))
+    state.locations_items.restore(PMap((lid, list(items)) for lid, items in location_items))
+    state.flags = PersistentDict(flags)
+    # часы с нуля: сроки таймеров в ходах - через сколько ходов, в секундах - уже истекли
+    state.timers = PersistentDict((tid, 0.0 if left is None else left) for tid, left in timers)
+    return state
+
+
+def key_hash(key: StateKey) -> int:
+    """
+    64-битный отпечаток ключа. Хешируется repr, а не marshal/pickle: те пишут
+    ссылки на повторяющиеся и интернированные строки, и байты одного и того же
+    ключа различаются между процессами пула.
+    """
+    return int.from_bytes(hashlib.blake2b(repr(key).encode(), digest_size=8).digest(), "little")
+
+
+def inventory_of(key: StateKey) -> tuple:
+    return key[1]
@@ -0,0 +1,437 @@
+"""
+Решатель: обходит все достижимые из стартового состояния GameState,
+применяя каждый доступный выбор (включая общие "взять/открыть/закрыть"),
+и проверяет контент:
+
+- выборы из choices.yaml, которые не становятся доступны ни в одном состоянии;
+- предметы, которые ни разу не попадают в инвентарь;
+- тупики - состояния, из которых нельзя перейти ни в какое другое;
+- с --goal ITEM: достижима ли цель и после каких выборов она становится
+  недостижимой (например, ключ потрачен до того, как открылся сундук);
+- эффекты, падающие с исключением.
+
+Как и в Game.tick, после каждого выбора проходит ход и срабатывают истекшие
+таймеры в ходах. Запущенный таймер в секундах может сработать в любой момент:
+его срабатывание - отдельный переход с id вида timer:<id таймера>.
+
+Обход идет по уровням (BFS), фронтир раздается пулу процессов пачками.
+Посещенные состояния хранятся 64-битными отпечатками в открытой хеш-таблице
+поверх array, плюс по 8 байт на состояние для восстановления пути к нему.
+При превышении --max-states обход останавливается и отчет помечается неполным.
+
+Состояния различаются только по отпечаткам: при совпадении отпечатков двух
+разных состояний второе молча считается уже посещенным, и за ним может
+скрыться тупик или недостижимый выбор. Вероятность хотя бы одного совпадения
+среди n состояний не больше n^2 / 2^65 (около 3e-6 для 10 млн); отчет
+пишет эту оценку в collision_bound.
+
+    cd src && python -m analysis.solver [--content-dir DIR] [--goal ITEM] [--workers 4]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+from array import array
+from collections.abc import Iterable, Iterator
+from dataclasses import asdict, dataclass, field
+from multiprocessing.pool import Pool
+from pathlib import Path
+
+from analysis.canonical import (
+    StateKey,
+    inventory_of,
+    key_hash,
+    state_from_key,
+    state_key,
+)
+from choices import GenericChoices
+from content_parts import GameContent
+from definitions import Choice, GameState, ItemId
+from init_content import ContentLoader
+from loaders import SnapshotLoader, loader_for
+from timers import SessionTimers, fire
+
+NO_PARENT = 0xFFFFFFFF
+SAMPLES = 5             # сколько примеров путей класть в отчет
+# так эффекты сообщают о несогласованном контенте: нет предмета, локации, флага, объект не открывается
+CONTENT_ERRORS = (KeyError, ValueError)
+
+
+class VisitedSet:
+    """
+    Множество отпечатков состояний с номерами: открытая адресация с линейным
+    пробированием в array('Q'). Ноль - пустая ячейка, поэтому нулевой отпечаток
+    заменяется единицей. Занимает ~24 байта на состояние против ~100 у set[int].
+    Полные ключи не хранятся, поэтому совпадение отпечатков не обнаруживается.
+    """
+
+    def __init__(self, capacity: int = 1 << 16) -> None:
+        size = 1
+        while size < capacity * 2:
+            size <<= 1
+        self.mask = size - 1
+        self.hashes = array("Q", bytes(8 * size))
+        self.indexes = array("I", bytes(4 * size))
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, fingerprint: int) -> tuple[int, bool]:
+        """Возвращает номер состояния и признак того, что оно новое."""
+        fingerprint = fingerprint or 1
+        slot = fingerprint & self.mask
+        hashes = self.hashes
+        while True:
+            current = hashes[slot]
+            if current == fingerprint:
+                return self.indexes[slot], False
+            if current == 0:
+                break
+            slot = (slot + 1) & self.mask
+        index = self.count
+        hashes[slot] = fingerprint
+        self.indexes[slot] = index
+        self.count += 1
+        if self.count * 2 > self.mask:
+            self._grow()
+        return index, True
+
+    def _grow(self) -> None:
+        old_hashes, old_indexes = self.hashes, self.indexes
+        size = (self.mask + 1) * 2
+        self.mask = size - 1
+        self.hashes = array("Q", bytes(8 * size))
+        self.indexes = array("I", bytes(4 * size))
+        for fingerprint, index in zip(old_hashes, old_indexes):
+            if fingerprint:
+                slot = fingerprint & self.mask
+                while self.hashes[slot]:
+                    slot = (slot + 1) & self.mask
+                self.hashes[slot] = fingerprint
+                self.indexes[slot] = index
+
+
+# --- работа воркера: раскрытие пачки состояний ---
+
+_content: GameContent | None = None
+
+
+def _init_worker(content_dir: Path | None) -> None:
+    global _content
+    _content = load_content(content_dir)
+
+
+def available_choices(state: GameState, content: GameContent) -> list[Choice]:
+    """Полный перебор выборов: у решателя нет кешей сессии, которые можно переиспользовать."""
+    choices = [c for c in content.choices.values() if c.is_available(state, content)]
+    generic = GenericChoices(state, content)
+    choices += generic.pickup() + generic.open() + generic.close()
+    generic.detach()
+    return choices
+
+
+# (номер родителя, тупик ли, [(id выбора, отпечаток, ключ)], [(id выбора, ошибка)])
+Expansion = tuple[int, bool, list[tuple[str, int, StateKey]], list[tuple[str, str]]]
+
+
+def expand(content: GameContent, index: int, key: StateKey) -> Expansion:
+    state = state_from_key(content, key)
+    own_hash = key_hash(key)
+    transitions: list[tuple[str, int, StateKey]] = []
+    errors: list[tuple[str, str]] = []
+    stuck = True
+    for choice in available_choices(state, content):
+        child = state.clone()
+        try:
+            for effect in choice.do:
+                effect(child, content)
+            timers = SessionTimers(child, content)
+            timers.tick()
+            timers.detach()
+        except CONTENT_ERRORS as exc:
+            errors.append((choice.id, f"{type(exc).__name__}: {exc}"))
+            continue
+        child_key = state_key(child, content)
+        child_hash = key_hash(child_key)
+        stuck = stuck and child_hash == own_hash
+        transitions.append((choice.id, child_hash, child_key))
+    for tid, due in state.timers.items():
+        if content.timers[tid].ticks is not None:
+            continue
+        cid = f"timer:{tid}"
+        child = state.clone()
+        try:
+            fire(child, content, tid, due)
+        except CONTENT_ERRORS as exc:
+            errors.append((cid, f"{type(exc).__name__}: {exc}"))
+            continue
+        child_key = state_key(child, content)
+        child_hash = key_hash(child_key)
+        stuck = stuck and child_hash == own_hash
+        transitions.append((cid, child_hash, child_key))
+    return index, stuck, transitions, errors
+
+
+def _expand_batch(batch: list[tuple[int, StateKey]]) -> list[Expansion]:
+    content = _content
+    if content is None:
+        raise RuntimeError("solver worker is not initialized")
+    return [expand(content, index, key) for index, key in batch]
+
+
+# --- отчет ---
+
+@dataclass
+class SolverReport:
+    states: int = 0
+    depth: int = 0
+    truncated: bool = False
+    unreachable_choices: list[str] = field(default_factory=list)
+    unreachable_items: list[str] = field(default_factory=list)
+    dead_ends: int = 0
+    dead_end_paths: list[list[str]] = field(default_factory=list)
+    errors: list[dict] = field(default_factory=list)
+    # верхняя оценка вероятности, что два состояния слились из-за совпадения отпечатков
+    collision_bound: float = 0.0
+    goal: str | None = None
+    goal_reachable: bool | None = None
+    goal_path: list[str] | None = None
+    # состояния, из которых цель уже недостижима, и выборы, которые в них ведут
+    doomed: int = 0
+    fatal_choices: dict[str, int] = field(default_factory=dict)
+    fatal_paths: list[list[str]] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return (
+            not self.unreachable_choices and not self.dead_ends and not self.errors
+            and self.goal_reachable is not False and not self.doomed
+        )
+
+    def format(self) -> str:
+        lines = [
+            f"states: {self.states}, depth: {self.depth}" + (" (truncated)" if self.truncated else "")
+            + f", fingerprint collision probability <= {self.collision_bound:.1e}"
+        ]
+        if self.unreachable_choices:
+            lines.append(f"unreachable choices ({len(self.unreachable_choices)}): {', '.join(self.unreachable_choices)}")
+        if self.unreachable_items:
+            lines.append(f"unreachable items ({len(self.unreachable_items)}): {', '.join(self.unreachable_items)}")
+        if self.dead_ends:
+            lines.append(f"dead ends: {self.dead_ends}")
+            lines.extend(f"  via: {' -> '.join(path) or '<start>'}" for path in self.dead_end_paths)
+        for error in self.errors:
+            lines.append(f"error in {error['choice']}: {error['error']} via: {' -> '.join(error['path']) or '<start>'}")
+        if self.goal is not None:
+            # путь заполняется вместе с goal_reachable
+            path = self.goal_path
+            if self.goal_reachable and path is not None:
+                lines.append(f"goal {self.goal} reachable in {len(path)} steps: {' -> '.join(path)}")
+            else:
+                lines.append(f"goal {self.goal} is NOT reachable")
+            if self.doomed:
+                lines.append(f"states where the goal is lost: {self.doomed}")
+                for cid, n in sorted(self.fatal_choices.items(), key=lambda kv: -kv[1]):
+                    lines.append(f"  fatal choice {cid}: {n}")
+                lines.extend(f"  via: {' -> '.join(path)}" for path in self.fatal_paths)
+        return "\n".join(lines)
+
+
+# --- обход ---
+
+def load_content(content_dir: Path | None = None) -> GameContent:
+    loader = SnapshotLoader if content_dir is None else loader_for(SnapshotLoader, content_dir)
+    content, _ = ContentLoader(loader).init_content()
+    return content
+
+
+def _batches(frontier: list[tuple[int, StateKey]], size: int) -> Iterator[list[tuple[int, StateKey]]]:
+    for start in range(0, len(frontier), size):
+        yield frontier[start:start + size]
+
+
+class Solver:
+    def __init__(
+        self,
+        content: GameContent,
+        content_dir: Path | None = None,
+        workers: int = 0,
+        batch: int = 256,
+        max_states: int = 10_000_000,
+        goal: ItemId | None = None,
+    ) -> None:
+        self.content = content
+        self.content_dir = content_dir
+        self.workers = workers
+        self.batch = batch
+        self.max_states = max_states
+        self.goal = goal
+
+        self.visited = VisitedSet()
+        # путь к состоянию: родитель и выбор, которым в него пришли
+        self.parents = array("I")
+        self.via = array("I")
+        self.choice_ids: list[str] = []
+        self._choice_index: dict[str, int] = {}
+        # ребра нужны только для обратного обхода от цели
+        self.edges_from = array("I")
+        self.edges_to = array("I")
+        self.edges_via = array("I")
+        self.goal_states = array("I")
+
+    def _intern(self, cid: str) -> int:
+        index = self._choice_index.get(cid)
+        if index is None:
+            index = self._choice_index[cid] = len(self.choice_ids)
+            self.choice_ids.append(cid)
+        return index
+
+    def path(self, index: int) -> list[str]:
+        steps: list[str] = []
+        while self.parents[index] != NO_PARENT:
+            steps.append(self.choice_ids[self.via[index]])
+            index = self.parents[index]
+        steps.reverse()
+        return steps
+
+    def _expansions(self, pool: Pool | None, frontier: list[tuple[int, StateKey]]) -> Iterable[Expansion]:
+        if pool is None:
+            for index, key in frontier:
+                yield expand(self.content, index, key)
+            return
+        for results in pool.imap_unordered(_expand_batch, _batches(frontier, self.batch)):
+            yield from results
+
+    def solve(self) -> SolverReport:
+        report = SolverReport(goal=self.goal)
+        start_key = state_key(GameState.from_content(self.content), self.content)
+        start, _ = self.visited.add(key_hash(start_key))
+        self.parents.append(NO_PARENT)
+        self.via.append(0)
+        reached_items: set[ItemId] = set()
+        fired: set[str] = set()
+        self._visit(start, start_key, reached_items)
+
+        pool = None
+        if self.workers > 1:
+            pool = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self.content_dir,))
+        frontier = [(start, start_key)]
+        try:
+            while frontier and not report.truncated:
+                next_frontier: list[tuple[int, StateKey]] = []
+                for parent, stuck, transitions, errors in self._expansions(pool, frontier):
+                    if stuck:
+                        report.dead_ends += 1
+                        if len(report.dead_end_paths) < SAMPLES:
+                            report.dead_end_paths.append(self.path(parent))
+                    for cid, error in errors:
+                        # выбор был доступен - недостижимым он не считается
+                        fired.add(cid)
+                        if len(report.errors) < SAMPLES:
+                            report.errors.append({"choice": cid, "error": error, "path": self.path(parent)})
+                    for cid, child_hash, child_key in transitions:
+                        fired.add(cid)
+                        child, new = self.visited.add(child_hash)
+                        if new:
+                            self.parents.append(parent)
+                            self.via.append(self._intern(cid))
+                            self._visit(child, child_key, reached_items)
+                            next_frontier.append((child, child_key))
+                        if self.goal is not None:
+                            self.edges_from.append(parent)
+                            self.edges_to.append(child)
+                            self.edges_via.append(self._intern(cid))
+                    if len(self.visited) > self.max_states:
+                        report.truncated = True
+                        break
+                if next_frontier:
+                    report.depth += 1
+                frontier = next_frontier
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        report.states = len(self.visited)
+        report.collision_bound = min(1.0, report.states ** 2 / 2 ** 65)
+        report.unreachable_choices = sorted(cid for cid in self.content.choices if cid not in fired)
+        report.unreachable_items = sorted(iid for iid in self.content.items if iid not in reached_items)
+        if self.goal is not None and not report.truncated:
+            self._check_goal(report)
+        return report
+
+    def _visit(self, index: int, key: StateKey, reached_items: set[ItemId]) -> None:
+        inventory = inventory_of(key)
+        for iid, _ in inventory:
+            reached_items.add(iid)
+        if self.goal is not None and any(iid == self.goal for iid, _ in inventory):
+            self.goal_states.append(index)
+
+    def _check_goal(self, report: SolverReport) -> None:
+        report.goal_reachable = bool(self.goal_states)
+        if not self.goal_states:
+            return
+        # BFS нумерует состояния по глубине - первое целевое и есть ближайшее
+        report.goal_path = self.path(min(self.goal_states))
+
+        # обратные ребра в CSR: для каждого состояния - откуда в него приходят
+        n = len(self.visited)
+        offsets = array("I", bytes(4 * (n + 1)))
+        for dst in self.edges_to:
+            offsets[dst + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+        fill = array("I", offsets)
+        sources = array("I", bytes(4 * len(self.edges_to)))
+        for src, dst in zip(self.edges_from, self.edges_to):
+            sources[fill[dst]] = src
+            fill[dst] += 1
+
+        winnable = bytearray(n)
+        stack = list(self.goal_states)
+        for index in stack:
+            winnable[index] = 1
+        while stack:
+            dst = stack.pop()
+            for src in sources[offsets[dst]:offsets[dst + 1]]:
+                if not winnable[src]:
+                    winnable[src] = 1
+                    stack.append(src)
+
+        report.doomed = n - sum(winnable)
+        for src, dst, via in zip(self.edges_from, self.edges_to, self.edges_via):
+            if winnable[src] and not winnable[dst]:
+                cid = self.choice_ids[via]
+                report.fatal_choices[cid] = report.fatal_choices.get(cid, 0) + 1
+                if len(report.fatal_paths) < SAMPLES:
+                    report.fatal_paths.append(self.path(src) + [cid])
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--content-dir", type=Path, default=None)
+    parser.add_argument("--goal", default=None, help="id предмета, получение которого считается победой")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--max-states", type=int, default=10_000_000)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    content = load_content(args.content_dir)
+    if args.goal is not None and args.goal not in content.items:
+        parser.error(f"unknown item {args.goal!r}")
+    solver = Solver(
+        content,
+        content_dir=args.content_dir,
+        workers=args.workers,
+        batch=args.batch,
+        max_states=args.max_states,
+        goal=args.goal,
+    )
+    report = solver.solve()
+    print(json.dumps(asdict(report), ensure_ascii=False, indent=2) if args.json else report.format())
+    raise SystemExit(0 if report.ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Размер и скорость storage.codec против JSON, pickle и marshal того же
+GameState.diff() на случайных состояниях синтетического мира. Проверки
+круга encode -> decode - в tests/test_codec.py.
+
+    cd src && python -m benchmarks.codec --size 1000 --states 500
+"""
+import argparse
+import json
+import marshal
+import pickle
+import random
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from benchmarks.worldgen import generate_world
+from content_parts import GameContent
+from definitions import GameState
+from game import Game
+from init_content import ContentLoader
+from loaders import SnapshotLoader, loader_for
+from storage import codec
+
+
+def random_states(content: GameContent, count: int, max_ticks: int, seed: int) -> list[GameState]:
+    rnd = random.Random(seed)
+    states = []
+    for _ in range(count):
+        game = Game.new(content)
+        for _ in range(rnd.randrange(max_ticks + 1)):
+            choices = game.get_available_choices()
+            if not choices:
+                break
+            choices[rnd.randrange(len(choices))].apply(game.state, content)
+        states.append(game.state)
+    return states
+
+
+def measure(states: list[GameState], encode: Callable, decode: Callable) -> dict[str, float]:
+    started = time.perf_counter()
+    records = [encode(state) for state in states]
+    encoded = time.perf_counter()
+    for record in records:
+        decode(record)
+    decoded = time.perf_counter()
+    return {
+        "bytes": sum(map(len, records)) / len(states),
+        "encode_us": (encoded - started) / len(states) * 1e6,
+        "decode_us": (decoded - encoded) / len(states) * 1e6,
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--choices-per-location", type=float, default=3.0)
+    parser.add_argument("--states", type=int, default=500)
+    parser.add_argument("--ticks", type=int, default=100, help="наибольшее число ходов на состояние")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        content_dir = generate_world(Path(tmp), args.size, int(args.size * args.choices_per_location), args.seed)
+        content, _ = ContentLoader(loader_for(SnapshotLoader, content_dir)).init_content()
+    states = random_states(content, args.states, args.ticks, args.seed)
+
+    formats = {
+        "codec": (lambda s: codec.encode(s, content), lambda r: codec.decode(r, content)),
+        "codec portable": (lambda s: codec.encode(s, content, True), lambda r: codec.decode(r, content)),
+        "json": (lambda s: json.dumps(s.diff()).encode(), lambda r: GameState.from_diff(content, json.loads(r))),
+        "pickle": (lambda s: pickle.dumps(s.diff()), lambda r: GameState.from_diff(content, pickle.loads(r))),
+        "marshal": (lambda s: marshal.dumps(s.diff()), lambda r: GameState.from_diff(content, marshal.loads(r))),
+    }
+    for name, (encode, decode) in formats.items():
+        result = measure(states, encode, decode)
+        print(f"{name:<16}{result['bytes']:9.1f} B  encode {result['encode_us']:7.1f}us  decode {result['decode_us']:7.1f}us")
+
+
+if __name__ == "__main__":
+    main()
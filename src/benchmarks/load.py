@@ -0,0 +1,463 @@
+"""
+Нагрузочный тест бота целиком: N виртуальных игроков через локальный Bot API.
+
+Бот запускается отдельным процессом (bot.run) и ходит в outgoing.fake_api,
+поднятый здесь же. Игроки шлют /start, затем жмут кнопки последнего
+сообщения - опции из Game.get_available_choices - случайно (по зерну) или
+по сценарию, с паузой "на подумать" между ходами. Задержка хода - от
+попадания обновления в очередь getUpdates до sendMessage/editMessageText
+в чат игрока.
+
+Лимиты отправки бота и Bot API по умолчанию сняты, чтобы мерить сам бот;
+--telegram-limits возвращает настоящие. Отчет - JSON со сводкой и рядом по
+интервалам: ответы в секунду, p50/p95/p99 задержки, задержка цикла событий
+бота и RSS его процессов (у рабочих ShardedEngine общие страницы
+считаются в каждом). --compare сравнивает сводку с прошлым прогоном:
+
+    cd src && python -m benchmarks.load --players 1000 --think 2 --duration 60 --output load.json
+    cd src && python -m benchmarks.load --players 1000 --think 2 --workers 4 --compare load.json
+
+Сценарий (--script) - файл, по строке на ход: текст кнопки или команда
+("/go Чердак", "/undo"); строки идут по кругу, кнопка, которой сейчас нет,
+заменяется случайной.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import random
+import tempfile
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import Any
+
+from benchmarks.run import git_revision
+from benchmarks.worldgen import generate_world
+from instrumentation import STATS, enable, resident_bytes
+from outgoing.fake_api import FakeBotAPI
+
+logger = logging.getLogger(__name__)
+
+TOKEN = "1:load"
+LAG_TICK = 0.01
+STOP_TIMEOUT = 30.0
+# задержка цикла генератора, после которой его замерам верить нельзя
+HARNESS_LAG_WARNING = 0.1
+
+
+class LoopMonitor:
+    """Задержка цикла событий: насколько позже срока просыпается короткий sleep."""
+
+    def __init__(self, tick: float = LAG_TICK) -> None:
+        self.tick = tick
+        self.lags: list[float] = []
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(self.tick)
+            self.lags.append(max(0.0, loop.time() - before - self.tick))
+
+    def take(self) -> tuple[float, float]:
+        """(максимум, среднее) с прошлого вызова, секунды."""
+        lags, self.lags = self.lags, []
+        if not lags:
+            return 0.0, 0.0
+        return max(lags), sum(lags) / len(lags)
+
+
+# --- процесс бота ---
+
+def serve_bot(url: str, options: dict[str, Any], conn: Connection, interval: float, stats: bool) -> None:
+    """Точка входа процесса бота: задержка цикла - каждые interval, STATS - при остановке."""
+    logging.basicConfig(level=logging.WARNING)
+    if stats:
+        enable()
+    asyncio.run(_serve_bot(url, options, conn, interval))
+
+
+async def _serve_bot(url: str, options: dict[str, Any], conn: Connection, interval: float) -> None:
+    # импорт здесь: процессу генератора aiogram и движок не нужны
+    import bot
+
+    monitor = LoopMonitor()
+
+    async def report() -> None:
+        while True:
+            await asyncio.sleep(interval)
+            conn.send(("lag", time.time(), *monitor.take()))
+
+    tasks = [asyncio.create_task(monitor.run()), asyncio.create_task(report())]
+    try:
+        # SIGTERM останавливает polling aiogram, дальше run дописывает очереди и выходит
+        await bot.run(TOKEN, api_url=url, stats_interval=math.inf, **options)
+    finally:
+        for task in tasks:
+            task.cancel()
+        conn.send(("stats", STATS.snapshot() if STATS.enabled else None))
+        conn.close()
+
+
+def receive(conn: Connection) -> tuple[list[tuple], bool]:
+    """Все пришедшие от процесса бота сообщения и признак, что он закрыл канал."""
+    messages = []
+    try:
+        while conn.poll():
+            messages.append(conn.recv())
+    except EOFError:
+        return messages, True
+    return messages, False
+
+
+def tree_rss(pid: int) -> int:
+    """RSS процесса и его прямых потомков (рабочих ShardedEngine)."""
+    total = resident_bytes(pid)
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        children = []
+    return total + sum(resident_bytes(child) for child in children)
+
+
+# --- игроки ---
+
+@dataclass
+class Player:
+    chat_id: int
+    rnd: random.Random
+    step: int = 0
+    sent_at: float = 0.0
+    reply: asyncio.Future | None = None
+
+
+@dataclass
+class Counters:
+    updates: int = 0
+    replies: int = 0
+    timeouts: int = 0
+    stale: int = 0
+    restarts: int = 0
+    script_misses: int = 0
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def latency_summary(latencies: list[float]) -> dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "max_ms": (ordered[-1] if ordered else 0.0) * 1000,
+    }
+
+
+@dataclass
+class LoadTest:
+    """Игроки поверх FakeBotAPI: ход - обновление, ответ ловится слушателем API."""
+    api: FakeBotAPI
+    think: float
+    reply_timeout: float
+    script: list[str] = field(default_factory=list)
+    counters: Counters = field(default_factory=Counters)
+    latencies: list[float] = field(default_factory=list)
+    # задержки текущего интервала отчета
+    window: list[float] = field(default_factory=list)
+    waiting: dict[int, Player] = field(default_factory=dict)
+    callbacks: dict[str, Player] = field(default_factory=dict)
+    active: int = 0
+
+    def __post_init__(self) -> None:
+        self.api.listeners.append(self.on_api)
+
+    def on_api(self, method: str, chat_id: int, payload: dict[str, Any]) -> None:
+        if method == "answerCallbackQuery":
+            player = self.callbacks.pop(payload.get("callback_query_id", ""), None)
+            # ответ с текстом - кнопка устарела, сообщения не будет
+            if player is not None and payload.get("text"):
+                self.counters.stale += 1
+                self._resolve(player, None)
+            return
+        player = self.waiting.get(chat_id)
+        if player is not None:
+            latency = time.perf_counter() - player.sent_at
+            self.latencies.append(latency)
+            self.window.append(latency)
+            self.counters.replies += 1
+            self._resolve(player, latency)
+
+    def _resolve(self, player: Player, latency: float | None) -> None:
+        self.waiting.pop(player.chat_id, None)
+        if player.reply is not None and not player.reply.done():
+            player.reply.set_result(latency)
+
+    async def play(self, player: Player) -> None:
+        self.active += 1
+        try:
+            await self._act(player, lambda: self.api.push_message(player.chat_id, "/start"))
+            while True:
+                if self.think > 0:
+                    await asyncio.sleep(player.rnd.expovariate(1 / self.think))
+                await self._turn(player)
+        finally:
+            self.active -= 1
+
+    async def _turn(self, player: Player) -> None:
+        log = self.api.chats.get(player.chat_id)
+        message_id = log.last_message_id if log is not None else None
+        message = log.messages.get(message_id) if log is not None and message_id is not None else None
+        buttons = [row[0] for row in (message or {}).get("reply_markup", {}).get("inline_keyboard", [])]
+        command = None
+        if self.script:
+            command = self.script[player.step % len(self.script)]
+            player.step += 1
+            if command.startswith("/"):
+                await self._act(player, lambda: self.api.push_message(player.chat_id, command))
+                return
+        if not buttons or message_id is None:
+            # игра кончилась или ответа не было - начинаем заново
+            self.counters.restarts += 1
+            await self._act(player, lambda: self.api.push_message(player.chat_id, "/start"))
+            return
+        button = next((b for b in buttons if b["text"] == command), None) if command is not None else None
+        if command is not None and button is None:
+            self.counters.script_misses += 1
+        if button is None:
+            button = player.rnd.choice(buttons)
+        await self._act(
+            player,
+            lambda: self.api.push_callback(player.chat_id, message_id, button["callback_data"]),
+            callback=True,
+        )
+
+    async def _act(self, player: Player, push: Callable[[], int], callback: bool = False) -> None:
+        player.reply = asyncio.get_running_loop().create_future()
+        self.waiting[player.chat_id] = player
+        player.sent_at = time.perf_counter()
+        update_id = push()
+        self.counters.updates += 1
+        if callback:
+            self.callbacks[str(update_id)] = player
+        try:
+            await asyncio.wait_for(player.reply, self.reply_timeout)
+        except TimeoutError:
+            self.counters.timeouts += 1
+            self.waiting.pop(player.chat_id, None)
+
+
+# --- прогон ---
+
+def bot_options(args: argparse.Namespace, content_dir: Path | None) -> dict[str, Any]:
+    options: dict[str, Any] = {
+        "database_url": args.database_url,
+        "region_cache": args.region_cache,
+        "session_capacity": args.session_capacity,
+        "journal_dir": args.journal_dir,
+        "workers": args.workers,
+        "content_dir": str(content_dir) if content_dir is not None else None,
+    }
+    if not args.telegram_limits:
+        options["chat_rate"] = options["global_rate"] = math.inf
+    return options
+
+
+async def load_test(args: argparse.Namespace, content_dir: Path | None, script: list[str]) -> dict[str, Any]:
+    if args.telegram_limits:
+        api = FakeBotAPI(record_calls=False, keep_messages=2)
+    else:
+        api = FakeBotAPI(enforce_limits=False, record_calls=False, keep_messages=2)
+    url = await api.start()
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    # spawn: копировать fork'ом процесс с запущенным циклом событий и сервером нельзя;
+    # не daemon - у ShardedEngine свои дочерние процессы
+    process = multiprocessing.get_context("spawn").Process(
+        target=serve_bot,
+        args=(url, bot_options(args, content_dir), sender, args.interval, args.bot_stats),
+        name="bot",
+    )
+    process.start()
+    bot_pid = process.pid
+    if bot_pid is None:
+        raise RuntimeError("bot process did not start")
+    sender.close()
+    test = LoadTest(api, args.think, args.reply_timeout, script)
+    monitor = LoopMonitor()
+    monitor_task = asyncio.create_task(monitor.run())
+    players: list[asyncio.Task] = []
+    timeline: list[dict[str, float]] = []
+    bot_stats = None
+    try:
+        await asyncio.wait_for(api.polling.wait(), args.startup_timeout)
+        monitor.take()
+
+        async def start_players() -> None:
+            for n in range(args.players):
+                player = Player(chat_id=1000 + n, rnd=random.Random(args.seed + n))
+                players.append(asyncio.create_task(test.play(player)))
+                if args.ramp > 0:
+                    await asyncio.sleep(args.ramp / args.players)
+
+        ramping = asyncio.create_task(start_players())
+        started = time.perf_counter()
+        previous = Counters()
+        while (elapsed := time.perf_counter() - started) < args.duration:
+            await asyncio.sleep(min(args.interval, args.duration - elapsed))
+            bot_lag_max = bot_lag_mean = 0.0
+            messages, closed = receive(receiver)
+            if closed:
+                raise RuntimeError(f"bot process exited with code {process.exitcode}")
+            for kind, *payload in messages:
+                if kind == "lag":
+                    _, lag_max, lag_mean = payload
+                    bot_lag_max, bot_lag_mean = max(bot_lag_max, lag_max), max(bot_lag_mean, lag_mean)
+            harness_lag, _ = monitor.take()
+            counters = test.counters
+            row = {
+                "t": round(time.perf_counter() - started, 2),
+                "players": test.active,
+                "updates": counters.updates - previous.updates,
+                "replies": counters.replies - previous.replies,
+                "replies_per_sec": (counters.replies - previous.replies) / args.interval,
+                **latency_summary(test.window),
+                "timeouts": counters.timeouts - previous.timeouts,
+                "bot_lag_max_ms": bot_lag_max * 1000,
+                "bot_lag_mean_ms": bot_lag_mean * 1000,
+                "bot_rss_mb": tree_rss(bot_pid) / 2**20,
+                "harness_lag_max_ms": harness_lag * 1000,
+            }
+            timeline.append(row)
+            test.window = []
+            previous = Counters(**vars(counters))
+            print(
+                f"t={row['t']:6.1f}s players={row['players']:5d} replies/s={row['replies_per_sec']:8.1f} "
+                f"p50={row['p50_ms']:7.1f}ms p95={row['p95_ms']:7.1f}ms p99={row['p99_ms']:7.1f}ms "
+                f"lag={row['bot_lag_max_ms']:6.1f}ms rss={row['bot_rss_mb']:6.1f}MB"
+            )
+        ramping.cancel()
+    finally:
+        for task in players:
+            task.cancel()
+        await asyncio.gather(*players, return_exceptions=True)
+        process.terminate()
+        await asyncio.to_thread(process.join, STOP_TIMEOUT)
+        if process.is_alive():
+            logger.error("bot did not stop in %.0fs, killing", STOP_TIMEOUT)
+            process.kill()
+            await asyncio.to_thread(process.join)
+        for kind, *payload in receive(receiver)[0]:
+            if kind == "stats":
+                bot_stats = payload[0]
+        receiver.close()
+        monitor_task.cancel()
+        await api.stop()
+    return {"summary": summarize(test, timeline, args), "timeline": timeline, "bot_stats": bot_stats}
+
+
+def summarize(test: LoadTest, timeline: list[dict[str, float]], args: argparse.Namespace) -> dict[str, float]:
+    # установившийся режим - после разгона, когда все игроки уже в игре
+    steady = [row for row in timeline if row["t"] > args.ramp] or timeline
+    steady_time = len(steady) * args.interval
+    return {
+        "updates": test.counters.updates,
+        "replies": test.counters.replies,
+        "replies_per_sec": test.counters.replies / args.duration,
+        "steady_replies_per_sec": sum(row["replies"] for row in steady) / steady_time if steady_time else 0.0,
+        **latency_summary(test.latencies),
+        "timeouts": test.counters.timeouts,
+        "stale": test.counters.stale,
+        "restarts": test.counters.restarts,
+        "script_misses": test.counters.script_misses,
+        "bot_lag_max_ms": max((row["bot_lag_max_ms"] for row in timeline), default=0.0),
+        "bot_rss_peak_mb": max((row["bot_rss_mb"] for row in timeline), default=0.0),
+        "harness_lag_max_ms": max((row["harness_lag_max_ms"] for row in timeline), default=0.0),
+    }
+
+
+def compare(baseline: dict, current: dict) -> list[str]:
+    lines: list[str] = []
+    base = baseline.get("summary", {})
+    for key, value in current["summary"].items():
+        old = base.get(key)
+        if not isinstance(value, (int, float)) or not old:
+            continue
+        lines.append(f"  {key:<26}{old:14.2f} -> {value:14.2f}  ({(value - old) / old * 100:+.1f}%)")
+    return lines
+
+
+def read_script(path: Path) -> list[str]:
+    lines = (line.strip() for line in path.read_text(encoding="utf-8").splitlines())
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--think", type=float, default=1.0, help="средняя пауза между ходами игрока, с (экспоненциальная)")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--ramp", type=float, default=5.0, help="за сколько секунд подключаются все игроки")
+    parser.add_argument("--interval", type=float, default=1.0, help="шаг ряда отчета, с")
+    parser.add_argument("--script", type=Path, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reply-timeout", type=float, default=30.0)
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--size", type=int, default=None, help="синтетический мир из стольких локаций вместо world/")
+    parser.add_argument("--choices-per-location", type=float, default=3.0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--journal-dir", default=None)
+    parser.add_argument("--region-cache", type=int, default=None)
+    parser.add_argument("--session-capacity", type=int, default=None)
+    parser.add_argument("--telegram-limits", action="store_true", help="лимиты отправки как у настоящего Bot API")
+    parser.add_argument("--bot-stats", action="store_true", help="включить instrumentation в боте и сохранить ее в отчет")
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, default=None, help="JSON предыдущего прогона")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    script = read_script(args.script) if args.script is not None else []
+    with tempfile.TemporaryDirectory() as tmp:
+        content_dir = None
+        if args.size is not None:
+            content_dir = generate_world(Path(tmp), args.size, int(args.size * args.choices_per_location), args.seed)
+        result = asyncio.run(load_test(args, content_dir, script))
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": datetime.now(UTC).isoformat(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "params": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()
+                   if key not in ("output", "compare")},
+        **result,
+    }
+    summary = report["summary"]
+    print(
+        f"players {args.players}: {summary['steady_replies_per_sec']:.1f} replies/s, "
+        f"p50 {summary['p50_ms']:.1f}ms p95 {summary['p95_ms']:.1f}ms p99 {summary['p99_ms']:.1f}ms, "
+        f"timeouts {summary['timeouts']}, bot lag max {summary['bot_lag_max_ms']:.1f}ms, "
+        f"rss peak {summary['bot_rss_peak_mb']:.1f}MB"
+    )
+    if summary["harness_lag_max_ms"] > HARNESS_LAG_WARNING * 1000:
+        print(f"warning: load generator lagged {summary['harness_lag_max_ms']:.0f}ms - latencies are inflated")
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    if args.compare is not None:
+        print("\n".join(compare(json.loads(args.compare.read_text(encoding="utf-8")), report)))
+
+
+if __name__ == "__main__":
+    main()
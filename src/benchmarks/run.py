@@ -0,0 +1,175 @@
+"""
+Набор бенчмарков движка на синтетических мирах.
+
+Для каждого размера мира генерирует YAML, загружает его и без input()
+прогоняет сценарий ходов: выбор из get_available_choices по фиксированному
+зерну и apply. Результаты пишутся в JSON, чтобы сравнивать коммиты:
+
+    cd src && python -m benchmarks.run --sizes 10 1000 10000 --output bench.json
+    cd src && python -m benchmarks.run --sizes 10 1000 --compare bench.json
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+from benchmarks.worldgen import generate_world
+from content_parts import GameContent
+from definitions import GameState
+from game import Game
+from init_content import ContentLoader
+from loaders import SnapshotLoader, YamlLoader, loader_for
+
+
+def bench_loading(content_dir: Path) -> tuple[GameContent, dict[str, float]]:
+    yaml_loader = loader_for(YamlLoader, content_dir)
+    snapshot_loader = loader_for(SnapshotLoader, content_dir)
+    started = time.perf_counter()
+    raw = yaml_loader.load()
+    yaml_s = time.perf_counter() - started
+
+    snapshot_loader.write_snapshot(raw, snapshot_loader.source_hash())
+    started = time.perf_counter()
+    cl = ContentLoader(snapshot_loader)
+    snapshot_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    content, _ = cl.init_content()
+    init_s = time.perf_counter() - started
+    return content, {
+        "yaml_load_ms": yaml_s * 1000,
+        "snapshot_load_ms": snapshot_s * 1000,
+        "init_content_ms": init_s * 1000,
+    }
+
+
+def bench_ticks(content: GameContent, ticks: int, seed: int) -> dict[str, float]:
+    """Сценарий: случайный (по зерну) выбор из доступных и его применение."""
+    rnd = random.Random(seed)
+    game = Game.new(content)
+    state = game.state
+    choose_s = apply_s = render_s = 0.0
+    renders = 0
+    for _ in range(ticks):
+        started = time.perf_counter()
+        choices = game.get_available_choices()
+        chosen = time.perf_counter()
+        if not choices:
+            break
+        choices[rnd.randrange(len(choices))].apply(state, content)
+        applied = time.perf_counter()
+        game.renderer.render_location(verbose=False)
+        rendered = time.perf_counter()
+        choose_s += chosen - started
+        apply_s += applied - chosen
+        render_s += rendered - applied
+        renders += 1
+    return {
+        "ticks": renders,
+        "ticks_per_sec": renders / (choose_s + apply_s) if renders else 0.0,
+        "get_available_choices_us": choose_s / max(renders, 1) * 1e6,
+        "apply_us": apply_s / max(renders, 1) * 1e6,
+        "render_location_us": render_s / max(renders, 1) * 1e6,
+    }
+
+
+def bench_memory(content: GameContent, sessions: int, ticks: int, seed: int) -> dict[str, float]:
+    rnd = random.Random(seed)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        states = [GameState.from_content(content) for _ in range(sessions)]
+        idle = tracemalloc.take_snapshot()
+        games = [Game.new(content) for _ in range(sessions)]
+        for game in games:
+            for _ in range(ticks):
+                choices = game.get_available_choices()
+                if not choices:
+                    break
+                choices[rnd.randrange(len(choices))].apply(game.state, content)
+        played = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    idle_bytes = sum(s.size_diff for s in idle.compare_to(before, "filename"))
+    game_bytes = sum(s.size_diff for s in played.compare_to(idle, "filename"))
+    del states, games
+    return {
+        "state_bytes_idle": idle_bytes / sessions,
+        "game_bytes_after_ticks": game_bytes / sessions,
+    }
+
+
+def run_size(size: int, choices: int | None, ticks: int, sessions: int, seed: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        content_dir = generate_world(Path(tmp), size, choices, seed)
+        content, loading = bench_loading(content_dir)
+    return {
+        "locations": len(content.locations),
+        "choices": len(content.choices),
+        **loading,
+        **bench_ticks(content, ticks, seed),
+        **bench_memory(content, sessions, min(ticks, 50), seed),
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def compare(baseline: dict, current: dict) -> list[str]:
+    lines: list[str] = []
+    for size, metrics in current["results"].items():
+        base = baseline.get("results", {}).get(size)
+        if base is None:
+            continue
+        lines.append(f"size {size}")
+        for key, value in metrics.items():
+            old = base.get(key)
+            if not isinstance(value, (int, float)) or not old:
+                continue
+            lines.append(f"  {key:<26}{old:14.2f} -> {value:14.2f}  ({(value - old) / old * 100:+.1f}%)")
+    return lines
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--choices-per-location", type=float, default=3.0)
+    parser.add_argument("--ticks", type=int, default=2000)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, default=None, help="JSON предыдущего прогона")
+    args = parser.parse_args(argv)
+
+    report: dict[str, Any] = {
+        "revision": git_revision(),
+        "timestamp": datetime.now(UTC).isoformat(),
+        "python": platform.python_version(),
+        "params": {"ticks": args.ticks, "sessions": args.sessions, "seed": args.seed},
+        "results": {},
+    }
+    for size in args.sizes:
+        result = run_size(size, int(size * args.choices_per_location), args.ticks, args.sessions, args.seed)
+        report["results"][str(size)] = result
+        print(f"size {size}: " + ", ".join(f"{k}={v:.2f}" for k, v in result.items()))
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.compare is not None:
+        print("\n".join(compare(json.loads(args.compare.read_text(encoding="utf-8")), report)))
+
+
+if __name__ == "__main__":
+    main()
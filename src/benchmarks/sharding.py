@@ -0,0 +1,82 @@
+"""
+Пропускная способность ShardedEngine в зависимости от числа рабочих процессов.
+
+Сессии играют параллельно: каждая выбирает случайную (по зерну) опцию из
+ответа на предыдущий ход. Ходы идут через супервизор, как обновления бота,
+без хранилища и журнала - меряется только игра и передача между процессами.
+
+    cd src && python -m benchmarks.sharding --workers 1 2 4 8 --size 1000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.worldgen import generate_world
+from content_parts import GameContent
+from engine import SessionEngine
+from init_content import ContentLoader
+from loaders import SnapshotLoader, loader_for
+from sharding import ShardedEngine
+
+
+def memory_engine(content: GameContent, worker: str) -> SessionEngine:
+    return SessionEngine(content)
+
+
+async def bench(content: GameContent, workers: int, sessions: int, turns: int, seed: int) -> dict[str, float]:
+    engine = ShardedEngine(content, memory_engine, workers)
+    await engine.launch()
+    try:
+        async def play(key: int) -> int:
+            rnd = random.Random(seed + key)
+            reply = await engine.start(key)
+            played = 0
+            for _ in range(turns):
+                if not reply.options:
+                    break
+                option = rnd.choice(reply.options)[0]
+                next_reply = await engine.handle(key, option)
+                if next_reply is None:
+                    break
+                reply = next_reply
+                played += 1
+            return played
+
+        started = time.perf_counter()
+        played = sum(await asyncio.gather(*(play(key) for key in range(sessions))))
+        elapsed = time.perf_counter() - started
+    finally:
+        await engine.shutdown()
+    return {"turns": played, "turns_per_sec": played / elapsed}
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--choices-per-location", type=float, default=3.0)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        content_dir = generate_world(Path(tmp), args.size, int(args.size * args.choices_per_location), args.seed)
+        content, _ = ContentLoader(loader_for(SnapshotLoader, content_dir)).init_content()
+    print(f"cpus: {os.cpu_count()}, sessions: {args.sessions}, turns per session: {args.turns}")
+    baseline = None
+    for workers in args.workers:
+        result = asyncio.run(bench(content, workers, args.sessions, args.turns, args.seed))
+        baseline = baseline or result["turns_per_sec"]
+        print(
+            f"workers {workers}: {result['turns_per_sec']:.0f} turns/s "
+            f"(x{result['turns_per_sec'] / baseline:.2f}), {result['turns']} turns"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Время холодного старта: разбор YAML против бинарного снимка контента.
+
+    cd src && python -m benchmarks.startup --repeat 20 [--content-dir DIR]
+"""
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from init_content import ContentLoader
+from loaders import Loader, SnapshotLoader, YamlLoader, loader_for
+
+
+def measure(loader: Loader, repeat: int) -> dict[str, float]:
+    load_times: list[float] = []
+    init_times: list[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cl = ContentLoader(loader)
+        loaded = time.perf_counter()
+        cl.init_content()
+        finished = time.perf_counter()
+        load_times.append(loaded - started)
+        init_times.append(finished - loaded)
+    return {
+        "load_median_ms": statistics.median(load_times) * 1000,
+        "load_min_ms": min(load_times) * 1000,
+        "init_content_median_ms": statistics.median(init_times) * 1000,
+        "total_median_ms": statistics.median(l + i for l, i in zip(load_times, init_times)) * 1000,
+    }
+
+
+def run(content_dir: Path, repeat: int) -> dict[str, dict[str, float]]:
+    yaml_loader = loader_for(YamlLoader, content_dir)
+    snapshot_loader = loader_for(SnapshotLoader, content_dir)
+    snapshot_loader.snapshot_path().unlink(missing_ok=True)
+
+    started = time.perf_counter()
+    snapshot_loader.load()      # промах: YAML + запись снимка
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    results = {
+        "yaml": measure(yaml_loader, repeat),
+        "snapshot": measure(snapshot_loader, repeat),
+    }
+    results["snapshot"]["compile_ms"] = compile_ms
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--content-dir", type=Path, default=YamlLoader.CONTENT_DIR)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    results = run(args.content_dir, args.repeat)
+    for name, stats in results.items():
+        print(name)
+        for key, value in stats.items():
+            print(f"  {key:<24}{value:10.3f}")
+    speedup = results["yaml"]["load_median_ms"] / results["snapshot"]["load_median_ms"]
+    print(f"load speedup: x{speedup:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Генератор синтетических миров в схеме src/world.
+
+Локации соединены в кольцо дверями (выходы открыты, пока открыта дверь),
+каждая десятая - еще и лазом в случайную локацию; в каждой есть сундук,
+запертый ключом из соседней локации, и пара предметов. Выборы - выходы,
+открытие сундуков ключами и "осмотры" для добора нужного количества.
+
+    cd src && python -m benchmarks.worldgen /tmp/world --locations 1000 --choices 5000
+"""
+import argparse
+import random
+from pathlib import Path
+
+import yaml
+
+
+def _dump(path: Path, data: dict) -> None:
+    dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+    with path.open(mode="w", encoding="utf-8") as file:
+        yaml.dump(data, file, Dumper=dumper, allow_unicode=True, sort_keys=False)
+
+
+def generate_world(path: Path, locations: int, choices: int | None = None, seed: int = 0) -> Path:
+    """Пишет items/locations/inventory/choices.yaml в path и возвращает path."""
+    rnd = random.Random(seed)
+    locations = max(locations, 3)
+    choices = choices if choices is not None else locations * 3
+    path.mkdir(parents=True, exist_ok=True)
+    lids = [f"loc_{n}" for n in range(locations)]
+
+    items: dict[str, dict] = {}
+    for n in range(locations):
+        items[f"key_{n}"] = {"name": f"Ключ {n}", "description": f"Ключ от сундука {n}.", "consumable": True}
+        items[f"treasure_{n}"] = {"name": f"Сокровище {n}", "description": "Блестит.", "consumable": False}
+        items[f"junk_{n}"] = {"name": f"Хлам {n}", "description": "Ничего ценного.", "consumable": False}
+
+    world: dict[str, dict] = {}
+    for n, lid in enumerate(lids):
+        nxt = (n + 1) % locations
+        world[lid] = {
+            "name": f"Комната {n}",
+            "description": f"Ничем не примечательная комната номер {n}.",
+            "furniture": {
+                f"chest_{n}": {
+                    "kind": "container",
+                    "name": f"Сундук {n}",
+                    "description": "Тяжелый сундук.",
+                    "can_open": True,
+                    "can_lock": True,
+                    "is_container": True,
+                    "locked": True,
+                    "open": False,
+                    "contents": [f"treasure_{n}"],
+                },
+                f"door_{n}_{nxt}": {
+                    "kind": "door",
+                    "name": f"Дверь в комнату {nxt}",
+                    "description": "Обычная дверь.",
+                    "can_open": True,
+                    "locked": False,
+                    "open": False,
+                    "link_to": f"door_{nxt}_{n}",
+                },
+                f"door_{n}_{(n - 1) % locations}": {
+                    "kind": "door",
+                    "name": f"Дверь в комнату {(n - 1) % locations}",
+                    "description": "Обычная дверь.",
+                    "can_open": True,
+                    "locked": False,
+                    "open": False,
+                    "link_to": f"door_{(n - 1) % locations}_{n}",
+                },
+            },
+            # ключ от сундука лежит в предыдущей комнате
+            "items": [f"key_{nxt}", f"junk_{n}"],
+        }
+
+    raw_choices: dict[str, dict] = {}
+    # выходы становятся выборами и тоже считаются в choices
+    exits = 0
+
+    def add(cid: str, choice: dict) -> bool:
+        if len(raw_choices) + exits >= choices:
+            return False
+        raw_choices[cid] = choice
+        return True
+
+    for n, lid in enumerate(lids):
+        nxt = (n + 1) % locations
+        for a, b in ((n, nxt), (nxt, n)):
+            world[lids[a]].setdefault("exits", []).append({
+                "to": lids[b],
+                "id": f"go_{a}_{b}",
+                "text": f"Пойти в комнату {b}",
+                "result_text": f"Ты перешел в комнату {b}.",
+                "conditions": [{"type": "object_is_open", "object": f"door_{a}_{b}"}],
+            })
+            exits += 1
+        if n % 10 == 0 and locations > 3:
+            m = rnd.choice([m for m in range(locations) if m not in (n, nxt, (n - 1) % locations)])
+            world[lid]["exits"].append({
+                "to": lids[m],
+                "text": f"Пролезть в лаз к комнате {m}",
+                "result_text": f"Ты выбрался в комнату {m}.",
+            })
+            exits += 1
+    for n, lid in enumerate(lids):
+        add(f"unlock_chest_{n}", {
+            "text": f"Открыть сундук {n} ключом",
+            "result_text": "Ключ повернулся, сундук открыт.",
+            "conditions": [
+                {"type": "has_item", "item": f"key_{n}"},
+                {"type": "container_locked", "container": f"chest_{n}"},
+                {"type": "in_location", "location": lid},
+            ],
+            "effects": [
+                {"type": "consume_item", "item": f"key_{n}"},
+                {"type": "unlock_container", "container": f"chest_{n}"},
+                {"type": "reveal_contents", "container": f"chest_{n}"},
+            ],
+        })
+    n = 0
+    while len(raw_choices) + exits < choices:
+        lid = rnd.choice(lids)
+        conditions = [{"type": "in_location", "location": lid}]
+        if rnd.random() < 0.5:
+            conditions.append({"type": "has_item", "item": f"treasure_{rnd.randrange(locations)}"})
+        add(f"inspect_{n}", {
+            "text": f"Осмотреться внимательнее ({n})",
+            "result_text": "Ничего нового.",
+            "conditions": conditions,
+            "effects": [],
+        })
+        n += 1
+
+    _dump(path / "items.yaml", items)
+    _dump(path / "locations.yaml", world)
+    _dump(path / "inventory.yaml", {"start_location": lids[0], "items": [{"item": "key_0", "qty": 1}]})
+    _dump(path / "choices.yaml", {"choices": raw_choices})
+    return path
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--locations", type=int, default=100)
+    parser.add_argument("--choices", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    generate_world(args.path, args.locations, args.choices, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import cast
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.filters import Command, CommandObject, CommandStart
+from aiogram.types import CallbackQuery, Message
+
+from content_parts import GameContent
+from definitions import GameState
+from engine import SessionEngine
+from game import Game
+from init_content import ContentLoader
+from instrumentation import dump_periodically
+from loaders import SnapshotLoader, loader_for
+from outgoing import OutgoingDispatcher, parse_callback
+from outgoing.dispatcher import CHAT_RATE, GLOBAL_RATE, ChatId
+from regions import RegionalContentLoader, RegionLoader
+from reload import ContentReloader
+from sharding import ShardedEngine
+from storage import WriteBehindStore, make_engine
+from storage.journal import Journal
+
+logger = logging.getLogger(__name__)
+
+STALE_OPTION = "Этот выбор уже неактуален."
+
+
+def keyboard_game(content: GameContent, state: GameState | None = None) -> Game:
+    # опции показываются кнопками, в тексте их не повторяем
+    game = Game.new(content, state)
+    game.show_choices = False
+    return game
+
+
+def build_router(engine: SessionEngine | ShardedEngine, outgoing: OutgoingDispatcher) -> Router:
+    """
+    Ответы не отправляются из обработчиков, а ставятся в очередь outgoing.
+    На текстовые сообщения отвечаем новым сообщением, на кнопки - правкой
+    предыдущего, если локация не сменилась.
+    """
+    router = Router()
+
+    @router.message(CommandStart())
+    async def on_start(message: Message) -> None:
+        outgoing.submit(message.chat.id, await engine.start(message.chat.id), edit=False)
+
+    @router.message(Command("undo"))
+    async def on_undo(message: Message) -> None:
+        outgoing.submit(message.chat.id, await engine.undo(message.chat.id), edit=False)
+
+    @router.message(Command("save"))
+    async def on_save(message: Message, command: CommandObject) -> None:
+        outgoing.submit(message.chat.id, await engine.save(message.chat.id, command.args or "1"), edit=False)
+
+    @router.message(Command("load"))
+    async def on_load(message: Message, command: CommandObject) -> None:
+        outgoing.submit(message.chat.id, await engine.load(message.chat.id, command.args or "1"), edit=False)
+
+    @router.message(Command("go"))
+    async def on_go(message: Message, command: CommandObject) -> None:
+        # /go без аргумента - список известных локаций
+        outgoing.submit(message.chat.id, await engine.travel(message.chat.id, command.args or ""), edit=False)
+
+    @router.message(F.text)
+    async def on_choice(message: Message) -> None:
+        # без номера хода handle всегда возвращает экран
+        reply = await engine.handle(message.chat.id, (message.text or "").strip())
+        if reply is not None:
+            outgoing.submit(message.chat.id, reply, edit=False)
+
+    @router.callback_query(F.data)
+    async def on_button(callback: CallbackQuery) -> None:
+        parsed = parse_callback(callback.data or "")
+        if parsed is None or callback.message is None:
+            await callback.answer()
+            return
+        turn, option = parsed
+        chat_id = callback.message.chat.id
+        reply = await engine.handle(chat_id, option, turn)
+        if reply is None:
+            await callback.answer(STALE_OPTION)
+            return
+        await callback.answer()
+        outgoing.submit(chat_id, reply)
+
+    return router
+
+
+async def run(
+    token: str,
+    database_url: str | None = None,
+    stats_interval: float = 60.0,
+    region_cache: int | None = None,
+    api_url: str | None = None,
+    session_capacity: int | None = None,
+    session_ttl: float | None = None,
+    memory_limit: int | None = None,
+    journal_dir: str | None = None,
+    content_poll: float | None = None,
+    workers: int = 1,
+    content_dir: str | None = None,
+    chat_rate: float = CHAT_RATE,
+    global_rate: float = GLOBAL_RATE,
+) -> None:
+    # content_dir - другой мир вместо world/ (например, из benchmarks.worldgen);
+    # chat_rate и global_rate - лимиты отправки, по умолчанию как у Bot API
+    snapshot_loader = loader_for(SnapshotLoader, Path(content_dir)) if content_dir else SnapshotLoader
+
+    def build_content() -> GameContent:
+        if region_cache:
+            region_loader = loader_for(RegionLoader, Path(content_dir)) if content_dir else RegionLoader
+            return RegionalContentLoader(region_loader, capacity=region_cache).init_content()[0]
+        return ContentLoader(snapshot_loader).init_content()[0]
+
+    def build_engine(content: GameContent, worker: str | None = None) -> SessionEngine:
+        store = None
+        if database_url:
+            store = WriteBehindStore(make_engine(database_url), content)
+            if worker is None:
+                store.create_schema()
+        journal = None
+        if journal_dir:
+            # у каждого рабочего процесса свой журнал
+            journal = Journal(os.path.join(journal_dir, worker) if worker else journal_dir, content)
+        return SessionEngine(
+            content,
+            game_factory=keyboard_game,
+            store=store,
+            capacity=session_capacity,
+            idle_ttl=session_ttl,
+            memory_limit=memory_limit,
+            journal=journal,
+        )
+
+    content = build_content()
+    if workers > 1:
+        if database_url:
+            # схема создается один раз, до рабочих процессов
+            db = make_engine(database_url)
+            WriteBehindStore(db, content).create_schema()
+            # соединения пула не должны достаться рабочим через fork
+            db.dispose()
+        sharded = ShardedEngine(content, build_engine, workers)
+        # рабочие процессы создаются до потоков и соединений супервизора
+        await sharded.launch()
+        engine: SessionEngine | ShardedEngine = sharded
+    else:
+        engine = build_engine(content)
+    # api_url - свой сервер Bot API, например outgoing.fake_api
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None
+    async with Bot(token, session=session) as bot, asyncio.TaskGroup() as tg:
+        outgoing = OutgoingDispatcher(bot, chat_rate=chat_rate, global_rate=global_rate)
+        # ключи сессий бота - id чатов
+        engine.on_evict = lambda key: outgoing.forget(cast(ChatId, key))
+        # сработавший таймер присылает новый экран отдельным сообщением
+        engine.on_timer = lambda key, reply: outgoing.submit(cast(ChatId, key), reply, edit=False)
+        dp = Dispatcher()
+        dp.include_router(build_router(engine, outgoing))
+        background = [tg.create_task(dump_periodically(stats_interval))]
+        if isinstance(engine, SessionEngine):
+            # с несколькими процессами сброс, журнал, выгрузку и таймеры запускают рабочие
+            if engine.store is not None:
+                background.append(tg.create_task(engine.store.run()))
+            if engine.journal is not None:
+                background.append(tg.create_task(engine.journal.run()))
+            if engine.persistent:
+                background.append(tg.create_task(engine.run_evictor()))
+            background.append(tg.create_task(engine.run_timers()))
+        if content_poll:
+            if isinstance(engine, ShardedEngine):
+                logger.warning("content hot reload is not supported with several workers, disabled")
+            else:
+                reloader = ContentReloader(engine, build_content, snapshot_loader.CONTENT_DIR, content_poll)
+                background.append(tg.create_task(reloader.watch()))
+        # сессию бота закрывает async with: очереди outgoing еще дописываются после остановки polling
+        await dp.start_polling(bot, close_bot_session=False)
+        await outgoing.join()
+        if isinstance(engine, ShardedEngine):
+            await engine.shutdown()
+        for task in background:
+            task.cancel()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(
+        os.environ["BOT_TOKEN"],
+        os.environ.get("DATABASE_URL"),
+        float(os.environ.get("HAPPYDAMSEL_STATS_INTERVAL", "60")),
+        int(os.environ.get("REGION_CACHE_SIZE", "0")) or None,
+        os.environ.get("TELEGRAM_API_URL"),
+        int(os.environ.get("SESSION_CAPACITY", "0")) or None,
+        float(os.environ.get("SESSION_IDLE_TTL", "0")) or None,
+        int(os.environ.get("SESSION_MEMORY_LIMIT_MB", "0")) * 2**20 or None,
+        os.environ.get("JOURNAL_DIR"),
+        float(os.environ.get("CONTENT_POLL_INTERVAL", "0")) or None,
+        int(os.environ.get("WORKERS", "1")),
+        os.environ.get("CONTENT_DIR"),
+        float(os.environ.get("OUTGOING_CHAT_RATE", str(CHAT_RATE))),
+        float(os.environ.get("OUTGOING_GLOBAL_RATE", str(GLOBAL_RATE))),
+    ))
+
+
+if __name__ == "__main__":
+    main()
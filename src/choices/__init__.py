@@ -1,3 +1,3 @@
-from .generic import GenericChoices
+from .generic import GenericChoiceRegistry, GenericChoices
 
-__all__ = ["GenericChoices"]
\ No newline at end of file
+__all__ = ["GenericChoiceRegistry", "GenericChoices"]
\ No newline at end of file
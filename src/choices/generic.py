@@ -1,58 +1,150 @@
-from content_parts import GameContent
-from definitions import Choice, Result
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from definitions import (
+    Choice,
+    Fact,
+    FurnitureDef,
+    GameState,
+    ItemDef,
+    ItemId,
+    LocationId,
+    ObjectId,
+    Result,
+)
 from effects import EFFECTS
-from definitions import GameState
-from content_parts import GameContent
+from overlay import LocationItems
+
+if TYPE_CHECKING:
+    from content_parts import GameContent
+
+
+@dataclass
+class GenericChoiceRegistry:
+    """
+    Общие выборы (взять/открыть/закрыть), построенные один раз при загрузке
+    контента: по одному экземпляру Choice на предмет или объект и действие.
+    """
+    pickup: dict[ItemId, Choice] = field(default_factory=dict)
+    # при загрузке по регионам open/close - RegionMapping
+    open: Mapping[ObjectId, Choice] = field(default_factory=dict)
+    close: Mapping[ObjectId, Choice] = field(default_factory=dict)
+    # объекты, у которых есть open/close; всегда в памяти, без загрузки регионов
+    openable: frozenset[ObjectId] = field(default_factory=frozenset)
+    # порядок выдачи "взять" - по тексту; одинаковые тексты получают одинаковый ранг
+    pickup_rank: dict[ItemId, int] = field(default_factory=dict)
+    # готовые списки "взять" для локаций, где предметы не трогали: общие для всех
+    # сессий, заполняются по первому заходу
+    location_pickup: dict[LocationId, list[Choice]] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, items: dict[ItemId, ItemDef], furniture: dict[ObjectId, FurnitureDef]) -> "GenericChoiceRegistry":
+        registry = cls()
+        for iid, item in items.items():
+            registry.pickup[iid] = Choice(
+                id=f"pick_up_{iid}",
+                text=f"Взять {item.name}",
+                result=Result("generic_pickup", {"item": iid}),
+                do=[EFFECTS["get_item"]({"item": iid})]
+            )
+        texts = sorted({c.text for c in registry.pickup.values()})
+        rank = {text: n for n, text in enumerate(texts)}
+        registry.pickup_rank = {iid: rank[c.text] for iid, c in registry.pickup.items()}
+
+        opens: dict[ObjectId, Choice] = {}
+        closes: dict[ObjectId, Choice] = {}
+        for fid, obj in furniture.items():
+            if not obj.can_open:
+                continue
+            opens[fid] = Choice(
+                id=f"open_{fid}",
+                text=f"Открыть {obj.name}",
+                result=Result("generic_open", {"object": fid}),
+                do=[EFFECTS["open_object"]({"object": fid})]
+            )
+            closes[fid] = Choice(
+                id=f"close_{fid}",
+                text=f"Закрыть {obj.name}",
+                result=Result("generic_close", {"object": fid}),
+                do=[EFFECTS["close_object"]({"object": fid})]
+            )
+        registry.open, registry.close = opens, closes
+        registry.openable = frozenset(opens)
+        return registry
+
 
 class GenericChoices:
-    def __init__(self, state: GameState, content: GameContent):
+    """
+    Общие выборы текущей локации сессии. Списки берутся из реестра контента
+    и пересобираются только когда меняется локация, ее предметы или флаги ее
+    объектов; иначе возвращаются те же самые списки (их нельзя изменять).
+    """
+
+    def __init__(self, state: GameState, content: "GameContent"):
         self.state = state
         self.content = content
+        self.registry: GenericChoiceRegistry = content.generic
+        self._pickup: list[Choice] | None = None
+        self._open: list[Choice] | None = None
+        self._close: list[Choice] | None = None
+        state.subscribe(self.on_fact)
+
+    def detach(self) -> None:
+        self.state.unsubscribe(self.on_fact)
+
+    def on_fact(self, fact: Fact) -> None:
+        kind = fact[0]
+        if kind == "location" or kind == "*":
+            self._pickup = self._open = self._close = None
+        elif kind == "location_items" and fact[1] == self.state.current_location:
+            self._pickup = None
+        elif (
+            kind == "object" and fact[1] in self.registry.openable
+            and self.content.object_locations.get(ObjectId(fact[1])) == self.state.current_location
+        ):
+            # списки - только для объектов текущей локации
+            self._open = self._close = None
 
     def pickup(self) -> list[Choice]:
-        pickup_options: list[Choice] = []
-        for iid in self.state.locations_items[self.state.current_location]:
-            item = self.content.items[iid]
-            pickup_options.append(
-                Choice(
-                    id=f"pick_up_{iid}",
-                    text=f"Взять {item.name}",
-                    result=Result("generic_pickup", {"item": iid}),
-                    do=[EFFECTS["get_item"]({"item": iid})]
-                )
-            )
-        return sorted(pickup_options, key=lambda i: i.text)
+        if self._pickup is None:
+            lid = self.state.current_location
+            locations_items = self.state.locations_items
+            if isinstance(locations_items, LocationItems) and locations_items.untouched(lid):
+                choices = self.registry.location_pickup.get(lid)
+                if choices is None:
+                    choices = self.registry.location_pickup[lid] = self._sorted(locations_items[lid])
+                self._pickup = choices
+            else:
+                self._pickup = self._sorted(locations_items[lid])
+        return self._pickup
+
+    def _sorted(self, items: Iterable[ItemId]) -> list[Choice]:
+        rank = self.registry.pickup_rank
+        return [self.registry.pickup[iid] for iid in sorted(items, key=rank.__getitem__)]
 
     def open(self) -> list[Choice]:
-        choices: list[Choice] = []
-        for fid in self.content.locations[self.state.current_location].objects:
-            furniture = self.content.furniture[fid]
-            if furniture.can_open:
-                if not (self.state.objects[fid].flags["open"]  or self.state.objects[fid].flags["locked"]):
-                   choices.append(
-                       Choice(
-                           id=f"open_{fid}",
-                           text=f"Открыть {furniture.name}",
-                           result=Result("generic_open", {"object": fid}),
-                           do=[EFFECTS["open_object"]({"object": fid})]
-
-                       )
-                   )
-        return choices
+        if self._open is None:
+            choices: list[Choice] = []
+            for fid in self.content.locations[self.state.current_location].objects:
+                choice = self.registry.open.get(fid)
+                if choice is None:
+                    continue
+                flags = self.state.objects[fid].flags
+                if not (flags["open"] or flags["locked"]):
+                    choices.append(choice)
+            self._open = choices
+        return self._open
 
     def close(self) -> list[Choice]:
-        choices: list[Choice] = []
-        for fid in self.content.locations[self.state.current_location].objects:
-            furniture = self.content.furniture[fid]
-            if furniture.can_open:
-                if self.state.objects[fid].flags["open"]  and not self.state.objects[fid].flags["locked"]:
-                   choices.append(
-                       Choice(
-                           id=f"close_{fid}",
-                           text=f"Закрыть {furniture.name}",
-                           result=Result("generic_close", {"object": fid}),
-                           do=[EFFECTS["close_object"]({"object": fid})]
-
-                       )
-                   )
-        return choices
+        if self._close is None:
+            choices: list[Choice] = []
+            for fid in self.content.locations[self.state.current_location].objects:
+                choice = self.registry.close.get(fid)
+                if choice is None:
+                    continue
+                flags = self.state.objects[fid].flags
+                if flags["open"] and not flags["locked"]:
+                    choices.append(choice)
+            self._close = choices
+        return self._close
@@ -1,3 +1,3 @@
-from .common import CONDITIONS
+from .common import CONDITION_FACTS, CONDITION_REFS, CONDITIONS, LINKED_CONDITIONS
 
-__all__ = ["CONDITIONS"]
\ No newline at end of file
+__all__ = ["CONDITIONS", "CONDITION_FACTS", "CONDITION_REFS", "LINKED_CONDITIONS"]
\ No newline at end of file
@@ -1,26 +1,61 @@
-from typing import Callable
-from definitions import GameState, ObjectId, ItemId, LocationId, Condition
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+from definitions import Condition, Fact, GameState, ItemId, LocationId, ObjectId
+from instrumentation import instrument_factory
+from overlay import FLAG_BITS
+
+if TYPE_CHECKING:
+    from content_parts import GameContent
+    from linker import Linker
 
 
 ConditionFactory = Callable[[dict], Condition]
+LinkedConditionFactory = Callable[[dict, "Linker"], Condition]
+FactsFactory = Callable[[dict], list[Fact]]
 CONDITIONS: dict[str, ConditionFactory] = {}
+# от каких фактов состояния зависит условие; условия без записи
+# пересчитываются при любом изменении
+CONDITION_FACTS: dict[str, FactsFactory] = {}
+# на что ссылаются параметры условия: параметр -> вид ссылки для линкера
+CONDITION_REFS: dict[str, dict[str, str]] = {}
+# варианты фабрик для слинкованного контента: ссылки уже проверены и
+# заменены целочисленными дескрипторами
+LINKED_CONDITIONS: dict[str, LinkedConditionFactory] = {}
+
+LOCKED = FLAG_BITS["locked"]
+OPEN = FLAG_BITS["open"]
+
+
+def register_condition(name: str, depends_on: FactsFactory | None = None, refs: dict[str, str] | None = None) -> Callable[[ConditionFactory], ConditionFactory]:
+    def decorator(fn: ConditionFactory) -> ConditionFactory:
+        CONDITIONS[name] = instrument_factory(f"condition.{name}", fn)
+        if depends_on is not None:
+            CONDITION_FACTS[name] = depends_on
+        CONDITION_REFS[name] = refs or {}
+        return fn
+    return decorator
 
 
-def register_condition(name: str):
-    def decorator(fn: ConditionFactory):
-        CONDITIONS[name] = fn
+def register_linked_condition(name: str) -> Callable[[LinkedConditionFactory], LinkedConditionFactory]:
+    def decorator(fn: LinkedConditionFactory) -> LinkedConditionFactory:
+        LINKED_CONDITIONS[name] = instrument_factory(f"condition.{name}", fn)
         return fn
     return decorator
 
 
-@register_condition("has_item")
+@register_condition("has_item", depends_on=lambda data: [("inventory", ItemId(data["item"]))], refs={"item": "item"})
 def has_item(data: dict) -> Condition:
     item = ItemId(data["item"])
     def _cond(state: GameState, content: "GameContent") -> bool:
         return state.inventory.has(item)
     return _cond
 
-@register_condition("container_locked")
+@register_condition(
+    "container_locked",
+    depends_on=lambda data: [("object", ObjectId(data["container"]))],
+    refs={"container": "lockable"},
+)
 def container_locked(data: dict) -> Condition:
     cid = ObjectId(data["container"])
 
@@ -32,7 +67,11 @@ def container_locked(data: dict) -> Condition:
     return _cond
 
 
-@register_condition("in_location")
+@register_condition(
+    "in_location",
+    depends_on=lambda data: [("location", LocationId(data["location"]))],
+    refs={"location": "location"},
+)
 def entity_in_location(data: dict) -> Condition:
     lid = LocationId(data["location"])
     def _cond(state: GameState, content: "GameContent") -> bool:
@@ -40,7 +79,11 @@ def entity_in_location(data: dict) -> Condition:
     return _cond
 
 
-@register_condition("object_is_open")
+@register_condition(
+    "object_is_open",
+    depends_on=lambda data: [("object", ObjectId(data["object"]))],
+    refs={"object": "openable"},
+)
 def object_is_open(data: dict) -> Condition:
     oid = ObjectId(data["object"])
     def _cond(state: GameState, content: "GameContent") -> bool:
@@ -48,12 +91,16 @@ def object_is_open(data: dict) -> Condition:
         if o is None:
             raise ValueError(f"Object {oid} does not exist")
         odef = content.furniture.get(oid)
-        if not odef.can_open:
+        if odef is None or not odef.can_open:
             raise ValueError(f"Object {oid} is not openable")
         return o.flags.get("open", False)
     return _cond
 
-@register_condition("object_is_closed")
+@register_condition(
+    "object_is_closed",
+    depends_on=lambda data: [("object", ObjectId(data["object"]))],
+    refs={"object": "openable"},
+)
 def object_is_closed(data: dict) -> Condition:
     oid = ObjectId(data["object"])
     def _cond(state: GameState, content: "GameContent") -> bool:
@@ -61,8 +108,46 @@ def object_is_closed(data: dict) -> Condition:
         if o is None:
             raise ValueError(f"Object {oid} does not exist")
         odef = content.furniture.get(oid)
-        if not odef.can_open:
+        if odef is None or not odef.can_open:
             raise ValueError(f"Object {oid} is not openable")
         return not o.flags.get("open", True)
     return _cond
 
+
+@register_condition(
+    "item_in_location",
+    depends_on=lambda data: [("location_items", LocationId(data["location"]))],
+    refs={"item": "item", "location": "location"},
+)
+def item_in_location(data: dict) -> Condition:
+    item = ItemId(data["item"])
+    lid = LocationId(data["location"])
+    def _cond(state: GameState, content: "GameContent") -> bool:
+        return item in state.locations_items[lid]
+    return _cond
+
+
+# --- слинкованные варианты: флаги читаются по номеру объекта, без проверок на каждом ходу ---
+
+@register_linked_condition("container_locked")
+def linked_container_locked(data: dict, linker: "Linker") -> Condition:
+    index = linker.handles.objects[ObjectId(data["container"])]
+    def _cond(state: GameState, content: "GameContent") -> bool:
+        return bool(state.objects.bits(index) & LOCKED)
+    return _cond
+
+
+@register_linked_condition("object_is_open")
+def linked_object_is_open(data: dict, linker: "Linker") -> Condition:
+    index = linker.handles.objects[ObjectId(data["object"])]
+    def _cond(state: GameState, content: "GameContent") -> bool:
+        return bool(state.objects.bits(index) & OPEN)
+    return _cond
+
+
+@register_linked_condition("object_is_closed")
+def linked_object_is_closed(data: dict, linker: "Linker") -> Condition:
+    index = linker.handles.objects[ObjectId(data["object"])]
+    def _cond(state: GameState, content: "GameContent") -> bool:
+        return not state.objects.bits(index) & OPEN
+    return _cond
@@ -1,5 +1,26 @@
+from collections.abc import Mapping
 from dataclasses import dataclass, field
-from definitions import ItemId, LocationId, LocationDef, Inventory, Choice, ItemDef, FurnitureDef, ObjectId
+from typing import TYPE_CHECKING
+
+from choices import GenericChoiceRegistry
+from definitions import (
+    Choice,
+    FurnitureDef,
+    ItemDef,
+    ItemId,
+    LocationDef,
+    LocationId,
+    ObjectId,
+    TimerDef,
+)
+from matching import ConditionNetwork
+from overlay import StateDefaults
+from renderers import LocationTemplate
+
+if TYPE_CHECKING:
+    from linker import Handles
+    from regions import RegionCache
+    from routes import RouteTable
 
 
 @dataclass(frozen=True)
@@ -12,7 +33,27 @@ class RawContent:
 
 @dataclass(frozen=True)
 class GameContent:
+    # при загрузке по регионам это RegionMapping - определения подгружаются по требованию
     items: dict[ItemId, ItemDef]
-    furniture: dict[ObjectId, FurnitureDef]
-    locations: dict[LocationId, LocationDef]
-    choices: dict[str, Choice]
\ No newline at end of file
+    furniture: Mapping[ObjectId, FurnitureDef]
+    locations: Mapping[LocationId, LocationDef]
+    choices: Mapping[str, Choice]
+    # начальное состояние мира, поверх которого сессии хранят свои отличия
+    defaults: StateDefaults
+    network: ConditionNetwork = field(default_factory=ConditionNetwork)
+    generic: GenericChoiceRegistry = field(default_factory=GenericChoiceRegistry, repr=False)
+    # скомпилированные описания локаций и кеш отрендеренных текстов результатов
+    location_templates: Mapping[LocationId, LocationTemplate] = field(default_factory=dict, repr=False)
+    object_locations: dict[ObjectId, LocationId] = field(default_factory=dict, repr=False)
+    render_cache: dict[tuple, str] = field(default_factory=dict, repr=False, compare=False)
+    # кеш регионов и карта локация -> регион; None при полной загрузке
+    regions: "RegionCache | None" = field(default=None, repr=False, compare=False)
+    location_region: Mapping[LocationId, str] | None = field(default=None, repr=False)
+    # названия локаций без загрузки их регионов
+    location_names: Mapping[LocationId, str] = field(default_factory=dict, repr=False)
+    # целочисленные дескрипторы сущностей после линковки; None для региональной загрузки
+    handles: "Handles | None" = field(default=None, repr=False, compare=False)
+    # отложенные эффекты schedule_effect по id таймера
+    timers: Mapping[str, TimerDef] = field(default_factory=dict, repr=False)
+    # кратчайшие маршруты по выходам локаций для перехода в известную локацию
+    routes: "RouteTable | None" = field(default=None, repr=False, compare=False)
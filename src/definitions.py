@@ -1,8 +1,15 @@
-from typing import Callable, Self, NewType
+from collections.abc import Callable, MutableMapping
 from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, NewType, Self
 
+from overlay import INVENTORY, LocationItems, ObjectStates, Place, StateDefaults
+from persistent import PersistentDict, PersistentSet, PMap, freeze_map
 from renderers import render_template
 
+if TYPE_CHECKING:
+    from content_parts import GameContent
+    from overlay import Items
+
 ItemId = NewType("ItemId", str)
 ObjectId = NewType("ObjectId", str)
 LocationId = NewType("LocationId", str)
@@ -36,6 +43,8 @@ class ExitDef:
     text: str                     # "Пойти на кухню"
     when: list["Condition"] = field(default_factory=list)
     do: list["Effect"] = field(default_factory=list)
+    # выбор, которым выход показывается игроку: in_location, when; do, move_to
+    choice: str = ""
 
 
 @dataclass(frozen=True)
@@ -45,18 +54,22 @@ class LocationDef:
     description: str
     objects: list[ObjectId]
     items: list[ItemId]
-    # exits: list[ExitDef]
+    exits: list[ExitDef] = field(default_factory=list)
 
-@dataclass
+@dataclass(slots=True)
 class ObjectState:
     flags: dict[str, bool] = field(default_factory=dict)
     items: list[ItemId] = field(default_factory=list)
 
 
 
-@dataclass
+@dataclass(slots=True)
 class Inventory:
-    items: dict[ItemId, int]
+    items: MutableMapping[ItemId, int]
+
+    def __post_init__(self) -> None:
+        if not isinstance(self.items, PersistentDict):
+            self.items = PersistentDict(self.items)
 
     def has(self, item: ItemId) -> bool:
         return self.items.get(item, 0) > 0
@@ -72,10 +85,45 @@ class Inventory:
         else:
             self.items[item] -= qty
 
+    def copy(self) -> "Inventory":
+        items = self.items
+        return Inventory(items=items.copy() if isinstance(items, PersistentDict) else dict(items))
+
 
 Condition = Callable[["GameState", "GameContent"], bool]
 Effect = Callable[["GameState", "GameContent"], None]
 
+# Факт - адрес кусочка состояния, который может изменить эффект:
+# ("inventory", item_id), ("object", object_id), ("location", location_id) - покинутая
+# и новая текущая локация,
+# ("location_items", location_id), ("visited", location_id), ("flag", name)
+Fact = tuple[str, ...]
+ANY_FACT: Fact = ("*",)     # состояние изменилось целиком
+FactObserver = Callable[[Fact], None]
+
+@dataclass(frozen=True)
+class TimerDef:
+    """
+    Отложенный эффект из schedule_effect: срабатывает через ticks ходов
+    или seconds секунд после запуска, с repeat - каждые столько же.
+    """
+    id: str
+    do: list[Effect]
+    ticks: int | None = None
+    seconds: float | None = None
+    repeat: bool = False
+    text: str | None = None
+
+    @property
+    def period(self) -> float:
+        """Задержка в ходах или секундах; загрузчик требует ровно одно из двух."""
+        if self.ticks is not None:
+            return self.ticks
+        if self.seconds is not None:
+            return self.seconds
+        raise ValueError(f"timer {self.id!r} has neither ticks nor seconds")
+
+
 @dataclass
 class Result:
     template: str
@@ -106,23 +154,227 @@ class Choice:
         return ""
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
+class StateSnapshot:
+    """
+    Неизменяемый снимок GameState. Все части - персистентные словари, общие
+    с живым состоянием, поэтому снимок стоит O(1), а последующие ходы копируют
+    только то, что меняют.
+    """
+    current_location: LocationId
+    return_location: LocationId | None
+    inventory: PMap[ItemId, int]
+    objects: tuple[PMap[int, int], PMap[int, "Items"]]
+    locations_items: PMap[LocationId, "Items"]
+    visited_locations: PMap[LocationId, bool]
+    flags: PMap[str, Any]
+    clock: int = 0
+    timers: PMap[str, float] = field(default_factory=PMap)
+
+
+@dataclass(slots=True)
 class GameState:
     current_location: LocationId
     inventory: Inventory
+    # оверлеи поверх StateDefaults контента, см. from_content
+    locations_items: LocationItems
+    objects: ObjectStates
     return_location: LocationId | None = None
-    locations_items: dict[LocationId, list[ItemId]] = field(default_factory=dict)
-    objects: dict[ObjectId, ObjectState] = field(default_factory=dict)
-    visited_locations: set[LocationId] = field(default_factory=set)
-    flags: dict[str, bool] = field(default_factory=dict,)
+    visited_locations: PersistentSet[LocationId] = field(default_factory=PersistentSet)
+    flags: PersistentDict[str, Any] = field(default_factory=PersistentDict)
+    # ходы с начала игры и запущенные таймеры: id -> срок (номер хода или time.time())
+    clock: int = 0
+    timers: PersistentDict[str, float] = field(default_factory=PersistentDict)
+    observers: list[FactObserver] = field(default_factory=list, repr=False, compare=False)
+
+    @classmethod
+    def from_content(cls, content: "GameContent") -> Self:
+        defaults: StateDefaults = content.defaults
+        return cls(
+            current_location=defaults.start_location,
+            inventory=Inventory(items=dict(defaults.inventory)),
+            locations_items=LocationItems(defaults),
+            objects=ObjectStates(defaults),
+        )
+
+    def diff(self) -> dict:
+        """
+        Отличия от контента с ключами-id, а не номерами оверлеев: переживает
+        смену контента и годится для хранения (marshal, JSON).
+        """
+        objects = self.objects
+        object_ids = objects.defaults.object_ids
+        return {
+            "location": self.current_location,
+            "return": self.return_location,
+            "inventory": dict(self.inventory.items),
+            "bits": {object_ids[index]: bits for index, bits in objects.changed_bits.items()},
+            "contents": {object_ids[index]: list(items) for index, items in objects.contents.changed.items()},
+            "location_items": {lid: list(items) for lid, items in self.locations_items.contents.changed.items()},
+            "visited": list(self.visited_locations),
+            "flags": dict(self.flags),
+            "clock": self.clock,
+            "timers": dict(self.timers),
+        }
+
+    @classmethod
+    def from_diff(cls, content: "GameContent", data: dict) -> Self:
+        """
+        Состояние из diff(). Ссылки на то, чего в content нет (удаленные
+        локации, объекты, предметы), отбрасываются; пропавшая текущая локация
+        заменяется стартовой.
+        """
+        state = cls.from_content(content)
+        locations, items = content.locations, content.items
+        if data["location"] in locations:
+            state.current_location = LocationId(data["location"])
+        if data["return"] in locations:
+            state.return_location = data["return"]
+        state.inventory = Inventory(items={ItemId(iid): qty for iid, qty in data["inventory"].items() if iid in items})
+        index = content.defaults.object_index
+        for oid, bits in data["bits"].items():
+            if oid in index:
+                state.objects.set_bits(index[oid], bits)
+        for oid, contents in data["contents"].items():
+            if oid in index:
+                state.objects.contents.assign(index[oid], [ItemId(iid) for iid in contents if iid in items])
+        for lid, contents in data["location_items"].items():
+            if lid in locations:
+                state.locations_items[LocationId(lid)] = [ItemId(iid) for iid in contents if iid in items]
+        state.visited_locations = PersistentSet(LocationId(lid) for lid in data["visited"] if lid in locations)
+        state.flags = PersistentDict(data["flags"])
+        state.clock = data.get("clock", 0)
+        state.timers = PersistentDict((tid, due) for tid, due in data.get("timers", {}).items() if tid in content.timers)
+        return state
+
+    def snapshot(self) -> StateSnapshot:
+        """Снимок для отмены хода и сохранений, O(1)."""
+        return StateSnapshot(
+            current_location=self.current_location,
+            return_location=self.return_location,
+            inventory=freeze_map(self.inventory.items),
+            objects=self.objects.freeze(),
+            locations_items=self.locations_items.freeze(),
+            visited_locations=self.visited_locations.freeze(),
+            flags=freeze_map(self.flags),
+            clock=self.clock,
+            timers=freeze_map(self.timers),
+        )
+
+    def restore(self, snapshot: StateSnapshot) -> None:
+        """Возвращает состояние к снимку; подписчики получают ANY_FACT."""
+        self._load(snapshot)
+        self.touch(ANY_FACT)
+
+    def _load(self, snapshot: StateSnapshot) -> None:
+        self.current_location = snapshot.current_location
+        self.return_location = snapshot.return_location
+        self.inventory = Inventory(items=PersistentDict(snapshot.inventory))
+        self.objects.restore(snapshot.objects)
+        self.locations_items.restore(snapshot.locations_items)
+        self.visited_locations = PersistentSet(snapshot.visited_locations)
+        self.flags = PersistentDict(snapshot.flags)
+        self.clock = snapshot.clock
+        self.timers = PersistentDict(snapshot.timers)
+
+    def clone(self) -> Self:
+        """Копия состояния без подписчиков; общие значения по умолчанию не копируются."""
+        return type(self)(
+            current_location=self.current_location,
+            inventory=self.inventory.copy(),
+            return_location=self.return_location,
+            locations_items=self.locations_items.copy(),
+            objects=self.objects.copy(),
+            visited_locations=PersistentSet(self.visited_locations),
+            flags=PersistentDict(self.flags),
+            clock=self.clock,
+            timers=PersistentDict(self.timers),
+        )
+
+    def __deepcopy__(self, memo: dict) -> Self:
+        return self.clone()
+
+    def subscribe(self, observer: FactObserver) -> None:
+        self.observers.append(observer)
+
+    def unsubscribe(self, observer: FactObserver) -> None:
+        self.observers.remove(observer)
+
+    def touch(self, *facts: Fact) -> None:
+        for observer in self.observers:
+            for fact in facts:
+                observer(fact)
 
     def move_to(self, lid: LocationId) -> None:
-        if lid not in self.locations:
-            raise ValueError(f"Location {lid.value!r} does not exist")
+        """Переводит игрока в локацию; ее существование проверяет вызывающий по контенту."""
+        previous = self.current_location
         self.current_location = lid
+        self.touch(("location", previous), ("location", lid))
+
+    # --- размещение предметов ---
+
+    def places(self, item: ItemId) -> dict[Place, int]:
+        """
+        Где сейчас лежит предмет и сколько его там. Локации не обходятся:
+        начальные места берутся из обратного индекса контента, измененные -
+        из индексов оверлеев.
+        """
+        objects, locations_items = self.objects, self.locations_items
+        defaults = objects.defaults
+        found: dict[Place, int] = {}
+        for place in defaults.item_places.get(item, ()):
+            kind, key = place
+            if kind == "location":
+                moved = key in locations_items.contents.changed
+            else:
+                moved = defaults.object_index[ObjectId(key)] in objects.contents.changed
+            if not moved:
+                found[place] = found.get(place, 0) + 1
+        for lid, qty in locations_items.contents.holders(item).items():
+            found[("location", lid)] = qty
+        for index, qty in objects.contents.holders(item).items():
+            found[("object", defaults.object_ids[index])] = qty
+        qty = self.inventory.items.get(item, 0)
+        if qty:
+            found[INVENTORY] = qty
+        return found
+
+    def put_item(self, place: Place, item: ItemId, qty: int = 1) -> None:
+        kind, key = place
+        if kind == "inventory":
+            self.inventory.add(item, qty)
+            return
+        items = self.locations_items[LocationId(key)] if kind == "location" else self.objects[ObjectId(key)].items
+        for _ in range(qty):
+            items.append(item)
+
+    def take_item(self, place: Place, item: ItemId, qty: int = 1) -> None:
+        """ValueError, если столько предметов там нет."""
+        kind, key = place
+        if kind == "inventory":
+            self.inventory.remove(item, qty)
+            return
+        items = self.locations_items[LocationId(key)] if kind == "location" else self.objects[ObjectId(key)].items
+        if items.count(item) < qty:
+            raise ValueError(f"Item {item!r} not in {kind} {key!r}")
+        for _ in range(qty):
+            items.remove(item)
+
+    def move_item(self, item: ItemId, source: Place, target: Place, qty: int = 1) -> None:
+        """Переносит предмет и сообщает подписчикам об обоих местах."""
+        self.take_item(source, item, qty)
+        self.put_item(target, item, qty)
+        self.touch(_place_fact(source, item), _place_fact(target, item))
 
     def set_location_visited(self) -> None:
-        if self.current_location not in self.visied_locations:
-            self.visied_locations.add(self.current_location)
+        if self.current_location not in self.visited_locations:
+            self.visited_locations.add(self.current_location)
+            self.touch(("visited", self.current_location))
+
 
+def _place_fact(place: Place, item: ItemId) -> Fact:
+    kind, key = place
+    if kind == "inventory":
+        return ("inventory", item)
+    return ("location_items", key) if kind == "location" else ("object", key)
 
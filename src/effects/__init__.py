@@ -1,3 +1,3 @@
-from .common import EFFECTS
+from .common import EFFECT_REFS, EFFECTS, LINKED_EFFECTS
 
-__all__ = ["EFFECTS"]
\ No newline at end of file
+__all__ = ["EFFECTS", "EFFECT_REFS", "LINKED_EFFECTS"]
\ No newline at end of file
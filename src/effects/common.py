@@ -1,28 +1,53 @@
-from typing import Callable
-from definitions import GameState, ObjectId, ItemId, LocationId,  Effect
+import time
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+from definitions import Effect, GameState, ItemId, LocationId, ObjectId
+from instrumentation import instrument_factory
+from overlay import FLAG_BITS, INVENTORY
+
+if TYPE_CHECKING:
+    from content_parts import GameContent
+    from linker import Linker
 
 
 EffectFactory = Callable[[dict], Effect]
+LinkedEffectFactory = Callable[[dict, "Linker"], Effect]
 EFFECTS: dict[str, EffectFactory] = {}
+# см. CONDITION_REFS и LINKED_CONDITIONS
+EFFECT_REFS: dict[str, dict[str, str]] = {}
+LINKED_EFFECTS: dict[str, LinkedEffectFactory] = {}
+
+LOCKED = FLAG_BITS["locked"]
+OPEN = FLAG_BITS["open"]
+
+
+def register_effect(name: str, refs: dict[str, str] | None = None) -> Callable[[EffectFactory], EffectFactory]:
+    def decorator(fn: EffectFactory) -> EffectFactory:
+        EFFECTS[name] = instrument_factory(f"effect.{name}", fn)
+        EFFECT_REFS[name] = refs or {}
+        return fn
+    return decorator
 
 
-def register_effect(name: str):
-    def decorator(fn: EffectFactory):
-        EFFECTS[name] = fn
+def register_linked_effect(name: str) -> Callable[[LinkedEffectFactory], LinkedEffectFactory]:
+    def decorator(fn: LinkedEffectFactory) -> LinkedEffectFactory:
+        LINKED_EFFECTS[name] = instrument_factory(f"effect.{name}", fn)
         return fn
     return decorator
 
 
-@register_effect("consume_item")
-def make_consume_item(data: dict):
+@register_effect("consume_item", refs={"item": "item"})
+def make_consume_item(data: dict) -> Effect:
     item = ItemId(data["item"])
 
-    def _effect(state: GameState, content: "GameContent"):
+    def _effect(state: GameState, content: "GameContent") -> None:
         state.inventory.remove(item)
+        state.touch(("inventory", item))
 
     return _effect
 
-@register_effect("unlock_container")
+@register_effect("unlock_container", refs={"container": "lockable"})
 def make_unlock_and_open(data: dict) -> Effect:
     cid = ObjectId(data["container"])
 
@@ -30,64 +55,160 @@ def make_unlock_and_open(data: dict) -> Effect:
         c = state.objects[cid]
         c.flags["locked"] = False
         c.flags["open"] = True
+        state.touch(("object", cid))
     return _effect
 
 
-@register_effect("reveal_contents")
+@register_effect("reveal_contents", refs={"container": "container"})
 def make_reveal_contents(data: dict) -> Effect:
     cid = ObjectId(data["container"])
     def _effect(state: GameState, content: "GameContent") -> None:
         c = state.objects[cid]
-        for item in c.items:
+        revealed = list(c.items)
+        for item in revealed:
             state.inventory.add(item)
         c.items.clear()
+        state.touch(("object", cid), *(("inventory", item) for item in revealed))
     return _effect
 
 
-@register_effect("get_item")
+@register_effect("get_item", refs={"item": "item"})
 def make_get_item(data: dict) -> Effect:
     iid = ItemId(data["item"])
 
     def _effect(state: GameState, content: "GameContent") -> None:
-        state.locations_items[state.current_location].remove(iid)
-        state.inventory.add(iid)
+        state.move_item(iid, ("location", state.current_location), INVENTORY)
     return _effect
 
 
-@register_effect("move_to")
+@register_effect("move_to", refs={"location": "location"})
 def make_move_to(data: dict) -> Effect:
     lid = LocationId(data["location"])
     def _effect(state: GameState, content: "GameContent") -> None:
         if lid not in content.locations:
             raise ValueError(f"Location {lid} does not exist")
-        state.current_location = lid
+        state.move_to(lid)
     return _effect
 
 
-@register_effect("open_object")
+@register_effect("open_object", refs={"object": "openable"})
 def make_open_object(data: dict) -> Effect:
     oid = ObjectId(data["object"])
     def _effect(state: GameState, content: "GameContent") -> None:
         odef = content.furniture.get(oid)
-        if not odef.can_open:
+        if odef is None or not odef.can_open:
             raise ValueError(f"Object {oid} is not openable")
         o = state.objects[oid]
         o.flags["open"] = True
-        if odef.kind == "door":
+        state.touch(("object", oid))
+        if odef.kind == "door" and odef.link_to is not None:
             linked_obj = state.objects[odef.link_to]
             linked_obj.flags["open"] = True
+            state.touch(("object", odef.link_to))
     return _effect
 
-@register_effect("close_object")
+@register_effect("close_object", refs={"object": "openable"})
 def make_close_object(data: dict) -> Effect:
     oid = ObjectId(data["object"])
     def _effect(state: GameState, content: "GameContent") -> None:
         odef = content.furniture.get(oid)
-        if not odef.can_open:
+        if odef is None or not odef.can_open:
             raise ValueError(f"Object {oid} is not openable")
         o = state.objects[oid]
         o.flags["open"] = False
-        if odef.kind == "door":
+        state.touch(("object", oid))
+        if odef.kind == "door" and odef.link_to is not None:
             linked_obj = state.objects[odef.link_to]
-            linked_obj.flags["open"] = True
-    return _effect
\ No newline at end of file
+            linked_obj.flags["open"] = False
+            state.touch(("object", odef.link_to))
+    return _effect
+
+
+@register_effect("schedule_effect", refs={"timer": "timer"})
+def make_schedule_effect(data: dict) -> Effect:
+    """Запускает таймер (TimerDef собирается при загрузке); запущенный заново - перезапускает."""
+    tid = data["timer"]
+    ticks: int | None = data.get("after_ticks")
+    seconds: float = data.get("after_seconds", 0.0)
+
+    def _effect(state: GameState, content: "GameContent") -> None:
+        state.timers[tid] = state.clock + ticks if ticks is not None else time.time() + seconds
+        state.touch(("timer", tid))
+    return _effect
+
+
+@register_effect("cancel_timer", refs={"timer": "timer"})
+def make_cancel_timer(data: dict) -> Effect:
+    tid = data["timer"]
+
+    def _effect(state: GameState, content: "GameContent") -> None:
+        if tid in state.timers:
+            del state.timers[tid]
+            state.touch(("timer", tid))
+    return _effect
+
+
+# --- слинкованные варианты: объекты по номерам, связанные двери найдены при загрузке ---
+
+@register_linked_effect("unlock_container")
+def linked_unlock_and_open(data: dict, linker: "Linker") -> Effect:
+    cid = ObjectId(data["container"])
+    index = linker.handles.objects[cid]
+
+    def _effect(state: GameState, content: "GameContent") -> None:
+        objects = state.objects
+        objects.set_bits(index, (objects.bits(index) & ~LOCKED) | OPEN)
+        state.touch(("object", cid))
+    return _effect
+
+
+@register_linked_effect("reveal_contents")
+def linked_reveal_contents(data: dict, linker: "Linker") -> Effect:
+    cid = ObjectId(data["container"])
+    index = linker.handles.objects[cid]
+
+    def _effect(state: GameState, content: "GameContent") -> None:
+        contents = state.objects.contents
+        revealed = list(contents.read(index))
+        for item in revealed:
+            state.inventory.add(item)
+        contents.assign(index, [])
+        state.touch(("object", cid), *(("inventory", item) for item in revealed))
+    return _effect
+
+
+@register_linked_effect("move_to")
+def linked_move_to(data: dict, linker: "Linker") -> Effect:
+    lid = LocationId(data["location"])
+
+    def _effect(state: GameState, content: "GameContent") -> None:
+        state.move_to(lid)
+    return _effect
+
+
+def _linked_set_open(data: dict, linker: "Linker", value: bool) -> Effect:
+    oid = ObjectId(data["object"])
+    # дверь открывается и закрывается вместе со своей парой
+    targets = [oid]
+    odef = linker.furniture[oid]
+    if odef.kind == "door" and odef.link_to is not None:
+        targets.append(odef.link_to)
+    indexes = [(linker.handles.objects[t], ("object", t)) for t in targets]
+
+    def _effect(state: GameState, content: "GameContent") -> None:
+        objects = state.objects
+        for index, fact in indexes:
+            bits = objects.bits(index)
+            objects.set_bits(index, bits | OPEN if value else bits & ~OPEN)
+            state.touch(fact)
+    return _effect
+
+
+@register_linked_effect("open_object")
+def linked_open_object(data: dict, linker: "Linker") -> Effect:
+    return _linked_set_open(data, linker, True)
+
+
+@register_linked_effect("close_object")
+def linked_close_object(data: dict, linker: "Linker") -> Effect:
+    return _linked_set_open(data, linker, False)
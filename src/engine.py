@@ -0,0 +1,587 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Callable, Collection, Hashable, Mapping
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+from content_parts import GameContent
+from definitions import (
+    ANY_FACT,
+    Fact,
+    FactObserver,
+    GameState,
+    LocationId,
+    StateSnapshot,
+)
+from game import Game
+from instrumentation import STATS, resident_bytes
+from storage import WriteBehindStore, codec
+from storage.journal import Journal
+from timers import TimerWheel, fire
+
+logger = logging.getLogger(__name__)
+
+SessionKey = Hashable
+GameFactory = Callable[[GameContent, GameState | None], Game]
+# при нехватке памяти за один проход выгружается такая доля простаивающих сессий
+MEMORY_EVICT_FRACTION = 0.1
+# квант колеса таймеров в секундах: таймер срабатывает не раньше срока и не позже кванта после него
+TIMER_RESOLUTION = 1.0
+
+
+@dataclass(frozen=True)
+class Reply:
+    """Вывод одного хода: текст, доступные опции (номер, текст) и локация после хода."""
+    text: str
+    options: tuple[tuple[str, str], ...]
+    location: LocationId
+    turn: int
+
+    @classmethod
+    def of(cls, game: Game, text: str) -> "Reply":
+        return cls(
+            text=text.strip(),
+            options=tuple((n, c.text) for n, c in game.options.items()),
+            location=game.state.current_location,
+            turn=game.time,
+        )
+
+
+@dataclass(frozen=True)
+class Handoff:
+    """
+    Сессия, переданная другому движку: номер хода и состояние в storage.codec;
+    None - состояние уже лежит в общем хранилище.
+    """
+    key: SessionKey
+    time: int
+    state: bytes | None
+    # False - сессия была выгружена, принимающий только сохраняет ее
+    resident: bool = True
+    # таймеры выгруженной сессии в секундах: (id, срок по time.time())
+    timers: tuple[tuple[str, float], ...] = ()
+    # слоты сохранений: (имя, запись storage.codec); с общим хранилищем у выгруженных пусто
+    slots: tuple[tuple[str, bytes], ...] = ()
+
+
+@dataclass
+class Session:
+    game: Game
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_seen: float = field(default_factory=time.monotonic)
+    # подписка движка на таймеры в секундах
+    watch: FactObserver | None = None
+    # обработчики, которые держат блокировку или ждут ее; выгружать можно только при 0
+    in_flight: int = 0
+
+    @asynccontextmanager
+    async def turn(self) -> AsyncIterator[None]:
+        """Блокировка сессии; счетчик растет до ожидания, чтобы ждущих не выгрузили."""
+        self.in_flight += 1
+        try:
+            async with self.lock:
+                yield
+        finally:
+            self.in_flight -= 1
+
+
+class SessionEngine:
+    """
+    Асинхронный движок: держит игровые сессии по chat id и направляет
+    каждый ход в tick нужной сессии.
+    Обновления одной сессии применяются строго по очереди под ее блокировкой,
+    разные сессии друг друга не ждут. Сам ход - чистые вычисления без ввода-вывода,
+    поэтому он выполняется прямо в цикле событий, без потоков.
+
+    С хранилищем движок держит в памяти только активные сессии: LRU не больше
+    capacity, простаивающие дольше idle_ttl и, при превышении memory_limit
+    байт резидентной памяти, самые давние выгружаются (состояние дописывает
+    WriteBehindStore). Выгруженная сессия загружается при первом обновлении,
+    одновременные обновления ждут одну загрузку. История отмены живет только
+    в памяти и при выгрузке теряется. Слоты сохранений (не больше
+    game.MAX_SLOTS) пишутся в хранилище и журнал при сохранении, загружаются
+    вместе с сессией, передаются в Handoff и переживают новую игру.
+
+    Журнал (storage.journal) получает каждый примененный выбор, слоты и
+    снимки после новой игры, отмены и загрузки слота. Без хранилища выгруженная
+    сессия восстанавливается из журнала. Без хранилища и журнала сессии
+    не выгружаются - иначе пропал бы прогресс.
+
+    Таймеры в секундах (schedule_effect с after_seconds) всех сессий лежат
+    в одном колесе с квантом timer_resolution; run_timers раз в квант
+    забирает истекшие пачкой и отдает новый экран в on_timer. Выгруженная
+    сессия остается в колесе и загружается при срабатывании; таймеры сессий,
+    не загруженных после перезапуска процесса, срабатывают при их загрузке.
+    """
+
+    def __init__(
+        self,
+        content: GameContent,
+        game_factory: GameFactory = Game.new,
+        store: WriteBehindStore | None = None,
+        capacity: int | None = None,
+        idle_ttl: float | None = None,
+        memory_limit: int | None = None,
+        on_evict: Callable[[SessionKey], None] | None = None,
+        journal: Journal | None = None,
+        on_timer: Callable[[SessionKey, Reply], None] | None = None,
+        timer_resolution: float = TIMER_RESOLUTION,
+    ) -> None:
+        self.content = content
+        self.game_factory = game_factory
+        self.store = store
+        self.journal = journal
+        self.capacity = capacity
+        self.idle_ttl = idle_ttl
+        self.memory_limit = memory_limit
+        self.on_evict = on_evict
+        self.on_timer = on_timer
+        self.timer_resolution = timer_resolution
+        # ключ (сессия, id таймера), срок - номер кванта
+        self.timers: TimerWheel[tuple[SessionKey, str]] = TimerWheel(self._quantum(time.time()))
+        # порядок - от давно не использованных к недавним
+        self.sessions: OrderedDict[SessionKey, Session] = OrderedDict()
+        self.loading: dict[SessionKey, asyncio.Task[Session]] = {}
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    @property
+    def persistent(self) -> bool:
+        """Выгруженную сессию есть откуда восстановить."""
+        return self.store is not None or self.journal is not None
+
+    async def session(self, key: SessionKey) -> Session:
+        while True:
+            session = self.sessions.get(key)
+            if session is not None:
+                self.sessions.move_to_end(key)
+                STATS.count("sessions.hit")
+                return session
+            task = self.loading.get(key)
+            if task is None:
+                STATS.count("sessions.miss")
+                task = self.loading[key] = asyncio.create_task(self._load(key))
+            else:
+                STATS.count("sessions.load_wait")
+            # shield: отмена одного из ждущих обновлений не отменяет загрузку для остальных
+            session = await asyncio.shield(task)
+            if self.sessions.get(key) is session:
+                return session
+            # сессию успели выгрузить, пока ждали - загружаем заново
+
+    async def _load(self, key: SessionKey) -> Session:
+        try:
+            state = None
+            if self.store is not None:
+                state = self.store.resume(str(key))
+                if state is None:
+                    with STATS.timer("sessions.load"):
+                        state = self._current(await asyncio.to_thread(self.store.load, str(key)))
+                    if state is not None:
+                        self.store.track(str(key), state, new=False)
+            elif self.journal is not None:
+                with STATS.timer("sessions.load"):
+                    state = self._current(await self.journal.rebuild(str(key)))
+            slots = None if state is None else self._decode_slots(await self._read_slots(key))
+            return self._install(key, state, slots)
+        finally:
+            del self.loading[key]
+
+    def _current(self, state: GameState | None) -> GameState | None:
+        """Состояние, загруженное при старом контенте, если его успели сменить."""
+        if state is not None and state.objects.defaults is not self.content.defaults:
+            return GameState.from_diff(self.content, state.diff())
+        return state
+
+    def swap_content(self, content: GameContent) -> None:
+        """
+        Переключает движок на новый контент. Выполняется без await, поэтому
+        для всех сессий атомарен: ход идет либо целиком по старому контенту,
+        либо по новому. Игры резидентных сессий пересобираются поверх нового
+        контента, хранилище и журнал получают сверенные состояния.
+        """
+        for key, session in self.sessions.items():
+            self._unwatch(key, session)
+            session.game = session.game.rebind(content)
+        self.content = content
+        for key, session in self.sessions.items():
+            self._watch(key, session)
+        if self.store is not None:
+            self.store.swap_content(content, {str(key): s.game.state for key, s in self.sessions.items()})
+        if self.journal is not None:
+            # старые выборы повторялись бы уже по новому контенту - резидентные сессии начинают его снимком
+            self.journal.content = content
+            for key, session in self.sessions.items():
+                self.journal.snapshot(str(key), session.game.time, session.game.state)
+
+    async def _read_slots(self, key: SessionKey) -> dict[str, bytes]:
+        """Записанные слоты сессии из хранилища или журнала."""
+        if self.store is not None:
+            return await asyncio.to_thread(self.store.load_slots, str(key))
+        if self.journal is not None:
+            return await self.journal.read_slots_async(str(key))
+        return {}
+
+    def _encode_slots(self, game: Game) -> tuple[tuple[str, bytes], ...]:
+        # portable: запись переживает смену контента и читается другим процессом
+        return tuple(
+            (slot, codec.encode(game.thaw(snapshot), self.content, portable=True))
+            for slot, snapshot in game.slots.items()
+        )
+
+    def _decode_slots(self, slots: Mapping[str, bytes]) -> dict[str, StateSnapshot]:
+        return {slot: codec.decode(data, self.content).snapshot() for slot, data in slots.items()}
+
+    def _install(
+        self, key: SessionKey, state: GameState | None, slots: dict[str, StateSnapshot] | None = None
+    ) -> Session:
+        session = self.sessions[key] = Session(self.game_factory(self.content, state))
+        if slots:
+            session.game.slots.update(slots)
+        self._watch(key, session)
+        if state is None:
+            if self.store is not None:
+                self.store.track(str(key), session.game.state)
+            if self.journal is not None:
+                self.journal.snapshot(str(key), 0, session.game.state)
+        # сессия только что загружена для хода - ее не выгружаем, даже если остальные заняты
+        self.evict_over_capacity(exclude={key})
+        STATS.gauge("sessions.resident", len(self.sessions))
+        return session
+
+    async def start(self, key: SessionKey) -> Reply:
+        """Начинает игру заново и возвращает первый экран."""
+        task = self.loading.get(key)
+        if task is not None:
+            await asyncio.shield(task)
+        # слоты переживают новую игру
+        stored = {} if key in self.sessions else await self._read_slots(key)
+        old = self.sessions.get(key)
+        slots = dict(old.game.slots) if old is not None else self._decode_slots(stored)
+        self.drop(key)
+        session = self._install(key, None, slots)
+        async with session.turn():
+            session.last_seen = time.monotonic()
+            return Reply.of(session.game, session.game.render_turn())
+
+    async def handle(self, key: SessionKey, option: str, turn: int | None = None) -> Reply | None:
+        """
+        Применяет опцию. turn - номер хода, на котором опция была показана
+        (кнопки старых сообщений); если с тех пор был другой ход, возвращает None.
+        """
+        session = await self.session(key)
+        waited = time.perf_counter_ns()
+        async with session.turn():
+            STATS.record("engine.lock_wait", time.perf_counter_ns() - waited)
+            session.last_seen = time.monotonic()
+            game = session.game
+            with STATS.timer("engine.tick"):
+                if not game.options:
+                    # первое обновление сессии - показываем экран без хода
+                    return Reply.of(game, game.render_turn())
+                if turn is not None and turn != game.time:
+                    STATS.count("engine.stale_option")
+                    return None
+                choice = game.options.get(option)
+                reply = Reply.of(game, game.tick(option))
+            if choice is not None and self.journal is not None:
+                self.journal.record_choice(str(key), game.time, choice, game.state)
+            return reply
+
+    async def undo(self, key: SessionKey) -> Reply:
+        return await self._locked(key, Game.undo, checkpoint=True)
+
+    async def save(self, key: SessionKey, slot: str) -> Reply:
+        def save(game: Game) -> str:
+            text = game.save(slot)
+            # слот мог не поместиться - тогда записывать нечего
+            if slot in game.slots and self.persistent:
+                data = codec.encode(game.thaw(game.slots[slot]), self.content, portable=True)
+                if self.store is not None:
+                    self.store.save_slot(str(key), slot, data)
+                if self.journal is not None:
+                    self.journal.save_slot(str(key), game.time, slot, data)
+            return text
+
+        return await self._locked(key, save)
+
+    async def load(self, key: SessionKey, slot: str) -> Reply:
+        return await self._locked(key, lambda game: game.load(slot), checkpoint=True)
+
+    async def travel(self, key: SessionKey, target: str) -> Reply:
+        # переход - несколько выборов подряд, журналу проще снимок
+        return await self._locked(key, lambda game: game.travel(target), checkpoint=True)
+
+    async def _locked(self, key: SessionKey, action: Callable[[Game], str], checkpoint: bool = False) -> Reply:
+        """checkpoint - действие меняет состояние не выбором, журналу нужен снимок."""
+        session = await self.session(key)
+        async with session.turn():
+            session.last_seen = time.monotonic()
+            game = session.game
+            if not game.options:
+                return Reply.of(game, game.render_turn())
+            reply = Reply.of(game, action(game))
+            if checkpoint and self.journal is not None:
+                self.journal.snapshot(str(key), game.time, game.state)
+            return reply
+
+    def drop(self, key: SessionKey) -> None:
+        session = self.sessions.pop(key, None)
+        if session is not None:
+            # таймеры остаются в колесе: при срабатывании сессия загрузится заново
+            if session.watch is not None:
+                session.game.state.unsubscribe(session.watch)
+                session.watch = None
+            session.game.detach()
+            if self.store is not None:
+                self.store.untrack(str(key))
+
+    # --- передача сессий (sharding) ---
+
+    async def release(self, keep: Callable[[SessionKey], bool]) -> list[Handoff]:
+        """
+        Отдает сессии, для которых keep(key) ложно. Резидентные передаются из
+        памяти; после возврата их записи в общей базе актуальны. Без хранилища
+        из журнала отдаются и выгруженные сессии, а в журнале остается отметка,
+        что восстанавливать их отсюда больше нельзя. Таймеры в секундах
+        выгруженных сессий снимаются с колеса и уходят новому владельцу -
+        иначе они сработали бы здесь и загрузили чужую сессию.
+        """
+        handoffs: list[Handoff] = []
+        for key in [key for key in self.sessions if not keep(key)]:
+            session = self.sessions.get(key)
+            if session is None:
+                continue
+            async with session.turn():
+                if self.sessions.get(key) is not session:
+                    continue
+                handoffs.append(Handoff(
+                    key, session.game.time, codec.encode(session.game.state, self.content),
+                    slots=self._encode_slots(session.game),
+                ))
+                self.drop(key)
+                self._unwatch(key, session)
+                if self.journal is not None:
+                    self.journal.release(str(key))
+        # у резидентных таймеры сняты _unwatch и едут в состоянии; остались выгруженные
+        timers: dict[SessionKey, list[tuple[str, float]]] = {}
+        for key, tid in list(self.timers):
+            if keep(key):
+                continue
+            due = self.timers.due((key, tid))
+            self.timers.cancel((key, tid))
+            if due is not None:
+                timers.setdefault(key, []).append((tid, due * self.timer_resolution))
+        if self.store is not None:
+            await self.store.flush_async()
+        elif self.journal is not None:
+            # журнал знает сессии по строковым id
+            by_name = {str(key): key for key in timers}
+            for name in self.journal.sessions():
+                if keep(name):
+                    continue
+                state = await self.journal.rebuild(name)
+                pending = tuple(timers.pop(by_name.get(name, name), ()))
+                if state is not None:
+                    slots = tuple((await self.journal.read_slots_async(name)).items())
+                    handoffs.append(Handoff(
+                        name, 0, codec.encode(state, self.content), resident=False, timers=pending, slots=slots,
+                    ))
+                self.journal.release(name)
+        # в общем хранилище состояние есть и так - передаются только таймеры
+        handoffs.extend(Handoff(key, 0, None, resident=False, timers=tuple(pending)) for key, pending in timers.items())
+        if self.journal is not None:
+            await self.journal.flush_async()
+        STATS.count("sessions.released", len(handoffs))
+        STATS.gauge("sessions.resident", len(self.sessions))
+        return handoffs
+
+    def adopt(self, handoffs: list[Handoff]) -> None:
+        """Принимает сессии, отданные release другого движка."""
+        for handoff in handoffs:
+            state = None if handoff.state is None else codec.decode(handoff.state, self.content)
+            if not handoff.resident:
+                if state is not None and self.journal is not None:
+                    self.journal.snapshot(str(handoff.key), handoff.time, state)
+                    for slot, data in handoff.slots:
+                        self.journal.save_slot(str(handoff.key), handoff.time, slot, data)
+                for tid, due in handoff.timers:
+                    # сработав, таймер загрузит сессию уже здесь
+                    self.timers.insert((handoff.key, tid), math.ceil(due / self.timer_resolution))
+                continue
+            if state is None:
+                raise ValueError(f"resident handoff of {handoff.key!r} has no state")
+            self.drop(handoff.key)
+            session = self.sessions[handoff.key] = Session(self.game_factory(self.content, state))
+            session.game.slots.update(self._decode_slots(dict(handoff.slots)))
+            self._watch(handoff.key, session)
+            if handoff.time:
+                # у прежнего владельца экран уже был показан
+                session.game.resume(handoff.time)
+            if self.store is not None:
+                # база уже актуальна - release прежнего владельца дождался записи
+                self.store.track(str(handoff.key), session.game.state, new=False)
+            if self.journal is not None:
+                self.journal.snapshot(str(handoff.key), handoff.time, session.game.state)
+                for slot, data in handoff.slots:
+                    self.journal.save_slot(str(handoff.key), handoff.time, slot, data)
+        STATS.count("sessions.adopted", len(handoffs))
+        self.evict_over_capacity(exclude={handoff.key for handoff in handoffs if handoff.resident})
+        STATS.gauge("sessions.resident", len(self.sessions))
+
+    # --- таймеры в секундах ---
+
+    def _quantum(self, at: float) -> int:
+        return math.floor(at / self.timer_resolution)
+
+    def _watch(self, key: SessionKey, session: Session) -> None:
+        state = session.game.state
+
+        def on_fact(fact: Fact) -> None:
+            if fact[0] == "timer":
+                self._schedule(key, state, fact[1])
+            elif fact == ANY_FACT:
+                for tid in self.content.timers:
+                    self._schedule(key, state, tid)
+
+        session.watch = on_fact
+        state.subscribe(on_fact)
+        on_fact(ANY_FACT)
+
+    def _unwatch(self, key: SessionKey, session: Session) -> None:
+        """Сессия уходит из движка или от старого контента: ее таймеры снимаются с колеса."""
+        if session.watch is not None:
+            session.game.state.unsubscribe(session.watch)
+            session.watch = None
+        for tid in self.content.timers:
+            self.timers.cancel((key, tid))
+
+    def _schedule(self, key: SessionKey, state: GameState, tid: str) -> None:
+        tdef = self.content.timers.get(tid)
+        due = state.timers.get(tid)
+        if due is None or tdef is None or tdef.seconds is None:
+            self.timers.cancel((key, tid))
+        else:
+            # вверх до кванта - чтобы не сработать раньше срока
+            self.timers.insert((key, tid), math.ceil(due / self.timer_resolution))
+
+    async def run_timers(self) -> None:
+        """Раз в квант срабатывают истекшие таймеры всех сессий."""
+        while True:
+            await asyncio.sleep(self.timer_resolution)
+            expired = self.timers.advance(self._quantum(time.time()))
+            if not expired:
+                continue
+            STATS.count("timers.expired", len(expired))
+            by_session: dict[SessionKey, list[str]] = {}
+            for (key, tid), _ in expired:
+                by_session.setdefault(key, []).append(tid)
+            results = await asyncio.gather(
+                *(self.fire_timers(key, tids) for key, tids in by_session.items()), return_exceptions=True,
+            )
+            for key, result in zip(by_session, results):
+                if isinstance(result, Exception):
+                    logger.error("timers of session %s failed", key, exc_info=result)
+
+    async def fire_timers(self, key: SessionKey, tids: list[str]) -> Reply | None:
+        """
+        Срабатывание таймеров сессии; None - все они успели отмениться или
+        перезапуститься. Иначе игрок получает тексты таймеров и новый экран.
+        """
+        session = await self.session(key)
+        async with session.turn():
+            game = session.game
+            now = time.time()
+            texts: list[str] = []
+            fired = False
+            for tid in tids:
+                due = game.state.timers.get(tid)
+                if due is None or due > now:
+                    continue
+                fired = True
+                text = fire(game.state, self.content, tid, due)
+                if text:
+                    texts.append(text)
+            if not fired:
+                return None
+            if self.journal is not None:
+                # срабатывание не выбор - журналу нужен снимок
+                self.journal.snapshot(str(key), game.time, game.state)
+            reply = Reply.of(game, "\n".join([*texts, game.render_turn()]))
+        if self.on_timer is not None:
+            self.on_timer(key, reply)
+        return reply
+
+    # --- выгрузка ---
+
+    def evict(self, key: SessionKey, reason: str) -> None:
+        if self.journal is not None and self.journal.tails.get(str(key)):
+            # снимок при выгрузке - потом восстанавливать почти без повтора ходов
+            session = self.sessions[key]
+            self.journal.snapshot(str(key), session.game.time, session.game.state)
+        self.drop(key)
+        STATS.count(f"sessions.evict.{reason}")
+        STATS.gauge("sessions.resident", len(self.sessions))
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+    def _idle(self, exclude: Collection[SessionKey] = ()) -> list[SessionKey]:
+        """Сессии без хода в процессе, кроме exclude, от давних к недавним."""
+        return [
+            key for key, session in self.sessions.items() if not session.in_flight and key not in exclude
+        ]
+
+    def evict_over_capacity(self, exclude: Collection[SessionKey] = ()) -> int:
+        """exclude - сессии, которые нельзя выгружать: их только что загрузили или приняли."""
+        if not self.persistent or self.capacity is None or len(self.sessions) <= self.capacity:
+            return 0
+        excess = len(self.sessions) - self.capacity
+        victims = self._idle(exclude)[:excess]
+        for key in victims:
+            self.evict(key, "capacity")
+        return len(victims)
+
+    def evict_expired(self, now: float | None = None) -> int:
+        if not self.persistent or self.idle_ttl is None:
+            return 0
+        deadline = (time.monotonic() if now is None else now) - self.idle_ttl
+        victims: list[SessionKey] = []
+        for key in self._idle():
+            if self.sessions[key].last_seen > deadline:
+                # дальше по LRU только более свежие сессии
+                break
+            victims.append(key)
+        for key in victims:
+            self.evict(key, "ttl")
+        return len(victims)
+
+    def evict_for_memory(self) -> int:
+        """
+        Освобожденная память возвращается процессу не сразу, поэтому за один
+        проход выгружается только MEMORY_EVICT_FRACTION простаивающих сессий.
+        """
+        if not self.persistent or self.memory_limit is None:
+            return 0
+        rss = resident_bytes()
+        STATS.gauge("sessions.rss_bytes", rss)
+        if rss <= self.memory_limit:
+            return 0
+        idle = self._idle()
+        victims = idle[:max(1, int(len(idle) * MEMORY_EVICT_FRACTION))] if idle else []
+        for key in victims:
+            self.evict(key, "memory")
+        logger.info("rss %d > %d bytes: %d sessions evicted", rss, self.memory_limit, len(victims))
+        return len(victims)
+
+    async def run_evictor(self, interval: float = 10.0) -> None:
+        """Фоновая выгрузка простаивающих сессий по TTL и по памяти."""
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_expired()
+            self.evict_for_memory()
+            STATS.gauge("sessions.resident", len(self.sessions))
+            STATS.gauge("sessions.loading", len(self.loading))
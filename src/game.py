@@ -1,133 +1,277 @@
-from pprint import pprint
-from dataclasses import dataclass
-from effects import EFFECTS
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Self
+
+from choices import GenericChoices
 from content_parts import GameContent
+from definitions import Choice, GameState, LocationId, StateSnapshot
 from init_content import ContentLoader
-from loaders import YamlLoader
-from definitions import LocationId, GameState, Choice, Result
-from choices import GenericChoices
-
-
-cl = ContentLoader(YamlLoader)
-content, state = cl.init_content()
-for c in content.choices.values():
-    print(c)
-del cl
+from instrumentation import STATS
+from loaders import SnapshotLoader
+from matching import ChoiceMatcher
+from regions import RegionalMatcher
+from renderers import GameRenderer
+from routes import SessionRoutes
+from timers import SessionTimers
 
-for f in content.furniture.values():
-    print(f)
-# состояние игры
+INVALID_OPTION = "Неверная опция!"
+UNDONE = "Ход отменен."
+NOTHING_TO_UNDO = "Отменять нечего."
+UNDO_DEPTH = 20
+# слоты пишутся в хранилище и журнал - их число и длина имени ограничены
+MAX_SLOTS = 5
+SLOT_NAME_LENGTH = 32
+SLOT_NAME_TOO_LONG = f"Имя слота длиннее {SLOT_NAME_LENGTH} символов."
+TOO_MANY_SLOTS = f"Слотов не больше {MAX_SLOTS}, перезапиши один из них:"
+UNKNOWN_DESTINATION = "Такого места ты не знаешь."
+ALREADY_THERE = "Ты уже здесь."
+NO_ROUTE = "Туда сейчас не пройти."
+WHERE_TO = "Можно пойти:"
+NOWHERE_TO_GO = "Идти пока некуда."
 
-gc = GenericChoices(state, content)
 
 @dataclass
-class GameRenderer:
+class Game:
     state: GameState
     content: GameContent
+    renderer: GameRenderer
+    time: int = 0
+    previous_tick_location: LocationId | None = None
+    # False - список опций не печатается, клиент показывает их сам (кнопками)
+    show_choices: bool = True
+    matcher: ChoiceMatcher | RegionalMatcher = field(init=False, repr=False)
+    generic: GenericChoices = field(init=False, repr=False)
+    timers: SessionTimers = field(init=False, repr=False)
+    routes: SessionRoutes | None = field(init=False, repr=False, default=None)
+    options: dict[str, Choice] = field(init=False, repr=False, default_factory=dict)
+    _choice_parts: tuple[list[Choice], ...] = field(init=False, repr=False, default=())
+    _choices: list[Choice] = field(init=False, repr=False, default_factory=list)
+    # снимки до последних ходов и именованные сохранения; снимки стоят O(1)
+    history: deque[StateSnapshot] = field(init=False, repr=False, default_factory=lambda: deque(maxlen=UNDO_DEPTH))
+    slots: dict[str, StateSnapshot] = field(init=False, repr=False, default_factory=dict)
 
-    def render_location(self, verbose: bool = False):
-        description = ""
-        location = self.content.locations[self.state.current_location]
-        if verbose:
-            description += f"{location.name}\n{location.description}"
+    def __post_init__(self) -> None:
+        if self.content.regions is not None:
+            self.matcher = RegionalMatcher(self.content.regions, self.state, self.content)
         else:
-            description += location.name
-        description += "\n"
-
-        furniture = location.objects
-        print(furniture)
-        for fid in furniture:
-            furn_def = self.content.furniture[fid]
-            if furn_def.kind == "container":
-                fs = self.state.objects[fid]
-                status = "(закрыто)" if not fs.flags["open"] else ""
-                status = "(заперто)" if fs.flags["locked"] else status
-                if verbose:
-                    description += f"{furn_def.name} {status}. {furn_def.description}"
-                else:
-                    description +=f"{furn_def.name} {status}"
-                description += "\n"
-            if furn_def.kind == "door":
-                status = "(закрыто)" if not self.state.objects[fid].flags["open"] else "(открыто)"
-                description += f"{furn_def.name}{status}. {furn_def.description}'\n"
-            if furn_def.kind == "switch":
-                status = "(включено)" if self.state.objects[fid].flags["turned_on"] else "(выключено)"
-                description += f"{furn_def.name}{status}. {furn_def.description}\n"
-
-        item_names: list[str] = []
-        for iid in self.state.locations_items[self.state.current_location]:
-            item_names.append(self.content.items[iid].name)
-        if item_names:
-            description += f"Здесь находится: {"\n".join(item_names)}\n"
-        return description
-
-
-
-    def render_choices(self, choices_dict: dict[str, Choice]) -> str:
-        description = ""
-        for n, c in  choices_dict.items():
-            description +=f"{n}. {c.text}\n"
-        return description
+            self.matcher = ChoiceMatcher(self.content.network, self.state, self.content)
+        self.generic = GenericChoices(self.state, self.content)
+        self.timers = SessionTimers(self.state, self.content)
+        if self.content.routes is not None:
+            self.routes = SessionRoutes(self.content.routes, self.state, self.content)
 
+    @classmethod
+    def new(cls, content: GameContent, state: GameState | None = None) -> Self:
+        """Новая игра или продолжение сохраненного состояния state."""
+        if state is None:
+            state = GameState.from_content(content)
+        return cls(state, content, GameRenderer(state, content))
 
+    def rebind(self, content: GameContent) -> Self:
+        """
+        Та же игра поверх нового контента: состояние, история отмены и слоты
+        сверяются с ним через GameState.diff. Следующее обновление покажет
+        экран заново (описание локации могло измениться), старая игра
+        отписывается от состояния.
+        """
+        def convert(snapshot: StateSnapshot) -> StateSnapshot:
+            return GameState.from_diff(content, self.thaw(snapshot).diff()).snapshot()
 
-@dataclass
-class Game:
-    state: GameState
-    content: GameContent
-    renderer: GameRenderer
-    time: int = 0
-    previous_tick_location: LocationId | None = None
+        game = type(self).new(content, GameState.from_diff(content, self.state.diff()))
+        game.time = self.time
+        game.show_choices = self.show_choices
+        game.history.extend(convert(snapshot) for snapshot in self.history)
+        game.slots = {slot: convert(snapshot) for slot, snapshot in self.slots.items()}
+        self.detach()
+        return game
+
+    def resume(self, time: int) -> None:
+        """
+        Продолжает игру, экран которой игрок уже видит (сессию передали из
+        другого процесса): тот же номер хода и те же опции, описание
+        локации при следующем ходе не повторяется.
+        """
+        self.time = time
+        self.options = {str(n): c for n, c in enumerate(self.get_available_choices(), 1)}
+        self.previous_tick_location = self.state.current_location
+
+    def detach(self) -> None:
+        """Отписывает кеши сессии от состояния."""
+        self.matcher.detach()
+        self.generic.detach()
+        self.renderer.detach()
+        self.timers.detach()
+        if self.routes is not None:
+            self.routes.detach()
 
     def run(self) -> None:
+        """Консольная игра: ввод и вывод через терминал."""
+        print(self.render_turn())
         while self.time < 10:
-            self.tick()
+            option = input(">")
+            if option not in self.options:
+                print(INVALID_OPTION)
+                continue
+            print(self.tick(option))
+
+    def tick(self, option: str) -> str:
+        """Применяет выбранную опцию и возвращает текст следующего хода."""
+        if option not in self.options:
+            STATS.count("tick.invalid_option")
+            return f"{INVALID_OPTION}\n{self.render_choices()}"
+        self.history.append(self.state.snapshot())
+        with STATS.timer("tick.apply"):
+            action_description = self.process(option)
+        # таймеры в ходах срабатывают после выбора, их тексты идут следом за его результатом
+        fired = self.timers.tick()
+        if fired:
+            action_description = "\n".join([action_description, *fired])
+        return f"{action_description}\n{self.render_turn()}"
+
+    def destinations(self) -> list[tuple[LocationId, str]]:
+        """Известные (посещенные) локации, куда сейчас есть путь: (id, название)."""
+        if self.routes is None:
+            return []
+        here = self.state.current_location
+        found = [
+            (lid, self.content.location_names[lid])
+            for lid in self.state.visited_locations
+            if lid != here and self.routes.next_exit(here, lid) is not None
+        ]
+        return sorted(found, key=lambda pair: pair[1])
+
+    def travel(self, target: str) -> str:
+        """
+        Переход в известную локацию (id или название) кратчайшим путем. Каждый
+        выход на пути - ход со своими эффектами и таймерами, но экран
+        показывается один раз; отмена откатывает весь переход. Пустой
+        target - список известных локаций.
+        """
+        if not target.strip():
+            names = [name for _, name in self.destinations()]
+            text = f"{WHERE_TO} {', '.join(names)}." if names else NOWHERE_TO_GO
+            return f"{text}\n{self.render_choices()}"
+        routes = self.routes
+        lid = self._destination(target)
+        if routes is None or lid is None:
+            return f"{UNKNOWN_DESTINATION}\n{self.render_choices()}"
+        if lid == self.state.current_location:
+            return f"{ALREADY_THERE}\n{self.render_choices()}"
+        if routes.next_exit(self.state.current_location, lid) is None:
+            return f"{NO_ROUTE}\n{self.render_choices()}"
+        self.history.append(self.state.snapshot())
+        texts: list[str] = []
+        with STATS.timer("tick.travel"):
+            # путь не длиннее числа локаций; эффекты выходов могли увести в сторону
+            for _ in range(len(routes.table.ids)):
+                here = self.state.current_location
+                if here == lid:
+                    break
+                cid = routes.next_exit(here, lid)
+                choice = self.content.choices.get(cid) if cid is not None else None
+                if choice is None or not choice.is_available(self.state, self.content):
+                    texts.append(NO_ROUTE)
+                    break
+                texts.append(choice.apply(self.state, self.content))
+                texts.extend(self.timers.tick())
+                if self.state.current_location != lid:
+                    # через промежуточные локации игрок прошел - они тоже известны
+                    self.state.set_location_visited()
+        return "\n".join([*filter(None, texts), self.render_turn()])
+
+    def _destination(self, target: str) -> LocationId | None:
+        if self.routes is None:
+            return None
+        visited = self.state.visited_locations
+        if target in visited:
+            return LocationId(target)
+        wanted = target.strip().casefold()
+        for lid in visited:
+            if self.content.location_names[lid].casefold() == wanted:
+                return lid
+        return None
 
+    def undo(self) -> str:
+        """Откатывает последний ход."""
+        if not self.history:
+            return f"{NOTHING_TO_UNDO}\n{self.render_choices()}"
+        self.state.restore(self.history.pop())
+        return f"{UNDONE}\n{self.render_turn()}"
 
-    def tick(self) -> None:
+    def save(self, slot: str) -> str:
+        """Сохраняет в слот; новый слот - только пока их меньше MAX_SLOTS."""
+        if len(slot) > SLOT_NAME_LENGTH:
+            return f"{SLOT_NAME_TOO_LONG}\n{self.render_choices()}"
+        if slot not in self.slots and len(self.slots) >= MAX_SLOTS:
+            return f"{TOO_MANY_SLOTS} {', '.join(sorted(self.slots))}.\n{self.render_choices()}"
+        self.slots[slot] = self.state.snapshot()
+        return f"Сохранено в слот {slot}.\n{self.render_choices()}"
+
+    def load(self, slot: str) -> str:
+        """Загружает сохранение; загрузку тоже можно отменить."""
+        snapshot = self.slots.get(slot)
+        if snapshot is None:
+            return f"Слота {slot} нет.\n{self.render_choices()}"
+        self.history.append(self.state.snapshot())
+        self.state.restore(snapshot)
+        return f"Загружен слот {slot}.\n{self.render_turn()}"
+
+    def thaw(self, snapshot: StateSnapshot) -> GameState:
+        """Снимок отдельным состоянием без подписчиков - для записи и сверки с контентом."""
+        state = GameState.from_content(self.content)
+        state._load(snapshot)
+        return state
+
+    def render_turn(self) -> str:
         self.time += 1
         verbose = self.state.current_location not in self.state.visited_locations
 
+        with STATS.timer("tick.choices"):
+            choices = self.get_available_choices()
+            self.options = {str(n): c for n, c in enumerate(choices, 1)}
+        with STATS.timer("tick.render_choices"):
+            choice_description = self.render_choices()
 
-        choices = self.get_available_choices()
-        choices_dict = {str(n): c for n, c in enumerate(choices, 1)}
-        choice_description = self.renderer.render_choices(choices_dict)
-        
         # Печатаем описание локации только при первом посещении или смене локации
+        parts: list[str] = []
         if verbose or self.state.current_location != self.previous_tick_location:
-            location_description = self.renderer.render_location(verbose)
-            print(location_description)
-            
-        print(choice_description)
-        self.process(choices_dict)
+            with STATS.timer("tick.render_location"):
+                parts.append(self.renderer.render_location(verbose))
+            self.state.set_location_visited()
+        parts.append(choice_description)
+        self.previous_tick_location = self.state.current_location
+        return "\n".join(parts)
 
+    def render_choices(self) -> str:
+        if not self.show_choices:
+            return ""
+        return self.renderer.render_choices(self.options)
 
     def get_available_choices(self) -> list[Choice]:
-        choices: list[Choice] = []
-        for c in self.content.choices.values():
-            if c.is_available(self.state, self.content):
-                choices.append(c)
-        choices.extend(gc.pickup())
-        choices.extend(gc.open())
-        choices.extend(gc.close())
-        return choices
+        parts = (
+            self.matcher.available_choices(),
+            self.generic.pickup(),
+            self.generic.open(),
+            self.generic.close(),
+        )
+        # части переиспользуются, пока не изменились - склеиваем только новые
+        if len(parts) != len(self._choice_parts) or any(a is not b for a, b in zip(parts, self._choice_parts)):
+            self._choice_parts = parts
+            self._choices = [c for part in parts for c in part]
+        return self._choices
 
+    def process(self, option: str) -> str:
+        choice = self.options[option]
+        if STATS.enabled:
+            with STATS.timer(f"choice.{choice.id}"):
+                return choice.apply(self.state, self.content)
+        return choice.apply(self.state, self.content)
 
 
+def main() -> None:
+    content, _ = ContentLoader(SnapshotLoader).init_content()
+    Game.new(content).run()
 
 
-    def process(self, associations: dict[str, Choice]):
-        self.previous_tick_location = self.state.current_location
-        available_options = list(associations)
-        while True:
-            option = input(">")
-            if  option not in available_options:
-                print("Неверная опция!")
-                continue
-            action_description = associations[option].apply(self.state, self.content)
-            print(action_description)
-            break
-
-gr = GameRenderer(state, content)
-game = Game(state, content, gr)
-game.run()
+if __name__ == "__main__":
+    main()
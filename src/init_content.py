@@ -1,16 +1,35 @@
+import logging
+from collections.abc import Iterator
+
+from choices import GenericChoiceRegistry
 from content_parts import GameContent
-from loaders import Loader
-from conditions import CONDITIONS
+from definitions import (
+    Choice,
+    Condition,
+    Effect,
+    ExitDef,
+    FurnitureDef,
+    GameState,
+    Inventory,
+    ItemDef,
+    ItemId,
+    LocationDef,
+    LocationId,
+    ObjectId,
+    ObjectState,
+    Result,
+    TimerDef,
+)
 from effects import EFFECTS
-from definitions import (ItemId,
-                         LocationId,
-                         ObjectId,
-                         Choice,
-                         Condition,
-                         Effect,
-                         Inventory, ItemDef, LocationDef, FurnitureDef,
-                         GameState, ObjectState, Result
-                         )
+from linker import Linker
+from loaders import Loader
+from matching import ConditionNetwork, ConditionNode
+from overlay import StateDefaults, flags_to_bits
+from renderers import compile_locations
+from routes import RouteTable
+from routes.table import RawExit
+
+logger = logging.getLogger(__name__)
 
 
 
@@ -22,11 +41,19 @@ class ContentLoader:
         self.LOCATIONS: dict[LocationId, LocationDef] = {}
         self.INVENTORY = Inventory(items={})
         self.CHOICES: dict[str, Choice] = {}
+        self.TIMERS: dict[str, TimerDef] = {}
+        # исходные описания таймеров: попадают в индекс регионов
+        self.timer_specs: dict[str, dict] = {}
+        # выходы по локациям: (цель, id выбора, условия); попадают в индекс регионов
+        self.raw_exits: dict[str, list[RawExit]] = {}
         self.FURNITURE: dict[ObjectId, FurnitureDef] = {}
+        self.NETWORK = ConditionNetwork()
         self.raw_content = loader.load()
         self.object_states: dict[ObjectId, ObjectState] = {}
 
         self.location_items: dict[LocationId, list[ItemId]]= {}
+        # задан только на время init_content: выборы регионов собираются без линковки
+        self.LINKER: Linker | None = None
 
 
     def init_content(self) -> tuple[GameContent, GameState]:
@@ -37,31 +64,43 @@ class ContentLoader:
             self.build_location(lid, raw)
 
         self.build_inventory(self.raw_content.inventory["items"])
+        defaults = self.build_defaults(LocationId(self.raw_content.inventory.get("start_location", "attic")))
 
-        for cid, struct in self.raw_content.choices.items():
-            print(struct)
+        # все ссылки проверяются до первого хода, ошибки выдаются одним списком
+        self.LINKER = Linker(self.ITEMS, self.FURNITURE, self.LOCATIONS, defaults)
+        self.LINKER.check_world(self.raw_content, self.INVENTORY, defaults.start_location)
+        choices = {**self.raw_content.choices, **self.collect_exits(self.raw_content.locations)}
+        self.build_timers(self.collect_timers(choices))
+        for cid, struct in choices.items():
+            logger.debug("choice %s: %s", cid, struct)
             self.build_choice(cid, struct)
+        self.LINKER.raise_errors()
+        self.build_exits()
+        linker = self.LINKER
+        routes = RouteTable.build(tuple(self.LOCATIONS), self.raw_exits, lambda spec: linker.condition("exits", spec))
 
-
-        print(self.location_items)
-        print(self.object_states)
+        logger.debug("location items: %s", self.location_items)
+        logger.debug("object states: %s", self.object_states)
         content = GameContent(
             items=self.ITEMS,
             furniture=self.FURNITURE,
             locations=self.LOCATIONS,
-            choices=self.CHOICES
-        )
-        state = GameState(
-            current_location=LocationId("attic"),
-            inventory=self.INVENTORY,
-            locations_items=self.location_items,
-            objects=self.object_states,
-            flags={},
+            choices=self.CHOICES,
+            network=self.NETWORK,
+            defaults=defaults,
+            location_templates=compile_locations(self.LOCATIONS, self.FURNITURE),
+            object_locations={oid: lid for lid, loc in self.LOCATIONS.items() for oid in loc.objects},
+            location_names={lid: loc.name for lid, loc in self.LOCATIONS.items()},
+            generic=GenericChoiceRegistry.build(self.ITEMS, self.FURNITURE),
+            handles=self.LINKER.handles,
+            timers=self.TIMERS,
+            routes=routes,
         )
+        state = GameState.from_content(content)
         return content, state
 
 
-    def build_item(self, iid: str,  data: dict):
+    def build_item(self, iid: str,  data: dict) -> None:
         item_id = ItemId(iid)
         self.ITEMS[item_id] = ItemDef(
                 id=item_id,
@@ -72,7 +111,7 @@ class ContentLoader:
 
 
 
-    def build_location(self, lid: str,  data: dict):
+    def build_location(self, lid: str,  data: dict) -> None:
         location_id = LocationId(lid)
 
         raw_items = data.get("items", [])
@@ -107,7 +146,7 @@ class ContentLoader:
             name=data["name"],
             description=data["description"],
             objects=objects,
-            items=self.location_items[location_id]
+            items=list(self.location_items[location_id])
         )
 
 
@@ -116,7 +155,19 @@ class ContentLoader:
 
 
 
-    def build_inventory(self, data: list[dict]):
+    def build_defaults(self, start_location: LocationId) -> StateDefaults:
+        object_ids = tuple(self.object_states)
+        return StateDefaults(
+            start_location=start_location,
+            inventory=tuple(self.INVENTORY.items.items()),
+            object_ids=object_ids,
+            object_index={oid: i for i, oid in enumerate(object_ids)},
+            object_bits=tuple(flags_to_bits(self.object_states[oid].flags) for oid in object_ids),
+            object_items=tuple(tuple(self.object_states[oid].items) for oid in object_ids),
+            location_items={lid: tuple(items) for lid, items in self.location_items.items()},
+        )
+
+    def build_inventory(self, data: list[dict]) -> None:
         invtry: dict[ItemId, int] = {}
         for item in data:
             item_id = ItemId(item["item"])
@@ -124,22 +175,120 @@ class ContentLoader:
         self.INVENTORY.items = invtry
 
 
-    def build_choice(self, cid: str,  data: dict):
-        conditions: list[Condition] = []
+    def collect_exits(self, locations: dict[str, dict]) -> dict[str, dict]:
+        """
+        Выходы локаций (exits в locations.yaml) как обычные выборы: условие
+        in_location и условия выхода, эффекты выхода и move_to в цель.
+        Id выбора - id из описания выхода, иначе "локация->цель".
+        """
+        choices: dict[str, dict] = {}
+        for lid, data in locations.items():
+            out = self.raw_exits[lid] = []
+            for spec in data.get("exits", []):
+                target = spec.get("to")
+                cid = spec.get("id", f"{lid}->{target}")
+                if self.LINKER is not None:
+                    where = f"location {lid}"
+                    if "text" not in spec:
+                        self.LINKER.error(where, f"exit to {target!r} has no text")
+                        continue
+                    if cid in choices or cid in self.raw_content.choices:
+                        self.LINKER.error(where, f"exit id {cid!r} is already used")
+                        continue
+                choice = {
+                    "text": spec["text"],
+                    "conditions": [{"type": "in_location", "location": lid}, *spec.get("conditions", [])],
+                    "effects": [*spec.get("effects", []), {"type": "move_to", "location": target}],
+                }
+                if "result_text" in spec:
+                    choice["result_text"] = spec["result_text"]
+                choices[cid] = choice
+                out.append((target, cid, spec.get("conditions", [])))
+        return choices
+
+    def build_exits(self) -> None:
+        """ExitDef локаций из собранных выборов выходов."""
+        for lid, out in self.raw_exits.items():
+            exits = self.LOCATIONS[LocationId(lid)].exits
+            for target, cid, _ in out:
+                choice = self.CHOICES[cid]
+                exits.append(ExitDef(
+                    target=LocationId(target),
+                    text=choice.text,
+                    when=choice.when[1:],
+                    do=choice.do[:-1],
+                    choice=cid,
+                ))
+
+    def collect_timers(self, choices: dict[str, dict]) -> dict[str, dict]:
+        """
+        Описания schedule_effect всех выборов, включая вложенные в эффекты
+        таймеров. Один id может запускаться из разных выборов, но описан
+        должен быть одинаково.
+        """
+        specs: dict[str, dict] = {}
+        for where, spec in _schedules(choices):
+            tid = spec.get("timer")
+            if not isinstance(tid, str):
+                if self.LINKER is not None:
+                    self.LINKER.error(where, f"schedule_effect has bad timer id {tid!r}")
+                continue
+            if self.LINKER is not None:
+                ticks, seconds = spec.get("after_ticks"), spec.get("after_seconds")
+                if (ticks is None) == (seconds is None):
+                    self.LINKER.error(where, f"timer {tid!r} needs exactly one of after_ticks, after_seconds")
+                elif ticks is not None and (not isinstance(ticks, int) or ticks <= 0):
+                    self.LINKER.error(where, f"timer {tid!r} has bad after_ticks {ticks!r}")
+                elif seconds is not None and (not isinstance(seconds, (int, float)) or seconds <= 0):
+                    self.LINKER.error(where, f"timer {tid!r} has bad after_seconds {seconds!r}")
+                if tid in specs and specs[tid] != spec:
+                    self.LINKER.error(where, f"timer {tid!r} is defined differently elsewhere")
+            specs.setdefault(tid, spec)
+        return specs
+
+    def build_timers(self, specs: dict[str, dict]) -> None:
+        # все id известны до сборки эффектов: cancel_timer может ссылаться на таймер из другого выбора
+        self.timer_specs = specs
+        if self.LINKER is not None:
+            self.LINKER.timers = specs
+        for tid, spec in specs.items():
+            where = f"timer {tid}"
+            self.TIMERS[tid] = TimerDef(
+                id=tid,
+                do=[
+                    EFFECTS[e["type"]](e) if self.LINKER is None else self.LINKER.effect(where, e)
+                    for e in spec.get("effects", [])
+                ],
+                ticks=spec.get("after_ticks"),
+                seconds=spec.get("after_seconds"),
+                repeat=spec.get("repeat", False),
+                text=spec.get("text"),
+            )
+
+    def build_choice(self, cid: str,  data: dict) -> None:
+        # одинаковые условия разных выборов разделяют один узел сети
+        nodes: list[ConditionNode] = []
+        linker = self.LINKER
+        where = f"choice {cid}"
         for c in data.get("conditions", []):
-            conditions.append( CONDITIONS[c["type"]](c))
+            if linker is None:
+                nodes.append(self.NETWORK.node(c))
+            else:
+                # узел общий для одинаковых условий, а ошибки ссылок сообщаются для каждого выбора
+                build = linker.link_condition if linker.check_condition(where, c) else linker.broken_condition
+                nodes.append(self.NETWORK.node(c, build))
+        conditions: list[Condition] = [node.cond for node in nodes]
         effects: list[Effect] = []
         for e in data.get("effects", []):
-            effects.append( EFFECTS[e["type"]](e))
+            effects.append(EFFECTS[e["type"]](e) if linker is None else linker.effect(where, e))
         result = None
         if data.get("result"):
-            print(data.get("result"))
             result = Result(
                 template=data["result"]["template"],
                 params=data["result"].get("params", {})
             )
 
-        self.CHOICES[cid] = Choice(
+        choice = Choice(
             id=cid,
             text=data["text"],
             result_text=data.get("result_text", None),
@@ -147,4 +296,16 @@ class ContentLoader:
             when=conditions,
             do=effects
         )
+        self.CHOICES[cid] = choice
+        self.NETWORK.add_choice(choice, nodes)
+
+
+def _schedules(choices: dict[str, dict]) -> Iterator[tuple[str, dict]]:
+    def walk(where: str, effects: list[dict]) -> Iterator[tuple[str, dict]]:
+        for spec in effects:
+            if spec.get("type") == "schedule_effect":
+                yield where, spec
+                yield from walk(f"timer {spec.get('timer')}", spec.get("effects", []))
 
+    for cid, data in choices.items():
+        yield from walk(f"choice {cid}", data.get("effects", []))
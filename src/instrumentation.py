@@ -0,0 +1,188 @@
+"""
+Инструментирование горячего пути: счетчики и гистограммы задержек по типам
+условий и эффектов, по выборам и по фазам хода.
+
+Включается переменной окружения HAPPYDAMSEL_STATS=1 или вызовом enable() до
+загрузки контента. Замыкания условий и эффектов оборачиваются в момент их
+создания фабриками, поэтому при выключенной статистике они работают без
+оберток, а фазы хода стоят одну проверку флага.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager
+from dataclasses import dataclass, field
+from functools import update_wrapper
+from typing import Any, cast
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = 48        # корзины по степеням двойки наносекунд: до ~39 часов
+
+
+@dataclass
+class Histogram:
+    count: int = 0
+    total_ns: int = 0
+    max_ns: int = 0
+    buckets: list[int] = field(default_factory=lambda: [0] * BUCKETS)
+
+    def record(self, ns: int) -> None:
+        self.count += 1
+        self.total_ns += ns
+        self.max_ns = max(self.max_ns, ns)
+        self.buckets[min(ns.bit_length(), BUCKETS - 1)] += 1
+
+    def percentile(self, q: float) -> int:
+        """Верхняя граница корзины, в которую попадает q-й перцентиль, нс."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bucket, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(1 << bucket, self.max_ns)
+        return self.max_ns
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_us": self.total_ns / self.count / 1000 if self.count else 0.0,
+            "p50_us": self.percentile(0.5) / 1000,
+            "p99_us": self.percentile(0.99) / 1000,
+            "max_us": self.max_ns / 1000,
+        }
+
+
+class Stats:
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.counters: dict[str, int] = {}
+        self.gauges: dict[str, float] = {}
+        self.histograms: dict[str, Histogram] = {}
+
+    def histogram(self, key: str) -> Histogram:
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = Histogram()
+        return hist
+
+    def count(self, key: str, n: int = 1) -> None:
+        if self.enabled:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def gauge(self, key: str, value: float) -> None:
+        """Текущее значение величины (число сессий, память); хранится последнее."""
+        if self.enabled:
+            self.gauges[key] = value
+
+    def record(self, key: str, ns: int) -> None:
+        if self.enabled:
+            self.histogram(key).record(ns)
+
+    @contextmanager
+    def _timer(self, key: str) -> Iterator[None]:
+        started = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.histogram(key).record(time.perf_counter_ns() - started)
+
+    def timer(self, key: str) -> AbstractContextManager[None]:
+        """Контекстный менеджер замера фазы; без статистики - пустой."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timer(key)
+
+    def snapshot(self) -> dict[str, dict]:
+        return {
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "histograms": {key: hist.summary() for key, hist in sorted(self.histograms.items())},
+        }
+
+    def reset(self) -> None:
+        self.counters.clear()
+        self.gauges.clear()
+        self.histograms.clear()
+
+    def format(self) -> str:
+        lines = [f"{key}: {value}" for key, value in sorted(self.counters.items())]
+        lines.extend(f"{key}: {value:g}" for key, value in sorted(self.gauges.items()))
+        for key, s in self.snapshot()["histograms"].items():
+            lines.append(
+                f"{key}: n={s['count']} mean={s['mean_us']:.1f}us p50<={s['p50_us']:.1f}us "
+                f"p99<={s['p99_us']:.1f}us max={s['max_us']:.1f}us"
+            )
+        return "\n".join(lines)
+
+
+class _NullTimer:
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc: object) -> None:
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+STATS = Stats(enabled=os.environ.get("HAPPYDAMSEL_STATS", "") not in ("", "0"))
+
+
+def enable() -> None:
+    STATS.enabled = True
+
+
+def disable() -> None:
+    STATS.enabled = False
+
+
+def resident_bytes(pid: int | None = None) -> int:
+    """
+    Текущий резидентный размер процесса (по умолчанию своего); где /proc нет -
+    пиковый для своего процесса и 0 для чужого.
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if pid is not None:
+            return 0
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def timed[F: Callable[..., Any]](key: str, fn: F) -> F:
+    # гистограмма ищется при каждом замере: после STATS.reset() она новая
+    def wrapper(*args: Any) -> Any:
+        started = time.perf_counter_ns()
+        try:
+            return fn(*args)
+        finally:
+            STATS.histogram(key).record(time.perf_counter_ns() - started)
+
+    return cast(F, wrapper)
+
+
+def instrument_factory[F: Callable[..., Callable[..., Any]]](key: str, factory: F) -> F:
+    """Оборачивает фабрику так, чтобы созданные ею замыкания замерялись, если статистика включена."""
+    def build(*args: Any) -> Callable[..., Any]:
+        closure = factory(*args)
+        if STATS.enabled:
+            return timed(key, closure)
+        return closure
+
+    return cast(F, update_wrapper(build, factory))
+
+
+async def dump_periodically(interval: float, stats: Stats = STATS) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        if stats.enabled:
+            logger.info("stats:\n%s", stats.format())
@@ -0,0 +1,203 @@
+"""
+Линковка контента: проверка всех ссылок на предметы, объекты и локации
+за один проход при загрузке и сборка замыканий условий и эффектов,
+работающих с номерами объектов вместо строковых ключей.
+
+Все найденные ошибки собираются и выбрасываются одним ContentError,
+чтобы автор контента видел их сразу, а не по одной KeyError посреди игры.
+"""
+from collections import Counter
+from collections.abc import Collection, Mapping
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from conditions import CONDITION_REFS, CONDITIONS, LINKED_CONDITIONS
+from content_parts import RawContent
+from definitions import (
+    Condition,
+    Effect,
+    FurnitureDef,
+    GameState,
+    Inventory,
+    ItemDef,
+    ItemId,
+    LocationDef,
+    LocationId,
+    ObjectId,
+)
+from effects import EFFECT_REFS, EFFECTS, LINKED_EFFECTS
+from overlay import StateDefaults
+
+if TYPE_CHECKING:
+    from content_parts import GameContent
+
+
+class ContentError(Exception):
+    def __init__(self, problems: list[str]) -> None:
+        self.problems = problems
+        super().__init__(f"{len(problems)} content error(s):\n" + "\n".join(f"  - {p}" for p in problems))
+
+
+@dataclass(frozen=True)
+class Handles:
+    """
+    Плотные целочисленные дескрипторы сущностей контента.
+    Условия и эффекты предметов (has_item, consume_item, get_item) остаются
+    на ItemId: инвентарь и предметы локаций хранятся по id предмета, и номер
+    пришлось бы на каждом ходу переводить обратно в строку.
+    """
+    item_ids: tuple[ItemId, ...]
+    items: Mapping[ItemId, int]
+    object_ids: tuple[ObjectId, ...]
+    objects: Mapping[ObjectId, int]         # совпадает с StateDefaults.object_index
+    location_ids: tuple[LocationId, ...]
+    locations: Mapping[LocationId, int]
+
+    @classmethod
+    def build(cls, items: Mapping[ItemId, ItemDef], locations: Mapping[LocationId, LocationDef], defaults: StateDefaults) -> "Handles":
+        item_ids = tuple(items)
+        location_ids = tuple(locations)
+        return cls(
+            item_ids=item_ids,
+            items={iid: i for i, iid in enumerate(item_ids)},
+            object_ids=defaults.object_ids,
+            objects=defaults.object_index,
+            location_ids=location_ids,
+            locations={lid: i for i, lid in enumerate(location_ids)},
+        )
+
+
+def _never(state: GameState, content: "GameContent") -> bool:
+    return False
+
+
+def _noop(state: GameState, content: "GameContent") -> None:
+    return None
+
+
+class Linker:
+    def __init__(
+        self,
+        items: Mapping[ItemId, ItemDef],
+        furniture: Mapping[ObjectId, FurnitureDef],
+        locations: Mapping[LocationId, LocationDef],
+        defaults: StateDefaults,
+    ) -> None:
+        self.items = items
+        self.furniture = furniture
+        self.locations = locations
+        self.defaults = defaults
+        self.handles = Handles.build(items, locations, defaults)
+        # id таймеров; заполняется ContentLoader.build_timers до сборки выборов
+        self.timers: Collection[str] = ()
+        self.problems: list[str] = []
+
+    def error(self, where: str, message: str) -> None:
+        self.problems.append(f"{where}: {message}")
+
+    def raise_errors(self) -> None:
+        if self.problems:
+            raise ContentError(self.problems)
+
+    # --- мир ---
+
+    def check_world(self, raw: RawContent, inventory: Inventory, start_location: LocationId) -> None:
+        if start_location not in self.locations:
+            self.error("inventory", f"start location {start_location!r} does not exist")
+        for iid, qty in inventory.items.items():
+            self.check_ref("inventory", iid, "item")
+            if not isinstance(qty, int) or qty <= 0:
+                self.error("inventory", f"item {iid!r} has bad quantity {qty!r}")
+
+        # мебель с одним id в двух локациях молча перезаписывается при сборке
+        furniture_ids = Counter(fid for data in raw.locations.values() for fid in data.get("furniture", {}))
+        for fid, n in furniture_ids.items():
+            if n > 1:
+                self.error(f"object {fid}", f"defined in {n} locations")
+
+        for lid, location in self.locations.items():
+            for iid in location.items:
+                self.check_ref(f"location {lid}", iid, "item")
+        for oid, odef in self.furniture.items():
+            where = f"object {oid}"
+            if odef.link_to is not None:
+                self.check_ref(where, odef.link_to, "object")
+            elif odef.kind == "door" and odef.can_open:
+                self.error(where, "door has no link_to")
+            for iid in self.defaults.object_items[self.handles.objects[oid]]:
+                self.check_ref(where, iid, "item")
+
+    # --- ссылки ---
+
+    def check_ref(self, where: str, value: str, kind: str) -> bool:
+        if kind == "item":
+            if value not in self.items:
+                self.error(where, f"unknown item {value!r}")
+                return False
+            return True
+        if kind == "location":
+            if value not in self.locations:
+                self.error(where, f"unknown location {value!r}")
+                return False
+            return True
+        if kind == "timer":
+            if value not in self.timers:
+                self.error(where, f"unknown timer {value!r}")
+                return False
+            return True
+        odef = self.furniture.get(ObjectId(value))
+        if odef is None:
+            self.error(where, f"unknown object {value!r}")
+            return False
+        if kind == "openable" and not odef.can_open:
+            self.error(where, f"object {value!r} cannot be opened")
+            return False
+        if kind == "lockable" and not odef.can_lock:
+            self.error(where, f"object {value!r} cannot be locked")
+            return False
+        if kind == "container" and not odef.is_container:
+            self.error(where, f"object {value!r} is not a container")
+            return False
+        return True
+
+    def check_spec(self, where: str, spec: dict, known: Mapping, refs: Mapping[str, Mapping[str, str]], what: str) -> bool:
+        stype = spec.get("type")
+        if not isinstance(stype, str) or stype not in known:
+            self.error(where, f"unknown {what} type {stype!r}")
+            return False
+        ok = True
+        for param, kind in refs.get(stype, {}).items():
+            if param not in spec:
+                self.error(where, f"{what} {stype} is missing {param!r}")
+                ok = False
+            elif not self.check_ref(f"{where}, {what} {stype}", spec[param], kind):
+                ok = False
+        return ok
+
+    # --- сборка замыканий ---
+
+    def check_condition(self, where: str, spec: dict) -> bool:
+        return self.check_spec(where, spec, CONDITIONS, CONDITION_REFS, "condition")
+
+    def link_condition(self, spec: dict) -> Condition:
+        """Замыкание условия, уже прошедшего check_condition."""
+        linked = LINKED_CONDITIONS.get(spec["type"])
+        if linked is not None:
+            return linked(spec, self)
+        return CONDITIONS[spec["type"]](spec)
+
+    def broken_condition(self, spec: dict) -> Condition:
+        return _never
+
+    def condition(self, where: str, spec: dict) -> Condition:
+        if not self.check_condition(where, spec):
+            return _never
+        return self.link_condition(spec)
+
+    def effect(self, where: str, spec: dict) -> Effect:
+        if not self.check_spec(where, spec, EFFECTS, EFFECT_REFS, "effect"):
+            return _noop
+        linked = LINKED_EFFECTS.get(spec["type"])
+        if linked is not None:
+            return linked(spec, self)
+        return EFFECTS[spec["type"]](spec)
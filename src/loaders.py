@@ -1,18 +1,31 @@
+import hashlib
+import logging
+import marshal
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from collections.abc import Iterable
 from pathlib import Path
 from typing import Protocol
+
 import yaml
+
 from content_parts import RawContent
 
+logger = logging.getLogger(__name__)
+
 class Loader(Protocol):
-    @classmethod
-    def load(cls) -> RawContent: ...
+    # реализации - классы с classmethod load либо объекты с обычным методом
+    def load(self) -> RawContent: ...
 
 
 class YamlLoader(Loader):
     CONTENT_DIR = Path(__file__).resolve().parent / "world"
 
     @classmethod
-    def load(cls):
+    def load(cls) -> RawContent:
         with (cls.CONTENT_DIR / "items.yaml").open(mode="r", encoding="utf-8") as file:
             raw_item_data = yaml.safe_load(file.read())
         with (cls.CONTENT_DIR / "locations.yaml").open(mode="r", encoding="utf-8") as file:
@@ -30,4 +43,101 @@ class YamlLoader(Loader):
             locations=raw_location_data,
             inventory=raw_inventory_data,
             choices=raw_choices
-        )
\ No newline at end of file
+        )
+
+
+class SnapshotLoader(YamlLoader):
+    """
+    Загружает контент из бинарного снимка, скомпилированного из YAML.
+    Снимок привязан к хешу исходных файлов: если YAML поменялся, контент
+    читается заново и снимок перезаписывается.
+    """
+    SNAPSHOT_NAME = "content.snapshot"
+    MAGIC = b"HDCS"
+    FORMAT_VERSION = 1
+    # magic, версия формата, хеш исходников, длина данных
+    HEADER = struct.Struct("<4sH32sQ")
+    SECTIONS = ("items", "locations", "inventory", "choices")
+
+    @classmethod
+    def snapshot_path(cls) -> Path:
+        return cls.CONTENT_DIR / cls.SNAPSHOT_NAME
+
+    @classmethod
+    def source_hash(cls) -> bytes:
+        # marshal не совместим между версиями Python, поэтому версия входит в ключ
+        digest = hashlib.sha256()
+        digest.update(f"{cls.FORMAT_VERSION}:{sys.version_info[0]}.{sys.version_info[1]}".encode())
+        for path in sorted(cls.CONTENT_DIR.glob("*.yaml")):
+            digest.update(path.name.encode("utf-8"))
+            digest.update(path.read_bytes())
+        return digest.digest()
+
+    @classmethod
+    def load(cls) -> RawContent:
+        source_hash = cls.source_hash()
+        raw = cls.read_snapshot(source_hash)
+        if raw is None:
+            raw = super().load()
+            cls.write_snapshot(raw, source_hash)
+        return raw
+
+    @classmethod
+    def read_snapshot(cls, source_hash: bytes) -> RawContent | None:
+        try:
+            file = cls.snapshot_path().open(mode="rb")
+        except OSError:
+            return None
+        with file:
+            try:
+                mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # пустой файл mmap не отображает - снимка нет
+                return None
+        with mm:
+            if len(mm) < cls.HEADER.size:
+                return None
+            magic, version, stored_hash, length = cls.HEADER.unpack_from(mm)
+            if magic != cls.MAGIC or version != cls.FORMAT_VERSION or stored_hash != source_hash:
+                return None
+            if cls.HEADER.size + length > len(mm):
+                return None
+            with memoryview(mm)[cls.HEADER.size:cls.HEADER.size + length] as payload:
+                try:
+                    sections = marshal.loads(payload)
+                except (EOFError, ValueError, TypeError):
+                    return None
+        return RawContent(**sections)
+
+    @classmethod
+    def write_snapshot(cls, raw: RawContent, source_hash: bytes) -> None:
+        payload = marshal.dumps({name: getattr(raw, name) for name in cls.SECTIONS})
+        path = cls.snapshot_path()
+        try:
+            replace_file(path, (cls.HEADER.pack(cls.MAGIC, cls.FORMAT_VERSION, source_hash, len(payload)), payload))
+        except OSError as e:
+            # директория только для чтения - контент просто читается из YAML
+            logger.warning("content snapshot %s is not written: %s", path, e)
+
+
+def replace_file(path: Path, chunks: Iterable[bytes]) -> None:
+    """
+    Записывает файл целиком через временный файл рядом и os.replace:
+    читатели видят старую или новую версию, параллельные писатели не
+    затирают чужие временные файлы.
+    """
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp", delete=False) as file:
+        temp = Path(file.name)
+        try:
+            for chunk in chunks:
+                file.write(chunk)
+            file.close()
+            os.replace(temp, path)
+        except BaseException:
+            temp.unlink(missing_ok=True)
+            raise
+
+
+def loader_for[L: YamlLoader](base: type[L], content_dir: Path) -> type[L]:
+    """Загрузчик base, читающий контент из другой директории."""
+    return type(base.__name__, (base,), {"CONTENT_DIR": content_dir})
@@ -0,0 +1,4 @@
+from .batch import BatchEvaluator
+from .network import ChoiceMatcher, ConditionNetwork, ConditionNode
+
+__all__ = ["BatchEvaluator", "ChoiceMatcher", "ConditionNetwork", "ConditionNode"]
\ No newline at end of file
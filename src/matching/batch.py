@@ -0,0 +1,245 @@
+from collections.abc import Hashable, Iterable
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from definitions import (
+    ANY_FACT,
+    Choice,
+    Fact,
+    FactObserver,
+    GameState,
+    ItemId,
+    LocationId,
+    ObjectId,
+)
+from matching.network import ConditionNetwork, ConditionNode
+from overlay import FLAG_BITS
+
+if TYPE_CHECKING:
+    from content_parts import GameContent
+
+
+# способы векторной проверки узла
+HAS_ITEM = 0
+LOCKED = 1
+IN_LOCATION = 2
+IS_OPEN = 3
+IS_CLOSED = 4
+
+LOCKED_BIT = FLAG_BITS["locked"]
+OPEN_BIT = FLAG_BITS["open"]
+
+
+class BatchEvaluator:
+    """
+    Пакетная проверка доступности выборов сразу для многих сессий.
+    Сессия регистрируется через track: ее состояние один раз упаковывается
+    в строку массивов NumPy (есть ли предмет, биты объектов, текущая
+    локация - только то, что встречается в условиях), а дальше подписка на
+    факты GameState помечает строку грязной, и перед расчетом
+    перепаковываются только затронутые ячейки. Матрица доступности N x C
+    считается несколькими векторными операциями; связь выборов с узлами
+    хранится разреженно (CSR без значений), память линейна по числу условий.
+    Узлы, которые нельзя выразить через массивы (неизвестные типы условий,
+    ссылки на несуществующие или неоткрываемые объекты), проверяются
+    исходными замыканиями, поэтому результат совпадает с Choice.is_available.
+    """
+
+    def __init__(self, content: "GameContent", network: ConditionNetwork | None = None, capacity: int = 64) -> None:
+        self.content = content
+        self.network = network if network is not None else content.network
+        self.locations: dict[LocationId, int] = {lid: i for i, lid in enumerate(content.locations)}
+        self.item_columns: dict[ItemId, int] = {}
+        self.object_columns: dict[ObjectId, int] = {}
+
+        kinds: list[list[int]] = [[] for _ in range(5)]       # номера узлов по способу
+        columns: list[list[int]] = [[] for _ in range(5)]     # индексы в массивах сессий
+        self.fallback: list[ConditionNode] = []
+
+        for node in self.network.nodes:
+            ctype, frozen = node.key
+            params = dict(frozen) if isinstance(frozen, tuple) else {}
+            if ctype == "has_item":
+                col = self.item_columns.setdefault(ItemId(params["item"]), len(self.item_columns))
+                kinds[HAS_ITEM].append(node.index)
+                columns[HAS_ITEM].append(col)
+            elif ctype == "in_location" and params["location"] in self.locations:
+                kinds[IN_LOCATION].append(node.index)
+                columns[IN_LOCATION].append(self.locations[params["location"]])
+            elif ctype == "container_locked" and params["container"] in content.furniture:
+                col = self.object_columns.setdefault(ObjectId(params["container"]), len(self.object_columns))
+                kinds[LOCKED].append(node.index)
+                columns[LOCKED].append(col)
+            elif ctype in ("object_is_open", "object_is_closed") and self._openable(params["object"]):
+                col = self.object_columns.setdefault(ObjectId(params["object"]), len(self.object_columns))
+                kind = IS_OPEN if ctype == "object_is_open" else IS_CLOSED
+                kinds[kind].append(node.index)
+                columns[kind].append(col)
+            else:
+                self.fallback.append(node)
+
+        self.node_kinds = [np.array(k, dtype=np.intp) for k in kinds]
+        self.node_columns = [np.array(c, dtype=np.intp) for c in columns]
+        # узлы-замыкания: от каких фактов пересчитывать и какие - при любом изменении
+        self.fallback_by_fact: dict[Fact, list[int]] = {}
+        self.fallback_wildcard: list[int] = []
+        for col, node in enumerate(self.fallback):
+            if node.facts is None:
+                self.fallback_wildcard.append(col)
+            else:
+                for fact in node.facts:
+                    self.fallback_by_fact.setdefault(fact, []).append(col)
+
+        choice_nodes = self.network.choice_nodes
+        sizes = np.fromiter(map(len, choice_nodes), dtype=np.intp, count=len(choice_nodes))
+        # узлы выбора c - condition_nodes[starts[c]:starts[c] + sizes[c]]; выбор без условий доступен всегда,
+        # в reduceat идут только выборы с условиями - у пустого отрезка reduceat вернул бы чужой узел
+        self.condition_nodes = np.fromiter(
+            (n for nodes in choice_nodes for n in nodes), dtype=np.intp, count=int(sizes.sum())
+        )
+        self.conditional = np.flatnonzero(sizes)
+        self.condition_starts = (np.cumsum(sizes) - sizes)[self.conditional]
+
+        # упакованные сессии: строка на сессию, освободившиеся строки переиспользуются
+        capacity = max(capacity, 1)
+        # условия смотрят только, есть ли предмет, - количество не нужно
+        self.held = np.zeros((capacity, len(self.item_columns)), dtype=bool)
+        self.bits = np.zeros((capacity, len(self.object_columns)), dtype=np.uint8)
+        self.location = np.full(capacity, -1, dtype=np.intp)
+        self.fallback_values = np.zeros((capacity, len(self.fallback)), dtype=bool)
+        self.rows: dict[Hashable, int] = {}
+        self.states: dict[int, GameState] = {}
+        self.observers: dict[int, FactObserver] = {}
+        self.free: list[int] = []
+        self.dirty: dict[int, set[Fact]] = {}
+
+    def _openable(self, oid: str) -> bool:
+        odef = self.content.furniture.get(ObjectId(oid))
+        return odef is not None and odef.can_open
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.rows
+
+    # --- учет сессий ---
+
+    def track(self, key: Hashable, state: GameState) -> None:
+        """Упаковывает состояние сессии и подписывается на его изменения."""
+        if key in self.rows:
+            self.untrack(key)
+        row = self.free.pop() if self.free else self._grow()
+        self.rows[key] = row
+        self.states[row] = state
+        dirty = self.dirty
+
+        def observer(fact: Fact) -> None:
+            facts = dirty.get(row)
+            if facts is None:
+                facts = dirty[row] = set()
+            facts.add(fact)
+
+        self.observers[row] = observer
+        state.subscribe(observer)
+        self._pack(row, state)
+
+    def untrack(self, key: Hashable) -> None:
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        self.states.pop(row).unsubscribe(self.observers.pop(row))
+        self.dirty.pop(row, None)
+        self.free.append(row)
+
+    def _grow(self) -> int:
+        row = len(self.rows)
+        if row == len(self.location):
+            size = 2 * row
+            self.held = np.resize(self.held, (size, self.held.shape[1]))
+            self.bits = np.resize(self.bits, (size, self.bits.shape[1]))
+            self.location = np.resize(self.location, size)
+            self.fallback_values = np.resize(self.fallback_values, (size, self.fallback_values.shape[1]))
+        return row
+
+    # --- упаковка ---
+
+    def _pack(self, row: int, state: GameState) -> None:
+        inventory = state.inventory
+        for iid, col in self.item_columns.items():
+            self.held[row, col] = inventory.has(iid)
+        objects = state.objects
+        for oid, col in self.object_columns.items():
+            self.bits[row, col] = objects.bits(objects.index(oid))
+        self.location[row] = self.locations.get(state.current_location, -1)
+        for col in range(len(self.fallback)):
+            self._evaluate_fallback(row, state, col)
+
+    def _repack(self, row: int, facts: set[Fact]) -> None:
+        """Обновляет только ячейки, которые зависят от изменившихся фактов."""
+        state = self.states[row]
+        if ANY_FACT in facts:
+            self._pack(row, state)
+            return
+        recompute: set[int] = set(self.fallback_wildcard)
+        for fact in facts:
+            kind = fact[0]
+            if kind == "inventory":
+                col = self.item_columns.get(ItemId(fact[1]))
+                if col is not None:
+                    self.held[row, col] = state.inventory.has(ItemId(fact[1]))
+            elif kind == "object":
+                col = self.object_columns.get(ObjectId(fact[1]))
+                if col is not None:
+                    objects = state.objects
+                    self.bits[row, col] = objects.bits(objects.index(ObjectId(fact[1])))
+            elif kind == "location":
+                self.location[row] = self.locations.get(state.current_location, -1)
+            recompute.update(self.fallback_by_fact.get(fact, ()))
+        for col in recompute:
+            self._evaluate_fallback(row, state, col)
+
+    def _evaluate_fallback(self, row: int, state: GameState, col: int) -> None:
+        self.fallback_values[row, col] = bool(self.fallback[col].cond(state, self.content))
+
+    def _rows(self, keys: Iterable[Hashable]) -> np.ndarray:
+        """Номера строк сессий; перед этим перепаковывает измененные с прошлого расчета."""
+        rows = np.fromiter((self.rows[key] for key in keys), dtype=np.intp)
+        dirty = self.dirty
+        for row in rows.tolist():
+            facts = dirty.pop(row, None)
+            if facts:
+                self._repack(row, facts)
+        return rows
+
+    # --- расчет ---
+
+    def node_values(self, keys: Iterable[Hashable]) -> np.ndarray:
+        """Матрица N x узлы сети для сессий keys в этом порядке."""
+        rows = self._rows(keys)
+        held, bits, location = self.held[rows], self.bits[rows], self.location[rows]
+        values = np.zeros((len(rows), len(self.network.nodes)), dtype=bool)
+        kinds, cols = self.node_kinds, self.node_columns
+        values[:, kinds[HAS_ITEM]] = held[:, cols[HAS_ITEM]]
+        values[:, kinds[LOCKED]] = (bits[:, cols[LOCKED]] & LOCKED_BIT) != 0
+        values[:, kinds[IS_OPEN]] = (bits[:, cols[IS_OPEN]] & OPEN_BIT) != 0
+        values[:, kinds[IS_CLOSED]] = (bits[:, cols[IS_CLOSED]] & OPEN_BIT) == 0
+        values[:, kinds[IN_LOCATION]] = location[:, None] == cols[IN_LOCATION][None, :]
+        fallback = np.fromiter((node.index for node in self.fallback), dtype=np.intp, count=len(self.fallback))
+        values[:, fallback] = self.fallback_values[rows]
+        return values
+
+    def availability(self, keys: Iterable[Hashable]) -> np.ndarray:
+        """Матрица N x C: выбор network.choices[c] доступен в сессии keys[n]."""
+        values = self.node_values(keys)
+        available = np.ones((len(values), len(self.network.choice_nodes)), dtype=bool)
+        if len(self.conditional):
+            conditions = values[:, self.condition_nodes]
+            available[:, self.conditional] = np.logical_and.reduceat(conditions, self.condition_starts, axis=1)
+        return available
+
+    def available_choices(self, keys: Iterable[Hashable]) -> list[list[Choice]]:
+        matrix = self.availability(keys)
+        choices = self.network.choices
+        return [[choices[ci] for ci in np.flatnonzero(row)] for row in matrix]
@@ -0,0 +1,166 @@
+from array import array
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from conditions import CONDITION_FACTS, CONDITIONS
+from definitions import ANY_FACT, Choice, Condition, Fact, GameState
+
+if TYPE_CHECKING:
+    from content_parts import GameContent
+
+
+# тип условия (None, если не задан - такое отвергает линкер) и замороженные параметры
+NodeKey = tuple[str | None, Hashable]
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def node_key(spec: dict) -> NodeKey:
+    params = {k: v for k, v in spec.items() if k != "type"}
+    return spec.get("type"), _freeze(params)
+
+
+@dataclass
+class ConditionNode:
+    index: int
+    key: NodeKey
+    cond: Condition
+    facts: list[Fact] | None            # None - зависит от чего угодно
+    choices: list[int] = field(default_factory=list)
+
+
+class ConditionNetwork:
+    """
+    Дискриминационная сеть условий, общая для всех сессий.
+    Одинаковые условия (например, has_item rusty_key) разделяются между выборами,
+    а каждый узел знает, от каких фактов состояния он зависит.
+    """
+
+    def __init__(self) -> None:
+        self.nodes: list[ConditionNode] = []
+        self.node_by_key: dict[NodeKey, ConditionNode] = {}
+        self.nodes_by_fact: dict[Fact, list[ConditionNode]] = {}
+        self.wildcard_nodes: list[ConditionNode] = []
+        self.choices: list[Choice] = []
+        self.choice_nodes: list[list[int]] = []
+        self.choice_index: dict[str, int] = {}
+
+    def node(self, spec: dict, build: Callable[[dict], Condition] | None = None) -> ConditionNode:
+        """build собирает замыкание условия вместо CONDITIONS, например линкером."""
+        key = node_key(spec)
+        node = self.node_by_key.get(key)
+        if node is not None:
+            return node
+        ctype = spec.get("type")
+        facts = CONDITION_FACTS[ctype](spec) if ctype in CONDITION_FACTS else None
+        node = ConditionNode(index=len(self.nodes), key=key, cond=build(spec) if build else CONDITIONS[spec["type"]](spec), facts=facts)
+        self.nodes.append(node)
+        self.node_by_key[key] = node
+        if facts is None:
+            self.wildcard_nodes.append(node)
+        else:
+            for fact in facts:
+                self.nodes_by_fact.setdefault(fact, []).append(node)
+        return node
+
+    def add_choice(self, choice: Choice, nodes: list[ConditionNode]) -> None:
+        index = self.choice_index.get(choice.id)
+        if index is None:
+            index = len(self.choices)
+            self.choice_index[choice.id] = index
+            self.choices.append(choice)
+            self.choice_nodes.append([])
+        else:
+            # выбор переопределен - отвязываем старые узлы
+            for n in self.choice_nodes[index]:
+                self.nodes[n].choices.remove(index)
+            self.choices[index] = choice
+        unique = list(dict.fromkeys(node.index for node in nodes))
+        self.choice_nodes[index] = unique
+        for n in unique:
+            self.nodes[n].choices.append(index)
+
+    def affected_nodes(self, fact: Fact) -> list[ConditionNode]:
+        return self.nodes_by_fact.get(fact, [])
+
+
+class ChoiceMatcher:
+    """
+    Инкрементальный матчер доступных выборов для одной сессии.
+    Подписывается на изменения GameState и пересчитывает только те узлы сети,
+    факты которых затронули эффекты. Для каждого выбора хранится число
+    невыполненных условий; выбор доступен, когда счетчик равен нулю.
+    """
+
+    def __init__(self, network: ConditionNetwork, state: GameState, content: "GameContent") -> None:
+        self.network = network
+        self.state = state
+        self.content = content
+        # компактные массивы: состояние матчера на сессию - байт на узел и
+        # два байта на выбор (у выбора бывает больше 255 условий)
+        self.values = bytearray()
+        self.unsatisfied = array("H")
+        self.available: set[int] = set()
+        self.dirty: set[Fact] = set()
+        self._result: list[Choice] | None = None
+        self.reset()
+        state.subscribe(self.on_fact)
+
+    def detach(self) -> None:
+        self.state.unsubscribe(self.on_fact)
+
+    def on_fact(self, fact: Fact) -> None:
+        self.dirty.add(fact)
+
+    def reset(self) -> None:
+        network = self.network
+        self.values = bytearray(bool(node.cond(self.state, self.content)) for node in network.nodes)
+        self.unsatisfied = array("H", (
+            sum(1 for n in nodes if not self.values[n]) for nodes in network.choice_nodes
+        ))
+        self.available = {i for i, count in enumerate(self.unsatisfied) if count == 0}
+        self.dirty.clear()
+        self._result = None
+
+    def _update(self) -> None:
+        if len(self.unsatisfied) != len(self.network.choices) or ANY_FACT in self.dirty:
+            self.reset()
+            return
+        touched: dict[int, ConditionNode] = {}
+        for fact in self.dirty:
+            for node in self.network.affected_nodes(fact):
+                touched[node.index] = node
+        for node in self.network.wildcard_nodes:
+            touched[node.index] = node
+        self.dirty.clear()
+
+        for node in touched.values():
+            value = bool(node.cond(self.state, self.content))
+            if value == self.values[node.index]:
+                continue
+            self.values[node.index] = value
+            delta = -1 if value else 1
+            for ci in node.choices:
+                count = self.unsatisfied[ci] + delta
+                self.unsatisfied[ci] = count
+                if count == 0:
+                    self.available.add(ci)
+                else:
+                    self.available.discard(ci)
+            self._result = None
+
+    def available_choices(self) -> list[Choice]:
+        """Доступные выборы в порядке контента. Список общий для вызовов - не изменять."""
+        if self.dirty:
+            self._update()
+        if self._result is None:
+            choices = self.network.choices
+            self._result = [choices[i] for i in sorted(self.available)]
+        return self._result
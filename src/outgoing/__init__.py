@@ -0,0 +1,4 @@
+from .buckets import TokenBucket
+from .dispatcher import OutgoingDispatcher, keyboard, merge, parse_callback
+
+__all__ = ["OutgoingDispatcher", "TokenBucket", "keyboard", "merge", "parse_callback"]
@@ -0,0 +1,53 @@
+import asyncio
+import time
+from collections.abc import Callable
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate токенов в секунду, не больше capacity сразу.
+    pause() закрывает ведро на заданное время, после которого доступен ровно
+    один токен - так соблюдается retry_after из ответа 429.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0, clock: Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        start = max(self.updated, self.paused_until)
+        if now > start:
+            self.tokens = min(self.capacity, self.tokens + (now - start) * self.rate)
+        self.updated = max(now, self.updated)
+
+    def delay(self) -> float:
+        """Сколько секунд ждать до следующего токена; 0 - токен есть."""
+        now = self.clock()
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def try_take(self) -> bool:
+        if self.delay() > 0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+    async def acquire(self) -> None:
+        # проверка и списание идут без await между ними, поэтому атомарны в цикле событий
+        while (wait := self.delay()) > 0:
+            await asyncio.sleep(wait)
+        self.tokens -= 1.0
+
+    def pause(self, seconds: float) -> None:
+        now = self.clock()
+        self._refill(now)
+        self.tokens = 1.0
+        self.paused_until = max(self.paused_until, now + seconds)
@@ -0,0 +1,210 @@
+"""
+Исходящие сообщения Telegram.
+
+Весь вывод хода уходит одним сообщением с inline-клавиатурой из опций.
+Если локация не сменилась, предыдущее сообщение редактируется, а не
+отправляется новое. Вывод, накопившийся для чата, пока он ждал очереди,
+склеивается в одно сообщение. Каждая попытка отправки, включая повторы,
+берет токен из ведра чата и из ведра бота целиком; на 429 ведро чата
+закрывается на retry_after. Сообщение, которое API отвергло (например,
+400 Bad Request), пропускается, а очередь чата продолжает отправляться.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from definitions import LocationId
+from engine import Reply
+from instrumentation import STATS
+from outgoing.buckets import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+ChatId = int
+
+MESSAGE_LIMIT = 4096
+# лимиты Bot API: около сообщения в секунду в чат и 30 в секунду на бота
+CHAT_RATE = 1.0
+CHAT_BURST = 2.0
+GLOBAL_RATE = 30.0
+MAX_ATTEMPTS = 5
+
+
+def keyboard(reply: Reply) -> InlineKeyboardMarkup | None:
+    if not reply.options:
+        return None
+    # номер хода в данных кнопки отсекает нажатия на кнопки старых сообщений
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=text, callback_data=f"{reply.turn}:{n}")]
+        for n, text in reply.options
+    ])
+
+
+def parse_callback(data: str) -> tuple[int, str] | None:
+    turn, sep, option = data.partition(":")
+    if not sep or not turn.isdigit():
+        return None
+    return int(turn), option
+
+
+def merge(replies: list[Reply]) -> Reply:
+    """Склеивает вывод нескольких ходов; опции и локация - от последнего."""
+    last = replies[-1]
+    text = "\n\n".join(r.text for r in replies)
+    if len(text) > MESSAGE_LIMIT:
+        # старые ходы не помещаются - экран последнего важнее
+        text = last.text
+    if len(text) > MESSAGE_LIMIT:
+        text = text[:MESSAGE_LIMIT - 1] + "…"
+    return Reply(text=text, options=last.options, location=last.location, turn=last.turn)
+
+
+@dataclass
+class Outbox:
+    bucket: TokenBucket
+    pending: list[Reply] = field(default_factory=list)
+    # все ожидающие ответы разрешают правку предыдущего сообщения
+    editable: bool = True
+    queued_at: float = 0.0
+    message_id: int | None = None
+    location: LocationId | None = None
+    worker: asyncio.Task | None = None
+
+
+class OutgoingDispatcher:
+
+    def __init__(
+        self,
+        bot: Bot,
+        chat_rate: float = CHAT_RATE,
+        chat_burst: float = CHAT_BURST,
+        global_rate: float = GLOBAL_RATE,
+        max_attempts: int = MAX_ATTEMPTS,
+    ) -> None:
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        # очередь на общее ведро честная: ждущие чаты проходят по порядку
+        self.global_lock = asyncio.Lock()
+        self.outboxes: dict[ChatId, Outbox] = {}
+
+    def submit(self, chat_id: ChatId, reply: Reply, edit: bool = True) -> None:
+        """
+        Ставит вывод хода в очередь чата. edit=False запрещает править
+        предыдущее сообщение (например, после текстовой команды пользователя).
+        """
+        outbox = self.outboxes.get(chat_id)
+        if outbox is None:
+            outbox = self.outboxes[chat_id] = Outbox(TokenBucket(self.chat_rate, self.chat_burst))
+        if not outbox.pending:
+            outbox.queued_at = time.perf_counter()
+        else:
+            STATS.count("outgoing.coalesced")
+        outbox.pending.append(reply)
+        outbox.editable = outbox.editable and edit
+        if outbox.worker is None:
+            outbox.worker = asyncio.create_task(self._drain(chat_id, outbox))
+
+    def forget(self, chat_id: ChatId) -> None:
+        """Забывает чат без ожидающего вывода (например, при выгрузке сессии)."""
+        outbox = self.outboxes.get(chat_id)
+        if outbox is not None and outbox.worker is None:
+            del self.outboxes[chat_id]
+
+    async def join(self) -> None:
+        """Ждет, пока будет отправлено все, что стоит в очередях."""
+        while workers := [o.worker for o in self.outboxes.values() if o.worker is not None]:
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _drain(self, chat_id: ChatId, outbox: Outbox) -> None:
+        try:
+            while outbox.pending:
+                await self._acquire(outbox)
+                # все, что пришло за время ожидания, уходит одним сообщением
+                replies, outbox.pending = outbox.pending, []
+                editable, outbox.editable = outbox.editable, True
+                STATS.record("outgoing.queue_delay", int((time.perf_counter() - outbox.queued_at) * 1e9))
+                try:
+                    await self._deliver(chat_id, outbox, replies, editable)
+                except TelegramAPIError as e:
+                    # повтор не поможет - теряется только это сообщение
+                    STATS.count("outgoing.rejected")
+                    logger.error("chat %s: output rejected (%s)", chat_id, e.message)
+        except Exception:
+            logger.exception("outgoing worker for chat %s failed", chat_id)
+        finally:
+            outbox.worker = None
+
+    async def _acquire(self, outbox: Outbox) -> None:
+        await outbox.bucket.acquire()
+        async with self.global_lock:
+            await self.global_bucket.acquire()
+
+    async def _deliver(self, chat_id: ChatId, outbox: Outbox, replies: list[Reply], editable: bool) -> None:
+        reply = merge(replies)
+        edit = (
+            editable
+            and outbox.message_id is not None
+            and all(r.location == outbox.location for r in replies)
+        )
+        for attempt in range(1, self.max_attempts + 1):
+            # токены первой попытки взял _drain
+            if attempt > 1:
+                await self._acquire(outbox)
+            try:
+                with STATS.timer("outgoing.send"):
+                    if edit:
+                        edit = await self._edit(chat_id, outbox, reply)
+                    if not edit:
+                        message = await self.bot.send_message(chat_id, reply.text, reply_markup=keyboard(reply))
+                        outbox.message_id = message.message_id
+                        STATS.count("outgoing.sent")
+                outbox.location = reply.location
+                return
+            except TelegramRetryAfter as e:
+                STATS.count("outgoing.retry_after")
+                logger.warning("chat %s: flood limit, retry after %ss", chat_id, e.retry_after)
+                outbox.bucket.pause(e.retry_after)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                STATS.count("outgoing.error")
+                logger.warning("chat %s: send failed (%s), attempt %d", chat_id, e, attempt)
+                await asyncio.sleep(min(2 ** attempt * 0.5, 30.0))
+            except TelegramForbiddenError:
+                # бот заблокирован пользователем - отправлять некуда
+                STATS.count("outgoing.forbidden")
+                outbox.message_id = None
+                return
+        STATS.count("outgoing.dropped")
+        logger.error("chat %s: output dropped after %d attempts", chat_id, self.max_attempts)
+
+    async def _edit(self, chat_id: ChatId, outbox: Outbox, reply: Reply) -> bool:
+        """Правит предыдущее сообщение; False - править нельзя, нужно отправить новое."""
+        try:
+            await self.bot.edit_message_text(
+                text=reply.text,
+                chat_id=chat_id,
+                message_id=outbox.message_id,
+                reply_markup=keyboard(reply),
+            )
+        except TelegramBadRequest as e:
+            if "message is not modified" in e.message:
+                STATS.count("outgoing.unchanged")
+                return True
+            logger.debug("chat %s: edit failed (%s), sending instead", chat_id, e.message)
+            return False
+        STATS.count("outgoing.edited")
+        return True
@@ -0,0 +1,280 @@
+"""
+Локальный сервер, изображающий Bot API, для проверки бота без Telegram.
+
+Понимает getMe, getUpdates, deleteWebhook, sendMessage, editMessageText и
+answerCallbackQuery, записывает все вызовы и, как настоящий API, отвечает
+429 с retry_after, если чат или бот превышают лимит отправки.
+Входящие обновления добавляются через push_message и push_callback;
+listeners узнают об отправленных и исправленных ботом сообщениях сразу,
+без разбора calls (так их ждет нагрузочный тест benchmarks.load).
+
+    python -m outgoing.fake_api --port 8081
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_TOKEN=1:fake python bot.py
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiohttp import web
+
+from outgoing.buckets import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+FLOOD_METHODS = {"sendMessage", "editMessageText"}
+
+# (метод, id чата, сообщение или параметры вызова)
+Listener = Callable[[str, int, dict[str, Any]], None]
+
+
+@dataclass
+class Call:
+    method: str
+    params: dict[str, Any]
+    at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class ChatLog:
+    """Что видит пользователь: текущие тексты и клавиатуры сообщений бота."""
+    messages: dict[int, dict[str, Any]] = field(default_factory=dict)
+    last_message_id: int | None = None
+
+
+class FakeBotAPI:
+
+    def __init__(
+        self,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        global_rate: float = 30.0,
+        enforce_limits: bool = True,
+        record_calls: bool = True,
+        keep_messages: int | None = None,
+    ) -> None:
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.enforce_limits = enforce_limits
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets: dict[int, TokenBucket] = {}
+        # долгим прогонам журнал вызовов и старые сообщения не нужны
+        self.record_calls = record_calls
+        self.keep_messages = keep_messages
+        self.calls: list[Call] = []
+        self.chats: dict[int, ChatLog] = {}
+        self.listeners: list[Listener] = []
+        self.too_many = 0
+        self.updates: asyncio.Queue[dict] = asyncio.Queue()
+        # первый getUpdates - бот запущен и слушает
+        self.polling = asyncio.Event()
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.runner: web.AppRunner | None = None
+        self.url = ""
+
+    # --- входящие обновления ---
+
+    def push_message(self, chat_id: int, text: str) -> int:
+        """Возвращает update_id."""
+        return self._push({"message": self._message(chat_id, text, from_user=True)})
+
+    def push_callback(self, chat_id: int, message_id: int, data: str) -> int:
+        """Возвращает update_id; он же id запроса в answerCallbackQuery."""
+        message = self.chats[chat_id].messages[message_id]
+        return self._push({"callback_query": {
+            "id": str(self.next_update_id),
+            "from": self._user(chat_id),
+            "chat_instance": str(chat_id),
+            "message": {**message, "message_id": message_id},
+            "data": data,
+        }})
+
+    def _push(self, update: dict) -> int:
+        update_id = update["update_id"] = self.next_update_id
+        self.next_update_id += 1
+        self.updates.put_nowait(update)
+        return update_id
+
+    # --- сервер ---
+
+    @property
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        server = site._server
+        if not isinstance(server, asyncio.Server):
+            raise TypeError("fake Bot API server did not start")
+        sockname = server.sockets[0].getsockname()
+        self.url = f"http://{host}:{sockname[1]}"
+        return self.url
+
+    async def stop(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = {k: _decode(v) for k, v in (await request.post()).items()}
+        if self.record_calls:
+            self.calls.append(Call(method, params))
+        if method in FLOOD_METHODS and self.enforce_limits:
+            wait = self._flood_wait(int(params["chat_id"]))
+            if wait:
+                self.too_many += 1
+                return web.json_response({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {wait}",
+                    "parameters": {"retry_after": wait},
+                }, status=429)
+        handler = getattr(self, f"api_{method}", None)
+        if handler is None:
+            return _error(404, f"Not Found: method {method} not found")
+        result = await handler(params)
+        if isinstance(result, web.Response):
+            return result
+        return web.json_response({"ok": True, "result": result})
+
+    def _flood_wait(self, chat_id: int) -> int:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        wait = max(bucket.delay(), self.global_bucket.delay())
+        if wait > 0:
+            return math.ceil(wait)
+        bucket.try_take()
+        self.global_bucket.try_take()
+        return 0
+
+    # --- методы ---
+
+    async def api_getMe(self, params: dict) -> dict:
+        return {"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"}
+
+    async def api_deleteWebhook(self, params: dict) -> bool:
+        return True
+
+    async def api_getUpdates(self, params: dict) -> list[dict]:
+        self.polling.set()
+        timeout = float(params.get("timeout") or 0)
+        updates: list[dict] = []
+        try:
+            updates.append(await asyncio.wait_for(self.updates.get(), timeout) if timeout else self.updates.get_nowait())
+        except (TimeoutError, asyncio.QueueEmpty):
+            return []
+        while not self.updates.empty():
+            updates.append(self.updates.get_nowait())
+        return updates
+
+    async def api_sendMessage(self, params: dict) -> dict:
+        chat_id = int(params["chat_id"])
+        message = self._message(chat_id, params["text"], reply_markup=params.get("reply_markup"))
+        log = self.chats.setdefault(chat_id, ChatLog())
+        log.messages[message["message_id"]] = message
+        log.last_message_id = message["message_id"]
+        if self.keep_messages is not None and len(log.messages) > self.keep_messages:
+            del log.messages[next(iter(log.messages))]
+        self._notify("sendMessage", chat_id, message)
+        return message
+
+    async def api_editMessageText(self, params: dict) -> dict | web.Response:
+        chat_id = int(params["chat_id"])
+        log = self.chats.get(chat_id)
+        message = log.messages.get(int(params["message_id"])) if log is not None else None
+        if message is None:
+            return _error(400, "Bad Request: message to edit not found")
+        markup = params.get("reply_markup")
+        if message["text"] == params["text"] and message.get("reply_markup") == markup:
+            return _error(400, "Bad Request: message is not modified")
+        message["text"] = params["text"]
+        message["edit_date"] = int(time.time())
+        if markup is None:
+            message.pop("reply_markup", None)
+        else:
+            message["reply_markup"] = markup
+        self._notify("editMessageText", chat_id, message)
+        return message
+
+    async def api_answerCallbackQuery(self, params: dict) -> bool:
+        # чата в параметрах нет - слушатель узнает его по callback_query_id
+        self._notify("answerCallbackQuery", 0, params)
+        return True
+
+    def _notify(self, method: str, chat_id: int, payload: dict[str, Any]) -> None:
+        for listener in self.listeners:
+            listener(method, chat_id, payload)
+
+    def _message(self, chat_id: int, text: str, from_user: bool = False, reply_markup: Any = None) -> dict:
+        message: dict[str, Any] = {
+            "message_id": self.next_message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+        }
+        self.next_message_id += 1
+        if from_user:
+            message["from"] = self._user(chat_id)
+            if text.startswith("/"):
+                command = text.split()[0]
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        else:
+            message["from"] = {"id": 1, "is_bot": True, "first_name": "fake"}
+        if reply_markup is not None:
+            message["reply_markup"] = reply_markup
+        return message
+
+    @staticmethod
+    def _user(chat_id: int) -> dict:
+        return {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"}
+
+
+def _decode(value: Any) -> Any:
+    # сложные параметры (reply_markup) aiogram передает строкой JSON
+    if isinstance(value, str) and value[:1] in "{[":
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _error(status: int, description: str) -> web.Response:
+    return web.json_response({"ok": False, "error_code": status, "description": description}, status=status)
+
+
+async def serve(host: str, port: int, enforce_limits: bool) -> None:
+    api = FakeBotAPI(enforce_limits=enforce_limits)
+    url = await api.start(host, port)
+    logger.info("fake Bot API at %s", url)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await api.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local fake Telegram Bot API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--no-limits", action="store_true", help="never answer 429")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(args.host, args.port, not args.no_limits))
+
+
+if __name__ == "__main__":
+    main()
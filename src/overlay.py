@@ -0,0 +1,494 @@
+from collections.abc import (
+    Collection,
+    Hashable,
+    Iterable,
+    Iterator,
+    Mapping,
+    MutableMapping,
+    Sequence,
+)
+from dataclasses import dataclass
+from functools import cached_property
+from itertools import repeat
+from typing import TYPE_CHECKING, Protocol
+
+from persistent import PersistentDict, PMap
+
+if TYPE_CHECKING:
+    from definitions import ItemId, LocationId, ObjectId, ObjectState
+
+
+# флаги объектов хранятся битами одного int
+FLAG_BITS: dict[str, int] = {
+    "locked": 1,
+    "open": 2,
+    "turned_on": 4,
+}
+
+# место, где может лежать предмет: ("location", id локации), ("object", id объекта) или инвентарь
+Place = tuple[str, str]
+INVENTORY: Place = ("inventory", "")
+
+
+def flags_to_bits(flags: Mapping[str, bool]) -> int:
+    bits = 0
+    for name, value in flags.items():
+        if name not in FLAG_BITS:
+            raise KeyError(f"Unknown object flag {name!r}")
+        if value:
+            bits |= FLAG_BITS[name]
+    return bits
+
+
+@dataclass(frozen=True)
+class StateDefaults:
+    """Неизменяемое начальное состояние мира, общее для всех сессий."""
+    start_location: "LocationId"
+    inventory: tuple[tuple["ItemId", int], ...]
+    object_ids: tuple["ObjectId", ...]
+    object_index: Mapping["ObjectId", int]
+    object_bits: tuple[int, ...]
+    object_items: tuple[tuple["ItemId", ...], ...]
+    location_items: Mapping["LocationId", tuple["ItemId", ...]]
+
+    @cached_property
+    def item_places(self) -> Mapping["ItemId", tuple[Place, ...]]:
+        """Начальные места предметов в локациях и объектах, место повторяется по числу экземпляров."""
+        places: dict[ItemId, list[Place]] = {}
+        for lid, items in self.location_items.items():
+            for iid in items:
+                places.setdefault(iid, []).append(("location", lid))
+        for oid, items in zip(self.object_ids, self.object_items):
+            for iid in items:
+                places.setdefault(iid, []).append(("object", oid))
+        return {iid: tuple(where) for iid, where in places.items()}
+
+
+class ItemBag:
+    """
+    Мультимножество предметов: счетчики в порядке первого появления.
+    Добавление, удаление и проверка - O(1); обход повторяет предмет
+    столько раз, сколько его экземпляров, поэтому порядок стабилен.
+    """
+    __slots__ = ("counts", "size")
+
+    def __init__(self, items: Iterable["ItemId"] = ()) -> None:
+        self.counts: dict[ItemId, int] = {}
+        self.size = 0
+        for item in items:
+            self.add(item)
+
+    def add(self, item: "ItemId", qty: int = 1) -> None:
+        self.counts[item] = self.counts.get(item, 0) + qty
+        self.size += qty
+
+    def remove(self, item: "ItemId", qty: int = 1) -> None:
+        have = self.counts.get(item, 0)
+        if have < qty:
+            raise ValueError(f"{item!r} not in bag")
+        if have == qty:
+            del self.counts[item]
+        else:
+            self.counts[item] = have - qty
+        self.size -= qty
+
+    def count(self, item: "ItemId") -> int:
+        return self.counts.get(item, 0)
+
+    def clear(self) -> None:
+        self.counts.clear()
+        self.size = 0
+
+    def __contains__(self, item: object) -> bool:
+        return item in self.counts
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator["ItemId"]:
+        for item, qty in self.counts.items():
+            if qty == 1:
+                yield item
+            else:
+                yield from repeat(item, qty)
+
+    def __eq__(self, other: object) -> bool:
+        # сравнение как мультимножеств: порядок не важен
+        if isinstance(other, ItemBag):
+            return self.counts == other.counts
+        if isinstance(other, (list, tuple)):
+            return self.size == len(other) and self.counts == ItemBag(other).counts
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"ItemBag({list(self)!r})"
+
+
+# предметы места в оверлее: ItemBag или, пока не изменены, кортеж/список из снимка
+Items = ItemBag | Sequence["ItemId"]
+
+
+class ItemsDefaults[K](Protocol):
+    """Предметы мест по умолчанию: словарь локаций или кортеж по номерам объектов."""
+    def __getitem__(self, key: K, /) -> tuple["ItemId", ...]: ...
+
+
+class ItemsView[K: Hashable](Collection["ItemId"]):
+    """
+    Предметы одного места поверх значения по умолчанию.
+    Пока их не меняли, читается кортеж из контента; первая запись копирует
+    его в мультимножество оверлея сессии. Методы - как у list, но без
+    позиций: append и remove - O(1).
+    """
+    __slots__ = ("_key", "_overlay")
+
+    def __init__(self, overlay: "ItemsOverlay[K]", key: K) -> None:
+        self._overlay = overlay
+        self._key = key
+
+    def _read(self) -> Items:
+        return self._overlay.read(self._key)
+
+    def __len__(self) -> int:
+        return len(self._read())
+
+    def __iter__(self) -> Iterator["ItemId"]:
+        return iter(self._read())
+
+    def __contains__(self, value: object) -> bool:
+        return value in self._read()
+
+    def count(self, value: "ItemId") -> int:
+        return self._read().count(value)
+
+    def append(self, value: "ItemId") -> None:
+        self._overlay.add(self._key, value)
+
+    def extend(self, values: Iterable["ItemId"]) -> None:
+        for value in values:
+            self._overlay.add(self._key, value)
+
+    def remove(self, value: "ItemId") -> None:
+        self._overlay.remove(self._key, value)
+
+    def clear(self) -> None:
+        self._overlay.assign(self._key, ())
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ItemsView):
+            other = other._read()
+        if not isinstance(other, Iterable):
+            return NotImplemented
+        # как у ItemBag: мультимножества, порядок не важен
+        return ItemBag(self._read()) == (other if isinstance(other, ItemBag) else list(other))
+
+    def __repr__(self) -> str:
+        return repr(list(self._read()))
+
+
+class ItemsOverlay[K: Hashable]:
+    """
+    Разреженный copy-on-write оверлей предметов по местам.
+    Измененные места лежат в персистентном словаре; после снимка (freeze)
+    значения общие со снимком, и первая запись в каждое снова его копирует.
+    Значения - ItemBag, у восстановленных из снимков и хранилища - любые
+    последовательности, пока их не изменят.
+
+    places - обратный индекс измененных мест: предмет -> {ключ места: сколько};
+    строится по первому запросу и дальше правится вместе с записями.
+    drift - для своих значений: сколько экземпляров отличает их от значения
+    по умолчанию; правится при каждой записи, и место возвращается к
+    умолчанию, когда он падает до нуля, без сравнения мультимножеств.
+    """
+    __slots__ = ("changed", "defaults", "drift", "owned", "places")
+
+    def __init__(self, defaults: ItemsDefaults[K]) -> None:
+        self.defaults = defaults
+        self.changed: PersistentDict[K, Items] = PersistentDict()
+        # значения, которые принадлежат только этому оверлею и правятся на месте
+        # (dict вместо set: пустой dict втрое меньше пустого set)
+        self.owned: dict[K, ItemBag] = {}
+        self.drift: dict[K, int] = {}
+        self.places: dict[ItemId, dict[K, int]] | None = None
+
+    def read(self, key: K) -> Items:
+        changed = self.changed.get(key)
+        if changed is not None:
+            return changed
+        return self.defaults[key]
+
+    def write(self, key: K) -> ItemBag:
+        owned = self.owned.get(key)
+        if owned is not None:
+            return owned
+        items = ItemBag(self.read(key))
+        if key not in self.changed:
+            self._index(key, items, 1)
+        self.changed[key] = items
+        self.owned[key] = items
+        self.drift[key] = self._drift(key, items)
+        return items
+
+    def _drift(self, key: K, items: ItemBag) -> int:
+        default = ItemBag(self.defaults[key])
+        missing = sum(qty for item, qty in default.counts.items() if item not in items)
+        return missing + sum(abs(qty - default.count(item)) for item, qty in items.counts.items())
+
+    def _move(self, key: K, item: "ItemId", qty: int) -> None:
+        bag = self.write(key)
+        have = bag.count(item)
+        if qty > 0:
+            bag.add(item, qty)
+        else:
+            bag.remove(item, -qty)
+        # предметов места по умолчанию единицы - count по кортежу дешевле словаря
+        expected = self.defaults[key].count(item)
+        drift = self.drift[key] + abs(have + qty - expected) - abs(have - expected)
+        self.drift[key] = drift
+        self._place(item, key, qty)
+        if not drift:
+            # вернулись к значению по умолчанию - оверлей больше не нужен
+            self.reset(key)
+
+    def add(self, key: K, item: "ItemId", qty: int = 1) -> None:
+        self._move(key, item, qty)
+
+    def remove(self, key: K, item: "ItemId", qty: int = 1) -> None:
+        if self.read(key).count(item) < qty:
+            raise ValueError(f"{item!r} not in {key!r}")
+        self._move(key, item, -qty)
+
+    def assign(self, key: K, items: Iterable["ItemId"]) -> None:
+        self.reset(key)
+        bag = self.changed[key] = self.owned[key] = ItemBag(items)
+        self._index(key, bag, 1)
+        self.drift[key] = self._drift(key, bag)
+        if not self.drift[key]:
+            self.reset(key)
+
+    def reset(self, key: K) -> None:
+        items = self.changed.get(key)
+        if items is not None:
+            self._index(key, items, -1)
+            self.changed.discard(key)
+        self.owned.pop(key, None)
+        self.drift.pop(key, None)
+
+    def holders(self, item: "ItemId") -> Mapping[K, int]:
+        """Измененные места, где лежит предмет: ключ -> количество."""
+        if self.places is None:
+            self.places = {}
+            for key, items in self.changed.items():
+                self._index(key, items, 1)
+        return self.places.get(item, {})
+
+    def _index(self, key: K, items: Iterable["ItemId"], sign: int) -> None:
+        if self.places is not None:
+            for item in items:
+                self._place(item, key, sign)
+
+    def _place(self, item: "ItemId", key: K, qty: int) -> None:
+        if self.places is None:
+            return
+        holders = self.places.setdefault(item, {})
+        qty += holders.get(key, 0)
+        if qty:
+            holders[key] = qty
+        else:
+            del holders[key]
+            if not holders:
+                del self.places[item]
+
+    def freeze(self) -> PMap[K, Items]:
+        """Текущие отличия как неизменяемое значение, O(1)."""
+        self.owned = {}
+        self.drift = {}
+        return self.changed.freeze()
+
+    def restore(self, changed: PMap[K, Items]) -> None:
+        self.changed = PersistentDict(changed)
+        self.owned = {}
+        self.drift = {}
+        self.places = None
+
+    def copy(self) -> "ItemsOverlay[K]":
+        clone = ItemsOverlay(self.defaults)
+        self.owned = {}
+        self.drift = {}
+        clone.changed = self.changed.copy()
+        return clone
+
+
+class FlagsView(MutableMapping[str, bool]):
+    __slots__ = ("_index", "_objects")
+
+    def __init__(self, objects: "ObjectStates", index: int) -> None:
+        self._objects = objects
+        self._index = index
+
+    def __getitem__(self, name: str) -> bool:
+        return bool(self._objects.bits(self._index) & FLAG_BITS[name])
+
+    def __setitem__(self, name: str, value: bool) -> None:
+        bit = FLAG_BITS[name]
+        bits = self._objects.bits(self._index)
+        self._objects.set_bits(self._index, bits | bit if value else bits & ~bit)
+
+    def __delitem__(self, name: str) -> None:
+        self[name] = False
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(FLAG_BITS)
+
+    def __len__(self) -> int:
+        return len(FLAG_BITS)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class ObjectView:
+    """Фасад ObjectState для объекта, хранящегося в ObjectStates."""
+    __slots__ = ("_index", "_objects")
+
+    def __init__(self, objects: "ObjectStates", index: int) -> None:
+        self._objects = objects
+        self._index = index
+
+    @property
+    def flags(self) -> FlagsView:
+        return FlagsView(self._objects, self._index)
+
+    @flags.setter
+    def flags(self, value: Mapping[str, bool]) -> None:
+        self._objects.set_bits(self._index, flags_to_bits(value))
+
+    @property
+    def items(self) -> ItemsView[int]:
+        return ItemsView(self._objects.contents, self._index)
+
+    @items.setter
+    def items(self, value: list["ItemId"]) -> None:
+        self._objects.contents.assign(self._index, value)
+
+    def __repr__(self) -> str:
+        return f"ObjectState(flags={self.flags!r}, items={self.items!r})"
+
+
+class ObjectStates(MutableMapping):
+    """
+    Состояния объектов сессии: битовые флаги, проиндексированные номером объекта,
+    и предметы внутри. Хранятся только отличия от StateDefaults.
+    """
+    __slots__ = ("changed_bits", "contents", "defaults")
+
+    def __init__(self, defaults: StateDefaults) -> None:
+        self.defaults = defaults
+        self.changed_bits: PersistentDict[int, int] = PersistentDict()
+        self.contents: ItemsOverlay[int] = ItemsOverlay(defaults.object_items)
+
+    def index(self, oid: "ObjectId") -> int:
+        return self.defaults.object_index[oid]
+
+    def bits(self, index: int) -> int:
+        bits = self.changed_bits.get(index)
+        if bits is None:
+            return self.defaults.object_bits[index]
+        return bits
+
+    def set_bits(self, index: int, bits: int) -> None:
+        if bits == self.defaults.object_bits[index]:
+            self.changed_bits.discard(index)
+        else:
+            self.changed_bits[index] = bits
+
+    def __getitem__(self, oid: "ObjectId") -> ObjectView:
+        return ObjectView(self, self.defaults.object_index[oid])
+
+    def __setitem__(self, oid: "ObjectId", value: "ObjectState | ObjectView") -> None:
+        index = self.defaults.object_index[oid]
+        self.set_bits(index, flags_to_bits(value.flags))
+        self.contents.assign(index, value.items)
+
+    def __delitem__(self, oid: "ObjectId") -> None:
+        # удаление сбрасывает объект к состоянию из контента
+        index = self.defaults.object_index[oid]
+        self.changed_bits.discard(index)
+        self.contents.reset(index)
+
+    def __iter__(self) -> Iterator["ObjectId"]:
+        return iter(self.defaults.object_ids)
+
+    def __len__(self) -> int:
+        return len(self.defaults.object_ids)
+
+    def __contains__(self, oid: object) -> bool:
+        return oid in self.defaults.object_index
+
+    def freeze(self) -> tuple[PMap[int, int], PMap[int, Items]]:
+        return self.changed_bits.freeze(), self.contents.freeze()
+
+    def restore(self, frozen: tuple[PMap[int, int], PMap[int, Items]]) -> None:
+        bits, items = frozen
+        self.changed_bits = PersistentDict(bits)
+        self.contents.restore(items)
+
+    def copy(self) -> "ObjectStates":
+        clone = ObjectStates(self.defaults)
+        clone.changed_bits = self.changed_bits.copy()
+        clone.contents = self.contents.copy()
+        return clone
+
+    def __repr__(self) -> str:
+        return f"ObjectStates(changed={len(self.changed_bits) + len(self.contents.changed)})"
+
+
+class LocationItems(MutableMapping):
+    """Предметы, лежащие в локациях; хранятся только измененные списки."""
+    __slots__ = ("contents", "defaults")
+
+    def __init__(self, defaults: StateDefaults) -> None:
+        self.defaults = defaults
+        self.contents: ItemsOverlay[LocationId] = ItemsOverlay(defaults.location_items)
+
+    def __getitem__(self, lid: "LocationId") -> ItemsView["LocationId"]:
+        if lid not in self.defaults.location_items:
+            raise KeyError(lid)
+        return ItemsView(self.contents, lid)
+
+    def __setitem__(self, lid: "LocationId", value: list["ItemId"]) -> None:
+        if lid not in self.defaults.location_items:
+            raise KeyError(lid)
+        self.contents.assign(lid, value)
+
+    def __delitem__(self, lid: "LocationId") -> None:
+        self.contents.reset(lid)
+
+    def __iter__(self) -> Iterator["LocationId"]:
+        return iter(self.defaults.location_items)
+
+    def __len__(self) -> int:
+        return len(self.defaults.location_items)
+
+    def __contains__(self, lid: object) -> bool:
+        return lid in self.defaults.location_items
+
+    def untouched(self, lid: "LocationId") -> bool:
+        """В локации лежит то же, что в контенте."""
+        return lid not in self.contents.changed
+
+    def freeze(self) -> PMap["LocationId", Items]:
+        return self.contents.freeze()
+
+    def restore(self, frozen: PMap["LocationId", Items]) -> None:
+        self.contents.restore(frozen)
+
+    def copy(self) -> "LocationItems":
+        clone = LocationItems(self.defaults)
+        clone.contents = self.contents.copy()
+        return clone
+
+    def __repr__(self) -> str:
+        return f"LocationItems(changed={len(self.contents.changed)})"
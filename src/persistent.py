@@ -0,0 +1,382 @@
+"""
+Персистентные (неизменяемые, со структурным разделением) словари и множества.
+
+PMap - HAMT: префиксное дерево по 5 бит хеша ключа с битовой картой в каждом
+узле. set/delete возвращают новый словарь, копируя только узлы на пути
+к ключу, - O(log32 n); остальное дерево общее со старой версией. Поэтому
+"снимок" такого словаря - это просто ссылка на него.
+
+Маленькие словари (до FLAT_LIMIT ключей - типичные отличия сессии от
+контента) хранятся плоским dict, который копируется при записи: так чтение
+остается обычным dict.get, а копирование десятка ключей дешевле пути в дереве.
+
+PersistentDict и PersistentSet - изменяемые обертки для кода, который пишет
+в состояние как в обычный dict/set: каждая запись подменяет корень, а
+freeze() за O(1) отдает текущую неизменяемую версию.
+"""
+from collections.abc import (
+    Hashable,
+    Iterable,
+    Iterator,
+    Mapping,
+    MutableMapping,
+    MutableSet,
+)
+from typing import Any, final
+
+SHIFT = 5
+MASK = (1 << SHIFT) - 1
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+FLAT_LIMIT = 16
+
+# Any: возвращается и сравнивается там же, где значения словаря
+_MISSING: Any = object()
+
+# лист дерева: (hash, key, value)
+Leaf = tuple[int, Any, Any]
+
+
+@final
+class _Node:
+    """
+    Узел дерева. entries - по элементу на каждый взведенный бит bitmap:
+    лист (hash, key, value) или дочерний узел.
+    """
+    __slots__ = ("bitmap", "entries")
+
+    def __init__(self, bitmap: int, entries: tuple[Any, ...]) -> None:
+        self.bitmap = bitmap
+        self.entries = entries
+
+
+@final
+class _Collision:
+    """Листья с полностью совпавшим хешем."""
+    __slots__ = ("hash", "leaves")
+
+    def __init__(self, h: int, leaves: tuple[Leaf, ...]) -> None:
+        self.hash = h
+        self.leaves = leaves
+
+
+Tree = _Node | _Collision
+
+_EMPTY_NODE = _Node(0, ())
+
+
+def _hash(key: Hashable) -> int:
+    return hash(key) & HASH_MASK
+
+
+def _pair(shift: int, a: Leaf, b: Leaf) -> Tree:
+    """Узел из двух листьев с разными ключами."""
+    if shift >= HASH_BITS:
+        return _Collision(a[0], (a, b))
+    ia = (a[0] >> shift) & MASK
+    ib = (b[0] >> shift) & MASK
+    if ia == ib:
+        return _Node(1 << ia, (_pair(shift + SHIFT, a, b),))
+    if ia < ib:
+        return _Node((1 << ia) | (1 << ib), (a, b))
+    return _Node((1 << ia) | (1 << ib), (b, a))
+
+
+def _set(node: Tree, shift: int, leaf: Leaf) -> tuple[Tree, bool]:
+    """Возвращает новый узел и признак того, что ключ добавлен (а не заменен)."""
+    if type(node) is _Collision:
+        for n, old in enumerate(node.leaves):
+            if old[1] == leaf[1]:
+                if old[2] is leaf[2]:
+                    return node, False
+                return _Collision(node.hash, node.leaves[:n] + (leaf,) + node.leaves[n + 1:]), False
+        return _Collision(node.hash, node.leaves + (leaf,)), True
+
+    bit = 1 << ((leaf[0] >> shift) & MASK)
+    pos = (node.bitmap & (bit - 1)).bit_count()
+    entries = node.entries
+    if not node.bitmap & bit:
+        return _Node(node.bitmap | bit, entries[:pos] + (leaf,) + entries[pos:]), True
+
+    entry = entries[pos]
+    child: Leaf | Tree
+    if type(entry) is tuple:
+        if entry[0] == leaf[0] and entry[1] == leaf[1]:
+            if entry[2] is leaf[2]:
+                return node, False
+            child, added = leaf, False
+        else:
+            child, added = _pair(shift + SHIFT, entry, leaf), True
+    else:
+        child, added = _set(entry, shift + SHIFT, leaf)
+        if child is entry:
+            return node, False
+    return _Node(node.bitmap, entries[:pos] + (child,) + entries[pos + 1:]), added
+
+
+def _delete(node: Tree, shift: int, h: int, key: Hashable) -> Leaf | Tree | None:
+    """Возвращает новый узел, None для опустевшего узла или _MISSING, если ключа нет."""
+    if type(node) is _Collision:
+        leaves = tuple(leaf for leaf in node.leaves if leaf[1] != key)
+        if len(leaves) == len(node.leaves):
+            return _MISSING
+        if len(leaves) == 1:
+            return leaves[0]
+        return _Collision(node.hash, leaves)
+
+    bit = 1 << ((h >> shift) & MASK)
+    if not node.bitmap & bit:
+        return _MISSING
+    pos = (node.bitmap & (bit - 1)).bit_count()
+    entry = node.entries[pos]
+    child: Leaf | Tree | None
+    if type(entry) is tuple:
+        if entry[0] != h or entry[1] != key:
+            return _MISSING
+        child = None
+    else:
+        child = _delete(entry, shift + SHIFT, h, key)
+        if child is _MISSING:
+            return _MISSING
+        # узел с единственным листом заменяем самим листом
+        if type(child) is _Node and len(child.entries) == 1 and type(child.entries[0]) is tuple:
+            child = child.entries[0]
+
+    if child is None:
+        bitmap = node.bitmap & ~bit
+        if not bitmap:
+            return None
+        return _Node(bitmap, node.entries[:pos] + node.entries[pos + 1:])
+    return _Node(node.bitmap, node.entries[:pos] + (child,) + node.entries[pos + 1:])
+
+
+def _leaves(node: Tree) -> Iterator[Leaf]:
+    entries: tuple[Any, ...] = node.leaves if type(node) is _Collision else node.entries
+    for entry in entries:
+        if type(entry) is tuple:
+            yield entry
+        else:
+            yield from _leaves(entry)
+
+
+class PMap[K: Hashable, V](Mapping[K, V]):
+    """Неизменяемый словарь со структурным разделением. _root - dict или узел HAMT."""
+    __slots__ = ("_root", "_size")
+    _root: dict[K, V] | Tree
+    _size: int
+
+    def __init__(self, items: Mapping[K, V] | Iterable[tuple[K, V]] = ()) -> None:
+        flat = dict(items.items() if isinstance(items, Mapping) else items)
+        if len(flat) <= FLAT_LIMIT:
+            self._root = flat
+        else:
+            self._root = _EMPTY_NODE
+            for key, value in flat.items():
+                self._root, _ = _set(self._root, 0, (_hash(key), key, value))
+        self._size = len(flat)
+
+    @classmethod
+    def _make(cls, root: "dict[K, V] | Tree", size: int) -> "PMap[K, V]":
+        pmap = cls.__new__(cls)
+        pmap._root = root
+        pmap._size = size
+        return pmap
+
+    def get(self, key: K, default: Any = None) -> Any:
+        node = self._root
+        if isinstance(node, dict):
+            return node.get(key, default)
+        h = _hash(key)
+        shift = 0
+        while True:
+            if type(node) is _Collision:
+                for leaf in node.leaves:
+                    if leaf[1] == key:
+                        return leaf[2]
+                return default
+            bit = 1 << ((h >> shift) & MASK)
+            if not node.bitmap & bit:
+                return default
+            entry = node.entries[(node.bitmap & (bit - 1)).bit_count()]
+            if type(entry) is tuple:
+                if entry[0] == h and entry[1] == key:
+                    return entry[2]
+                return default
+            node = entry
+            shift += SHIFT
+
+    def __getitem__(self, key: K) -> V:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        return self.get(key, _MISSING) is not _MISSING  # type: ignore[arg-type]
+
+    def __iter__(self) -> Iterator[K]:
+        if isinstance(self._root, dict):
+            yield from self._root
+            return
+        for leaf in _leaves(self._root):
+            yield leaf[1]
+
+    def __len__(self) -> int:
+        return self._size
+
+    # генератор, а не ItemsView: обход листьев дерева без поиска каждого ключа
+    def items(self) -> Iterator[tuple[K, V]]:  # type: ignore[override]
+        if isinstance(self._root, dict):
+            yield from self._root.items()
+            return
+        for leaf in _leaves(self._root):
+            yield leaf[1], leaf[2]
+
+    def set(self, key: K, value: V) -> "PMap[K, V]":
+        root = self._root
+        if isinstance(root, dict):
+            if root.get(key, _MISSING) is value:
+                return self
+            if key in root or len(root) < FLAT_LIMIT:
+                flat = dict(root)
+                flat[key] = value
+                return self._make(flat, len(flat))
+            return PMap(list(root.items()) + [(key, value)])
+        root, added = _set(root, 0, (_hash(key), key, value))
+        if root is self._root:
+            return self
+        return self._make(root, self._size + added)
+
+    def delete(self, key: K) -> "PMap[K, V]":
+        """Без ключа возвращает себя же."""
+        if isinstance(self._root, dict):
+            if key not in self._root:
+                return self
+            flat = dict(self._root)
+            del flat[key]
+            return self._make(flat, len(flat))
+        root = _delete(self._root, 0, _hash(key), key)
+        if root is _MISSING:
+            return self
+        if root is None:
+            return EMPTY
+        # лист возвращается только из узла коллизий, а корень - всегда _Node
+        assert not isinstance(root, tuple)
+        return self._make(root, self._size - 1)
+
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        if isinstance(other, Mapping):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"PMap({dict(self.items())!r})"
+
+
+EMPTY: PMap[Any, Any] = PMap()
+
+
+def freeze_map[K: Hashable, V](value: Mapping[K, V]) -> PMap[K, V]:
+    """Неизменяемая версия словаря: O(1) для PMap/PersistentDict, иначе копия."""
+    if isinstance(value, PMap):
+        return value
+    if isinstance(value, PersistentDict):
+        return value.freeze()
+    return PMap(value)
+
+
+class PersistentDict[K: Hashable, V](MutableMapping[K, V]):
+    """
+    Изменяемая обертка над PMap; снимок (freeze), копия и создание из PMap -
+    O(1): все они только делят корень. Чтения идут прямо в PMap - для
+    маленьких словарей это обычный dict.get, для больших - путь в дереве
+    O(log32 n); запись - O(log32 n) (до FLAT_LIMIT ключей - копия dict).
+    """
+    __slots__ = ("_map",)
+    _map: PMap[K, V]
+
+    def __init__(self, items: Mapping[K, V] | Iterable[tuple[K, V]] = ()) -> None:
+        if isinstance(items, PMap):
+            self._map = items
+        else:
+            flat = dict(items.items() if isinstance(items, Mapping) else items)
+            self._map = PMap(flat) if flat else EMPTY
+
+    def freeze(self) -> PMap[K, V]:
+        return self._map
+
+    def get(self, key: K, default: Any = None) -> Any:
+        return self._map.get(key, default)
+
+    def __getitem__(self, key: K) -> V:
+        return self._map[key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._map
+
+    def __setitem__(self, key: K, value: V) -> None:
+        self._map = self._map.set(key, value)
+
+    def __delitem__(self, key: K) -> None:
+        if key not in self._map:
+            raise KeyError(key)
+        self._map = self._map.delete(key)
+
+    def discard(self, key: K) -> None:
+        self._map = self._map.delete(key)
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(self._map)
+
+    def __len__(self) -> int:
+        return len(self._map)
+
+    # как у PMap: обход листьев без поиска каждого ключа
+    def items(self) -> Iterator[tuple[K, V]]:  # type: ignore[override]
+        return self._map.items()
+
+    def copy(self) -> "PersistentDict[K, V]":
+        clone: PersistentDict[K, V] = PersistentDict.__new__(PersistentDict)
+        clone._map = self._map
+        return clone
+
+    def __repr__(self) -> str:
+        return repr(dict(self._map.items()))
+
+
+class PersistentSet[T: Hashable](MutableSet[T]):
+    """Изменяемое множество поверх PersistentDict с ключами и значениями True."""
+    __slots__ = ("_items",)
+    _items: PersistentDict[T, bool]
+
+    def __init__(self, items: Iterable[T] | PMap[T, bool] = ()) -> None:
+        self._items = PersistentDict(items if isinstance(items, PMap) else ((item, True) for item in items))
+
+    def freeze(self) -> PMap[T, bool]:
+        return self._items.freeze()
+
+    def __contains__(self, item: object) -> bool:
+        return item in self._items
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, item: T) -> None:
+        if item not in self._items:
+            self._items[item] = True
+
+    def discard(self, item: T) -> None:
+        self._items.discard(item)
+
+    def copy(self) -> "PersistentSet[T]":
+        clone: PersistentSet[T] = PersistentSet.__new__(PersistentSet)
+        clone._items = self._items.copy()
+        return clone
+
+    def __repr__(self) -> str:
+        return repr(set(self._items))
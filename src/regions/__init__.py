@@ -0,0 +1,14 @@
+from .cache import Region, RegionalContentLoader, RegionCache, RegionMapping
+from .index import GLOBAL_REGION, RegionIndex, RegionLoader
+from .matcher import RegionalMatcher
+
+__all__ = [
+    "GLOBAL_REGION",
+    "Region",
+    "RegionCache",
+    "RegionIndex",
+    "RegionLoader",
+    "RegionMapping",
+    "RegionalContentLoader",
+    "RegionalMatcher",
+]
@@ -0,0 +1,218 @@
+import logging
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterator, Mapping
+from dataclasses import dataclass
+from operator import attrgetter
+
+from choices import GenericChoiceRegistry
+from content_parts import GameContent, RawContent
+from definitions import (
+    Choice,
+    FurnitureDef,
+    GameState,
+    LocationDef,
+    LocationId,
+    ObjectId,
+)
+from init_content import ContentLoader
+from instrumentation import STATS
+from matching import ConditionNetwork
+from overlay import StateDefaults
+from regions.index import GLOBAL_REGION, RegionIndex, RegionLoader, _Raw
+from renderers import LocationTemplate, compile_locations
+from routes import RouteTable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Region:
+    """Определения одного региона: то, что держится в памяти, только пока регион в кеше."""
+    name: str
+    locations: dict[LocationId, LocationDef]
+    furniture: dict[ObjectId, FurnitureDef]
+    choices: dict[str, Choice]
+    ordinals: dict[str, int]
+    network: ConditionNetwork
+    templates: dict[LocationId, LocationTemplate]
+    generic: GenericChoiceRegistry
+
+    @classmethod
+    def build(cls, name: str, part: dict[str, dict]) -> "Region":
+        cl = ContentLoader(_Raw(RawContent(locations=part["locations"], choices=part["choices"])))
+        for lid, raw in part["locations"].items():
+            cl.build_location(lid, raw)
+        exits = cl.collect_exits(part["locations"])
+        for cid, raw in {**part["choices"], **exits}.items():
+            cl.build_choice(cid, raw)
+        cl.build_exits()
+        return cls(
+            name=name,
+            locations=cl.LOCATIONS,
+            furniture=cl.FURNITURE,
+            choices=cl.CHOICES,
+            ordinals=part["ordinals"],
+            network=cl.NETWORK,
+            templates=compile_locations(cl.LOCATIONS, cl.FURNITURE),
+            generic=GenericChoiceRegistry.build({}, cl.FURNITURE),
+        )
+
+
+class RegionCache:
+    """
+    Общий для всех сессий LRU-кеш регионов. Регион, в котором находится
+    хотя бы одна сессия, закреплен (pin) и не вытесняется, поэтому кеш может
+    временно превышать capacity, если сессии разбрелись по многим регионам.
+    """
+
+    def __init__(self, index: RegionIndex, capacity: int = 64) -> None:
+        self.index = index
+        self.capacity = capacity
+        self.regions: OrderedDict[str, Region] = OrderedDict()
+        self.pins: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.regions)
+
+    def get(self, name: str) -> Region:
+        region = self.regions.get(name)
+        if region is not None:
+            self.regions.move_to_end(name)
+            STATS.count("regions.hit")
+            return region
+        STATS.count("regions.miss")
+        with STATS.timer("regions.load"):
+            region = Region.build(name, self.index.read_region(name))
+        self.regions[name] = region
+        self._evict()
+        return region
+
+    def pin(self, name: str) -> None:
+        self.pins[name] = self.pins.get(name, 0) + 1
+
+    def unpin(self, name: str) -> None:
+        count = self.pins[name] - 1
+        if count:
+            self.pins[name] = count
+        else:
+            del self.pins[name]
+            self._evict()
+
+    def _evict(self) -> None:
+        if len(self.regions) <= self.capacity:
+            return
+        for name in list(self.regions):
+            if len(self.regions) <= self.capacity:
+                break
+            if name not in self.pins:
+                del self.regions[name]
+                STATS.count("regions.evict")
+                logger.debug("region %s evicted", name)
+
+
+class RegionMapping[K: Hashable, V](Mapping[K, V]):
+    """
+    Отображение над регионами: ключ ищется в резидентной карте ключ -> регион,
+    значение - в определениях региона, который при этом подгружается в кеш.
+    exact означает, что в каждом регионе есть значение для всех его ключей;
+    тогда проверка вхождения и длина не требуют загрузки.
+    """
+
+    def __init__(
+        self,
+        cache: RegionCache,
+        region_of: Mapping[K, str],
+        part: Callable[[Region], Mapping[K, V]],
+        exact: bool = True,
+    ) -> None:
+        self.cache = cache
+        self.region_of = region_of
+        self.part = part
+        self.exact = exact
+
+    def __getitem__(self, key: K) -> V:
+        region = self.region_of[key]
+        return self.part(self.cache.get(region))[key]
+
+    def __contains__(self, key: object) -> bool:
+        if self.exact:
+            return key in self.region_of
+        return super().__contains__(key)
+
+    def __iter__(self) -> Iterator[K]:
+        if self.exact:
+            return iter(self.region_of)
+        return (key for key in self.region_of if key in self)
+
+    def __len__(self) -> int:
+        if self.exact:
+            return len(self.region_of)
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"RegionMapping(keys={len(self.region_of)}, resident_regions={len(self.cache)})"
+
+
+class RegionalContentLoader:
+    """
+    Аналог ContentLoader для RegionLoader: в памяти остаются предметы,
+    состояние по умолчанию и карты регионов, а локации, мебель, выборы и их
+    скомпилированные части загружаются по регионам через RegionCache.
+    """
+
+    def __init__(self, loader: type[RegionLoader] = RegionLoader, capacity: int = 64) -> None:
+        self.index = loader.open_index()
+        self.cache = RegionCache(self.index, capacity)
+
+    def init_content(self) -> tuple[GameContent, GameState]:
+        skeleton = self.index.skeleton
+        cl = ContentLoader(_Raw(RawContent(items=skeleton["items"])))
+        for iid, raw in skeleton["items"].items():
+            cl.build_item(iid, raw)
+        cl.build_timers(skeleton["timers"])
+
+        raw_defaults = skeleton["defaults"]
+        object_ids = tuple(raw_defaults["object_ids"])
+        defaults = StateDefaults(
+            start_location=LocationId(raw_defaults["start_location"]),
+            inventory=tuple(raw_defaults["inventory"]),
+            object_ids=object_ids,
+            object_index={oid: i for i, oid in enumerate(object_ids)},
+            object_bits=tuple(raw_defaults["object_bits"]),
+            object_items=tuple(tuple(items) for items in raw_defaults["object_items"]),
+            location_items={lid: tuple(items) for lid, items in raw_defaults["location_items"].items()},
+        )
+
+        location_region: dict[LocationId, str] = skeleton["location_region"]
+        object_locations: dict[ObjectId, LocationId] = skeleton["object_location"]
+        object_region = {oid: location_region[lid] for oid, lid in object_locations.items()}
+
+        # глобальные выборы нужны всем сессиям - их регион закреплен навсегда
+        global_region = self.cache.get(GLOBAL_REGION)
+        self.cache.pin(GLOBAL_REGION)
+        pickups = GenericChoiceRegistry.build(cl.ITEMS, {})
+
+        content = GameContent(
+            items=cl.ITEMS,
+            furniture=RegionMapping(self.cache, object_region, attrgetter("furniture")),
+            locations=RegionMapping(self.cache, location_region, attrgetter("locations")),
+            choices=RegionMapping(self.cache, skeleton["choice_region"], attrgetter("choices")),
+            network=global_region.network,
+            defaults=defaults,
+            generic=GenericChoiceRegistry(
+                pickup=pickups.pickup,
+                open=RegionMapping(self.cache, object_region, attrgetter("generic.open"), exact=False),
+                close=RegionMapping(self.cache, object_region, attrgetter("generic.close"), exact=False),
+                openable=frozenset(skeleton["openable"]),
+                pickup_rank=pickups.pickup_rank,
+            ),
+            location_templates=RegionMapping(self.cache, location_region, attrgetter("templates")),
+            object_locations=object_locations,
+            regions=self.cache,
+            location_region=location_region,
+            location_names=self.index.location_names,
+            timers=cl.TIMERS,
+            # регионы нужны большим мирам - столбцы маршрутов считаются по первому переходу
+            routes=RouteTable.build(tuple(location_region), skeleton["exits"], eager=False),
+        )
+        return content, GameState.from_content(content)
@@ -0,0 +1,209 @@
+import marshal
+import mmap
+from dataclasses import dataclass
+from typing import Any
+
+from content_parts import RawContent
+from definitions import LocationId
+from loaders import SnapshotLoader, replace_file
+
+# выборы без условия in_location доступны в любой локации и лежат в этом регионе
+GLOBAL_REGION = ""
+
+
+def choice_location(raw: dict) -> str | None:
+    for cond in raw.get("conditions", []):
+        if cond.get("type") == "in_location":
+            return cond.get("location")
+    return None
+
+
+@dataclass
+class RegionIndex:
+    """
+    Открытый индекс регионов: оглавление держится в памяти, а определения
+    регионов читаются из mmap по запросу.
+    """
+    skeleton: dict[str, Any]
+    mm: mmap.mmap
+    data_offset: int
+
+    @property
+    def regions(self) -> dict[str, tuple[int, int]]:
+        return self.skeleton["regions"]
+
+    @property
+    def location_names(self) -> dict[LocationId, str]:
+        return self.skeleton["location_names"]
+
+    def read_region(self, name: str) -> dict[str, dict]:
+        offset, length = self.regions[name]
+        start = self.data_offset + offset
+        with memoryview(self.mm)[start:start + length] as payload:
+            return marshal.loads(payload)
+
+    def close(self) -> None:
+        self.mm.close()
+
+
+class RegionLoader(SnapshotLoader):
+    """
+    Контент, разбитый на регионы. При первом запуске YAML компилируется
+    в файл content.regions: оглавление (предметы, инвентарь, состояние мира
+    по умолчанию и карты локация/объект/выбор -> регион) и отдельный блок
+    на каждый регион с его локациями, мебелью и выборами.
+
+    Регион локации задается ключом region в locations.yaml, иначе локации
+    группируются по REGION_SIZE в порядке файла. Выбор относится к региону
+    локации из своего условия in_location, выборы без него - к GLOBAL_REGION.
+
+    load() собирает весь контент обратно и годится для ContentLoader;
+    ленивую загрузку дает RegionalContentLoader.
+    """
+    SNAPSHOT_NAME = "content.regions"
+    MAGIC = b"HDCR"
+    # 2: таймеры schedule_effect в оглавлении, 3: выходы локаций,
+    # 4: названия локаций в оглавлении, 5: открываемые объекты
+    FORMAT_VERSION = 5
+    REGION_SIZE = 64
+
+    @classmethod
+    def load(cls) -> RawContent:
+        index = cls.open_index()
+        try:
+            locations: dict[str, dict] = {}
+            choices: dict[str, tuple[int, dict]] = {}
+            for name in index.regions:
+                part = index.read_region(name)
+                locations.update(part["locations"])
+                for cid, raw in part["choices"].items():
+                    choices[cid] = (part["ordinals"][cid], raw)
+            skeleton = index.skeleton
+            return RawContent(
+                items=skeleton["items"],
+                locations={lid: locations[lid] for lid in skeleton["location_region"]},
+                inventory=skeleton["inventory"],
+                choices={cid: raw for cid, (_, raw) in sorted(choices.items(), key=lambda kv: kv[1][0])},
+            )
+        finally:
+            index.close()
+
+    @classmethod
+    def open_index(cls) -> RegionIndex:
+        source_hash = cls.source_hash()
+        index = cls.read_index(source_hash)
+        if index is None:
+            cls.write_index(super(SnapshotLoader, cls).load(), source_hash)
+            index = cls.read_index(source_hash)
+            if index is None:
+                raise OSError(f"region index {cls.snapshot_path()} is unreadable right after writing")
+        return index
+
+    @classmethod
+    def read_index(cls, source_hash: bytes) -> RegionIndex | None:
+        try:
+            file = cls.snapshot_path().open(mode="rb")
+        except OSError:
+            return None
+        with file:
+            try:
+                mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                return None
+        if len(mm) < cls.HEADER.size:
+            mm.close()
+            return None
+        magic, version, stored_hash, length = cls.HEADER.unpack_from(mm)
+        if magic != cls.MAGIC or version != cls.FORMAT_VERSION or stored_hash != source_hash:
+            mm.close()
+            return None
+        # обрезанный файл: оглавление не помещается
+        if cls.HEADER.size + length > len(mm):
+            mm.close()
+            return None
+        try:
+            with memoryview(mm)[cls.HEADER.size:cls.HEADER.size + length] as payload:
+                skeleton = marshal.loads(payload)
+            data_size = sum(size for _, size in skeleton["regions"].values())
+        except (EOFError, ValueError, TypeError, KeyError):
+            mm.close()
+            return None
+        if cls.HEADER.size + length + data_size > len(mm):
+            mm.close()
+            return None
+        return RegionIndex(skeleton, mm, cls.HEADER.size + length)
+
+    @classmethod
+    def assign_regions(cls, raw: RawContent) -> dict[str, str]:
+        return {
+            lid: data.get("region", f"region_{n // cls.REGION_SIZE}")
+            for n, (lid, data) in enumerate(raw.locations.items())
+        }
+
+    @classmethod
+    def write_index(cls, raw: RawContent, source_hash: bytes) -> None:
+        # полная загрузка проверяет ссылки контента (ContentError) и считает
+        # состояние по умолчанию тем же кодом; регионы потом собираются без линковки
+        from init_content import ContentLoader
+
+        full_loader = ContentLoader(_Raw(raw))
+        full, _ = full_loader.init_content()
+        defaults = full.defaults
+
+        location_region = cls.assign_regions(raw)
+        parts: dict[str, dict[str, dict]] = {GLOBAL_REGION: {"locations": {}, "choices": {}, "ordinals": {}}}
+        for lid, data in raw.locations.items():
+            part = parts.setdefault(location_region[lid], {"locations": {}, "choices": {}, "ordinals": {}})
+            part["locations"][lid] = data
+        # выборы выходов получают номера в том же порядке, что при полной загрузке;
+        # сами они не хранятся - Region.build собирает их из выходов своих локаций
+        exits = full_loader.collect_exits(raw.locations)
+        choice_region: dict[str, str] = {}
+        for ordinal, (cid, data) in enumerate({**raw.choices, **exits}.items()):
+            lid = choice_location(data)
+            region = GLOBAL_REGION if lid is None else location_region.get(lid, GLOBAL_REGION)
+            choice_region[cid] = region
+            if cid not in exits:
+                parts[region]["choices"][cid] = data
+            parts[region]["ordinals"][cid] = ordinal
+
+        blobs: list[bytes] = []
+        regions: dict[str, tuple[int, int]] = {}
+        offset = 0
+        for name, part in parts.items():
+            blob = marshal.dumps(part)
+            regions[name] = (offset, len(blob))
+            blobs.append(blob)
+            offset += len(blob)
+
+        skeleton = marshal.dumps({
+            "items": raw.items,
+            "inventory": raw.inventory,
+            "location_region": location_region,
+            "location_names": {lid: data["name"] for lid, data in raw.locations.items()},
+            "object_location": full.object_locations,
+            "openable": sorted(full.generic.openable),
+            "choice_region": choice_region,
+            "regions": regions,
+            "timers": full_loader.timer_specs,
+            "exits": full_loader.raw_exits,
+            "defaults": {
+                "start_location": defaults.start_location,
+                "inventory": defaults.inventory,
+                "object_ids": defaults.object_ids,
+                "object_bits": defaults.object_bits,
+                "object_items": defaults.object_items,
+                "location_items": dict(defaults.location_items),
+            },
+        })
+        header = cls.HEADER.pack(cls.MAGIC, cls.FORMAT_VERSION, source_hash, len(skeleton))
+        replace_file(cls.snapshot_path(), [header, skeleton, *blobs])
+
+
+@dataclass(frozen=True)
+class _Raw:
+    """Источник для ContentLoader из уже прочитанного RawContent."""
+    raw: RawContent
+
+    def load(self) -> RawContent:
+        return self.raw
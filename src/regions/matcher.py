@@ -0,0 +1,79 @@
+from typing import TYPE_CHECKING
+
+from definitions import Choice, Fact, GameState
+from matching import ChoiceMatcher
+from regions.cache import RegionCache
+from regions.index import GLOBAL_REGION
+
+if TYPE_CHECKING:
+    from content_parts import GameContent
+
+
+class RegionalMatcher:
+    """
+    Матчер сессии для контента, загружаемого по регионам. Выборы региона
+    требуют нахождения в одной из его локаций, поэтому вне региона они заведомо
+    недоступны: матчатся только глобальные выборы и выборы текущего региона.
+    Текущий регион закреплен в кеше, пока в нем находится сессия.
+    """
+
+    def __init__(self, cache: RegionCache, state: GameState, content: "GameContent") -> None:
+        if content.location_region is None:
+            raise ValueError("RegionalMatcher expects content loaded by regions")
+        self.cache = cache
+        self.state = state
+        self.content = content
+        self.location_region = content.location_region
+        self.global_region = cache.get(GLOBAL_REGION)
+        self.global_matcher = ChoiceMatcher(self.global_region.network, state, content)
+        self.region: str | None = None
+        self.local: ChoiceMatcher | None = None
+        self.moved = True
+        self._parts: tuple[list[Choice], list[Choice]] | None = None
+        self._result: list[Choice] = []
+        state.subscribe(self.on_fact)
+
+    def on_fact(self, fact: Fact) -> None:
+        if fact[0] == "location" or fact[0] == "*":
+            self.moved = True
+
+    def detach(self) -> None:
+        self.state.unsubscribe(self.on_fact)
+        self.global_matcher.detach()
+        self._leave()
+
+    def _leave(self) -> None:
+        if self.local is not None:
+            self.local.detach()
+            self.local = None
+        if self.region is not None:
+            self.cache.unpin(self.region)
+            self.region = None
+
+    def _follow(self) -> None:
+        self.moved = False
+        region = self.location_region[self.state.current_location]
+        if region == self.region:
+            return
+        self._leave()
+        self.cache.pin(region)
+        self.region = region
+        self.local = ChoiceMatcher(self.cache.get(region).network, self.state, self.content)
+        self._parts = None
+
+    def available_choices(self) -> list[Choice]:
+        """Доступные выборы в порядке контента. Список общий для вызовов - не изменять."""
+        if self.moved:
+            self._follow()
+        # после _follow сессия всегда в каком-то регионе
+        assert self.local is not None and self.region is not None
+        parts = (self.local.available_choices(), self.global_matcher.available_choices())
+        if self._parts is None or parts[0] is not self._parts[0] or parts[1] is not self._parts[1]:
+            self._parts = parts
+            local_order = self.cache.get(self.region).ordinals
+            global_order = self.global_region.ordinals
+            self._result = sorted(
+                parts[0] + parts[1],
+                key=lambda c: local_order[c.id] if c.id in local_order else global_order[c.id],
+            )
+        return self._result
@@ -0,0 +1,87 @@
+"""
+Горячая перезагрузка контента без остановки процесса.
+
+Новый GameContent собирается в потоке, пока сессии продолжают играть на
+старом. Если контент не прошел проверку (ContentError линкера или ошибка
+разбора YAML), остается старый; иначе он подменяется одним синхронным
+вызовом SessionEngine.swap_content. Наблюдатель опрашивает каталог контента
+и перезагружает его, когда файлы перестали меняться на debounce секунд -
+несколько файлов одной выкладки дают одну перезагрузку.
+"""
+import asyncio
+import logging
+from collections.abc import Callable
+from pathlib import Path
+
+from content_parts import GameContent
+from engine import SessionEngine
+from instrumentation import STATS
+
+logger = logging.getLogger(__name__)
+
+ContentBuilder = Callable[[], GameContent]
+Signature = tuple[tuple[str, int, int], ...]
+
+
+def signature(content_dir: Path, pattern: str = "*.yaml") -> Signature:
+    """Имена, размеры и времена изменения файлов контента."""
+    files: list[tuple[str, int, int]] = []
+    for path in sorted(content_dir.glob(pattern)):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        files.append((path.name, stat.st_size, stat.st_mtime_ns))
+    return tuple(files)
+
+
+class ContentReloader:
+
+    def __init__(
+        self,
+        engine: SessionEngine,
+        build: ContentBuilder,
+        content_dir: Path,
+        poll_interval: float = 1.0,
+        debounce: float = 2.0,
+    ) -> None:
+        self.engine = engine
+        self.build = build
+        self.content_dir = content_dir
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.lock = asyncio.Lock()
+
+    async def reload(self) -> bool:
+        """Пересобирает контент и подменяет его; False - новый контент отвергнут."""
+        async with self.lock:
+            try:
+                with STATS.timer("reload.build"):
+                    content = await asyncio.to_thread(self.build)
+            except Exception:
+                STATS.count("reload.rejected")
+                logger.exception("content reload rejected, keeping the current content")
+                return False
+            with STATS.timer("reload.swap"):
+                self.engine.swap_content(content)
+            STATS.count("reload.ok")
+            logger.info("content reloaded: %d sessions rebound", len(self.engine))
+            return True
+
+    async def watch(self) -> None:
+        """Опрашивает каталог контента и перезагружает его после серии изменений."""
+        current = signature(self.content_dir)
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            seen = signature(self.content_dir)
+            if seen == current:
+                continue
+            # ждем, пока выкладка закончится: debounce секунд без изменений
+            while True:
+                await asyncio.sleep(self.debounce)
+                latest = signature(self.content_dir)
+                if latest == seen:
+                    break
+                seen = latest
+            current = seen
+            await self.reload()
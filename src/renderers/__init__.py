@@ -1,3 +1,4 @@
 from .common import render_template
+from .location import GameRenderer, LocationTemplate, compile_locations
 
-__all__ = ["render_template"]
\ No newline at end of file
+__all__ = ["GameRenderer", "LocationTemplate", "compile_locations", "render_template"]
\ No newline at end of file
@@ -1,3 +1,9 @@
+from string import Formatter
+from typing import TYPE_CHECKING, cast
+
+if TYPE_CHECKING:
+    from content_parts import GameContent
+    from definitions import ItemId, ObjectId, Result
 
 
 TEMPLATES = {
@@ -8,17 +14,46 @@ TEMPLATES = {
     "generic_close": "Ты закрыл {object}."
 }
 
-def render_template(result: "Result", content: "GameContent"):
-    if result.template not in TEMPLATES:
+# шаблон -> [(текст, имя параметра или None)], разбирается один раз при импорте
+CompiledTemplate = list[tuple[str, str | None]]
+
+
+def compile_template(template: str) -> CompiledTemplate:
+    parts: CompiledTemplate = []
+    for literal, name, spec, conversion in Formatter().parse(template):
+        if spec or conversion:
+            raise ValueError(f"Форматирование параметров не поддерживается: {template!r}")
+        parts.append((literal, name))
+    return parts
+
+
+COMPILED_TEMPLATES: dict[str, CompiledTemplate] = {
+    name: compile_template(template) for name, template in TEMPLATES.items()
+}
+
+
+def render_template(result: "Result", content: "GameContent") -> str:
+    # текст результата зависит только от шаблона, параметров и контента
+    cache = content.render_cache
+    key = (result.template, tuple(result.params.items()))
+    text = cache.get(key)
+    if text is not None:
+        return text
+
+    if result.template not in COMPILED_TEMPLATES:
         raise ValueError(f"Не обнаружен шаблон для {result.template!r}")
-    resolved = {}
-    for key, value in result.params.items():
+    resolved: dict[str, str] = {}
+    for key_name, value in result.params.items():
         if value in content.items:
-            resolved[key] = content.items[value].name
+            resolved[key_name] = content.items[cast("ItemId", value)].name
         elif value in content.furniture:
-            resolved[key] = content.furniture[value].name
+            resolved[key_name] = content.furniture[cast("ObjectId", value)].name
         else:
-            resolved[key] = value
-
-    return TEMPLATES[result.template].format(**resolved)
+            resolved[key_name] = value
 
+    text = "".join(
+        literal if name is None else literal + resolved[name]
+        for literal, name in COMPILED_TEMPLATES[result.template]
+    )
+    cache[key] = text
+    return text
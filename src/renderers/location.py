@@ -0,0 +1,143 @@
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, cast
+
+from overlay import FLAG_BITS
+
+if TYPE_CHECKING:
+    from content_parts import GameContent
+    from definitions import (
+        Choice,
+        Fact,
+        FurnitureDef,
+        GameState,
+        ItemDef,
+        ItemId,
+        LocationDef,
+        LocationId,
+        ObjectId,
+    )
+
+
+LOCKED = FLAG_BITS["locked"]
+OPEN = FLAG_BITS["open"]
+TURNED_ON = FLAG_BITS["turned_on"]
+
+
+@dataclass(frozen=True)
+class ObjectFragment:
+    """Строки описания объекта для всех значений значимых флагов."""
+    oid: "ObjectId"
+    mask: int
+    short: dict[int, str]
+    verbose: dict[int, str]
+
+
+@dataclass(frozen=True)
+class LocationTemplate:
+    lid: "LocationId"
+    short_header: str
+    verbose_header: str
+    fragments: tuple[ObjectFragment, ...]
+
+
+def compile_fragment(furn_def: "FurnitureDef") -> ObjectFragment | None:
+    if furn_def.kind == "container":
+        short: dict[int, str] = {}
+        verbose: dict[int, str] = {}
+        for bits in (0, OPEN, LOCKED, LOCKED | OPEN):
+            status = "(закрыто)" if not bits & OPEN else ""
+            status = "(заперто)" if bits & LOCKED else status
+            short[bits] = f"{furn_def.name} {status}\n"
+            verbose[bits] = f"{furn_def.name} {status}. {furn_def.description}\n"
+        return ObjectFragment(furn_def.id, LOCKED | OPEN, short, verbose)
+    if furn_def.kind == "door":
+        texts = {
+            bits: f"{furn_def.name}{"(открыто)" if bits else "(закрыто)"}. {furn_def.description}\n"
+            for bits in (0, OPEN)
+        }
+        return ObjectFragment(furn_def.id, OPEN, texts, texts)
+    if furn_def.kind == "switch":
+        texts = {
+            bits: f"{furn_def.name}{"(включено)" if bits else "(выключено)"}. {furn_def.description}\n"
+            for bits in (0, TURNED_ON)
+        }
+        return ObjectFragment(furn_def.id, TURNED_ON, texts, texts)
+    return None
+
+
+def compile_locations(
+    locations: dict["LocationId", "LocationDef"],
+    furniture: dict["ObjectId", "FurnitureDef"],
+) -> dict["LocationId", LocationTemplate]:
+    templates: dict[LocationId, LocationTemplate] = {}
+    for lid, location in locations.items():
+        fragments = [compile_fragment(furniture[fid]) for fid in location.objects]
+        templates[lid] = LocationTemplate(
+            lid=lid,
+            short_header=f"{location.name}\n",
+            verbose_header=f"{location.name}\n{location.description}\n",
+            fragments=tuple(f for f in fragments if f is not None),
+        )
+    return templates
+
+
+@dataclass
+class GameRenderer:
+    """
+    Рендерер одной сессии. Описания локаций собираются из фрагментов,
+    скомпилированных при загрузке контента. Кешируется только краткое
+    описание текущей локации: подробное показывается один раз за локацию,
+    а кеш всех посещенных рос бы с исследованием мира в каждой сессии.
+    Кеш сбрасывается, только когда эффект трогает объект или предметы этой
+    локации.
+    """
+    state: "GameState"
+    content: "GameContent"
+    cached_location: "LocationId | None" = field(default=None, repr=False)
+    cached_text: str = field(default="", repr=False)
+
+    def __post_init__(self) -> None:
+        self.state.subscribe(self.on_fact)
+
+    def on_fact(self, fact: "Fact") -> None:
+        kind = fact[0]
+        if kind == "object":
+            lid = self.content.object_locations.get(cast("ObjectId", fact[1]))
+        elif kind == "location_items":
+            lid = cast("LocationId", fact[1])
+        elif kind == "*":
+            lid = self.cached_location
+        else:
+            return
+        if lid is not None and lid == self.cached_location:
+            self.cached_location = None
+
+    def detach(self) -> None:
+        self.state.unsubscribe(self.on_fact)
+
+    def render_location(self, verbose: bool = False) -> str:
+        lid = self.state.current_location
+        if verbose:
+            return self._render_location(lid, verbose)
+        if self.cached_location != lid:
+            self.cached_text = self._render_location(lid, verbose)
+            self.cached_location = lid
+        return self.cached_text
+
+    def _render_location(self, lid: "LocationId", verbose: bool) -> str:
+        template = self.content.location_templates[lid]
+        objects = self.state.objects
+        parts = [template.verbose_header if verbose else template.short_header]
+        for fragment in template.fragments:
+            bits = objects.bits(objects.index(fragment.oid))
+            texts = fragment.verbose if verbose else fragment.short
+            parts.append(texts[bits & fragment.mask])
+
+        items: dict[ItemId, ItemDef] = self.content.items
+        item_names = [items[iid].name for iid in self.state.locations_items[lid]]
+        if item_names:
+            parts.append(f"Здесь находится: {"\n".join(item_names)}\n")
+        return "".join(parts)
+
+    def render_choices(self, choices_dict: dict[str, "Choice"]) -> str:
+        return "".join(f"{n}. {c.text}\n" for n, c in choices_dict.items())
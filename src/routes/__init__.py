@@ -0,0 +1,4 @@
+from .session import SessionRoutes
+from .table import RouteTable
+
+__all__ = ["RouteTable", "SessionRoutes"]
@@ -0,0 +1,64 @@
+from typing import TYPE_CHECKING
+
+from definitions import GameState, LocationId
+from matching import ChoiceMatcher
+from routes.table import Column, ExitRef, RouteTable
+
+if TYPE_CHECKING:
+    from content_parts import GameContent
+
+
+class SessionRoutes:
+    """
+    Маршруты одной сессии с учетом ее закрытых условных выходов.
+
+    Общий столбец таблицы годится, пока ни один закрытый выход не лежит на
+    его дереве кратчайших путей: удаление других ребер пути не удлиняет.
+    Иначе столбец пересчитывается без закрытых выходов и хранится, пока
+    не изменится набор закрытых: открытие выхода сбрасывает все пересчеты
+    (пути могли сократиться), закрытие - только те, чье дерево его содержит.
+    """
+
+    def __init__(self, table: RouteTable, state: GameState, content: "GameContent") -> None:
+        self.table = table
+        # без условных выходов закрытых не бывает - матчер не нужен
+        self.matcher = ChoiceMatcher(table.gates, state, content) if table.gate_exits else None
+        self._open: list | None = None
+        self.closed: frozenset[ExitRef] = frozenset()
+        self.repaired: dict[int, Column] = {}
+
+    def detach(self) -> None:
+        if self.matcher is not None:
+            self.matcher.detach()
+
+    def _refresh(self, matcher: ChoiceMatcher) -> None:
+        opened = matcher.available_choices()
+        if opened is self._open:
+            return
+        self._open = opened
+        gate_exits = self.table.gate_exits
+        closed = frozenset(gate_exits[i] for i in range(len(gate_exits)) if i not in matcher.available)
+        if self.closed - closed:
+            self.repaired.clear()
+        else:
+            for u, k in closed - self.closed:
+                for dst in [dst for dst, column in self.repaired.items() if column[u] == k]:
+                    del self.repaired[dst]
+        self.closed = closed
+
+    def next_exit(self, src: LocationId, dst: LocationId) -> str | None:
+        """id выбора выхода - первого шага из src в dst; None - пути нет."""
+        table = self.table
+        s, d = table.index.get(src), table.index.get(dst)
+        if s is None or d is None or s == d:
+            return None
+        if self.matcher is not None:
+            self._refresh(self.matcher)
+        column = table.column(d)
+        if self.closed and any(column[u] == k for u, k in self.closed):
+            repaired = self.repaired.get(d)
+            if repaired is None:
+                repaired = self.repaired[d] = table.search(d, self.closed)
+            column = repaired
+        k = column[s]
+        return None if k == table.none else table.exits[s][k][1]
@@ -0,0 +1,107 @@
+from array import array
+from collections import deque
+from collections.abc import Callable, Collection, Mapping, Sequence
+
+from definitions import Choice, Condition, LocationId
+from matching import ConditionNetwork
+
+# выход из локации: (цель, id выбора, условия when)
+RawExit = tuple[str, str, list[dict]]
+Column = bytearray | array
+# (локация, номер выхода в ней)
+ExitRef = tuple[int, int]
+# все пары при загрузке - до стольких локаций: дальше это секунды старта и V*V байт
+EAGER_LOCATIONS = 2000
+
+
+class RouteTable:
+    """
+    Кратчайшие маршруты по выходам локаций, общие для всех сессий.
+
+    Для каждой локации назначения хранится столбец: каким по счету выходом
+    идти из каждой локации, байт на пару (два, если у локации больше 254
+    выходов), так что следующий шаг маршрута - одно обращение по индексу.
+    Столбцы считаются обходом в ширину от назначения по обратным выходам
+    для графа, где все условные выходы открыты; eager - сразу все (все пары
+    при загрузке, по умолчанию до EAGER_LOCATIONS локаций), иначе по первому
+    переходу в локацию - обход O(V + E), дальше столбец общий для всех.
+
+    Условия условных выходов собраны в отдельную сеть gates: матчер сессии
+    по ней знает, какие выходы у нее закрыты (SessionRoutes).
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[LocationId],
+        exits: list[list[tuple[int, str]]],
+        gates: ConditionNetwork,
+        gate_exits: list[ExitRef],
+        eager: bool | None = None,
+    ) -> None:
+        self.ids = tuple(ids)
+        self.index = {lid: n for n, lid in enumerate(self.ids)}
+        self.exits = exits
+        self.reverse: list[list[ExitRef]] = [[] for _ in self.ids]
+        for u, out in enumerate(exits):
+            for k, (v, _) in enumerate(out):
+                self.reverse[v].append((u, k))
+        self.gates = gates
+        self.gate_exits = gate_exits
+        wide = any(len(out) >= 0xFF for out in exits)
+        self.typecode = "H" if wide else "B"
+        self.none = 0xFFFF if wide else 0xFF
+        self.columns: dict[int, Column] = {}
+        if eager is None:
+            eager = len(self.ids) <= EAGER_LOCATIONS
+        if eager:
+            for dst in range(len(self.ids)):
+                self.columns[dst] = self.search(dst)
+
+    @classmethod
+    def build(
+        cls,
+        ids: Sequence[LocationId],
+        raw: Mapping[str, list[RawExit]],
+        condition: Callable[[dict], Condition] | None = None,
+        eager: bool | None = None,
+    ) -> "RouteTable":
+        """raw - выходы по локациям; condition собирает условия when (линкером), иначе CONDITIONS."""
+        index: dict[str, int] = {lid: n for n, lid in enumerate(ids)}
+        exits: list[list[tuple[int, str]]] = [[] for _ in ids]
+        gates = ConditionNetwork()
+        gate_exits: list[ExitRef] = []
+        for lid, out in raw.items():
+            u = index[lid]
+            for target, cid, when in out:
+                if target not in index:
+                    # ссылку уже отметил линкер выбора выхода
+                    continue
+                if when:
+                    nodes = [gates.node(spec, condition) for spec in when]
+                    gates.add_choice(Choice(id=cid, text="", when=[node.cond for node in nodes]), nodes)
+                    gate_exits.append((u, len(exits[u])))
+                exits[u].append((index[target], cid))
+        return cls(ids, exits, gates, gate_exits, eager)
+
+    def column(self, dst: int) -> Column:
+        column = self.columns.get(dst)
+        if column is None:
+            column = self.columns[dst] = self.search(dst)
+        return column
+
+    def search(self, dst: int, closed: Collection[ExitRef] = ()) -> Column:
+        """Столбец назначения dst без выходов closed."""
+        none = self.none
+        column = bytearray(b"\xff" * len(self.ids)) if self.typecode == "B" else array("H", [none]) * len(self.ids)
+        seen = bytearray(len(self.ids))
+        seen[dst] = 1
+        queue = deque([dst])
+        reverse = self.reverse
+        while queue:
+            v = queue.popleft()
+            for u, k in reverse[v]:
+                if not seen[u] and (not closed or (u, k) not in closed):
+                    seen[u] = 1
+                    column[u] = k
+                    queue.append(u)
+        return column
@@ -0,0 +1,5 @@
+from .ring import HashRing
+from .supervisor import ShardedEngine, WorkerError
+from .worker import serve
+
+__all__ = ["HashRing", "ShardedEngine", "WorkerError", "serve"]
@@ -0,0 +1,53 @@
+import bisect
+import hashlib
+from collections.abc import Hashable, Iterable
+
+
+def ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Консистентное хеширование: у каждого узла replicas точек на кольце,
+    ключ принадлежит первой точке по часовой стрелке от своего хеша.
+    При добавлении или удалении узла меняют владельца только ключи
+    его участков - в среднем 1/N всех ключей.
+    Ключ хешируется как str(key), поэтому 42 и "42" - один ключ.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 64) -> None:
+        self.replicas = replicas
+        self.nodes: list[str] = []
+        self.points: list[int] = []
+        self.owners: list[str] = []
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __contains__(self, node: str) -> bool:
+        return node in self.nodes
+
+    def add(self, node: str) -> None:
+        if node in self.nodes:
+            raise ValueError(f"node {node!r} is already on the ring")
+        self.nodes.append(node)
+        for replica in range(self.replicas):
+            point = ring_hash(f"{node}#{replica}")
+            index = bisect.bisect(self.points, point)
+            self.points.insert(index, point)
+            self.owners.insert(index, node)
+
+    def remove(self, node: str) -> None:
+        self.nodes.remove(node)
+        kept = [(p, o) for p, o in zip(self.points, self.owners) if o != node]
+        self.points = [p for p, _ in kept]
+        self.owners = [o for _, o in kept]
+
+    def owner(self, key: Hashable) -> str:
+        if not self.points:
+            raise LookupError("hash ring is empty")
+        index = bisect.bisect(self.points, ring_hash(str(key)))
+        return self.owners[index % len(self.points)]
@@ -0,0 +1,254 @@
+import asyncio
+import contextlib
+import gc
+import itertools
+import logging
+import multiprocessing
+import socket
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from multiprocessing.process import BaseProcess
+from typing import Any
+
+from content_parts import GameContent
+from engine import Handoff, Reply, SessionKey
+from instrumentation import STATS
+from sharding.ring import HashRing
+from sharding.worker import EngineFactory, Outbox, read_frame, serve
+
+logger = logging.getLogger(__name__)
+
+STOP_TIMEOUT = 30.0
+
+
+class WorkerError(RuntimeError):
+    """Вызов в рабочем процессе завершился ошибкой или процесс упал."""
+
+
+@dataclass
+class WorkerHandle:
+    name: str
+    process: BaseProcess
+    writer: asyncio.StreamWriter
+    outbox: Outbox
+    calls: dict[int, asyncio.Future] = field(default_factory=dict)
+    ids: Callable[[], int] = field(default_factory=lambda: itertools.count().__next__)
+    receiving: asyncio.Task | None = None
+
+    async def call(self, method: str, *args: Any) -> Any:
+        call_id = self.ids()
+        future = self.calls[call_id] = asyncio.get_running_loop().create_future()
+        self.outbox.put((call_id, method, args))
+        try:
+            return await future
+        finally:
+            self.calls.pop(call_id, None)
+
+    def fail(self, reason: str) -> None:
+        for future in self.calls.values():
+            if not future.done():
+                future.set_exception(WorkerError(reason))
+        self.calls.clear()
+
+
+class ShardedEngine:
+    """
+    Сессии по нескольким процессам: обходит GIL, ход каждой сессии
+    выполняется в ее рабочем процессе. Интерфейс как у SessionEngine.
+
+    Владелец сессии - узел кольца консистентного хеширования по ключу.
+    Контент загружается один раз здесь и достается рабочим через fork
+    (copy-on-write); gc.freeze перед fork не дает сборщику мусора трогать
+    страницы контента и копировать их в каждый процесс.
+
+    add_worker и remove_worker перераспределяют сессии: новые обновления
+    ждут, пока закончатся текущие, затем только сессии, сменившие владельца,
+    передаются новому (SessionEngine.release/adopt). Упавший рабочий
+    перезапускается под тем же именем и восстанавливает сессии из хранилища
+    или своего журнала; резидентный прогресс после последней записи теряется.
+    """
+
+    def __init__(
+        self,
+        content: GameContent,
+        factory: EngineFactory,
+        workers: int = 2,
+        replicas: int = 64,
+    ) -> None:
+        self.content = content
+        self.factory = factory
+        self.initial = workers
+        self.replicas = replicas
+        self.ring = HashRing(replicas=replicas)
+        self.workers: dict[str, WorkerHandle] = {}
+        self.names = (f"worker-{n}" for n in itertools.count())
+        self.on_evict: Callable[[SessionKey], None] | None = None
+        self.on_timer: Callable[[SessionKey, Reply], None] | None = None
+        self.closing = False
+        # обновления проходят, пока не идет перераспределение
+        self.ready = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.inflight = 0
+        self.rebalancing = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self.workers)
+
+    async def launch(self) -> None:
+        gc.freeze()
+        for _ in range(self.initial):
+            name = next(self.names)
+            self.workers[name] = await self._spawn(name)
+            self.ring.add(name)
+        STATS.gauge("sharding.workers", len(self.workers))
+        self.ready.set()
+
+    async def _spawn(self, name: str) -> WorkerHandle:
+        parent, child = socket.socketpair()
+        # fork - единственный способ отдать рабочему готовые объекты контента без копирования
+        process = multiprocessing.get_context("fork").Process(
+            target=serve, args=(child, name, self.content, self.factory), name=name, daemon=True,
+        )
+        process.start()
+        child.close()
+        reader, writer = await asyncio.open_connection(sock=parent)
+        handle = WorkerHandle(name, process, writer, Outbox(writer))
+        handle.receiving = asyncio.create_task(self._receive(handle, reader))
+        return handle
+
+    async def _receive(self, handle: WorkerHandle, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                for call_id, ok, result in await read_frame(reader):
+                    if call_id is None:
+                        self._notify(ok, result)
+                        continue
+                    future = handle.calls.get(call_id)
+                    if future is None or future.done():
+                        continue
+                    if ok:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(WorkerError(f"{handle.name}: {result}"))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        handle.fail(f"{handle.name} exited")
+        if not self.closing and self.workers.get(handle.name) is handle:
+            STATS.count("sharding.crash")
+            asyncio.create_task(self._restart(handle.name))
+
+    def _notify(self, kind: str, payload: Any) -> None:
+        """Уведомления рабочих, не связанные с вызовами."""
+        if kind == "evicted" and self.on_evict is not None:
+            self.on_evict(payload)
+        elif kind == "timer" and self.on_timer is not None:
+            self.on_timer(*payload)
+
+    async def _restart(self, name: str) -> None:
+        self.ready.clear()
+        try:
+            process = self.workers[name].process
+            await asyncio.to_thread(process.join)
+            logger.error("%s exited with code %s, restarting", name, process.exitcode)
+            self.workers[name] = await self._spawn(name)
+        finally:
+            if not self.rebalancing.locked():
+                self.ready.set()
+
+    # --- перераспределение ---
+
+    async def add_worker(self) -> str:
+        async with self.rebalancing:
+            name = next(self.names)
+            handle = await self._spawn(name)
+            donors = list(self.workers.values())
+            self.workers[name] = handle
+            await self._rebalance([*self.ring.nodes, name], donors)
+            STATS.gauge("sharding.workers", len(self.workers))
+            return name
+
+    async def remove_worker(self, name: str) -> None:
+        """Сессии рабочего переходят к остальным, затем процесс останавливается."""
+        async with self.rebalancing:
+            if len(self.workers) == 1:
+                raise ValueError("cannot remove the last worker")
+            handle = self.workers[name]
+            await self._rebalance([n for n in self.ring.nodes if n != name], [handle])
+            del self.workers[name]
+            await self._stop(handle)
+            STATS.gauge("sharding.workers", len(self.workers))
+
+    async def _rebalance(self, nodes: list[str], donors: list[WorkerHandle]) -> None:
+        """
+        Консистентное хеширование меняет владельца только части ключей:
+        при добавлении узла отдают все, но каждый - лишь ключи участков
+        нового узла; при удалении отдает только удаляемый.
+        """
+        self.ready.clear()
+        try:
+            await self.idle.wait()
+            with STATS.timer("sharding.rebalance"):
+                released = await asyncio.gather(*(w.call("release", nodes, self.replicas) for w in donors))
+                ring = HashRing(nodes, self.replicas)
+                moved: dict[str, list[Handoff]] = {}
+                for handoffs in released:
+                    for handoff in handoffs:
+                        moved.setdefault(ring.owner(handoff.key), []).append(handoff)
+                await asyncio.gather(*(self.workers[name].call("adopt", handoffs) for name, handoffs in moved.items()))
+                self.ring = ring
+            count = sum(len(handoffs) for handoffs in moved.values())
+            STATS.count("sharding.moved", count)
+            logger.info("rebalanced to %d workers: %d sessions moved", len(nodes), count)
+        finally:
+            self.ready.set()
+
+    # --- вызовы ---
+
+    async def _call(self, key: SessionKey, method: str, *args: Any) -> Any:
+        await self.ready.wait()
+        self.inflight += 1
+        self.idle.clear()
+        try:
+            return await self.workers[self.ring.owner(key)].call(method, key, *args)
+        finally:
+            self.inflight -= 1
+            if not self.inflight:
+                self.idle.set()
+
+    async def start(self, key: SessionKey) -> Reply:
+        return await self._call(key, "start")
+
+    async def handle(self, key: SessionKey, option: str, turn: int | None = None) -> Reply | None:
+        return await self._call(key, "handle", option, turn)
+
+    async def undo(self, key: SessionKey) -> Reply:
+        return await self._call(key, "undo")
+
+    async def save(self, key: SessionKey, slot: str) -> Reply:
+        return await self._call(key, "save", slot)
+
+    async def load(self, key: SessionKey, slot: str) -> Reply:
+        return await self._call(key, "load", slot)
+
+    async def travel(self, key: SessionKey, target: str) -> Reply:
+        return await self._call(key, "travel", target)
+
+    # --- остановка ---
+
+    async def _stop(self, handle: WorkerHandle) -> None:
+        with contextlib.suppress(WorkerError):
+            await handle.call("stop")
+        await asyncio.to_thread(handle.process.join, STOP_TIMEOUT)
+        if handle.process.is_alive():
+            logger.error("%s did not stop in %.0fs, terminating", handle.name, STOP_TIMEOUT)
+            handle.process.terminate()
+        handle.writer.close()
+
+    async def shutdown(self) -> None:
+        """Дожидается текущих обновлений; рабочие дописывают хранилище и журнал."""
+        self.closing = True
+        self.ready.clear()
+        await self.idle.wait()
+        await asyncio.gather(*(self._stop(handle) for handle in self.workers.values()))
+        self.workers.clear()
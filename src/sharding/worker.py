@@ -0,0 +1,159 @@
+"""
+Рабочий процесс: свой SessionEngine и свои сессии.
+
+Процесс создается fork'ом супервизора, поэтому уже загруженный GameContent
+достается ему без разбора и копирования - страницы общие, пока их никто
+не меняет. Связь с супервизором - сокет из socketpair: кадры "длина + pickle
+списка сообщений". Сообщения супервизора - (id, метод, аргументы), ответы -
+(id, True, результат) или (id, False, текст ошибки); (None, "evicted", key) -
+уведомление о выгруженной сессии, (None, "timer", (key, reply)) - экран
+после сработавшего таймера.
+"""
+import asyncio
+import logging
+import pickle
+import signal
+import socket
+import struct
+from collections.abc import Callable
+from typing import Any
+
+from content_parts import GameContent
+from engine import Handoff, Reply, SessionEngine, SessionKey
+from sharding.ring import HashRing
+
+logger = logging.getLogger(__name__)
+
+FRAME = struct.Struct("<I")
+Message = tuple[Any, ...]
+EngineFactory = Callable[[GameContent, str], SessionEngine]
+
+
+def write_frame(writer: asyncio.StreamWriter, messages: list[Message]) -> None:
+    payload = pickle.dumps(messages, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(FRAME.pack(len(payload)) + payload)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> list[Message]:
+    """Следующий кадр; IncompleteReadError - другая сторона закрыла сокет."""
+    (length,) = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return pickle.loads(await reader.readexactly(length))
+
+
+class Outbox:
+    """Сообщения, накопленные за одну итерацию цикла событий, уходят одним кадром."""
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.messages: list[Message] = []
+
+    def put(self, message: Message) -> None:
+        if not self.messages:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.messages.append(message)
+
+    def flush(self) -> None:
+        if self.messages and not self.writer.is_closing():
+            write_frame(self.writer, self.messages)
+        self.messages = []
+
+
+class Worker:
+
+    def __init__(self, name: str, engine: SessionEngine, outbox: Outbox) -> None:
+        self.name = name
+        self.engine = engine
+        self.outbox = outbox
+        self.stopping = asyncio.Event()
+        self.tasks: set[asyncio.Task] = set()
+        engine.on_evict = lambda key: outbox.put((None, "evicted", key))
+        engine.on_timer = lambda key, reply: outbox.put((None, "timer", (key, reply)))
+
+    def dispatch(self, message: Message) -> None:
+        task = asyncio.create_task(self.call(*message))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def call(self, call_id: int, method: str, args: tuple) -> None:
+        try:
+            result = await getattr(self, f"do_{method}")(*args)
+        except Exception as e:
+            logger.exception("worker %s: %s failed", self.name, method)
+            self.outbox.put((call_id, False, f"{type(e).__name__}: {e}"))
+        else:
+            self.outbox.put((call_id, True, result))
+
+    async def do_start(self, key: SessionKey) -> Reply:
+        return await self.engine.start(key)
+
+    async def do_handle(self, key: SessionKey, option: str, turn: int | None) -> Reply | None:
+        return await self.engine.handle(key, option, turn)
+
+    async def do_undo(self, key: SessionKey) -> Reply:
+        return await self.engine.undo(key)
+
+    async def do_save(self, key: SessionKey, slot: str) -> Reply:
+        return await self.engine.save(key, slot)
+
+    async def do_load(self, key: SessionKey, slot: str) -> Reply:
+        return await self.engine.load(key, slot)
+
+    async def do_travel(self, key: SessionKey, target: str) -> Reply:
+        return await self.engine.travel(key, target)
+
+    async def do_release(self, nodes: list[str], replicas: int) -> list[Handoff]:
+        ring = HashRing(nodes, replicas)
+        return await self.engine.release(lambda key: ring.owner(key) == self.name)
+
+    async def do_adopt(self, handoffs: list[Handoff]) -> int:
+        self.engine.adopt(handoffs)
+        return len(handoffs)
+
+    async def do_stop(self) -> None:
+        self.stopping.set()
+
+
+async def _serve(sock: socket.socket, name: str, content: GameContent, factory: EngineFactory) -> None:
+    reader, writer = await asyncio.open_connection(sock=sock)
+    worker = Worker(name, factory(content, name), Outbox(writer))
+    engine = worker.engine
+    background: list[asyncio.Task] = []
+    if engine.store is not None:
+        background.append(asyncio.create_task(engine.store.run()))
+    if engine.journal is not None:
+        background.append(asyncio.create_task(engine.journal.run()))
+    if engine.persistent:
+        background.append(asyncio.create_task(engine.run_evictor()))
+    background.append(asyncio.create_task(engine.run_timers()))
+
+    async def receive() -> None:
+        while True:
+            for message in await read_frame(reader):
+                worker.dispatch(message)
+
+    receiving = asyncio.create_task(receive())
+    stopping = asyncio.create_task(worker.stopping.wait())
+    try:
+        done, _ = await asyncio.wait([receiving, stopping], return_when=asyncio.FIRST_COMPLETED)
+        if receiving in done and not isinstance(receiving.exception(), asyncio.IncompleteReadError):
+            receiving.result()
+    finally:
+        receiving.cancel()
+        stopping.cancel()
+        if worker.tasks:
+            await asyncio.wait(list(worker.tasks))
+        # хранилище и журнал дописывают хвост при отмене run()
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        worker.outbox.flush()
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+
+def serve(sock: socket.socket, name: str, content: GameContent, factory: EngineFactory) -> None:
+    """Точка входа рабочего процесса."""
+    # Ctrl+C получает вся группа процессов; останавливает рабочих супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_serve(sock, name, content, factory))
@@ -0,0 +1,4 @@
+from .codec import CodecError, read_states, write_states
+from .write_behind import WriteBehindStore, make_engine
+
+__all__ = ["CodecError", "WriteBehindStore", "make_engine", "read_states", "write_states"]
@@ -0,0 +1,383 @@
+"""
+Компактный двоичный формат GameState.
+
+Кодируется GameState.diff() - только отличия от начального состояния
+контента. Все числа - varint (LEB128), множества пишутся по возрастанию
+ссылок разностями с предыдущей, биты флагов объекта - одним числом.
+
+Ссылки на предметы, объекты и локации - номера в таблицах Handles контента;
+в заголовке отпечаток этих таблиц, и с другим контентом такая запись не
+читается (CodecError). Инвентарь тогда тоже пишется отличиями от начального.
+Запись portable хранит встреченные id строками в своей таблице и читается
+любым контентом: пропавшие id отбрасываются, как в GameState.from_diff.
+Без таблиц контента (региональная загрузка) запись всегда portable.
+
+Формат, версия 2 (версия 1 - без хода и таймеров, читается):
+    "GS", версия, режим, [отпечаток, 8 байт]
+    таблица строк: число, затем (длина, utf-8)
+    локация; локация возврата (0 - нет, иначе ссылка + 1)
+    инвентарь: число, (ссылка, количество) - в режиме CONTENT количество 0
+        значит, что начального предмета больше нет
+    биты объектов: число, (ссылка, биты)
+    содержимое объектов: число, (ссылка, число предметов, ссылки)
+    предметы локаций: то же
+    посещенные локации: число, ссылки
+    флаги: число, ссылка на имя << 1 | значение
+    ход (state.clock)
+    таймеры: число, (ссылка на id << 1 | вид, срок) - вид 0: номер хода,
+        вид 1: time.time() в 8 байтах float64
+Поток записей (write_states/read_states) - записи с длиной-varint впереди.
+"""
+import hashlib
+import struct
+from collections.abc import Callable, Collection, Iterable, Iterator, Mapping
+from typing import TYPE_CHECKING, Any, BinaryIO
+
+from definitions import GameState, ItemId
+
+if TYPE_CHECKING:
+    from content_parts import GameContent
+    from linker import Handles
+
+
+MAGIC = b"GS"
+VERSION = 2
+# ссылки - номера в таблицах контента / в таблице строк записи
+CONTENT = 0
+PORTABLE = 1
+WALL_TIME = struct.Struct("<d")
+
+
+class CodecError(ValueError):
+    pass
+
+
+def fingerprint(handles: "Handles") -> bytes:
+    """Отпечаток таблиц id: запись режима CONTENT читается только с теми же таблицами."""
+    digest = hashlib.blake2b(digest_size=8)
+    for table in (handles.item_ids, handles.object_ids, handles.location_ids):
+        digest.update("\0".join(table).encode("utf-8"))
+        digest.update(b"\1")
+    return digest.digest()
+
+
+_FINGERPRINTS: dict[int, tuple["Handles", bytes]] = {}
+
+
+def _fingerprint(handles: "Handles") -> bytes:
+    cached = _FINGERPRINTS.get(id(handles))
+    if cached is None or cached[0] is not handles:
+        if len(_FINGERPRINTS) >= 8:
+            # контент сменился перезагрузкой - старые таблицы не держим
+            _FINGERPRINTS.clear()
+        cached = _FINGERPRINTS[id(handles)] = (handles, fingerprint(handles))
+    return cached[1]
+
+
+def _uint(out: bytearray, n: int) -> None:
+    while n >= 0x80:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+class _Writer:
+    __slots__ = ("body", "handles", "strings")
+
+    def __init__(self, handles: "Handles | None") -> None:
+        self.body = bytearray()
+        self.strings: dict[str, int] = {}
+        self.handles = handles
+
+    def string(self, value: str) -> int:
+        ref = self.strings.get(value)
+        if ref is None:
+            ref = self.strings[value] = len(self.strings)
+        return ref
+
+    def refs(self, table: str) -> Mapping[str, int] | None:
+        return None if self.handles is None else getattr(self.handles, table)
+
+    def keyed(self, table: str, entries: Mapping[str, Any], write: Callable[[Any], None]) -> None:
+        """Словарь id -> значение по возрастанию ссылок; write(значение) пишет значение."""
+        refs = self.refs(table)
+        pairs = sorted(((refs[key] if refs is not None else self.string(key)), value) for key, value in entries.items())
+        _uint(self.body, len(pairs))
+        previous = 0
+        for ref, value in pairs:
+            _uint(self.body, ref - previous)
+            previous = ref
+            write(value)
+
+    def items(self, items: list[str]) -> None:
+        refs = self.refs("items")
+        _uint(self.body, len(items))
+        for iid in items:
+            _uint(self.body, refs[iid] if refs is not None else self.string(iid))
+
+    def location(self, lid: str) -> int:
+        refs = self.refs("locations")
+        return refs[lid] if refs is not None else self.string(lid)
+
+
+def encode(state: GameState, content: "GameContent", portable: bool = False) -> bytes:
+    handles = content.handles
+    if portable or handles is None:
+        return encode_diff(state.diff(), content, portable=True)
+    # номера объектов в оверлеях совпадают с Handles.objects - diff() не нужен
+    objects = state.objects
+    body = bytearray()
+    locations, items = handles.locations, handles.items
+    _uint(body, locations[state.current_location])
+    _uint(body, 0 if state.return_location is None else locations[state.return_location] + 1)
+    inventory = state.inventory.items
+    initial = dict(content.defaults.inventory)
+    delta = [(items[iid], qty) for iid, qty in inventory.items() if initial.get(iid) != qty]
+    delta.extend((items[iid], 0) for iid in initial if iid not in inventory)
+    _pairs(body, delta)
+    _pairs(body, list(objects.changed_bits.items()))
+    _lists(body, [(index, contents) for index, contents in objects.contents.changed.items()], items)
+    _lists(body, [(locations[lid], contents) for lid, contents in state.locations_items.contents.changed.items()], items)
+    _pairs(body, [(locations[lid], None) for lid in state.visited_locations])
+    strings = {name: n for n, name in enumerate(state.flags)}
+    _uint(body, len(strings))
+    for name, value in state.flags.items():
+        _uint(body, strings[name] << 1 | bool(value))
+    _timers(body, state.clock, state.timers, lambda tid: strings.setdefault(tid, len(strings)))
+    return _assemble(handles, strings, body)
+
+
+def _timers(out: bytearray, clock: int, timers: Mapping[str, float], string: Callable[[str], int]) -> None:
+    _uint(out, clock)
+    _uint(out, len(timers))
+    for ref, due in sorted((string(tid), due) for tid, due in timers.items()):
+        if isinstance(due, int):
+            _uint(out, ref << 1)
+            _uint(out, due)
+        else:
+            _uint(out, ref << 1 | 1)
+            out += WALL_TIME.pack(due)
+
+
+def _pairs(out: bytearray, pairs: list[tuple[int, int]] | list[tuple[int, None]]) -> None:
+    """(ссылка, число) по возрастанию ссылок; None - только ссылка."""
+    pairs.sort()
+    _uint(out, len(pairs))
+    previous = 0
+    for ref, value in pairs:
+        _uint(out, ref - previous)
+        previous = ref
+        if value is not None:
+            _uint(out, value)
+
+
+def _lists(out: bytearray, pairs: list[tuple[int, Collection[ItemId]]], items: Mapping[ItemId, int]) -> None:
+    pairs.sort(key=lambda pair: pair[0])
+    _uint(out, len(pairs))
+    previous = 0
+    for ref, contents in pairs:
+        _uint(out, ref - previous)
+        previous = ref
+        _uint(out, len(contents))
+        for iid in contents:
+            _uint(out, items[iid])
+
+
+def _assemble(handles: "Handles | None", strings: Mapping[str, int], body: bytearray) -> bytes:
+    out = bytearray(MAGIC)
+    out.append(VERSION)
+    if handles is None:
+        out.append(PORTABLE)
+    else:
+        out.append(CONTENT)
+        out += _fingerprint(handles)
+    _uint(out, len(strings))
+    for value in strings:
+        raw = value.encode("utf-8")
+        _uint(out, len(raw))
+        out += raw
+    out += body
+    return bytes(out)
+
+
+def encode_diff(data: dict, content: "GameContent", portable: bool = False) -> bytes:
+    handles = None if portable else content.handles
+    writer = _Writer(handles)
+    body = writer.body
+
+    _uint(body, writer.location(data["location"]))
+    _uint(body, 0 if data["return"] is None else writer.location(data["return"]) + 1)
+    inventory = data["inventory"]
+    if handles is not None:
+        # отличия от начального инвентаря контента
+        initial = dict(content.defaults.inventory)
+        inventory = {iid: qty for iid, qty in inventory.items() if initial.get(iid) != qty}
+        inventory.update((iid, 0) for iid in initial if iid not in data["inventory"])
+    writer.keyed("items", inventory, lambda qty: _uint(body, qty))
+    writer.keyed("objects", data["bits"], lambda bits: _uint(body, bits))
+    writer.keyed("objects", data["contents"], writer.items)
+    writer.keyed("locations", data["location_items"], writer.items)
+    writer.keyed("locations", dict.fromkeys(data["visited"]), lambda _: None)
+    flags = sorted((writer.string(name), bool(value)) for name, value in data["flags"].items())
+    _uint(body, len(flags))
+    for ref, value in flags:
+        _uint(body, ref << 1 | value)
+    _timers(body, data.get("clock", 0), data.get("timers", {}), writer.string)
+
+    return _assemble(handles, writer.strings, body)
+
+
+class _Reader:
+    __slots__ = ("data", "handles", "pos", "strings")
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.pos = 0
+        self.strings: list[str] = []
+        self.handles: Handles | None = None
+
+    def uint(self) -> int:
+        data, pos = self.data, self.pos
+        byte = data[pos]
+        pos += 1
+        result = byte & 0x7F
+        shift = 7
+        while byte & 0x80:
+            byte = data[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            shift += 7
+        self.pos = pos
+        return result
+
+    def take(self, n: int) -> bytes:
+        if self.pos + n > len(self.data):
+            raise IndexError("record is truncated")
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return chunk
+
+    def ref(self, table: str) -> str:
+        ref = self.uint()
+        return self.strings[ref] if self.handles is None else getattr(self.handles, table)[ref]
+
+    def keyed(self, table: str, read: Callable[[], Any]) -> dict:
+        entries = {}
+        ref = 0
+        for _ in range(self.uint()):
+            ref += self.uint()
+            key = self.strings[ref] if self.handles is None else getattr(self.handles, table)[ref]
+            entries[key] = read()
+        return entries
+
+    def items(self) -> list[str]:
+        return [self.ref("item_ids") for _ in range(self.uint())]
+
+
+def decode(data: bytes, content: "GameContent") -> GameState:
+    return GameState.from_diff(content, decode_diff(data, content))
+
+
+def decode_diff(data: bytes, content: "GameContent") -> dict:
+    """Запись обратно в форму GameState.diff()."""
+    try:
+        return _decode_diff(data, content)
+    except (IndexError, UnicodeDecodeError) as e:
+        raise CodecError(f"corrupt state record: {e}") from None
+
+
+def _decode_diff(data: bytes, content: "GameContent") -> dict:
+    if data[:2] != MAGIC:
+        raise CodecError("not a state record")
+    version = data[2]
+    if version not in (1, VERSION):
+        raise CodecError(f"unsupported state record version {data[2]}")
+    reader = _Reader(data)
+    reader.pos = 4
+    if data[3] == CONTENT:
+        handles = content.handles
+        if handles is None or reader.take(8) != _fingerprint(handles):
+            raise CodecError("state record was encoded for different content")
+        reader.handles = handles
+    elif data[3] != PORTABLE:
+        raise CodecError(f"unknown state record mode {data[3]}")
+    reader.strings = [reader.take(reader.uint()).decode("utf-8") for _ in range(reader.uint())]
+
+    location = reader.ref("location_ids")
+    ret = reader.uint()
+    inventory = reader.keyed("item_ids", reader.uint)
+    if reader.handles is not None:
+        delta, inventory = inventory, dict(content.defaults.inventory)
+        for iid, qty in delta.items():
+            if qty:
+                inventory[iid] = qty
+            else:
+                inventory.pop(iid, None)
+    result: dict[str, Any] = {
+        "location": location,
+        "return": None if ret == 0 else (
+            reader.strings[ret - 1] if reader.handles is None else reader.handles.location_ids[ret - 1]
+        ),
+        "inventory": inventory,
+        "bits": reader.keyed("object_ids", reader.uint),
+        "contents": reader.keyed("object_ids", reader.items),
+        "location_items": reader.keyed("location_ids", reader.items),
+        "visited": list(reader.keyed("location_ids", lambda: None)),
+    }
+    flags = {}
+    for _ in range(reader.uint()):
+        packed = reader.uint()
+        flags[reader.strings[packed >> 1]] = bool(packed & 1)
+    result["flags"] = flags
+    if version >= 2:
+        result["clock"] = reader.uint()
+        timers = result["timers"] = {}
+        for _ in range(reader.uint()):
+            packed = reader.uint()
+            timers[reader.strings[packed >> 1]] = (
+                WALL_TIME.unpack(reader.take(WALL_TIME.size))[0] if packed & 1 else reader.uint()
+            )
+    if reader.pos != len(data):
+        raise CodecError(f"{len(data) - reader.pos} trailing bytes after state record")
+    return result
+
+
+# --- потоки записей ---
+
+def write_states(file: BinaryIO, states: Iterable[GameState], content: "GameContent", portable: bool = False) -> int:
+    """Пишет записи подряд, каждую с длиной впереди; возвращает число записей."""
+    count = 0
+    for state in states:
+        record = encode(state, content, portable)
+        prefix = bytearray()
+        _uint(prefix, len(record))
+        file.write(prefix)
+        file.write(record)
+        count += 1
+    return count
+
+
+def read_states(file: BinaryIO, content: "GameContent") -> Iterator[GameState]:
+    """Читает записи write_states по одной, не загружая поток целиком."""
+    while True:
+        length = _read_uint(file)
+        if length is None:
+            return
+        record = file.read(length)
+        if len(record) < length:
+            raise CodecError("state stream is truncated")
+        yield decode(record, content)
+
+
+def _read_uint(file: BinaryIO) -> int | None:
+    result = shift = 0
+    while True:
+        byte = file.read(1)
+        if not byte:
+            if shift:
+                raise CodecError("state stream is truncated")
+            return None
+        result |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return result
+        shift += 7
@@ -0,0 +1,490 @@
+"""
+Журнал выборов (event sourcing).
+
+Выбор детерминирован при данных состоянии и контенте, поэтому вместо
+состояния после каждого хода пишется только запись о примененном выборе:
+сессия, id выбора (для общих выборов - вид и предмет/объект), номер хода
+и время. Время от времени, а также после ходов, которые нельзя повторить
+по журналу (новая игра, отмена, загрузка слота), пишется компактный снимок
+состояния - только отличия от контента. Сессия восстанавливается из
+последнего снимка и выборов после него. Слоты сохранений пишутся отдельными
+записями и действуют, пока слот не перезаписан или сессия не отдана.
+
+Хранение - каталог сегментов journal-NNNNNN.log; запись - заголовок
+(длина, crc32) и marshal-кортеж. Записи копятся в памяти и пишутся пачкой
+с одним fsync на сегмент (групповая фиксация). Оборванный хвост последнего
+сегмента отрезается при открытии. Фоновая компактизация переписывает старые
+закрытые сегменты без записей, перекрытых более новым снимком той же сессии;
+последние keep_segments закрытых сегментов хранят полную историю.
+
+Гарантии: запись попадает на диск не позже flush_interval секунд или
+max_pending записей; при падении теряется только этот хвост.
+
+    python -m storage.journal JOURNAL_DIR [--session ID]
+"""
+import argparse
+import asyncio
+import logging
+import marshal
+import os
+import struct
+import threading
+import time
+import zlib
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from content_parts import GameContent
+from definitions import Choice, GameState
+from storage import codec
+from timers import SessionTimers
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct("<II")
+CHOICE = 1
+SNAPSHOT = 2
+# сессию забрал другой процесс (sharding): ее прежние записи больше не действуют
+RELEASE = 3
+# слот сохранения: choice - имя слота, state - запись storage.codec
+SLOT = 4
+# позиция записи - номер сегмента и смещение в нем, упакованные в одно число
+OFFSET_BITS = 40
+
+# шаблон результата общего выбора -> (реестр в GenericChoiceRegistry, параметр)
+GENERIC_TEMPLATES = {
+    "generic_pickup": ("pickup", "item"),
+    "generic_open": ("open", "object"),
+    "generic_close": ("close", "object"),
+}
+
+
+def position(segment: int, offset: int) -> int:
+    return segment << OFFSET_BITS | offset
+
+
+def split_position(pos: int) -> tuple[int, int]:
+    return pos >> OFFSET_BITS, pos & ((1 << OFFSET_BITS) - 1)
+
+
+@dataclass(frozen=True, slots=True)
+class Entry:
+    kind: int
+    session: str
+    tick: int
+    at: float
+    choice: str | None = None
+    # общий выбор: (реестр, id предмета или объекта)
+    generic: tuple[str, str] | None = None
+    # снимок: запись storage.codec (portable); в журналах старых версий - словарь GameState.diff()
+    state: bytes | dict[str, Any] | None = None
+
+    def pack(self) -> bytes:
+        payload = marshal.dumps((self.kind, self.session, self.tick, self.at, self.choice, self.generic, self.state))
+        return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    @classmethod
+    def unpack(cls, payload: bytes) -> "Entry":
+        return cls(*marshal.loads(payload))
+
+
+# --- выборы ---
+
+def choice_ref(choice: Choice, content: GameContent) -> tuple[str, tuple[str, str] | None]:
+    if choice.result is not None and choice.result.template in GENERIC_TEMPLATES:
+        registry, param = GENERIC_TEMPLATES[choice.result.template]
+        return choice.id, (registry, choice.result.params[param])
+    return choice.id, None
+
+
+def resolve_choice(content: GameContent, entry: Entry) -> Choice | None:
+    if entry.generic is None:
+        return None if entry.choice is None else content.choices.get(entry.choice)
+    registry, key = entry.generic
+    return getattr(content.generic, registry).get(key)
+
+
+def snapshot_diff(content: GameContent, entry: Entry) -> dict[str, Any]:
+    if isinstance(entry.state, dict):
+        return entry.state
+    if entry.state is None:
+        raise codec.CodecError(f"journal entry of session {entry.session} has no snapshot")
+    return codec.decode_diff(entry.state, content)
+
+
+def snapshot_state(content: GameContent, entry: Entry) -> GameState:
+    return GameState.from_diff(content, snapshot_diff(content, entry))
+
+
+# --- сегменты ---
+
+def scan(file: BinaryIO) -> Iterator[tuple[int, bytes]]:
+    """(смещение, запись целиком) до конца файла или первой испорченной записи."""
+    offset = 0
+    while True:
+        header = file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return
+        length, crc = HEADER.unpack(header)
+        payload = file.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        yield offset, header + payload
+        offset += HEADER.size + length
+
+
+def journal_sessions(path: str | os.PathLike) -> set[str]:
+    """
+    Сессии, которые можно восстановить из журнала в каталоге path. Только
+    читает сегменты: в отличие от Journal, не создает каталог и не отрезает
+    оборванный хвост.
+    """
+    sessions: set[str] = set()
+    for segment in sorted(Path(path).glob("journal-*.log")):
+        with segment.open("rb") as file:
+            for _, raw in scan(file):
+                entry = Entry.unpack(raw[HEADER.size:])
+                if entry.kind == RELEASE:
+                    sessions.discard(entry.session)
+                else:
+                    sessions.add(entry.session)
+    return sessions
+
+
+class Journal:
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        content: GameContent,
+        flush_interval: float = 0.05,
+        max_pending: int = 1000,
+        segment_bytes: int = 64 << 20,
+        snapshot_every: int = 100,
+        keep_segments: int = 4,
+        compact_interval: float = 600.0,
+    ) -> None:
+        self.dir = Path(path)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.content = content
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.segment_bytes = segment_bytes
+        self.snapshot_every = snapshot_every
+        self.keep_segments = keep_segments
+        self.compact_interval = compact_interval
+        # позиция последнего снимка сессии и позиции ее выборов после него
+        self.snapshots: dict[str, int] = {}
+        self.tails: dict[str, list[int]] = {}
+        # позиции последних записей слотов сессии: имя -> позиция
+        self.slots: dict[str, dict[str, int]] = {}
+        # позиции записей RELEASE отданных сессий
+        self.released: dict[str, int] = {}
+        # записи, еще не записанные на диск: (сегмент, байты)
+        self.buffer: list[tuple[int, bytes]] = []
+        self.segment = 1
+        self.size = 0
+        # чтение сегментов в потоках и подмена файлов компактизацией
+        self.files_lock = threading.Lock()
+        self.flush_lock = asyncio.Lock()
+        self._wakeup: asyncio.Event | None = None
+        self._recover()
+
+    def segment_path(self, segment: int) -> Path:
+        return self.dir / f"journal-{segment:06d}.log"
+
+    def segments(self) -> list[int]:
+        return sorted(int(p.stem.removeprefix("journal-")) for p in self.dir.glob("journal-*.log"))
+
+    def _recover(self) -> None:
+        segments = self.segments()
+        for n, segment in enumerate(segments):
+            path = self.segment_path(segment)
+            end = 0
+            with path.open("rb") as file:
+                for offset, raw in scan(file):
+                    self._index(Entry.unpack(raw[HEADER.size:]), position(segment, offset))
+                    end = offset + len(raw)
+            if end < path.stat().st_size:
+                if n == len(segments) - 1:
+                    logger.warning("journal %s: torn tail truncated at %d", path.name, end)
+                    with path.open("r+b") as file:
+                        file.truncate(end)
+                else:
+                    logger.error("journal %s: corrupt record at %d, rest of the segment ignored", path.name, end)
+        if segments:
+            self.segment = segments[-1]
+            self.size = self.segment_path(self.segment).stat().st_size
+
+    def _index(self, entry: Entry, pos: int) -> None:
+        if entry.kind == SNAPSHOT:
+            self.snapshots[entry.session] = pos
+            self.tails[entry.session] = []
+            self.released.pop(entry.session, None)
+        elif entry.kind == SLOT:
+            if entry.choice is not None:
+                self.slots.setdefault(entry.session, {})[entry.choice] = pos
+        elif entry.kind == RELEASE:
+            self.snapshots.pop(entry.session, None)
+            self.tails.pop(entry.session, None)
+            self.slots.pop(entry.session, None)
+            self.released[entry.session] = pos
+        else:
+            self.tails.setdefault(entry.session, []).append(pos)
+
+    # --- запись ---
+
+    def record_choice(self, session: str, tick: int, choice: Choice, state: GameState) -> None:
+        """Записывает примененный выбор; каждые snapshot_every выборов сессии - снимок."""
+        choice_id, generic = choice_ref(choice, self.content)
+        self._append(Entry(CHOICE, session, tick, time.time(), choice_id, generic))
+        if len(self.tails[session]) >= self.snapshot_every:
+            self.snapshot(session, tick, state)
+
+    def snapshot(self, session: str, tick: int, state: GameState) -> None:
+        self._append(Entry(SNAPSHOT, session, tick, time.time(), state=codec.encode(state, self.content, portable=True)))
+
+    def save_slot(self, session: str, tick: int, slot: str, data: bytes) -> None:
+        """Записывает слот сохранения; data - запись storage.codec (portable)."""
+        self._append(Entry(SLOT, session, tick, time.time(), slot, state=data))
+
+    def release(self, session: str) -> None:
+        """Сессия перешла к другому журналу: восстанавливать ее отсюда больше нельзя."""
+        self._append(Entry(RELEASE, session, 0, time.time()))
+
+    def sessions(self) -> list[str]:
+        """Сессии, которые можно восстановить из журнала."""
+        return list(self.snapshots.keys() | self.tails.keys())
+
+    def _append(self, entry: Entry) -> None:
+        raw = entry.pack()
+        if self.size and self.size + len(raw) > self.segment_bytes:
+            self.segment += 1
+            self.size = 0
+        self._index(entry, position(self.segment, self.size))
+        self.size += len(raw)
+        self.buffer.append((self.segment, raw))
+        if len(self.buffer) >= self.max_pending and self._wakeup is not None:
+            self._wakeup.set()
+
+    def write(self, batch: list[tuple[int, bytes]]) -> None:
+        """Пишет пачку с одним fsync на сегмент. Может выполняться в отдельном потоке."""
+        files: dict[int, tuple[BinaryIO, int]] = {}
+        try:
+            for segment, raw in batch:
+                if segment not in files:
+                    out = self.segment_path(segment).open("ab")
+                    files[segment] = (out, out.tell())
+                files[segment][0].write(raw)
+            for file, _ in files.values():
+                file.flush()
+                os.fsync(file.fileno())
+        except BaseException:
+            # позиции записей уже выданы - недописанная пачка должна исчезнуть целиком
+            for file, start in files.values():
+                file.truncate(start)
+            raise
+        finally:
+            for file, _ in files.values():
+                file.close()
+
+    def flush(self) -> int:
+        batch, self.buffer = self.buffer, []
+        if batch:
+            try:
+                self.write(batch)
+            except Exception:
+                self.buffer[:0] = batch
+                raise
+        return len(batch)
+
+    async def flush_async(self) -> None:
+        async with self.flush_lock:
+            batch, self.buffer = self.buffer, []
+            if not batch:
+                return
+            try:
+                await asyncio.to_thread(self.write, batch)
+            except Exception:
+                logger.exception("Journal flush failed, %d records requeued", len(batch))
+                self.buffer[:0] = batch
+
+    async def run(self) -> None:
+        """Фоновые сброс и компактизация для asyncio-приложения."""
+        self._wakeup = asyncio.Event()
+        next_compaction = time.monotonic() + self.compact_interval
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush_async()
+                if time.monotonic() >= next_compaction:
+                    await self.compact_async()
+                    next_compaction = time.monotonic() + self.compact_interval
+        finally:
+            self._wakeup = None
+            await self.flush_async()
+
+    # --- чтение ---
+
+    async def rebuild(self, session: str) -> GameState | None:
+        """Восстанавливает состояние сессии; None - сессии в журнале нет."""
+        await self.flush_async()
+        return await asyncio.to_thread(self.read_state, session)
+
+    def read_state(self, session: str) -> GameState | None:
+        with self.files_lock:
+            snapshot = self.snapshots.get(session)
+            positions = list(self.tails.get(session, ()))
+            if snapshot is None and not positions:
+                return None
+            if snapshot is not None:
+                positions.insert(0, snapshot)
+            entries = self._read(positions)
+        if entries[0].kind == SNAPSHOT:
+            state = snapshot_state(self.content, entries.pop(0))
+        else:
+            state = GameState.from_content(self.content)
+        # посещение отмечает Game.render_turn после каждого хода, в журнал оно не пишется;
+        # снимок мог быть сделан до первого экрана (новая игра, таймер)
+        state.set_location_visited()
+        # таймеры в ходах срабатывают при повторе так же, как в Game.tick
+        timers = SessionTimers(state, self.content)
+        for entry in entries:
+            choice = resolve_choice(self.content, entry)
+            if choice is None:
+                logger.warning("journal: session %s: choice %s no longer exists, skipped", session, entry.choice)
+                continue
+            if not choice.is_available(state, self.content):
+                logger.warning("journal: session %s: choice %s is not available on replay, skipped", session, entry.choice)
+                continue
+            # как Choice.apply, но без рендеринга текста результата
+            for effect in choice.do:
+                effect(state, self.content)
+            timers.tick()
+            state.set_location_visited()
+        timers.detach()
+        return state
+
+    async def read_slots_async(self, session: str) -> dict[str, bytes]:
+        await self.flush_async()
+        return await asyncio.to_thread(self.read_slots, session)
+
+    def read_slots(self, session: str) -> dict[str, bytes]:
+        """Слоты сохранений сессии: имя -> запись storage.codec."""
+        with self.files_lock:
+            entries = self._read(list(self.slots.get(session, {}).values()))
+        return {entry.choice: entry.state for entry in entries if entry.choice and isinstance(entry.state, bytes)}
+
+    def _read(self, positions: list[int]) -> list[Entry]:
+        files: dict[int, BinaryIO] = {}
+        try:
+            entries = []
+            for pos in positions:
+                segment, offset = split_position(pos)
+                file = files.get(segment)
+                if file is None:
+                    file = files[segment] = self.segment_path(segment).open("rb")
+                file.seek(offset)
+                length, _ = HEADER.unpack(file.read(HEADER.size))
+                entries.append(Entry.unpack(file.read(length)))
+            return entries
+        finally:
+            for file in files.values():
+                file.close()
+
+    def history(self, session: str | None = None) -> Iterator[Entry]:
+        """Все сохранившиеся записи (одной сессии) по порядку - для отладки и аналитики."""
+        for segment in self.segments():
+            with self.files_lock, self.segment_path(segment).open("rb") as file:
+                entries = [Entry.unpack(raw[HEADER.size:]) for _, raw in scan(file)]
+            for entry in entries:
+                if session is None or entry.session == session:
+                    yield entry
+
+    # --- компактизация ---
+
+    async def compact_async(self) -> int:
+        """Переписывает старые закрытые сегменты; возвращает число выброшенных записей."""
+        await self.flush_async()
+        sealed = [s for s in self.segments() if s < self.segment]
+        sealed = sealed[:len(sealed) - self.keep_segments] if self.keep_segments else sealed
+        if not sealed:
+            return 0
+        # записи до RELEASE тоже не нужны, сама RELEASE остается
+        snapshots = {**self.released, **self.snapshots}
+        # действующие слоты остаются, даже если они старше снимка
+        slots = {pos for positions in self.slots.values() for pos in positions.values()}
+        tmp, relocated, dropped = await asyncio.to_thread(self._compact, sealed, snapshots, slots)
+        if not dropped:
+            tmp.unlink()
+            return 0
+        # подмена файлов и позиций - в цикле событий, под блокировкой читателей
+        with self.files_lock:
+            os.replace(tmp, self.segment_path(sealed[-1]))
+            for segment in sealed[:-1]:
+                self.segment_path(segment).unlink()
+            for positions in (self.snapshots, self.released, *self.slots.values()):
+                for name, pos in positions.items():
+                    if pos in relocated:
+                        positions[name] = relocated[pos]
+            for tail in self.tails.values():
+                for n, pos in enumerate(tail):
+                    if pos in relocated:
+                        tail[n] = relocated[pos]
+        logger.info("journal: compacted %d segments, %d records dropped", len(sealed), dropped)
+        return dropped
+
+    def _compact(
+        self, sealed: list[int], snapshots: dict[str, int], slots: set[int]
+    ) -> tuple[Path, dict[int, int], int]:
+        target = sealed[-1]
+        tmp = self.segment_path(target).with_suffix(".compact")
+        relocated: dict[int, int] = {}
+        dropped = 0
+        with tmp.open("wb") as out:
+            for segment in sealed:
+                with self.segment_path(segment).open("rb") as file:
+                    for offset, raw in scan(file):
+                        pos = position(segment, offset)
+                        latest = snapshots.get(Entry.unpack(raw[HEADER.size:]).session)
+                        if latest is not None and pos < latest and pos not in slots:
+                            dropped += 1
+                            continue
+                        relocated[pos] = position(target, out.tell())
+                        out.write(raw)
+            out.flush()
+            os.fsync(out.fileno())
+        return tmp, relocated, dropped
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Dump the choice journal")
+    parser.add_argument("path")
+    parser.add_argument("--session")
+    args = parser.parse_args()
+
+    from init_content import ContentLoader
+    from loaders import SnapshotLoader
+
+    content, _ = ContentLoader(SnapshotLoader).init_content()
+    journal = Journal(args.path, content)
+    for entry in journal.history(args.session):
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.at))
+        if entry.kind == SNAPSHOT:
+            print(f"{stamp} {entry.session} #{entry.tick} snapshot at {snapshot_diff(content, entry)['location']}")
+        elif entry.kind == SLOT:
+            print(f"{stamp} {entry.session} #{entry.tick} saved slot {entry.choice}")
+        elif entry.kind == RELEASE:
+            print(f"{stamp} {entry.session} released")
+        else:
+            print(f"{stamp} {entry.session} #{entry.tick} {entry.choice}")
+
+
+if __name__ == "__main__":
+    main()
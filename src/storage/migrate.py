@@ -0,0 +1,659 @@
+"""
+Миграция сохраненных сессий после смены контента.
+
+Когда id предмета, объекта или локации переименован или удален, строки
+сессий в базе продолжают на него ссылаться. Правила миграции описываются
+в YAML списком:
+
+    - rule: rename_item        # rename_object, rename_location
+      from: old_key
+      to: rusty_key
+    - rule: drop_item          # drop_object, drop_location
+      id: needle
+    - rule: set_flag           # флаг нового объекта у уже начатых игр
+      object: trapdoor
+      flag: open
+      value: true
+      visited: cellar          # необязательно: только тем, кто там был
+
+Сессии читаются пачками по session_id (keyset - память не растет с числом
+сессий), правила применяются в пуле процессов, измененные сессии
+переписываются одной транзакцией на пачку. После каждой пачки в файл
+контрольной точки пишется последний обработанный ключ: прерванная миграция
+продолжается с него. Правила идемпотентны, поэтому пачка, записанная
+до падения, но не отмеченная в контрольной точке, безопасно проходит еще раз.
+--dry-run ничего не пишет и только считает затронутые сессии.
+
+Мигрировать нужно при остановленном боте: хранилище write-behind
+перезаписало бы строки сессий, которые держит в памяти.
+
+Мигрируется только база. Снимки журнала (storage.journal) не трогаются:
+при базе движок восстанавливает сессии из нее, а журнал без базы после
+смены контента потерял бы переименованные id (from_diff их отбрасывает).
+Поэтому, если в журнале (--journal-dir, по умолчанию JOURNAL_DIR) есть
+сессии, которых нет в базе, миграция отказывается запускаться.
+
+    python -m storage.migrate RULES.yaml --database-url URL [--dry-run]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from collections.abc import Callable, Collection, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import yaml
+from sqlalchemy import Engine, Table, bindparam, delete, select, update
+
+from content_parts import GameContent
+from overlay import FLAG_BITS
+from storage import models
+from storage.journal import journal_sessions
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+# таблицы, которые могут меняться правилами; флаги и таймеры сессий правила не трогают
+TABLES: dict[str, Table] = {
+    "inventory": models.inventory,
+    "objects": models.objects,
+    "location_items": models.location_items,
+    "visited": models.visited,
+}
+
+
+class RuleError(ValueError):
+    """Правило миграции записано неверно или не сходится с новым контентом."""
+
+
+@dataclass(frozen=True)
+class Target:
+    """Новый контент в виде, который дешево передать в процессы пула."""
+    start_location: str
+    items: frozenset[str]
+    locations: frozenset[str]
+    # объект -> (биты флагов, предметы) в начале игры
+    objects: dict[str, tuple[int, tuple[str, ...]]]
+    location_items: dict[str, tuple[str, ...]]
+
+    @classmethod
+    def from_content(cls, content: GameContent) -> "Target":
+        defaults = content.defaults
+        if defaults is None:
+            raise ValueError("content has no StateDefaults")
+        return cls(
+            start_location=defaults.start_location,
+            items=frozenset(content.items),
+            locations=frozenset(content.locations),
+            objects={
+                oid: (defaults.object_bits[index], defaults.object_items[index])
+                for oid, index in defaults.object_index.items()
+            },
+            location_items={lid: items for lid, items in defaults.location_items.items()},
+        )
+
+
+@dataclass
+class Record:
+    """Строки одной сессии; отсутствующая строка объекта или локации - значение из контента."""
+    session_id: str
+    current_location: str
+    return_location: str | None
+    inventory: dict[str, int] = field(default_factory=dict)
+    objects: dict[str, dict[str, Any]] = field(default_factory=dict)
+    location_items: dict[str, list[str]] = field(default_factory=dict)
+    visited: list[str] = field(default_factory=list)
+
+    def rows(self) -> dict[Table, list[dict]]:
+        sid = self.session_id
+        return {
+            models.inventory: [{"session_id": sid, "item_id": iid, "qty": qty} for iid, qty in self.inventory.items()],
+            models.objects: [
+                {"session_id": sid, "object_id": oid, "flags": row["flags"], "items": row["items"]}
+                for oid, row in self.objects.items()
+            ],
+            models.location_items: [
+                {"session_id": sid, "location_id": lid, "items": items} for lid, items in self.location_items.items()
+            ],
+            models.visited: [{"session_id": sid, "location_id": lid} for lid in self.visited],
+        }
+
+
+# --- правила ---
+
+RuleParser = Callable[[dict], "Rule"]
+RULES: dict[str, RuleParser] = {}
+
+
+def register_rule(*names: str) -> Callable[[RuleParser], RuleParser]:
+    def decorator(parse: RuleParser) -> RuleParser:
+        for name in names:
+            RULES[name] = parse
+        return parse
+    return decorator
+
+
+class Rule(ABC):
+
+    @property
+    @abstractmethod
+    def name(self) -> str:
+        """Подпись правила в отчете."""
+
+    def check(self, target: Target) -> None:
+        """RuleError, если правило не сходится с новым контентом."""
+
+    @abstractmethod
+    def apply(self, record: Record, target: Target) -> bool:
+        """Применяет правило к сессии; True - сессия изменилась."""
+
+
+def _known(target: Target, what: str) -> Collection[str]:
+    return {"item": target.items, "object": target.objects.keys(), "location": target.locations}[what]
+
+
+def _replace(items: list[str], source: str, replacement: str | None) -> bool:
+    if source not in items:
+        return False
+    if replacement is None:
+        items[:] = [iid for iid in items if iid != source]
+    else:
+        items[:] = [replacement if iid == source else iid for iid in items]
+    return True
+
+
+@dataclass(frozen=True)
+class Rename(Rule):
+    what: str
+    source: str
+    target: str
+
+    @property
+    def name(self) -> str:
+        return f"rename_{self.what} {self.source} -> {self.target}"
+
+    def check(self, target: Target) -> None:
+        known = _known(target, self.what)
+        if self.target not in known:
+            raise RuleError(f"{self.name}: no {self.what} {self.target!r} in the content")
+        if self.source in known:
+            raise RuleError(f"{self.name}: {self.what} {self.source!r} is still in the content")
+
+    def apply(self, record: Record, target: Target) -> bool:
+        if self.what == "item":
+            return self._item(record)
+        if self.what == "object":
+            return self._object(record)
+        return self._location(record)
+
+    def _item(self, record: Record) -> bool:
+        changed = False
+        qty = record.inventory.pop(self.source, 0)
+        if qty:
+            record.inventory[self.target] = record.inventory.get(self.target, 0) + qty
+            changed = True
+        for row in record.objects.values():
+            changed |= _replace(row["items"], self.source, self.target)
+        for items in record.location_items.values():
+            changed |= _replace(items, self.source, self.target)
+        return changed
+
+    def _object(self, record: Record) -> bool:
+        row = record.objects.pop(self.source, None)
+        if row is None:
+            return False
+        # состояние игрока важнее строки нового id: она бывает, только если объект уже был в контенте
+        record.objects[self.target] = row
+        return True
+
+    def _location(self, record: Record) -> bool:
+        changed = False
+        if record.current_location == self.source:
+            record.current_location = self.target
+            changed = True
+        if record.return_location == self.source:
+            record.return_location = self.target
+            changed = True
+        items = record.location_items.pop(self.source, None)
+        if items is not None:
+            record.location_items[self.target] = record.location_items.get(self.target, []) + items
+            changed = True
+        if self.source in record.visited:
+            record.visited = list(dict.fromkeys(self.target if lid == self.source else lid for lid in record.visited))
+            changed = True
+        return changed
+
+
+@dataclass(frozen=True)
+class Drop(Rule):
+    what: str
+    id: str
+
+    @property
+    def name(self) -> str:
+        return f"drop_{self.what} {self.id}"
+
+    def check(self, target: Target) -> None:
+        if self.id in _known(target, self.what):
+            raise RuleError(f"{self.name}: {self.what} {self.id!r} is still in the content")
+
+    def apply(self, record: Record, target: Target) -> bool:
+        if self.what == "item":
+            changed = record.inventory.pop(self.id, None) is not None
+            for row in record.objects.values():
+                changed |= _replace(row["items"], self.id, None)
+            for items in record.location_items.values():
+                changed |= _replace(items, self.id, None)
+            return changed
+        if self.what == "object":
+            return record.objects.pop(self.id, None) is not None
+        changed = record.location_items.pop(self.id, None) is not None
+        if record.current_location == self.id:
+            # как GameState.from_diff: игрок из пропавшей локации начинает со стартовой
+            record.current_location = target.start_location
+            changed = True
+        if record.return_location == self.id:
+            record.return_location = None
+            changed = True
+        if self.id in record.visited:
+            record.visited.remove(self.id)
+            changed = True
+        return changed
+
+
+@dataclass(frozen=True)
+class SetFlag(Rule):
+    object: str
+    flag: str
+    value: bool
+    visited: str | None = None
+
+    @property
+    def name(self) -> str:
+        when = f" if visited {self.visited}" if self.visited else ""
+        return f"set_flag {self.object}.{self.flag}={str(self.value).lower()}{when}"
+
+    def check(self, target: Target) -> None:
+        if self.object not in target.objects:
+            raise RuleError(f"{self.name}: no object {self.object!r} in the content")
+        if self.flag not in FLAG_BITS:
+            raise RuleError(f"{self.name}: unknown flag {self.flag!r}")
+        if self.visited is not None and self.visited not in target.locations:
+            raise RuleError(f"{self.name}: no location {self.visited!r} in the content")
+
+    def apply(self, record: Record, target: Target) -> bool:
+        if self.visited is not None and self.visited not in record.visited:
+            return False
+        row = record.objects.get(self.object)
+        if row is None:
+            bits, items = target.objects[self.object]
+            row = {"flags": bits, "items": list(items)}
+        bit = FLAG_BITS[self.flag]
+        bits = row["flags"] | bit if self.value else row["flags"] & ~bit
+        if bits == row["flags"]:
+            return False
+        record.objects[self.object] = {**row, "flags": bits}
+        return True
+
+
+def _spec(spec: dict, *keys: str) -> list[Any]:
+    missing = [key for key in keys if key not in spec]
+    if missing:
+        raise RuleError(f"{spec.get('rule')}: missing {', '.join(missing)}")
+    return [spec[key] for key in keys]
+
+
+@register_rule("rename_item", "rename_object", "rename_location")
+def _parse_rename(spec: dict) -> Rule:
+    return Rename(spec["rule"].removeprefix("rename_"), *_spec(spec, "from", "to"))
+
+
+@register_rule("drop_item", "drop_object", "drop_location")
+def _parse_drop(spec: dict) -> Rule:
+    return Drop(spec["rule"].removeprefix("drop_"), *_spec(spec, "id"))
+
+
+@register_rule("set_flag")
+def _parse_set_flag(spec: dict) -> Rule:
+    obj, flag, value = _spec(spec, "object", "flag", "value")
+    return SetFlag(obj, flag, bool(value), spec.get("visited"))
+
+
+def parse_rules(specs: list[dict]) -> list[Rule]:
+    rules = []
+    for spec in specs:
+        if not isinstance(spec, dict):
+            raise RuleError(f"migration rule must be a mapping, got {spec!r}")
+        name = spec.get("rule")
+        parse = RULES.get(name) if isinstance(name, str) else None
+        if parse is None:
+            raise RuleError(f"unknown migration rule {spec.get('rule')!r}")
+        rules.append(parse(spec))
+    return rules
+
+
+def load_rules(path: Path) -> tuple[list[Rule], str]:
+    """Правила из YAML и их отпечаток для контрольной точки."""
+    specs = yaml.safe_load(path.read_text(encoding="utf-8")) or []
+    fingerprint = hashlib.sha256(json.dumps(specs, sort_keys=True).encode()).hexdigest()[:16]
+    return parse_rules(specs), fingerprint
+
+
+# --- преобразование в процессах пула ---
+
+_rules: list[Rule] = []
+_target: Target | None = None
+
+
+def _init_worker(rules: list[Rule], target: Target) -> None:
+    global _rules, _target
+    _rules, _target = rules, target
+
+
+def _normalize(record: Record, target: Target) -> None:
+    """
+    Строка, совпавшая с контентом, не нужна - как у WriteBehindStore,
+    предметы сравниваются без учета порядка.
+    """
+    for oid, row in list(record.objects.items()):
+        default = target.objects.get(oid)
+        if default is not None and default[0] == row["flags"] and Counter(row["items"]) == Counter(default[1]):
+            del record.objects[oid]
+    for lid, items in list(record.location_items.items()):
+        default_items = target.location_items.get(lid)
+        if default_items is not None and Counter(items) == Counter(default_items):
+            del record.location_items[lid]
+
+
+def _dangling(record: Record, target: Target) -> Iterator[tuple[str, str]]:
+    """Ссылки, которые остались неизвестными новому контенту."""
+    places = [*record.location_items.values(), *(row["items"] for row in record.objects.values())]
+    for iid in {*record.inventory, *(iid for items in places for iid in items)}:
+        if iid not in target.items:
+            yield "item", iid
+    for oid in record.objects:
+        if oid not in target.objects:
+            yield "object", oid
+    for lid in {record.current_location, record.return_location, *record.location_items, *record.visited}:
+        if lid is not None and lid not in target.locations:
+            yield "location", lid
+
+
+def transform(batch: list[Record]) -> tuple[list[Record], Counter, Counter]:
+    """Применяет правила к пачке: измененные сессии, счетчик по правилам, оставшиеся висячие ссылки."""
+    target = _target
+    if target is None:
+        raise RuntimeError("migration rules are not set in this process")
+    changed: list[Record] = []
+    applied: Counter = Counter()
+    dangling: Counter = Counter()
+    for record in batch:
+        hit = False
+        for rule in _rules:
+            if rule.apply(record, target):
+                applied[rule.name] += 1
+                hit = True
+        if hit:
+            _normalize(record, target)
+            changed.append(record)
+        dangling.update(set(_dangling(record, target)))
+    return changed, applied, dangling
+
+
+# --- чтение и запись ---
+
+def read_batches(engine: Engine, after: str | None, batch_size: int) -> Iterator[list[Record]]:
+    """Сессии по возрастанию session_id пачками по batch_size, начиная после after."""
+    sessions = models.sessions
+    while True:
+        with engine.connect() as conn:
+            query = select(sessions).order_by(sessions.c.session_id).limit(batch_size)
+            if after is not None:
+                query = query.where(sessions.c.session_id > after)
+            records = {
+                row.session_id: Record(row.session_id, row.current_location, row.return_location)
+                for row in conn.execute(query)
+            }
+            if not records:
+                return
+            ids = list(records)
+            for name, table in TABLES.items():
+                for row in conn.execute(select(table).where(table.c.session_id.in_(ids))):
+                    record = records[row.session_id]
+                    if name == "inventory":
+                        record.inventory[row.item_id] = row.qty
+                    elif name == "objects":
+                        record.objects[row.object_id] = {"flags": row.flags, "items": list(row.items)}
+                    elif name == "location_items":
+                        record.location_items[row.location_id] = list(row.items)
+                    else:
+                        record.visited.append(row.location_id)
+        after = ids[-1]
+        yield list(records.values())
+
+
+def write_batch(engine: Engine, records: list[Record]) -> None:
+    """Переписывает измененные таблицы сессий одной транзакцией: удаление и вставка пачкой."""
+    if not records:
+        return
+    ids = [record.session_id for record in records]
+    inserts: dict[Table, list[dict]] = {}
+    for record in records:
+        for table, rows in record.rows().items():
+            inserts.setdefault(table, []).extend(rows)
+    sessions = models.sessions
+    with engine.begin() as conn:
+        conn.execute(
+            update(sessions)
+            .where(sessions.c.session_id == bindparam("b_session_id"))
+            .values(current_location=bindparam("b_current"), return_location=bindparam("b_return")),
+            [
+                {"b_session_id": r.session_id, "b_current": r.current_location, "b_return": r.return_location}
+                for r in records
+            ],
+        )
+        for table in TABLES.values():
+            conn.execute(delete(table).where(table.c.session_id.in_(ids)))
+            if inserts.get(table):
+                conn.execute(table.insert(), inserts[table])
+
+
+def journal_only(engine: Engine, journal_dir: Path) -> list[str]:
+    """Сессии журналов в journal_dir и каталогах рабочих процессов, которых нет в базе."""
+    found: set[str] = set()
+    for directory in {path.parent for path in journal_dir.rglob("journal-*.log")}:
+        found |= journal_sessions(directory)
+    ids = sorted(found)
+    missing: list[str] = []
+    sessions = models.sessions
+    with engine.connect() as conn:
+        for start in range(0, len(ids), BATCH_SIZE):
+            chunk = ids[start:start + BATCH_SIZE]
+            stored = set(conn.scalars(select(sessions.c.session_id).where(sessions.c.session_id.in_(chunk))))
+            missing.extend(sid for sid in chunk if sid not in stored)
+    return missing
+
+
+# --- проход по всем сессиям ---
+
+@dataclass
+class Progress:
+    """Контрольная точка: последний обработанный session_id и счетчики до него."""
+    rules: str
+    last: str | None = None
+    scanned: int = 0
+    changed: int = 0
+    applied: Counter = field(default_factory=Counter)
+    dangling: Counter = field(default_factory=Counter)
+
+    def save(self, path: Path) -> None:
+        data = {
+            "rules": self.rules,
+            "last": self.last,
+            "scanned": self.scanned,
+            "changed": self.changed,
+            "applied": dict(self.applied),
+            "dangling": [[what, oid, n] for (what, oid), n in self.dangling.items()],
+        }
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "Progress":
+        data = json.loads(path.read_text(encoding="utf-8"))
+        return cls(
+            rules=data["rules"],
+            last=data["last"],
+            scanned=data["scanned"],
+            changed=data["changed"],
+            applied=Counter(data["applied"]),
+            dangling=Counter({(what, oid): n for what, oid, n in data["dangling"]}),
+        )
+
+
+def migrate(
+    engine: Engine,
+    rules: list[Rule],
+    target: Target,
+    progress: Progress,
+    checkpoint: Path | None = None,
+    dry_run: bool = False,
+    batch_size: int = BATCH_SIZE,
+    workers: int = 0,
+) -> Progress:
+    """
+    Проводит все сессии после progress.last через правила. workers - размер
+    пула процессов, 0 - преобразование в этом процессе. Пока пул разбирает
+    пачку, предыдущая пишется в базу и читается следующая: в памяти не
+    больше двух пачек.
+    """
+    for rule in rules:
+        rule.check(target)
+    _init_worker(rules, target)
+    pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(rules, target)) if workers else None
+    try:
+        previous = None
+        for batch in read_batches(engine, progress.last, batch_size):
+            if pool is None:
+                transformed = [_done(transform(batch))]
+            else:
+                size = -(-len(batch) // workers)
+                transformed = [pool.submit(transform, batch[i:i + size]) for i in range(0, len(batch), size)]
+            if previous is not None:
+                _finish(engine, progress, *previous, checkpoint, dry_run)
+            previous = batch, transformed
+        if previous is not None:
+            _finish(engine, progress, *previous, checkpoint, dry_run)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return progress
+
+
+def _done(result: Any) -> Future:
+    future: Future = Future()
+    future.set_result(result)
+    return future
+
+
+def _finish(
+    engine: Engine,
+    progress: Progress,
+    batch: list[Record],
+    transformed: list[Future],
+    checkpoint: Path | None,
+    dry_run: bool,
+) -> None:
+    changed: list[Record] = []
+    for future in transformed:
+        records, applied, dangling = future.result()
+        changed.extend(records)
+        progress.applied.update(applied)
+        progress.dangling.update(dangling)
+    if not dry_run:
+        write_batch(engine, changed)
+    progress.last = batch[-1].session_id
+    progress.scanned += len(batch)
+    progress.changed += len(changed)
+    if checkpoint is not None and not dry_run:
+        progress.save(checkpoint)
+    logger.info("%d sessions scanned, %d changed, last %s", progress.scanned, progress.changed, progress.last)
+
+
+def report(progress: Progress, dry_run: bool) -> None:
+    verb = "would change" if dry_run else "changed"
+    print(f"sessions scanned: {progress.scanned}, {verb}: {progress.changed}")
+    for name, count in progress.applied.most_common():
+        print(f"  {count:8d}  {name}")
+    if progress.dangling:
+        print("references unknown to the content (no rule covers them):")
+        for (what, oid), count in progress.dangling.most_common():
+            print(f"  {count:8d}  {what} {oid}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Migrate saved sessions after content changes")
+    parser.add_argument("rules", type=Path)
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"))
+    parser.add_argument(
+        "--journal-dir", type=Path, default=os.environ.get("JOURNAL_DIR"),
+        help="журнал бота: миграция откажется, если в нем есть сессии, которых нет в базе",
+    )
+    parser.add_argument("--content-dir", type=Path, default=None, help="новый контент, по умолчанию world/")
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать затронутые сессии")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="0 - без пула процессов")
+    parser.add_argument("--checkpoint", type=Path, default=None, help="по умолчанию RULES.progress")
+    parser.add_argument("--restart", action="store_true", help="начать заново, не глядя на контрольную точку")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("--database-url or DATABASE_URL is required")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    from init_content import ContentLoader
+    from loaders import SnapshotLoader, loader_for
+    from storage.write_behind import make_engine
+
+    try:
+        rules, fingerprint = load_rules(args.rules)
+    except RuleError as e:
+        parser.error(str(e))
+    loader = loader_for(SnapshotLoader, args.content_dir) if args.content_dir else SnapshotLoader
+    target = Target.from_content(ContentLoader(loader).init_content()[0])
+
+    checkpoint = args.checkpoint or args.rules.with_suffix(".progress")
+    progress = Progress(fingerprint)
+    if checkpoint.exists() and not args.restart and not args.dry_run:
+        progress = Progress.load(checkpoint)
+        if progress.rules != fingerprint:
+            parser.error(f"{checkpoint} was written for other rules; use --restart")
+        logger.info("resuming after %s (%d sessions done)", progress.last, progress.scanned)
+
+    engine = make_engine(args.database_url)
+    if args.journal_dir is not None:
+        missing = journal_only(engine, args.journal_dir)
+        if missing:
+            parser.error(
+                f"{len(missing)} sessions (e.g. {', '.join(missing[:3])}) exist only in the journal "
+                f"{args.journal_dir}; journal snapshots are not migrated"
+            )
+    started = time.perf_counter()
+    try:
+        migrate(engine, rules, target, progress, checkpoint, args.dry_run, args.batch_size, args.workers)
+    except RuleError as e:
+        parser.error(str(e))
+    report(progress, args.dry_run)
+    print(f"done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    Column,
+    Float,
+    Integer,
+    LargeBinary,
+    MetaData,
+    String,
+    Table,
+)
+
+metadata = MetaData()
+
+# Для объектов и предметов локаций храним только отличия от контента:
+# отсутствие строки означает "как в начале игры".
+
+sessions = Table(
+    "game_sessions",
+    metadata,
+    Column("session_id", String, primary_key=True),
+    Column("current_location", String, nullable=False),
+    Column("return_location", String, nullable=True),
+    Column("clock", Integer, nullable=False, server_default="0"),
+)
+
+inventory = Table(
+    "session_inventory",
+    metadata,
+    Column("session_id", String, primary_key=True),
+    Column("item_id", String, primary_key=True),
+    Column("qty", Integer, nullable=False),
+)
+
+objects = Table(
+    "session_objects",
+    metadata,
+    Column("session_id", String, primary_key=True),
+    Column("object_id", String, primary_key=True),
+    Column("flags", Integer, nullable=False),
+    Column("items", JSON, nullable=False),
+)
+
+location_items = Table(
+    "session_location_items",
+    metadata,
+    Column("session_id", String, primary_key=True),
+    Column("location_id", String, primary_key=True),
+    Column("items", JSON, nullable=False),
+)
+
+visited = Table(
+    "session_visited",
+    metadata,
+    Column("session_id", String, primary_key=True),
+    Column("location_id", String, primary_key=True),
+)
+
+flags = Table(
+    "session_flags",
+    metadata,
+    Column("session_id", String, primary_key=True),
+    Column("name", String, primary_key=True),
+    Column("value", Boolean, nullable=False),
+)
+
+# срок - номер хода или time.time(), смотря по таймеру в контенте
+timers = Table(
+    "session_timers",
+    metadata,
+    Column("session_id", String, primary_key=True),
+    Column("timer_id", String, primary_key=True),
+    Column("due", Float, nullable=False),
+)
+
+# слоты сохранений (Game.slots): запись storage.codec в portable-виде, поэтому
+# при смене контента она сверяется при чтении; полная перезапись состояния
+# сессии (новая игра, смена контента) слоты не трогает
+slots = Table(
+    "session_slots",
+    metadata,
+    Column("session_id", String, primary_key=True),
+    Column("slot", String, primary_key=True),
+    Column("data", LargeBinary, nullable=False),
+)
+
+# таблица -> имя ключевой колонки внутри сессии
+KEY_COLUMNS: dict[Table, str] = {
+    inventory: "item_id",
+    objects: "object_id",
+    location_items: "location_id",
+    visited: "location_id",
+    flags: "name",
+    timers: "timer_id",
+    slots: "slot",
+}
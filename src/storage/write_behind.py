@@ -0,0 +1,452 @@
+"""
+Отложенная (write-behind) запись GameState в базу.
+
+Эффекты сообщают о затронутых фактах через GameState.touch, хранилище копит
+их в памяти и раз в flush_interval секунд (или раньше, когда накопилось
+max_pending фактов) записывает одной транзакцией только измененные строки.
+Значения читаются из живого состояния в момент сбора пачки, поэтому
+несколько изменений одного факта между сбросами дают одну запись.
+
+Гарантии при падении процесса:
+- каждая пачка пишется в одной транзакции: в базе либо вся пачка, либо ничего;
+- пачка собирается для всех сессий в один момент, поэтому каждая сессия в базе
+  соответствует состоянию, которое было в памяти на границе одного из сбросов;
+- изменения после последнего успешного сброса теряются (не больше
+  flush_interval секунд или max_pending фактов);
+- если запись пачки не удалась, ее факты возвращаются в очередь и будут
+  записаны следующим сбросом.
+
+Слоты сохранений идут той же очередью фактами ("slot", имя), но значение
+кодируется сразу при сохранении (save_slot) и хранится до записи.
+"""
+import asyncio
+import logging
+import threading
+from contextlib import AbstractContextManager, nullcontext
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import Delete, Engine, Table, bindparam, create_engine, delete, select
+from sqlalchemy.pool import StaticPool
+
+from content_parts import GameContent
+from definitions import (
+    ANY_FACT,
+    Fact,
+    FactObserver,
+    GameState,
+    Inventory,
+    ItemId,
+    LocationId,
+    ObjectId,
+)
+from overlay import ItemBag, flags_to_bits
+from persistent import PersistentDict, PersistentSet
+from storage import models
+
+logger = logging.getLogger(__name__)
+
+SessionId = str
+
+FACT_TABLES: dict[str, Table] = {
+    "inventory": models.inventory,
+    "object": models.objects,
+    "location_items": models.location_items,
+    "visited": models.visited,
+    "flag": models.flags,
+    "timer": models.timers,
+}
+
+
+def make_engine(url: str, pool_size: int = 5, **kwargs: Any) -> Engine:
+    if url.startswith("sqlite"):
+        if ":memory:" in url or url in ("sqlite://", "sqlite:///"):
+            # одна общая память для потока сброса и основного потока
+            kwargs.setdefault("poolclass", StaticPool)
+        kwargs.setdefault("connect_args", {"check_same_thread": False})
+    else:
+        kwargs.setdefault("pool_size", pool_size)
+    return create_engine(url, pool_pre_ping=True, **kwargs)
+
+
+@dataclass
+class Batch:
+    # сессии, которые переписываются целиком
+    full: list[SessionId] = field(default_factory=list)
+    deletes: dict[Table, list[dict]] = field(default_factory=dict)
+    inserts: dict[Table, list[dict]] = field(default_factory=dict)
+    facts: dict[SessionId, set[Fact]] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.facts)
+
+
+class WriteBehindStore:
+    def __init__(
+        self,
+        engine: Engine,
+        content: GameContent,
+        flush_interval: float = 1.0,
+        max_pending: int = 1000,
+    ) -> None:
+        self.engine = engine
+        self.content = content
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.states: dict[SessionId, GameState] = {}
+        self.observers: dict[SessionId, FactObserver] = {}
+        self.pending: dict[SessionId, set[Fact]] = {}
+        self.pending_count = 0
+        self.untracked: set[SessionId] = set()
+        # еще не записанные слоты: сессия -> имя -> запись storage.codec
+        self.slots: dict[SessionId, dict[str, bytes]] = {}
+        # сессии пачки, которая сейчас пишется: в базе их строки еще старые
+        self.writing: set[SessionId] = set()
+        # запись пачки и чтение сессии идут в разных потоках; у sqlite в памяти
+        # (StaticPool) на всех одно соединение - тогда обращения идут по одному,
+        # а пул соединений пропускает их параллельно
+        self.db_lock: AbstractContextManager[Any] = (
+            threading.Lock() if isinstance(engine.pool, StaticPool) else nullcontext()
+        )
+        # пачки пишутся по очереди: более старая не должна лечь поверх новой
+        self.flush_lock = asyncio.Lock()
+        self._wakeup: asyncio.Event | None = None
+
+    def create_schema(self) -> None:
+        models.metadata.create_all(self.engine)
+
+    # --- отслеживание изменений ---
+
+    def track(self, session_id: SessionId, state: GameState, new: bool = True) -> None:
+        """Начинает следить за сессией; новая сессия будет записана целиком."""
+        def observer(fact: Fact) -> None:
+            self._mark(session_id, fact)
+
+        self.untracked.discard(session_id)
+        self.states[session_id] = state
+        self.observers[session_id] = observer
+        state.subscribe(observer)
+        if new:
+            self._mark(session_id, ANY_FACT)
+
+    def untrack(self, session_id: SessionId) -> None:
+        observer = self.observers.pop(session_id, None)
+        if observer is None:
+            return
+        self.states[session_id].unsubscribe(observer)
+        if session_id in self.pending or session_id in self.writing:
+            # состояние нужно, пока оно не записано
+            self.untracked.add(session_id)
+        else:
+            del self.states[session_id]
+
+    def resume(self, session_id: SessionId) -> GameState | None:
+        """
+        Снова отслеживает сессию, которую отпустили, но еще не записали:
+        ее состояние в памяти новее базы. None - читать из базы.
+        """
+        if session_id not in self.untracked:
+            return None
+        state = self.states[session_id]
+        self.track(session_id, state, new=False)
+        return state
+
+    def swap_content(self, content: GameContent, states: dict[SessionId, GameState]) -> None:
+        """
+        Переключает хранилище на новый контент. states - сверенные с ним
+        состояния отслеживаемых сессий; отпущенные, но еще не записанные
+        сверяются здесь. Все они переписываются целиком, чтобы исчезли строки
+        удаленных объектов и локаций.
+        """
+        self.content = content
+        for session_id, state in list(self.states.items()):
+            observer = self.observers.pop(session_id, None)
+            if observer is not None:
+                state.unsubscribe(observer)
+                self.track(session_id, states.get(session_id) or GameState.from_diff(content, state.diff()))
+            else:
+                self.states[session_id] = GameState.from_diff(content, state.diff())
+                self._mark(session_id, ANY_FACT)
+
+    def _mark(self, session_id: SessionId, fact: Fact) -> None:
+        if fact[0] == "location" or fact[0] == "clock":
+            # обе локации перехода и номер хода пишутся одной строкой сессии
+            fact = ("location",)
+        facts = self.pending.setdefault(session_id, set())
+        if fact not in facts:
+            facts.add(fact)
+            self.pending_count += 1
+            if self.pending_count >= self.max_pending and self._wakeup is not None:
+                self._wakeup.set()
+
+    # --- сброс ---
+
+    def collect(self) -> Batch:
+        """Собирает строки для всех накопленных фактов. Вызывается в потоке игры."""
+        batch = Batch(facts=self.pending)
+        self.pending = {}
+        self.pending_count = 0
+        for session_id, facts in batch.facts.items():
+            state = self.states[session_id]
+            if ANY_FACT in facts:
+                batch.full.append(session_id)
+                self._collect_full(batch, session_id, state)
+                # слоты полная перезапись не покрывает
+                facts = {fact for fact in facts if fact[0] == "slot"}
+            for fact in facts:
+                self._collect_fact(batch, session_id, state, fact)
+        return batch
+
+    def write(self, batch: Batch) -> None:
+        """Пишет пачку одной транзакцией. Может выполняться в отдельном потоке."""
+        with self.db_lock, self.engine.begin() as conn:
+            if batch.full:
+                for table in models.metadata.sorted_tables:
+                    if table is models.slots:
+                        continue
+                    conn.execute(delete(table).where(table.c.session_id.in_(batch.full)))
+            for table, keys in batch.deletes.items():
+                conn.execute(_delete_by_key(table), keys)
+            for table, rows in batch.inserts.items():
+                conn.execute(table.insert(), rows)
+
+    def requeue(self, batch: Batch) -> None:
+        for session_id, facts in batch.facts.items():
+            for fact in facts:
+                self._mark(session_id, fact)
+
+    def save_slot(self, session_id: SessionId, slot: str, data: bytes) -> None:
+        """Запоминает слот сессии до записи; сессия должна отслеживаться."""
+        self.slots.setdefault(session_id, {})[slot] = data
+        self._mark(session_id, ("slot", slot))
+
+    def load_slots(self, session_id: SessionId) -> dict[str, bytes]:
+        """Слоты сессии: из базы и еще не записанные (они новее). Может выполняться в отдельном потоке."""
+        # копия до чтения базы: слот убирают из памяти только после записи
+        pending = dict(self.slots.get(session_id, {}))
+        with self.db_lock, self.engine.connect() as conn:
+            stored = {
+                r.slot: r.data
+                for r in conn.execute(select(models.slots).where(models.slots.c.session_id == session_id))
+            }
+        return stored | pending
+
+    def _release_slots(self, batch: Batch) -> None:
+        for row in batch.inserts.get(models.slots, ()):
+            pending = self.slots.get(row["session_id"])
+            # слот могли сохранить заново, пока пачка писалась
+            if pending is not None and pending.get(row["slot"]) is row["data"]:
+                del pending[row["slot"]]
+                if not pending:
+                    del self.slots[row["session_id"]]
+
+    def _release_untracked(self) -> None:
+        for session_id in self.untracked - self.pending.keys() - self.writing:
+            self.states.pop(session_id, None)
+            self.untracked.discard(session_id)
+
+    def flush(self) -> int:
+        batch = self.collect()
+        if not batch:
+            return 0
+        try:
+            self.write(batch)
+        except Exception:
+            self.requeue(batch)
+            raise
+        self._release_slots(batch)
+        self._release_untracked()
+        return len(batch.facts)
+
+    async def run(self) -> None:
+        """Фоновый цикл сброса для asyncio-приложения."""
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush_async()
+        finally:
+            self._wakeup = None
+            await self.flush_async()
+
+    async def flush_async(self) -> None:
+        async with self.flush_lock:
+            batch = self.collect()
+            if not batch:
+                return
+            # пока пачка пишется в другом потоке, выгруженные сессии из нее
+            # остаются в памяти: resume вернет их вместо строк из базы
+            self.writing = set(batch.facts)
+            try:
+                await asyncio.to_thread(self.write, batch)
+            except Exception:
+                logger.exception("Write-behind flush failed, %d sessions requeued", len(batch.facts))
+                self.requeue(batch)
+                return
+            finally:
+                self.writing = set()
+            self._release_slots(batch)
+            self._release_untracked()
+
+    # --- строки ---
+
+    def _collect_full(self, batch: Batch, session_id: SessionId, state: GameState) -> None:
+        self._insert(batch, models.sessions, self._session_row(session_id, state))
+        for iid in state.inventory.items:
+            self._collect_fact(batch, session_id, state, ("inventory", iid), deleted=True)
+        # объекты и локации - только отличия оверлеев, а не весь мир
+        objects = state.objects
+        object_ids = objects.defaults.object_ids
+        for index in sorted({*objects.changed_bits, *objects.contents.changed}):
+            self._collect_fact(batch, session_id, state, ("object", object_ids[index]), deleted=True)
+        for lid in state.locations_items.contents.changed:
+            self._collect_fact(batch, session_id, state, ("location_items", lid), deleted=True)
+        for lid in state.visited_locations:
+            self._collect_fact(batch, session_id, state, ("visited", lid), deleted=True)
+        for name in state.flags:
+            self._collect_fact(batch, session_id, state, ("flag", name), deleted=True)
+        for tid in state.timers:
+            self._collect_fact(batch, session_id, state, ("timer", tid), deleted=True)
+
+    def _collect_fact(
+        self, batch: Batch, session_id: SessionId, state: GameState, fact: Fact, deleted: bool = False
+    ) -> None:
+        kind = fact[0]
+        if kind == "location":
+            batch.deletes.setdefault(models.sessions, []).append({"b_session_id": session_id})
+            self._insert(batch, models.sessions, self._session_row(session_id, state))
+            return
+        if kind == "slot":
+            batch.deletes.setdefault(models.slots, []).append({"b_session_id": session_id, "b_key": fact[1]})
+            self._insert(batch, models.slots, {
+                "session_id": session_id, "slot": fact[1], "data": self.slots[session_id][fact[1]],
+            })
+            return
+        table = FACT_TABLES.get(kind)
+        if table is None:
+            return
+        key = fact[1]
+        if not deleted:
+            batch.deletes.setdefault(table, []).append({"b_session_id": session_id, "b_key": key})
+        row = self._row(state, kind, key)
+        if row is not None:
+            row["session_id"] = session_id
+            row[models.KEY_COLUMNS[table]] = key
+            self._insert(batch, table, row)
+
+    def _row(self, state: GameState, kind: str, key: str) -> dict | None:
+        """Значение факта или None, если строка не нужна (значение по умолчанию)."""
+        if kind == "inventory":
+            qty = state.inventory.items.get(ItemId(key), 0)
+            return {"qty": qty} if qty > 0 else None
+        if kind == "object":
+            defaults = self.content.defaults
+            index = defaults.object_index[ObjectId(key)]
+            o = state.objects[ObjectId(key)]
+            bits = flags_to_bits(o.flags)
+            items = ItemBag(o.items)
+            # как и оверлей, предметы сравниваются без учета порядка
+            if bits == defaults.object_bits[index] and items == defaults.object_items[index]:
+                return None
+            return {"flags": bits, "items": list(items)}
+        if kind == "location_items":
+            items = ItemBag(state.locations_items[LocationId(key)])
+            if items == self.content.defaults.location_items.get(LocationId(key)):
+                return None
+            return {"items": list(items)}
+        if kind == "visited":
+            return {} if LocationId(key) in state.visited_locations else None
+        if kind == "flag":
+            return {"value": state.flags[key]} if key in state.flags else None
+        if kind == "timer":
+            return {"due": state.timers[key]} if key in state.timers else None
+        return None
+
+    @staticmethod
+    def _session_row(session_id: SessionId, state: GameState) -> dict:
+        return {
+            "session_id": session_id,
+            "current_location": state.current_location,
+            "return_location": state.return_location,
+            "clock": state.clock,
+        }
+
+    @staticmethod
+    def _insert(batch: Batch, table: Table, row: dict) -> None:
+        batch.inserts.setdefault(table, []).append(row)
+
+    # --- чтение ---
+
+    def load(self, session_id: SessionId) -> GameState | None:
+        """
+        Состояние сессии из базы. Строки, записанные при прежнем контенте,
+        сверяются с текущим, как в GameState.from_diff: ссылки на удаленные
+        локации, объекты и предметы отбрасываются.
+        """
+        locations, items = self.content.locations, self.content.items
+        object_index = self.content.defaults.object_index
+        with self.db_lock, self.engine.connect() as conn:
+            row = conn.execute(
+                select(models.sessions).where(models.sessions.c.session_id == session_id)
+            ).first()
+            if row is None:
+                return None
+            state = GameState.from_content(self.content)
+            if row.current_location in locations:
+                state.current_location = LocationId(row.current_location)
+            if row.return_location in locations:
+                state.return_location = row.return_location
+            state.inventory = Inventory(items={
+                ItemId(r.item_id): r.qty
+                for r in conn.execute(select(models.inventory).where(models.inventory.c.session_id == session_id))
+                if r.item_id in items
+            })
+            for r in conn.execute(select(models.objects).where(models.objects.c.session_id == session_id)):
+                index = object_index.get(ObjectId(r.object_id))
+                if index is None:
+                    continue
+                state.objects.set_bits(index, r.flags)
+                state.objects.contents.assign(index, [ItemId(i) for i in r.items if i in items])
+            for r in conn.execute(
+                select(models.location_items).where(models.location_items.c.session_id == session_id)
+            ):
+                if r.location_id in locations:
+                    state.locations_items[LocationId(r.location_id)] = [ItemId(i) for i in r.items if i in items]
+            state.visited_locations = PersistentSet(
+                LocationId(r.location_id)
+                for r in conn.execute(select(models.visited).where(models.visited.c.session_id == session_id))
+                if r.location_id in locations
+            )
+            state.flags = PersistentDict(
+                (r.name, r.value)
+                for r in conn.execute(select(models.flags).where(models.flags.c.session_id == session_id))
+            )
+            state.clock = row.clock
+            timers = self.content.timers
+            state.timers = PersistentDict(
+                (r.timer_id, int(r.due) if timers[r.timer_id].ticks is not None else r.due)
+                for r in conn.execute(select(models.timers).where(models.timers.c.session_id == session_id))
+                if r.timer_id in timers
+            )
+        return state
+
+    def delete(self, session_id: SessionId) -> None:
+        self.untrack(session_id)
+        self.pending.pop(session_id, None)
+        self.slots.pop(session_id, None)
+        self.states.pop(session_id, None)
+        self.untracked.discard(session_id)
+        with self.db_lock, self.engine.begin() as conn:
+            for table in models.metadata.sorted_tables:
+                conn.execute(delete(table).where(table.c.session_id == session_id))
+
+
+def _delete_by_key(table: Table) -> Delete:
+    stmt = delete(table).where(table.c.session_id == bindparam("b_session_id"))
+    if table is models.sessions:
+        return stmt
+    return stmt.where(table.c[models.KEY_COLUMNS[table]] == bindparam("b_key"))
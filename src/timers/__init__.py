@@ -0,0 +1,4 @@
+from .session import SessionTimers, fire
+from .wheel import TimerWheel
+
+__all__ = ["SessionTimers", "TimerWheel", "fire"]
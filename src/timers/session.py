@@ -0,0 +1,77 @@
+from typing import TYPE_CHECKING
+
+from definitions import ANY_FACT, Fact, GameState
+from timers.wheel import TimerWheel
+
+if TYPE_CHECKING:
+    from content_parts import GameContent
+
+
+def fire(state: GameState, content: "GameContent", tid: str, due: float) -> str | None:
+    """
+    Срабатывание таймера tid со сроком due; возвращает его текст. Срок
+    сверяется с состоянием: таймер могли отменить или перезапустить после
+    того, как он попал в колесо, тогда срабатывание пропускается.
+    """
+    tdef = content.timers.get(tid)
+    if tdef is None or state.timers.get(tid) != due:
+        return None
+    if tdef.repeat:
+        state.timers[tid] = due + tdef.period
+    else:
+        del state.timers[tid]
+    state.touch(("timer", tid))
+    for effect in tdef.do:
+        effect(state, content)
+    return tdef.text
+
+
+class SessionTimers:
+    """
+    Таймеры сессии в ходах: колесо по state.clock, каждый ход отдает только
+    истекшие таймеры вместо перебора всех запущенных. Таймеры в секундах
+    ведет SessionEngine общим колесом для всех сессий.
+    """
+
+    def __init__(self, state: GameState, content: "GameContent") -> None:
+        self.state = state
+        self.content = content
+        self.wheel: TimerWheel[str] = TimerWheel(state.clock)
+        self.reset()
+        state.subscribe(self.on_fact)
+
+    def detach(self) -> None:
+        self.state.unsubscribe(self.on_fact)
+
+    def reset(self) -> None:
+        self.wheel.clear(now=self.state.clock)
+        for tid in self.state.timers:
+            self._schedule(tid)
+
+    def on_fact(self, fact: Fact) -> None:
+        if fact[0] == "timer":
+            self._schedule(fact[1])
+        elif fact == ANY_FACT:
+            self.reset()
+
+    def _schedule(self, tid: str) -> None:
+        due = self.state.timers.get(tid)
+        tdef = self.content.timers.get(tid)
+        if due is None or tdef is None or tdef.ticks is None:
+            self.wheel.cancel(tid)
+        else:
+            self.wheel.insert(tid, due)
+
+    def tick(self) -> list[str]:
+        """Следующий ход: срабатывают таймеры со сроком не позже нового state.clock."""
+        state = self.state
+        state.clock += 1
+        if state.timers:
+            # номер хода пишется в хранилище, только пока есть что отсчитывать
+            state.touch(("clock",))
+        texts: list[str] = []
+        for tid, due in self.wheel.advance(state.clock):
+            text = fire(state, self.content, tid, due)
+            if text:
+                texts.append(text)
+        return texts
@@ -0,0 +1,175 @@
+from collections.abc import Hashable, Iterator
+
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+SLOT_MASK = SLOTS - 1
+LEVELS = 4
+# дальше этого горизонта таймеры ждут в overflow
+HORIZON = 1 << (SLOT_BITS * LEVELS)
+
+
+class TimerWheel[K: Hashable]:
+    """
+    Иерархическое колесо таймеров (Varghese, Lauck): LEVELS уровней по SLOTS
+    ячеек, ячейка уровня L покрывает SLOTS**L единиц времени. Таймер кладется
+    в ячейку уровня, соответствующего его задержке; когда младший уровень
+    делает оборот, ячейка старшего раскладывается по младшим.
+
+    Вставка и отмена - O(1), advance отдает все истекшие таймеры пачкой.
+    Единица времени - целое число (ход или квант секунд), ключ - любой
+    hashable; повторная вставка ключа переносит таймер.
+    """
+    __slots__ = ("counts", "expired", "levels", "now", "overflow", "where")
+
+    def __init__(self, now: int = 0) -> None:
+        self.now = now
+        # уровни создаются при первой вставке - пустое колесо почти ничего не весит
+        self.levels: list[list[dict[K, int]] | None] = [None] * LEVELS
+        self.counts = [0] * LEVELS
+        # ключ -> (уровень, ячейка); уровень -1 - overflow, -2 - уже истек
+        self.where: dict[K, tuple[int, int]] = {}
+        self.overflow: dict[K, int] = {}
+        self.expired: dict[K, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.where)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.where
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(self.where)
+
+    def due(self, key: K) -> int | None:
+        """Срок таймера или None, если его нет."""
+        place = self.where.get(key)
+        if place is None:
+            return None
+        level, slot = place
+        if level == -2:
+            return self.expired[key]
+        if level == -1:
+            return self.overflow[key]
+        slots = self.levels[level]
+        return None if slots is None else slots[slot][key]
+
+    def insert(self, key: K, due: int) -> None:
+        if key in self.where:
+            self.cancel(key)
+        self._place(key, due)
+
+    def _place(self, key: K, due: int) -> None:
+        delta = due - self.now
+        if delta <= 0:
+            self.expired[key] = due
+            self.where[key] = (-2, 0)
+            return
+        if delta >= HORIZON:
+            self.overflow[key] = due
+            self.where[key] = (-1, 0)
+            return
+        level = (delta.bit_length() - 1) // SLOT_BITS
+        slot = (due >> (SLOT_BITS * level)) & SLOT_MASK
+        slots = self.levels[level]
+        if slots is None:
+            slots = self.levels[level] = [{} for _ in range(SLOTS)]
+        slots[slot][key] = due
+        self.counts[level] += 1
+        self.where[key] = (level, slot)
+
+    def cancel(self, key: K) -> bool:
+        place = self.where.pop(key, None)
+        if place is None:
+            return False
+        level, slot = place
+        if level == -2:
+            del self.expired[key]
+        elif level == -1:
+            del self.overflow[key]
+        else:
+            slots = self.levels[level]
+            # ключ в ячейке уровня - значит, уровень уже создан
+            if slots is not None:
+                del slots[slot][key]
+                self.counts[level] -= 1
+        return True
+
+    def clear(self, now: int | None = None) -> None:
+        self.levels = [None] * LEVELS
+        self.counts = [0] * LEVELS
+        self.where.clear()
+        self.overflow.clear()
+        self.expired.clear()
+        if now is not None:
+            self.now = now
+
+    def advance(self, now: int) -> list[tuple[K, int]]:
+        """Переводит время на now; возвращает истекшие (ключ, срок) по порядку сроков."""
+        fired = list(self.expired.items())
+        for key in self.expired:
+            del self.where[key]
+        self.expired.clear()
+        while self.now < now:
+            if len(self.where) == len(self.overflow):
+                # в ячейках пусто - шагать незачем
+                self.now = now
+                break
+            # пустые младшие уровни перешагиваются до ближайшего каскада
+            level = 0
+            while not self.counts[level]:
+                level += 1
+            if level:
+                span = 1 << (SLOT_BITS * level)
+                boundary = (self.now | (span - 1)) + 1
+                if boundary > now:
+                    self.now = now
+                    break
+                self.now = boundary - 1
+            self.now += 1
+            self._cascade()
+            slots = self.levels[0]
+            if slots is not None:
+                bucket = slots[self.now & SLOT_MASK]
+                if bucket:
+                    fired.extend(bucket.items())
+                    for key in bucket:
+                        del self.where[key]
+                    self.counts[0] -= len(bucket)
+                    bucket.clear()
+            # разложенные при каскаде таймеры с уже наступившим сроком
+            if self.expired:
+                fired.extend(self.expired.items())
+                for key in self.expired:
+                    del self.where[key]
+                self.expired.clear()
+        if self.overflow and self.now >= now:
+            for key, due in list(self.overflow.items()):
+                if due - self.now < HORIZON:
+                    del self.overflow[key]
+                    del self.where[key]
+                    self._place(key, due)
+            if self.expired:
+                fired.extend(self.expired.items())
+                for key in self.expired:
+                    del self.where[key]
+                self.expired.clear()
+        fired.sort(key=lambda pair: pair[1])
+        return fired
+
+    def _cascade(self) -> None:
+        now = self.now
+        for level in range(1, LEVELS):
+            if (now >> (SLOT_BITS * (level - 1))) & SLOT_MASK:
+                # младший уровень не сделал оборот
+                return
+            slots = self.levels[level]
+            if slots is None:
+                continue
+            bucket = slots[(now >> (SLOT_BITS * level)) & SLOT_MASK]
+            if bucket:
+                moved = list(bucket.items())
+                self.counts[level] -= len(moved)
+                bucket.clear()
+                for key, due in moved:
+                    del self.where[key]
+                    self._place(key, due)
@@ -0,0 +1,24 @@
+import shutil
+
+import pytest
+
+from benchmarks.worldgen import generate_world
+from content_parts import GameContent
+from init_content import ContentLoader
+from loaders import SnapshotLoader, loader_for
+
+
+@pytest.fixture(scope="session")
+def content(tmp_path_factory: pytest.TempPathFactory) -> GameContent:
+    """Мир из src/world; снимок пишется во временную копию, а не в дерево исходников."""
+    world = tmp_path_factory.mktemp("shipped")
+    for path in SnapshotLoader.CONTENT_DIR.glob("*.yaml"):
+        shutil.copy(path, world)
+    return ContentLoader(loader_for(SnapshotLoader, world)).init_content()[0]
+
+
+@pytest.fixture(scope="session")
+def generated(tmp_path_factory: pytest.TempPathFactory) -> GameContent:
+    """Синтетический мир побольше: кольцо из 30 локаций с дверями."""
+    world = generate_world(tmp_path_factory.mktemp("world"), 30, seed=1)
+    return ContentLoader(loader_for(SnapshotLoader, world)).init_content()[0]
@@ -0,0 +1,64 @@
+import random
+
+from content_parts import GameContent
+from definitions import Choice, ItemId
+from game import Game
+from matching import BatchEvaluator, ConditionNetwork
+
+
+def expected(game: Game) -> list[str]:
+    network = game.content.network
+    return [c.id for c in network.choices if c.is_available(game.state, game.content)]
+
+
+def test_batch_matches_is_available(generated: GameContent) -> None:
+    rnd = random.Random(5)
+    games = {key: Game.new(generated) for key in range(12)}
+    # маленькая емкость - строки массивов растут по ходу
+    batch = BatchEvaluator(generated, capacity=3)
+    for key, game in games.items():
+        game.render_turn()
+        batch.track(key, game.state)
+    for _ in range(200):
+        key = rnd.randrange(len(games))
+        game = games[key]
+        if rnd.random() < 0.1:
+            game.undo()
+        elif game.options:
+            game.tick(rnd.choice(list(game.options)))
+        keys = rnd.sample(sorted(games), 5)
+        got = batch.available_choices(keys)
+        assert [[c.id for c in row] for row in got] == [expected(games[k]) for k in keys]
+
+
+def test_untracked_rows_are_reused(generated: GameContent) -> None:
+    batch = BatchEvaluator(generated, capacity=2)
+    first, second = Game.new(generated), Game.new(generated)
+    batch.track("a", first.state)
+    batch.track("b", second.state)
+    observer = batch.observers[batch.rows["a"]]
+    batch.untrack("a")
+    assert "a" not in batch and len(batch) == 1
+    assert observer not in first.state.observers
+    third = Game.new(generated)
+    batch.track("c", third.state)
+    assert batch.rows["c"] == 0
+    third.render_turn()
+    third.tick(next(iter(third.options)))
+    assert [c.id for c in batch.available_choices(["c"])[0]] == expected(third)
+
+
+def test_choices_without_conditions(generated: GameContent) -> None:
+    network = ConditionNetwork()
+    has_key = network.node({"type": "has_item", "item": "key_0"})
+    here = network.node({"type": "in_location", "location": "loc_0"})
+    # выборы без условий в начале, середине и конце - пустые отрезки в CSR
+    for cid, nodes in [("free_a", []), ("key_here", [has_key, here]), ("free_b", []), ("here", [here]), ("free_c", [])]:
+        network.add_choice(Choice(cid, cid), nodes)
+    batch = BatchEvaluator(generated, network)
+    game = Game.new(generated)
+    batch.track("a", game.state)
+    assert [c.id for c in batch.available_choices(["a"])[0]] == ["free_a", "key_here", "free_b", "here", "free_c"]
+    game.state.inventory.remove(ItemId("key_0"))
+    game.state.touch(("inventory", "key_0"))
+    assert [c.id for c in batch.available_choices(["a"])[0]] == ["free_a", "free_b", "here", "free_c"]
@@ -0,0 +1,56 @@
+import io
+
+import pytest
+
+from benchmarks.codec import random_states
+from content_parts import GameContent
+from definitions import GameState
+from storage import codec
+
+SEEDS = range(5)
+
+
+def normalized(state: GameState) -> dict:
+    data = state.diff()
+    data["visited"] = sorted(data["visited"])
+    return data
+
+
+@pytest.fixture(scope="module", params=SEEDS)
+def states(request: pytest.FixtureRequest, generated: GameContent) -> list[GameState]:
+    return random_states(generated, 40, 60, request.param)
+
+
+@pytest.mark.parametrize("portable", [False, True])
+def test_round_trip(generated: GameContent, states: list[GameState], portable: bool) -> None:
+    for state in states:
+        record = codec.encode(state, generated, portable)
+        assert normalized(codec.decode(record, generated)) == normalized(state)
+        assert codec.decode_diff(codec.encode_diff(state.diff(), generated, portable), generated) == (
+            codec.decode_diff(record, generated)
+        )
+
+
+@pytest.mark.parametrize("portable", [False, True])
+def test_truncated_records_are_rejected(generated: GameContent, states: list[GameState], portable: bool) -> None:
+    for state in states[:10]:
+        record = codec.encode(state, generated, portable)
+        for cut in range(len(record)):
+            with pytest.raises(codec.CodecError):
+                codec.decode(record[:cut], generated)
+
+
+def test_stream_round_trip(generated: GameContent, states: list[GameState]) -> None:
+    stream = io.BytesIO()
+    assert codec.write_states(stream, states, generated) == len(states)
+    stream.seek(0)
+    assert [normalized(s) for s in codec.read_states(stream, generated)] == [normalized(s) for s in states]
+
+
+def test_other_content(content: GameContent, generated: GameContent, states: list[GameState]) -> None:
+    # запись с номерами контента другим контентом не читается, portable - читается как from_diff
+    for state in states[:10]:
+        with pytest.raises(codec.CodecError):
+            codec.decode(codec.encode(state, generated), content)
+        portable = codec.decode(codec.encode(state, generated, portable=True), content)
+        assert normalized(portable) == normalized(GameState.from_diff(content, state.diff()))
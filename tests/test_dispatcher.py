@@ -0,0 +1,147 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any
+
+import pytest
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+)
+from aiogram.methods import SendMessage
+
+from definitions import LocationId
+from engine import Reply
+from outgoing import OutgoingDispatcher, TokenBucket
+
+METHOD = SendMessage(chat_id=1, text="")
+
+
+def reply(text: str, location: str = "hall", turn: int = 1) -> Reply:
+    return Reply(text=text, options=(("1", "Дальше"),), location=LocationId(location), turn=turn)
+
+
+@dataclass
+class Message:
+    message_id: int
+
+
+@dataclass
+class FakeBot:
+    """Вместо aiogram.Bot: записывает отправки и выбрасывает заданные ошибки."""
+    failures: list[Exception] = field(default_factory=list)
+    sent: list[str] = field(default_factory=list)
+    edited: list[str] = field(default_factory=list)
+    on_send: Any = None
+
+    async def send_message(self, chat_id: int, text: str, reply_markup: Any = None) -> Message:
+        if self.on_send is not None:
+            self.on_send(text)
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append(text)
+        return Message(len(self.sent))
+
+    async def edit_message_text(self, text: str, chat_id: int, message_id: int, reply_markup: Any = None) -> None:
+        self.edited.append(text)
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def dispatcher(bot: FakeBot) -> OutgoingDispatcher:
+    return OutgoingDispatcher(bot, chat_rate=1000.0, chat_burst=1000.0, global_rate=1000.0)  # type: ignore[arg-type]
+
+
+def count_acquires(bucket: TokenBucket) -> list[int]:
+    calls = [0]
+    acquire = bucket.acquire
+
+    async def counted() -> None:
+        calls[0] += 1
+        await acquire()
+
+    bucket.acquire = counted  # type: ignore[method-assign]
+    return calls
+
+
+def test_token_bucket_rate_and_burst() -> None:
+    clock = Clock()
+    bucket = TokenBucket(2.0, 3.0, clock=clock)
+    assert [bucket.try_take() for _ in range(4)] == [True, True, True, False]
+    assert bucket.delay() == pytest.approx(0.5)
+    clock.now = 0.5
+    assert bucket.try_take() and not bucket.try_take()
+    clock.now = 100.0
+    # накопление ограничено capacity
+    assert sum(bucket.try_take() for _ in range(10)) == 3
+
+
+def test_token_bucket_pause_leaves_one_token() -> None:
+    clock = Clock()
+    bucket = TokenBucket(10.0, 5.0, clock=clock)
+    bucket.pause(2.0)
+    assert bucket.delay() == pytest.approx(2.0)
+    clock.now = 2.0
+    assert bucket.try_take() and not bucket.try_take()
+
+
+@pytest.mark.asyncio
+async def test_every_retry_takes_both_buckets(monkeypatch: pytest.MonkeyPatch) -> None:
+    sleep = asyncio.sleep
+
+    async def no_backoff(delay: float) -> None:
+        await sleep(0)
+
+    monkeypatch.setattr(asyncio, "sleep", no_backoff)
+    bot = FakeBot(failures=[
+        TelegramRetryAfter(METHOD, "Too Many Requests", retry_after=0),
+        TelegramNetworkError(METHOD, "connection reset"),
+    ])
+    outgoing = dispatcher(bot)
+    global_calls = count_acquires(outgoing.global_bucket)
+    outgoing.submit(1, reply("hello"))
+    chat_calls = count_acquires(outgoing.outboxes[1].bucket)
+    await outgoing.join()
+    assert bot.sent == ["hello"]
+    assert chat_calls == global_calls == [3]
+
+
+@pytest.mark.asyncio
+async def test_rejected_message_does_not_stop_the_queue() -> None:
+    bot = FakeBot()
+    outgoing = dispatcher(bot)
+
+    def reject_first(text: str) -> None:
+        if text == "bad":
+            # следующий ход приходит, пока отправляется отвергнутый
+            outgoing.submit(1, reply("good", turn=2), edit=False)
+            bot.failures.append(TelegramBadRequest(METHOD, "Bad Request: can't parse entities"))
+
+    bot.on_send = reject_first
+    outgoing.submit(1, reply("bad"))
+    await outgoing.join()
+    assert bot.sent == ["good"]
+    assert outgoing.outboxes[1].worker is None
+
+
+@pytest.mark.asyncio
+async def test_waiting_output_is_merged_and_edited() -> None:
+    bot = FakeBot()
+    outgoing = dispatcher(bot)
+    outgoing.submit(1, reply("first"))
+    await outgoing.join()
+    outgoing.submit(1, reply("second", turn=2))
+    outgoing.submit(1, reply("third", turn=3))
+    await outgoing.join()
+    assert bot.sent == ["first"]
+    assert bot.edited == ["second\n\nthird"]
+    # другая локация - новое сообщение
+    outgoing.submit(1, reply("cellar", location="cellar", turn=4))
+    await outgoing.join()
+    assert bot.sent == ["first", "cellar"]
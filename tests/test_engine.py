@@ -0,0 +1,211 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from content_parts import GameContent
+from definitions import GameState
+from engine import SessionEngine, SessionKey
+from game import MAX_SLOTS, TOO_MANY_SLOTS
+from storage import WriteBehindStore, make_engine, models
+from storage.write_behind import Batch
+
+
+@pytest.mark.asyncio
+async def test_turns_of_one_session_are_serialized(generated: GameContent) -> None:
+    engine = SessionEngine(generated)
+    first = await engine.start(1)
+    assert first.turn == 1 and first.options
+    # одновременные обновления одной сессии применяются по очереди
+    replies = await asyncio.gather(*(engine.handle(1, "1") for _ in range(10)))
+    assert sorted(reply.turn for reply in replies if reply is not None) == list(range(2, 12))
+    assert engine.sessions[1].game.time == 11
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_independent(generated: GameContent) -> None:
+    engine = SessionEngine(generated)
+    await engine.start("a")
+    await engine.start("b")
+    await engine.handle("a", "1")
+    assert (engine.sessions["a"].game.time, engine.sessions["b"].game.time) == (2, 1)
+    assert engine.sessions["a"].game.state is not engine.sessions["b"].game.state
+
+
+@pytest.mark.asyncio
+async def test_stale_option_is_refused(generated: GameContent) -> None:
+    engine = SessionEngine(generated)
+    reply = await engine.start(7)
+    assert await engine.handle(7, "1", turn=reply.turn) is not None
+    # кнопка из сообщения прошлого хода
+    assert await engine.handle(7, "1", turn=reply.turn) is None
+    assert engine.sessions[7].game.time == reply.turn + 1
+
+
+@pytest.mark.asyncio
+async def test_first_update_shows_the_screen(generated: GameContent) -> None:
+    engine = SessionEngine(generated)
+    reply = await engine.handle(3, "1")
+    assert reply is not None and reply.turn == 1 and reply.options
+
+
+def persistent_engine(content: GameContent, **kwargs: Any) -> SessionEngine:
+    engine = make_engine("sqlite://")
+    models.metadata.create_all(engine)
+    return SessionEngine(content, store=WriteBehindStore(engine, content), **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_sessions_are_evicted(generated: GameContent) -> None:
+    evicted: list[SessionKey] = []
+    engine = persistent_engine(generated, capacity=2, on_evict=evicted.append)
+    await engine.start("a")
+    await engine.handle("a", "1")
+    saved = engine.sessions["a"].game.state.diff()
+    for key in ("b", "c"):
+        await engine.start(key)
+    assert evicted == ["a"] and list(engine.sessions) == ["b", "c"]
+    await engine.handle("b", "1")
+    await engine.start("d")
+    assert evicted == ["a", "c"]
+    # выгруженная сессия загружается из хранилища
+    assert (await engine.session("a")).game.state.diff() == saved
+
+
+@pytest.mark.asyncio
+async def test_session_with_waiting_handler_is_not_evicted(generated: GameContent) -> None:
+    engine = persistent_engine(generated, idle_ttl=0.0)
+    await engine.start("a")
+    session = engine.sessions["a"]
+    async with session.lock:
+        waiter = asyncio.create_task(engine.handle("a", "1"))
+        await asyncio.sleep(0)
+        assert engine._idle() == []
+    # блокировка уже свободна, но ждущий ход еще не начался
+    assert not session.lock.locked() and session.in_flight == 1
+    assert engine.evict_expired(now=time.monotonic() + 60) == 0
+    reply = await waiter
+    assert reply is not None and engine.sessions["a"] is session
+    assert session.in_flight == 0 and engine.evict_expired(now=time.monotonic() + 60) == 1
+
+
+@pytest.mark.asyncio
+async def test_session_evicted_during_flush_keeps_its_state(
+    generated: GameContent, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # файловая база: запись пачки и чтение сессии не ждут друг друга
+    db = make_engine(f"sqlite:///{tmp_path / 'sessions.db'}")
+    models.metadata.create_all(db)
+    store = WriteBehindStore(db, generated)
+    engine = SessionEngine(generated, store=store)
+    await engine.start("a")
+    for _ in range(5):
+        await engine.handle("a", "1")
+    saved = engine.sessions["a"].game.state.diff()
+    write = store.write
+
+    def slow_write(batch: Batch) -> None:
+        time.sleep(0.5)
+        write(batch)
+
+    monkeypatch.setattr(store, "write", slow_write)
+    flush = asyncio.create_task(store.flush_async())
+    await asyncio.sleep(0.1)
+    engine.evict("a", "test")
+    # пачка еще не записана - сессия берется из памяти, а не из базы
+    assert (await engine.session("a")).game.state.diff() == saved
+    await flush
+    engine.evict("a", "test")
+    await store.flush_async()
+    assert "a" not in store.states
+    assert (await engine.session("a")).game.state.diff() == saved
+
+
+@pytest.mark.asyncio
+async def test_loaded_session_is_not_evicted_while_others_are_busy(
+    generated: GameContent, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    engine = persistent_engine(generated, capacity=1)
+    await engine.start("a")
+    await engine.start("b")
+    assert list(engine.sessions) == ["b"]
+    store = engine.store
+    assert store is not None
+    await store.flush_async()
+    loads: list[str] = []
+    load = store.load
+
+    def counted(session_id: str) -> GameState | None:
+        loads.append(session_id)
+        return load(session_id)
+
+    monkeypatch.setattr(store, "load", counted)
+    async with engine.sessions["b"].turn():
+        # единственная другая сессия занята - выгружать для загруженной "a" некого
+        reply = await asyncio.wait_for(engine.handle("a", "1"), 1.0)
+        assert reply is not None and loads == ["a"]
+        assert list(engine.sessions) == ["b", "a"]
+        # новая игра тоже не выгружает свой же экран
+        await asyncio.wait_for(engine.start("c"), 1.0)
+        assert list(engine.sessions) == ["b", "c"]
+    assert engine.evict_over_capacity() == 1 and list(engine.sessions) == ["c"]
+
+
+@pytest.mark.asyncio
+async def test_timers_of_evicted_sessions_move_with_release(generated: GameContent) -> None:
+    donor = persistent_engine(generated)
+    store = donor.store
+    assert store is not None
+    receiver = SessionEngine(generated, store=WriteBehindStore(store.engine, generated))
+    await donor.start("a")
+    await donor.start("b")
+    donor.evict("a", "test")
+    # таймер в секундах выгруженной сессии остается в колесе движка
+    due = donor._quantum(time.time()) + 100
+    donor.timers.insert(("a", "alarm"), due)
+    handoffs = await donor.release(lambda key: key == "b")
+    assert list(donor.timers) == []
+    assert [(h.key, h.state, h.resident, h.timers) for h in handoffs] == [
+        ("a", None, False, (("alarm", due * donor.timer_resolution),)),
+    ]
+    receiver.adopt(handoffs)
+    assert receiver.timers.due(("a", "alarm")) == due and "a" not in receiver.sessions
+
+
+@pytest.mark.asyncio
+async def test_save_slots_outlive_the_session(generated: GameContent) -> None:
+    engine = persistent_engine(generated)
+    store = engine.store
+    assert store is not None
+    await engine.start("a")
+    await engine.handle("a", "1")
+    saved = engine.sessions["a"].game.state.diff()
+    for n in range(MAX_SLOTS):
+        await engine.save("a", f"slot{n}")
+    # слотов уже MAX_SLOTS: новый не создается, существующий перезаписывается
+    reply = await engine.save("a", "more")
+    assert reply.text.startswith(TOO_MANY_SLOTS) and "more" not in engine.sessions["a"].game.slots
+    assert (await engine.save("a", "slot1")).text.startswith("Сохранено")
+    engine.evict("a", "test")
+    await store.flush_async()
+    assert store.slots == {}
+    # новая игра после выгрузки получает слоты из базы
+    await engine.start("a")
+    assert len(engine.sessions["a"].game.slots) == MAX_SLOTS
+    await engine.load("a", "slot0")
+    assert engine.sessions["a"].game.state.diff() == saved
+
+
+@pytest.mark.asyncio
+async def test_save_slots_move_with_release(generated: GameContent) -> None:
+    donor, receiver = SessionEngine(generated), SessionEngine(generated)
+    await donor.start("a")
+    await donor.handle("a", "1")
+    saved = donor.sessions["a"].game.state.diff()
+    await donor.save("a", "one")
+    await donor.handle("a", "1")
+    receiver.adopt(await donor.release(lambda key: False))
+    await receiver.load("a", "one")
+    assert receiver.sessions["a"].game.state.diff() == saved
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from content_parts import GameContent
+from definitions import Choice, GameState
+from game import Game
+
+
+def from_scratch(state: GameState, content: GameContent) -> tuple[list[str], list[str], list[str]]:
+    """Общие выборы локации без кешей сессии и реестра."""
+    registry = content.generic
+    lid = state.current_location
+    pickup = sorted(state.locations_items[lid], key=registry.pickup_rank.__getitem__)
+    opens: list[str] = []
+    closes: list[str] = []
+    for fid in content.locations[lid].objects:
+        if fid not in registry.open:
+            continue
+        flags = state.objects[fid].flags
+        if flags["open"] and not flags["locked"]:
+            closes.append(registry.close[fid].id)
+        elif not (flags["open"] or flags["locked"]):
+            opens.append(registry.open[fid].id)
+    return [registry.pickup[iid].id for iid in pickup], opens, closes
+
+
+def ids(choices: list[Choice]) -> list[str]:
+    return [c.id for c in choices]
+
+
+@pytest.mark.parametrize("world", ["content", "generated"])
+def test_cached_lists_match_a_rebuild(world: str, request: pytest.FixtureRequest) -> None:
+    content: GameContent = request.getfixturevalue(world)
+    rnd = random.Random(5)
+    # несколько сессий по очереди: общий кеш "взять" реестра заполняют все
+    games = [Game.new(content) for _ in range(3)]
+    for game in games:
+        game.render_turn()
+    for _ in range(150):
+        game = rnd.choice(games)
+        generic = game.generic
+        assert (ids(generic.pickup()), ids(generic.open()), ids(generic.close())) == from_scratch(game.state, content)
+        if rnd.random() < 0.1:
+            game.undo()
+        elif game.options:
+            game.tick(rnd.choice(list(game.options)))
+
+
+def test_other_locations_keep_the_lists(generated: GameContent) -> None:
+    game = Game.new(generated)
+    game.render_turn()
+    opens, closes = game.generic.open(), game.generic.close()
+    here = game.state.current_location
+    elsewhere = next(oid for oid in generated.generic.openable if generated.object_locations[oid] != here)
+    game.state.objects[elsewhere].flags["open"] = True
+    game.state.touch(("object", elsewhere))
+    assert game.generic.open() is opens and game.generic.close() is closes
+    local = next(oid for oid in generated.generic.openable if generated.object_locations[oid] == here)
+    game.state.objects[local].flags["open"] = not game.state.objects[local].flags["open"]
+    game.state.touch(("object", local))
+    assert game.generic.open() is not opens
@@ -0,0 +1,81 @@
+import shutil
+from pathlib import Path
+
+import pytest
+import yaml
+
+from init_content import ContentLoader
+from linker import ContentError
+from loaders import SnapshotLoader, YamlLoader, loader_for
+
+
+@pytest.fixture
+def world(tmp_path: Path) -> Path:
+    for path in SnapshotLoader.CONTENT_DIR.glob("*.yaml"):
+        shutil.copy(path, tmp_path)
+    return tmp_path
+
+
+def add_choices(world: Path, choices: dict[str, dict]) -> None:
+    path = world / "choices.yaml"
+    data = yaml.safe_load(path.read_text(encoding="utf-8"))
+    data["choices"].update(choices)
+    path.write_text(yaml.safe_dump(data, allow_unicode=True), encoding="utf-8")
+
+
+def problems(world: Path) -> list[str]:
+    with pytest.raises(ContentError) as error:
+        ContentLoader(loader_for(YamlLoader, world)).init_content()
+    return error.value.problems
+
+
+def test_shipped_world_links(world: Path) -> None:
+    content, _ = ContentLoader(loader_for(YamlLoader, world)).init_content()
+    assert content.handles is not None
+    assert len(content.handles.object_ids) == len(content.furniture)
+
+
+def test_all_errors_are_reported_at_once(world: Path) -> None:
+    add_choices(world, {
+        "bad_refs": {
+            "text": "Сломанный выбор",
+            "conditions": [
+                {"type": "has_item", "item": "no_such_item"},
+                {"type": "object_is_open", "object": "no_such_object"},
+                {"type": "no_such_condition"},
+            ],
+            "effects": [
+                {"type": "move_to", "location": "no_such_location"},
+                {"type": "consume_item"},
+            ],
+        },
+    })
+    found = problems(world)
+    assert any("unknown item 'no_such_item'" in p for p in found)
+    assert any("unknown object 'no_such_object'" in p for p in found)
+    assert any("unknown condition type 'no_such_condition'" in p for p in found)
+    assert any("unknown location 'no_such_location'" in p for p in found)
+    assert any("effect consume_item is missing 'item'" in p for p in found)
+    assert all(p.startswith("choice bad_refs") for p in found)
+
+
+def test_shared_bad_condition_is_reported_for_every_choice(world: Path) -> None:
+    bad = {"type": "container_locked", "container": "no_such_box"}
+    add_choices(world, {
+        cid: {"text": cid, "conditions": [dict(bad)], "effects": []}
+        for cid in ("first_broken", "second_broken")
+    })
+    found = [p for p in problems(world) if "no_such_box" in p]
+    assert [p.split(",")[0] for p in found] == ["choice first_broken", "choice second_broken"]
+
+
+def test_only_bad_references_are_reported(world: Path) -> None:
+    add_choices(world, {
+        "open_ring": {
+            "text": "Открыть кольцо",
+            "conditions": [{"type": "object_is_closed", "object": "wooden_box"}],
+            "effects": [{"type": "reveal_contents", "container": "no_such_box"}],
+        },
+    })
+    found = problems(world)
+    assert found == ["choice open_ring, effect reveal_contents: unknown object 'no_such_box'"]
@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import pytest
+
+import loaders
+from benchmarks.worldgen import generate_world
+from loaders import SnapshotLoader, YamlLoader, loader_for
+
+
+@pytest.fixture
+def world(tmp_path: Path) -> Path:
+    return generate_world(tmp_path / "world", 10, seed=3)
+
+
+def test_snapshot_matches_yaml(world: Path) -> None:
+    loader = loader_for(SnapshotLoader, world)
+    raw = loader.load()
+    assert loader.snapshot_path().exists()
+    assert loader.read_snapshot(loader.source_hash()) == raw == loader_for(YamlLoader, world).load()
+    # временные файлы записи не остаются
+    assert sorted(p.name for p in world.iterdir() if not p.name.endswith(".yaml")) == ["content.snapshot"]
+
+
+@pytest.mark.parametrize("damage", [b"", b"HDCS", None])
+def test_broken_snapshot_falls_back_to_yaml(world: Path, damage: bytes | None) -> None:
+    loader = loader_for(SnapshotLoader, world)
+    expected = loader.load()
+    path = loader.snapshot_path()
+    # пустой, обрезанный до заголовка и обрезанный посреди данных
+    path.write_bytes(damage if damage is not None else path.read_bytes()[:-10])
+    assert loader.read_snapshot(loader.source_hash()) is None
+    assert loader.load() == expected
+    assert loader.read_snapshot(loader.source_hash()) == expected
+
+
+def test_unwritable_directory_falls_back_to_yaml(world: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    def refuse(*args: object, **kwargs: object) -> None:
+        raise PermissionError("read-only file system")
+
+    monkeypatch.setattr(loaders.tempfile, "NamedTemporaryFile", refuse)
+    loader = loader_for(SnapshotLoader, world)
+    assert loader.load() == loader_for(YamlLoader, world).load()
+    assert not loader.snapshot_path().exists()
+
+
+def test_failed_replace_removes_temp_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    def refuse(*args: object) -> None:
+        raise OSError("cross-device link")
+
+    monkeypatch.setattr(loaders.os, "replace", refuse)
+    with pytest.raises(OSError):
+        loaders.replace_file(tmp_path / "content.snapshot", [b"data"])
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,174 @@
+from pathlib import Path
+
+import pytest
+from sqlalchemy import Engine, select
+
+from content_parts import GameContent
+from definitions import GameState
+from storage import WriteBehindStore, make_engine, migrate, models
+from storage.journal import Journal
+
+RULES = """
+- rule: rename_item
+  from: old_key
+  to: key_0
+- rule: drop_item
+  id: gone
+- rule: rename_object
+  from: old_chest
+  to: chest_2
+- rule: drop_object
+  id: old_door
+- rule: rename_location
+  from: old_hall
+  to: loc_1
+- rule: drop_location
+  id: old_cellar
+- rule: set_flag
+  object: chest_5
+  flag: open
+  value: true
+  visited: loc_1
+"""
+
+
+@pytest.fixture
+def engine(tmp_path: Path) -> Engine:
+    """Сохранения, сделанные до переименований: строки со старыми id."""
+    engine = make_engine(f"sqlite:///{tmp_path / 'saves.db'}")
+    models.metadata.create_all(engine)
+    rows = {
+        models.sessions: [
+            {"session_id": "s1", "current_location": "old_hall", "return_location": "old_cellar"},
+            {"session_id": "s2", "current_location": "old_cellar", "return_location": None},
+            {"session_id": "s3", "current_location": "loc_4", "return_location": None},
+        ],
+        models.inventory: [
+            {"session_id": "s1", "item_id": "old_key", "qty": 1},
+            {"session_id": "s1", "item_id": "key_0", "qty": 1},
+            {"session_id": "s2", "item_id": "gone", "qty": 3},
+        ],
+        models.objects: [
+            {"session_id": "s1", "object_id": "old_chest", "flags": 2, "items": ["old_key", "gone"]},
+            {"session_id": "s2", "object_id": "old_door", "flags": 2, "items": []},
+        ],
+        models.location_items: [
+            {"session_id": "s1", "location_id": "loc_3", "items": ["key_4", "gone", "junk_3"]},
+            {"session_id": "s2", "location_id": "old_cellar", "items": ["junk_9"]},
+        ],
+        models.visited: [
+            {"session_id": "s1", "location_id": "old_hall"},
+            {"session_id": "s2", "location_id": "old_cellar"},
+            {"session_id": "s2", "location_id": "loc_0"},
+        ],
+        models.flags: [{"session_id": "s3", "name": "met_ghost", "value": True}],
+    }
+    with engine.begin() as conn:
+        for table, table_rows in rows.items():
+            conn.execute(table.insert(), table_rows)
+    return engine
+
+
+@pytest.fixture
+def rules(tmp_path: Path) -> tuple[list[migrate.Rule], str]:
+    path = tmp_path / "rules.yaml"
+    path.write_text(RULES, encoding="utf-8")
+    return migrate.load_rules(path)
+
+
+def dump(engine: Engine) -> list[list[tuple]]:
+    with engine.connect() as conn:
+        return [sorted(map(tuple, conn.execute(select(table)))) for table in models.metadata.sorted_tables]
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_migrated_sessions_load_with_new_content(
+    generated: GameContent, engine: Engine, rules: tuple[list[migrate.Rule], str], workers: int
+) -> None:
+    parsed, fingerprint = rules
+    target = migrate.Target.from_content(generated)
+    progress = migrate.migrate(engine, parsed, target, migrate.Progress(fingerprint), batch_size=2, workers=workers)
+    assert (progress.scanned, progress.changed) == (3, 2)
+    assert not progress.dangling
+
+    store = WriteBehindStore(engine, generated)
+    s1 = store.load("s1")
+    assert s1 is not None
+    assert (s1.current_location, s1.return_location) == ("loc_1", None)
+    assert s1.inventory.items == {"key_0": 2}
+    chest = s1.objects["chest_2"]
+    assert chest.flags["open"] and list(chest.items) == ["key_0"]
+    assert list(s1.locations_items["loc_3"]) == ["key_4", "junk_3"]
+    assert s1.objects["chest_5"].flags["open"]
+    assert set(s1.visited_locations) == {"loc_1"}
+
+    s2 = store.load("s2")
+    assert s2 is not None
+    assert s2.current_location == generated.defaults.start_location
+    assert not s2.inventory.items and set(s2.visited_locations) == {"loc_0"}
+    # флаг ставится только тем, кто был в loc_1
+    assert not s2.objects["chest_5"].flags["open"]
+
+    s3 = store.load("s3")
+    assert s3 is not None and s3.flags == {"met_ghost": True}
+
+
+def test_dry_run_and_rerun_change_nothing(
+    generated: GameContent, engine: Engine, rules: tuple[list[migrate.Rule], str]
+) -> None:
+    parsed, fingerprint = rules
+    target = migrate.Target.from_content(generated)
+    before = dump(engine)
+    dry = migrate.migrate(engine, parsed, target, migrate.Progress(fingerprint), dry_run=True)
+    assert dump(engine) == before
+    assert dry.changed == 2 and dry.applied["rename_item old_key -> key_0"] == 1
+    migrate.migrate(engine, parsed, target, migrate.Progress(fingerprint))
+    again = migrate.migrate(engine, parsed, target, migrate.Progress(fingerprint))
+    assert again.changed == 0 and not again.applied
+
+
+def test_resume_from_checkpoint(
+    generated: GameContent, engine: Engine, rules: tuple[list[migrate.Rule], str], tmp_path: Path
+) -> None:
+    parsed, fingerprint = rules
+    target = migrate.Target.from_content(generated)
+    checkpoint = tmp_path / "rules.progress"
+    migrate.Progress(fingerprint, last="s1", scanned=1, changed=1).save(checkpoint)
+    progress = migrate.migrate(engine, parsed, target, migrate.Progress.load(checkpoint), checkpoint, batch_size=1)
+    assert (progress.scanned, progress.changed) == (3, 2)
+    assert migrate.Progress.load(checkpoint).last == "s3"
+    with engine.connect() as conn:
+        # s1 до контрольной точки не трогали
+        assert conn.scalar(select(models.sessions.c.current_location).where(models.sessions.c.session_id == "s1")) == "old_hall"
+
+
+def test_rules_are_checked_against_content(generated: GameContent) -> None:
+    target = migrate.Target.from_content(generated)
+    with pytest.raises(migrate.RuleError):
+        migrate.parse_rules([{"rule": "rename_item", "from": "key_1", "to": "key_0"}])[0].check(target)
+    with pytest.raises(migrate.RuleError):
+        migrate.parse_rules([{"rule": "set_flag", "object": "chest_0", "flag": "shiny", "value": True}])[0].check(target)
+    with pytest.raises(migrate.RuleError):
+        migrate.parse_rules([{"rule": "recolor"}])
+    with pytest.raises(TypeError):
+        migrate.Rule()  # type: ignore[abstract]
+
+
+def test_sessions_only_in_journal(generated: GameContent, engine: Engine, tmp_path: Path) -> None:
+    journal = Journal(tmp_path / "journal" / "worker-0", generated)
+    state = GameState.from_content(generated)
+    journal.snapshot("s1", 0, state)
+    journal.snapshot("s9", 0, state)
+    journal.flush()
+    assert migrate.journal_only(engine, tmp_path / "journal") == ["s9"]
+    journal.release("s9")
+    journal.flush()
+    assert migrate.journal_only(engine, tmp_path / "journal") == []
+
+
+def test_rows_equal_to_defaults_in_any_order_are_dropped(generated: GameContent) -> None:
+    target = migrate.Target.from_content(generated)
+    lid, items = next((lid, items) for lid, items in target.location_items.items() if len(set(items)) > 1)
+    record = migrate.Record("s", lid, None, location_items={lid: list(reversed(items))})
+    migrate._normalize(record, target)
+    assert record.location_items == {}
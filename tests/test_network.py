@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from content_parts import GameContent
+from definitions import Choice, GameState
+from game import Game
+from matching import ChoiceMatcher, ConditionNetwork
+
+
+def brute_force(game: Game) -> list[str]:
+    return [c.id for c in game.content.network.choices if c.is_available(game.state, game.content)]
+
+
+@pytest.mark.parametrize("world", ["content", "generated"])
+def test_matcher_agrees_with_is_available(world: str, request: pytest.FixtureRequest) -> None:
+    content: GameContent = request.getfixturevalue(world)
+    rnd = random.Random(11)
+    for _ in range(5):
+        game = Game.new(content)
+        game.render_turn()
+        for _ in range(60):
+            assert isinstance(game.matcher, ChoiceMatcher)
+            assert [c.id for c in game.matcher.available_choices()] == brute_force(game)
+            if rnd.random() < 0.15:
+                game.undo()
+            elif game.options:
+                game.tick(rnd.choice(list(game.options)))
+
+
+def test_identical_conditions_share_a_node(generated: GameContent) -> None:
+    network = ConditionNetwork()
+    spec = {"type": "has_item", "item": next(iter(generated.items))}
+    first = network.node(spec)
+    assert network.node(dict(spec)) is first
+    assert len(network.nodes) == 1
+    assert network.affected_nodes(("inventory", spec["item"])) == [first]
+    # сеть контента тоже не хранит двух узлов с одним ключом
+    keys = [node.key for node in generated.network.nodes]
+    assert len(keys) == len(set(keys))
+
+
+def test_choice_with_many_conditions(generated: GameContent) -> None:
+    network = ConditionNetwork()
+    nodes = [network.node({"type": "has_item", "item": f"ghost_{i}"}) for i in range(300)]
+    choice = Choice(id="many", text="many", when=[node.cond for node in nodes])
+    network.add_choice(choice, nodes)
+    matcher = ChoiceMatcher(network, GameState.from_content(generated), generated)
+    assert matcher.unsatisfied[0] == 300
+    assert matcher.available_choices() == []
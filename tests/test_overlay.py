@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from content_parts import GameContent
+from definitions import GameState, ItemId, LocationId
+from overlay import FLAG_BITS, ItemBag, ItemsOverlay, LocationItems, ObjectStates
+
+
+def test_item_bag_is_a_multiset() -> None:
+    bag = ItemBag(["a", "b", "a"])
+    assert list(bag) == ["a", "a", "b"] and len(bag) == 3
+    assert bag.count("a") == 2 and "b" in bag and "c" not in bag
+    bag.remove("a")
+    bag.add("c", 2)
+    assert list(bag) == ["a", "b", "c", "c"]
+    # сравнение без учета порядка, в том числе со списками
+    assert bag == ["c", "b", "c", "a"] and bag != ["a", "b", "c"]
+    with pytest.raises(ValueError):
+        bag.remove("b", 2)
+    bag.clear()
+    assert not bag and bag == []
+
+
+def test_object_flags_store_only_changes(generated: GameContent) -> None:
+    defaults = generated.defaults
+    objects = ObjectStates(defaults)
+    oid = defaults.object_ids[0]
+    index = objects.index(oid)
+    initial = objects[oid].flags["open"]
+    objects[oid].flags["open"] = not initial
+    assert objects.bits(index) & FLAG_BITS["open"] == (0 if initial else FLAG_BITS["open"])
+    assert index in objects.changed_bits
+    objects[oid].flags["open"] = initial
+    assert not objects.changed_bits
+    objects[oid].flags["locked"] = True
+    del objects[oid]
+    assert objects.bits(index) == defaults.object_bits[index]
+
+
+def test_location_items_copy_on_write(generated: GameContent) -> None:
+    defaults = generated.defaults
+    lid = next(lid for lid, items in defaults.location_items.items() if items)
+    item = defaults.location_items[lid][0]
+    locations = LocationItems(defaults)
+    assert locations.untouched(lid)
+
+    locations[lid].remove(item)
+    assert item not in locations[lid] and not locations.untouched(lid)
+    frozen = locations.freeze()
+    clone = locations.copy()
+    # запись после снимка не меняет ни снимок, ни копию
+    locations[lid].append(ItemId("extra"))
+    assert "extra" not in frozen[lid] and "extra" not in clone[lid]
+    assert "extra" in locations[lid]
+
+    locations.restore(frozen)
+    assert list(locations[lid]) == list(clone[lid])
+    # вернули как было - оверлей пуст
+    locations[lid].append(item)
+    assert locations.untouched(lid)
+    assert sorted(locations[lid]) == sorted(defaults.location_items[lid])
+    with pytest.raises(ValueError):
+        locations[lid].remove(ItemId("missing"))
+
+
+def test_sessions_share_defaults(generated: GameContent) -> None:
+    first = GameState.from_content(generated)
+    second = GameState.from_content(generated)
+    assert first.objects.defaults is second.objects.defaults
+    oid = generated.defaults.object_ids[0]
+    first.objects[oid].flags["locked"] = not first.objects[oid].flags["locked"]
+    assert second.objects[oid].flags["locked"] != first.objects[oid].flags["locked"]
+    assert not second.objects.changed_bits and not second.locations_items.contents.changed
+
+
+def test_items_overlay_compacts_when_moves_cancel_out(generated: GameContent, monkeypatch: pytest.MonkeyPatch) -> None:
+    defaults = generated.defaults
+    places = [lid for lid, items in defaults.location_items.items() if items][:4]
+    pool = sorted({iid for lid in places for iid in defaults.location_items[lid]})
+    overlay = LocationItems(defaults).contents
+    full_counts = ItemsOverlay._drift
+    calls = []
+
+    def counted(self: ItemsOverlay, key: LocationId, items: ItemBag) -> int:
+        calls.append(key)
+        return full_counts(self, key, items)
+
+    monkeypatch.setattr(ItemsOverlay, "_drift", counted)
+    rnd = random.Random(9)
+    model = {lid: ItemBag(defaults.location_items[lid]) for lid in places}
+    for _ in range(2000):
+        lid = rnd.choice(places)
+        item = rnd.choice(pool)
+        if rnd.random() < 0.5 and item in model[lid]:
+            overlay.remove(lid, item)
+            model[lid].remove(item)
+        else:
+            overlay.add(lid, item)
+            model[lid].add(item)
+        for key in places:
+            assert ItemBag(overlay.read(key)) == model[key]
+            # отличий нет - места нет и в оверлее
+            assert (key in overlay.changed) == (model[key] != ItemBag(defaults.location_items[key]))
+    # полный пересчет - только при копировании места в оверлей, не на каждом ходу
+    assert len(calls) < 2000 // 4
+
+
+def test_item_views_compare_as_multisets(generated: GameContent) -> None:
+    defaults = generated.defaults
+    lid = next(lid for lid, items in defaults.location_items.items() if len(set(items)) > 1)
+    first, second = LocationItems(defaults), LocationItems(defaults)
+    first[lid].append(ItemId("extra"))
+    # те же предметы, добавленные в другом порядке
+    second[lid].clear()
+    second[lid].extend(["extra", *reversed(defaults.location_items[lid])])
+    assert first[lid] == second[lid] == ["extra", *defaults.location_items[lid]]
+    assert first[lid] != defaults.location_items[lid]
@@ -0,0 +1,134 @@
+import random
+
+import pytest
+
+from persistent import (
+    EMPTY,
+    FLAT_LIMIT,
+    PersistentDict,
+    PersistentSet,
+    PMap,
+    freeze_map,
+)
+
+
+class Clash:
+    """Ключ с одинаковым хешем у всех экземпляров - коллизии в HAMT."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __hash__(self) -> int:
+        return 42
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Clash) and other.name == self.name
+
+    def __repr__(self) -> str:
+        return f"Clash({self.name!r})"
+
+
+def test_pmap_matches_dict_under_random_edits() -> None:
+    rnd = random.Random(5)
+    pmap: PMap[int, int] = PMap()
+    model: dict[int, int] = {}
+    versions: list[tuple[PMap[int, int], dict[int, int]]] = []
+    for step in range(3000):
+        key = rnd.randrange(400)
+        if rnd.random() < 0.3:
+            pmap = pmap.delete(key)
+            model.pop(key, None)
+        else:
+            pmap = pmap.set(key, step)
+            model[key] = step
+        if step % 250 == 0:
+            versions.append((pmap, dict(model)))
+    assert len(pmap) == len(model) > FLAT_LIMIT
+    assert dict(pmap.items()) == model and pmap == model
+    # старые версии не меняются от записей в новые
+    for version, expected in versions:
+        assert dict(version.items()) == expected and len(version) == len(expected)
+
+
+def test_hash_collisions() -> None:
+    keys = [Clash(str(n)) for n in range(6)]
+    # плюс обычные ключи, чтобы корень был деревом, а не плоским dict
+    pmap: PMap[object, int] = PMap({n: n for n in range(FLAT_LIMIT + 1)})
+    for n, key in enumerate(keys):
+        pmap = pmap.set(key, n)
+    assert all(pmap[key] == n for n, key in enumerate(keys))
+    assert Clash("missing") not in pmap
+    assert len(pmap) == FLAT_LIMIT + 1 + len(keys)
+
+    before = pmap
+    for key in keys[:-1]:
+        pmap = pmap.delete(key)
+    assert keys[-1] in pmap and keys[0] not in pmap
+    assert all(key in before for key in keys)
+    pmap = pmap.delete(keys[-1])
+    assert pmap == {n: n for n in range(FLAT_LIMIT + 1)}
+    # удаление отсутствующего ключа возвращает тот же словарь
+    assert pmap.delete(Clash("missing")) is pmap
+
+
+def test_delete_to_empty() -> None:
+    pmap: PMap[int, int] = PMap({n: n for n in range(FLAT_LIMIT * 3)})
+    for n in range(FLAT_LIMIT * 3):
+        pmap = pmap.delete(n)
+    assert pmap is EMPTY and not pmap
+    with pytest.raises(KeyError):
+        pmap[0]
+
+
+def test_set_same_value_returns_self() -> None:
+    value = object()
+    small = PMap({"a": value})
+    assert small.set("a", value) is small
+    large = PMap({n: value for n in range(FLAT_LIMIT * 2)})
+    assert large.set(3, value) is large
+
+
+def test_persistent_dict_freeze_and_copy_are_independent() -> None:
+    data: PersistentDict[str, int] = PersistentDict({"a": 1})
+    frozen = data.freeze()
+    clone = data.copy()
+    data["b"] = 2
+    del data["a"]
+    clone["c"] = 3
+    assert frozen == {"a": 1}
+    assert dict(data) == {"b": 2} and data.freeze() == {"b": 2}
+    assert dict(clone) == {"a": 1, "c": 3}
+    assert freeze_map(data) == data.freeze() and freeze_map(frozen) is frozen
+    data.discard("missing")
+    with pytest.raises(KeyError):
+        del data["missing"]
+    # обертка над готовым PMap читает то же содержимое
+    assert dict(PersistentDict(frozen)) == {"a": 1}
+
+
+def test_persistent_dict_copy_and_restore_share_the_tree() -> None:
+    frozen: PMap[int, int] = PMap((n, n) for n in range(1000))
+    data = PersistentDict(frozen)
+    # O(1): ни копия, ни обертка над снимком не перестраивают содержимое
+    assert data.freeze() is frozen and data.copy().freeze() is frozen
+    data[5] = -5
+    assert data[5] == -5 and frozen[5] == 5 and len(data) == 1000
+    assert dict(data.items()) == {**{n: n for n in range(1000)}, 5: -5}
+
+
+def test_persistent_set() -> None:
+    items: PersistentSet[str] = PersistentSet(["x", "y"])
+    frozen = items.freeze()
+    clone = items.copy()
+    items.add("z")
+    items.discard("x")
+    assert set(items) == {"y", "z"} and len(items) == 2
+    assert set(frozen) == {"x", "y"} and set(clone) == {"x", "y"}
+    assert set(PersistentSet(frozen)) == {"x", "y"}
+
+
+def test_pmap_equality() -> None:
+    small = PMap({"a": 1})
+    assert small == {"a": 1} and small == PMap([("a", 1)])
+    assert small != {"a": 2} and small != {"a": 1, "b": 2}
+    assert small.__eq__(1) is NotImplemented
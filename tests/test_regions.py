@@ -0,0 +1,121 @@
+import random
+from pathlib import Path
+
+import pytest
+
+from benchmarks.worldgen import generate_world
+from content_parts import GameContent
+from game import Game
+from init_content import ContentLoader
+from loaders import SnapshotLoader, loader_for
+from regions import GLOBAL_REGION, RegionalContentLoader, RegionLoader
+
+
+class SmallRegions(RegionLoader):
+    REGION_SIZE = 5
+
+
+@pytest.fixture
+def world(tmp_path: Path) -> Path:
+    return generate_world(tmp_path / "world", 30, seed=3)
+
+
+def regional(world: Path, capacity: int = 2) -> GameContent:
+    return RegionalContentLoader(loader_for(SmallRegions, world), capacity=capacity).init_content()[0]
+
+
+def test_cache_keeps_pinned_regions(world: Path) -> None:
+    content = regional(world)
+    cache = content.regions
+    assert cache is not None and GLOBAL_REGION in cache.pins
+    for name in ("region_0", "region_1", "region_2", "region_3"):
+        cache.get(name)
+    # глобальный регион закреплен, остальные вытесняются по LRU
+    assert list(cache.regions) == [GLOBAL_REGION, "region_3"]
+    # закрепленный регион не вытесняется даже ради только что загруженного
+    cache.pin("region_3")
+    assert cache.get("region_4").name == "region_4"
+    assert list(cache.regions) == [GLOBAL_REGION, "region_3"]
+    cache.unpin("region_3")
+    cache.get("region_4")
+    assert list(cache.regions) == [GLOBAL_REGION, "region_4"]
+
+
+def test_regional_game_matches_full_load(world: Path) -> None:
+    full = ContentLoader(loader_for(SnapshotLoader, world)).init_content()[0]
+    content = regional(world)
+    rnd = random.Random(7)
+    games = Game.new(full), Game.new(content)
+    for game in games:
+        game.render_turn()
+    for _ in range(80):
+        options = [[c.id for c in game.options.values()] for game in games]
+        assert options[0] == options[1]
+        if not options[0]:
+            break
+        number = rnd.choice(list(games[0].options))
+        for game in games:
+            game.tick(number)
+    assert games[0].destinations() == games[1].destinations()
+
+
+def test_destinations_do_not_load_regions(world: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    content = regional(world, capacity=1)
+    game = Game.new(content)
+    game.render_turn()
+    rnd = random.Random(1)
+    for _ in range(100):
+        game.tick(rnd.choice(list(game.options)))
+        if game.destinations():
+            break
+    cache = content.regions
+    assert cache is not None
+    resident = list(cache.regions)
+
+    def read_region(name: str) -> dict:
+        raise AssertionError(f"region {name} loaded")
+
+    # названия берутся из оглавления индекса: регионы не читаются и не вытесняются
+    monkeypatch.setattr(cache.index, "read_region", read_region)
+    destinations = game.destinations()
+    assert destinations
+    lid, name = destinations[0]
+    assert name == content.location_names[lid] and game._destination(name) == lid
+    assert list(cache.regions) == resident
+
+
+@pytest.mark.parametrize("damage", [b"", b"HDCR", None])
+def test_damaged_index_is_rebuilt(world: Path, damage: bytes | None) -> None:
+    loader = loader_for(SmallRegions, world)
+    loader.open_index().close()
+    path = loader.snapshot_path()
+    data = path.read_bytes()
+    # пустой файл, обрезанный заголовок или обрезанные регионы
+    path.write_bytes(data[: len(data) // 2] if damage is None else damage)
+    assert loader.read_index(loader.source_hash()) is None
+    index = loader.open_index()
+    try:
+        assert set(index.regions) >= {GLOBAL_REGION, "region_0"}
+        assert path.read_bytes() == data
+    finally:
+        index.close()
+
+
+def test_object_facts_do_not_load_regions(world: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    full = ContentLoader(loader_for(SnapshotLoader, world)).init_content()[0]
+    content = regional(world, capacity=1)
+    assert content.generic.openable == full.generic.openable
+    game = Game.new(content)
+    game.render_turn()
+    cache = content.regions
+    assert cache is not None
+    resident = list(cache.regions)
+
+    def read_region(name: str) -> dict:
+        raise AssertionError(f"region {name} loaded")
+
+    # объекты всех локаций, в том числе невыгруженных регионов
+    monkeypatch.setattr(cache.index, "read_region", read_region)
+    for oid in content.object_locations:
+        game.state.touch(("object", oid))
+    assert list(cache.regions) == resident
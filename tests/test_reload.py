@@ -0,0 +1,125 @@
+import asyncio
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+import yaml
+
+from benchmarks.worldgen import generate_world
+from content_parts import GameContent
+from definitions import ItemId, ObjectId
+from engine import SessionEngine
+from init_content import ContentLoader
+from loaders import SnapshotLoader, loader_for
+from reload import ContentBuilder, ContentReloader
+from storage import WriteBehindStore, make_engine, models
+
+
+def builder(world: Path) -> ContentBuilder:
+    def build() -> GameContent:
+        return ContentLoader(loader_for(SnapshotLoader, world)).init_content()[0]
+    return build
+
+
+def edit(path: Path, change: Callable[[dict], object]) -> None:
+    data = yaml.safe_load(path.read_text(encoding="utf-8"))
+    change(data)
+    path.write_text(yaml.safe_dump(data, allow_unicode=True), encoding="utf-8")
+
+
+def replace_chest(world: Path) -> None:
+    """Следующая выкладка: сундука chest_2 больше нет, в loc_0 появилась бочка."""
+    def locations(data: dict) -> None:
+        del data["loc_2"]["furniture"]["chest_2"]
+        data["loc_0"]["furniture"]["barrel_0"] = {
+            "kind": "container",
+            "name": "Бочка",
+            "description": "Пустая бочка.",
+            "can_open": True,
+            "is_container": True,
+            "locked": False,
+            "open": False,
+            "contents": [],
+        }
+
+    edit(world / "locations.yaml", locations)
+    edit(world / "choices.yaml", lambda data: data["choices"].pop("unlock_chest_2"))
+
+
+@pytest.mark.asyncio
+async def test_swap_reconciles_resident_and_evicted_sessions(tmp_path: Path) -> None:
+    world = generate_world(tmp_path / "world", 6, seed=1)
+    build = builder(world)
+    old = build()
+    db = make_engine("sqlite://")
+    models.metadata.create_all(db)
+    store = WriteBehindStore(db, old)
+    engine = SessionEngine(old, store=store)
+    for key in ("resident", "evicted"):
+        await engine.start(key)
+        state = engine.sessions[key].game.state
+        state.objects[ObjectId("chest_2")].flags["locked"] = False
+        state.objects[ObjectId("chest_0")].items.append(ItemId("junk_0"))
+    engine.evict("evicted", "test")
+    await store.flush_async()
+
+    replace_chest(world)
+    assert await ContentReloader(engine, build, world).reload()
+    assert engine.content is not old and store.content is engine.content
+    await store.flush_async()
+    # резидентная сессия пересобрана сразу, выгруженная - при загрузке
+    for key in ("resident", "evicted"):
+        game = (await engine.session(key)).game
+        assert game.content is engine.content
+        diff = game.state.diff()
+        assert "chest_2" not in diff["bits"] and diff["contents"]["chest_0"] == ["treasure_0", "junk_0"]
+        assert game.state.objects[ObjectId("barrel_0")].flags["open"] is False
+        assert (await engine.handle(key, "")) is not None
+    # резидентная сессия переписана целиком - строк удаленного объекта у нее нет;
+    # у выгруженной они остались и отбрасываются при каждой загрузке
+    with db.connect() as conn:
+        stored = {(row.session_id, row.object_id) for row in conn.execute(models.objects.select())}
+    assert ("resident", "chest_2") not in stored and ("resident", "chest_0") in stored
+
+
+@pytest.mark.asyncio
+async def test_broken_content_keeps_the_old_one(tmp_path: Path) -> None:
+    world = generate_world(tmp_path / "world", 6, seed=1)
+    build = builder(world)
+    content = build()
+    engine = SessionEngine(content)
+    await engine.start("a")
+    game = engine.sessions["a"].game
+    # выбор ссылается на предмет, которого нет
+    edit(world / "choices.yaml", lambda data: data["choices"]["unlock_chest_1"]["conditions"].append(
+        {"type": "has_item", "item": "missing"},
+    ))
+    assert not await ContentReloader(engine, build, world).reload()
+    assert engine.content is content and engine.sessions["a"].game is game
+    assert (await engine.handle("a", "1")) is not None
+
+
+@pytest.mark.asyncio
+async def test_series_of_changes_reloads_once(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    world = generate_world(tmp_path / "world", 6, seed=1)
+    reloader = ContentReloader(SessionEngine(builder(world)()), builder(world), world, poll_interval=0.01, debounce=0.2)
+    reloads = []
+
+    async def reload() -> bool:
+        reloads.append(len(reloads))
+        return True
+
+    monkeypatch.setattr(reloader, "reload", reload)
+    watcher = asyncio.create_task(reloader.watch())
+    try:
+        await asyncio.sleep(0.05)
+        # выкладка по одному файлу: каждый следующий - раньше, чем истечет debounce
+        for n in range(3):
+            path = world / "items.yaml"
+            path.write_text(path.read_text(encoding="utf-8") + f"# {n}\n", encoding="utf-8")
+            await asyncio.sleep(0.04)
+        assert reloads == []
+        await asyncio.sleep(0.6)
+        assert reloads == [0]
+    finally:
+        watcher.cancel()
@@ -0,0 +1,42 @@
+import random
+
+import pytest
+
+from content_parts import GameContent
+from game import Game
+
+
+@pytest.mark.parametrize("world", ["content", "generated"])
+def test_cached_text_matches_a_fresh_render(world: str, request: pytest.FixtureRequest) -> None:
+    content: GameContent = request.getfixturevalue(world)
+    rnd = random.Random(9)
+    game = Game.new(content)
+    game.render_turn()
+    renderer = game.renderer
+    for _ in range(150):
+        lid = game.state.current_location
+        for verbose in (False, True):
+            assert renderer.render_location(verbose) == renderer._render_location(lid, verbose)
+        # в кеше только краткое описание текущей локации
+        assert renderer.cached_location == lid
+        if rnd.random() < 0.1:
+            game.undo()
+        elif game.options:
+            game.tick(rnd.choice(list(game.options)))
+
+
+def test_facts_invalidate_only_the_current_location(generated: GameContent) -> None:
+    game = Game.new(generated)
+    game.render_turn()
+    renderer = game.renderer
+    here = game.state.current_location
+    text = renderer.render_location()
+    elsewhere = next(oid for oid, lid in generated.object_locations.items() if lid != here)
+    game.state.objects[elsewhere].flags["open"] = True
+    game.state.touch(("object", elsewhere))
+    assert renderer.render_location() is text
+    chest = next(oid for oid in generated.locations[here].objects if oid.startswith("chest"))
+    game.state.objects[chest].flags["locked"] = False
+    game.state.touch(("object", chest))
+    assert renderer.cached_location is None
+    assert renderer.render_location() != text
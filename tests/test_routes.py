@@ -0,0 +1,102 @@
+import random
+from collections import deque
+
+import pytest
+
+from content_parts import GameContent
+from definitions import LocationId
+from game import Game
+from routes import RouteTable, SessionRoutes
+
+
+def distances(exits: list[list[tuple[int, str]]], dst: int, is_open: set[tuple[int, int]] | None = None) -> list[int | None]:
+    """Обход в ширину по обратным ребрам: число шагов до dst из каждой локации."""
+    reverse: list[list[int]] = [[] for _ in exits]
+    for u, out in enumerate(exits):
+        for k, (v, _) in enumerate(out):
+            if is_open is None or (u, k) in is_open:
+                reverse[v].append(u)
+    dist: list[int | None] = [None] * len(exits)
+    dist[dst] = 0
+    queue = deque([dst])
+    while queue:
+        v = queue.popleft()
+        for u in reverse[v]:
+            if dist[u] is None:
+                dist[u] = dist[v] + 1  # type: ignore[operator]
+                queue.append(u)
+    return dist
+
+
+def test_table_follows_shortest_paths() -> None:
+    ids = [LocationId(f"l{n}") for n in range(6)]
+    # кольцо 0-1-2-3-4-5 и короткий путь 0 -> 3
+    raw = {
+        lid: [(ids[(n + 1) % 6], f"{lid}_next", []), (ids[(n - 1) % 6], f"{lid}_prev", [])]
+        for n, lid in enumerate(ids)
+    }
+    raw[ids[0]].append((ids[3], "shortcut", []))
+    table = RouteTable.build(ids, raw)
+    assert not table.gate_exits and table.typecode == "B"
+    for dst in range(6):
+        dist = distances(table.exits, dst)
+        column = table.column(dst)
+        for src in range(6):
+            if src == dst:
+                continue
+            v, _ = table.exits[src][column[src]]
+            assert dist[v] == dist[src] - 1  # type: ignore[operator]
+    assert table.exits[0][table.column(3)[0]][1] == "shortcut"
+
+
+def test_many_exits_use_wide_columns() -> None:
+    ids = [LocationId(f"l{n}") for n in range(300)]
+    raw = {ids[0]: [(lid, f"to_{lid}", []) for lid in ids[1:]]}
+    table = RouteTable.build(ids, raw, eager=False)
+    assert table.typecode == "H" and not table.columns
+    assert table.exits[0][table.column(299)[0]][1] == "to_l299"
+    assert table.column(0)[299] == table.none
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_session_routes_skip_closed_exits(generated: GameContent, seed: int) -> None:
+    game = Game.new(generated)
+    game.render_turn()
+    routes = game.routes
+    assert isinstance(routes, SessionRoutes)
+    table = routes.table
+    rnd = random.Random(seed)
+    for _ in range(40):
+        gates = table.gates
+        closed = {
+            ref for ref, choice in zip(table.gate_exits, gates.choices)
+            if not choice.is_available(game.state, generated)
+        }
+        is_open = {(u, k) for u, out in enumerate(table.exits) for k in range(len(out))} - closed
+        for dst in rnd.sample(range(len(table.ids)), 5):
+            dist = distances(table.exits, dst, is_open)
+            for src in range(len(table.ids)):
+                cid = routes.next_exit(table.ids[src], table.ids[dst])
+                if src == dst or dist[src] is None:
+                    assert cid is None
+                    continue
+                k = next(k for k, (_, c) in enumerate(table.exits[src]) if c == cid)
+                assert (src, k) in is_open
+                assert dist[table.exits[src][k][0]] == dist[src] - 1  # type: ignore[operator]
+        game.tick(rnd.choice(list(game.options)))
+
+
+def test_travel_is_undone_as_one_turn(generated: GameContent) -> None:
+    game = Game.new(generated)
+    game.render_turn()
+    rnd = random.Random(4)
+    for _ in range(200):
+        game.tick(rnd.choice(list(game.options)))
+        if game.destinations():
+            break
+    lid, name = game.destinations()[-1]
+    start = game.state.current_location
+    game.travel(name)
+    assert game.state.current_location == lid
+    game.undo()
+    assert game.state.current_location == start
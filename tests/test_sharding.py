@@ -0,0 +1,63 @@
+import pytest
+
+from content_parts import GameContent
+from engine import SessionEngine
+from sharding import HashRing, ShardedEngine
+
+KEYS = range(2000)
+
+
+def owners(ring: HashRing) -> dict[int, str]:
+    return {key: ring.owner(key) for key in KEYS}
+
+
+def test_ring_moves_only_keys_of_the_changed_node() -> None:
+    ring = HashRing(["a", "b", "c"])
+    before = owners(ring)
+    assert set(before.values()) == {"a", "b", "c"}
+    ring.add("d")
+    after = owners(ring)
+    moved = [key for key in KEYS if before[key] != after[key]]
+    # ключи уходят только к новому узлу, примерно четверть
+    assert all(after[key] == "d" for key in moved)
+    assert 0.15 < len(moved) / len(KEYS) < 0.35
+    ring.remove("d")
+    assert owners(ring) == before
+
+
+def test_ring_is_deterministic_and_hashes_str_of_key() -> None:
+    first, second = HashRing(["x", "y"]), HashRing(["y", "x"])
+    assert owners(first) == owners(second)
+    assert first.owner(42) == first.owner("42")
+    with pytest.raises(ValueError):
+        first.add("x")
+    with pytest.raises(LookupError):
+        HashRing().owner(1)
+
+
+def memory_engine(content: GameContent, worker: str) -> SessionEngine:
+    return SessionEngine(content)
+
+
+@pytest.mark.asyncio
+async def test_sessions_survive_rebalancing(generated: GameContent) -> None:
+    engine = ShardedEngine(generated, memory_engine, workers=2)
+    await engine.launch()
+    try:
+        keys = range(12)
+        for key in keys:
+            await engine.start(key)
+            assert await engine.handle(key, "1") is not None
+        name = await engine.add_worker()
+        assert len(engine) == 3 and name in engine.ring
+        # резидентные сессии переданы новому владельцу с тем же номером хода
+        for key in keys:
+            reply = await engine.handle(key, "1", turn=2)
+            assert reply is not None and reply.turn == 3
+        await engine.remove_worker("worker-0")
+        assert "worker-0" not in engine.ring
+        for key in keys:
+            reply = await engine.handle(key, "1", turn=3)
+            assert reply is not None and reply.turn == 4
+    finally:
+        await engine.shutdown()
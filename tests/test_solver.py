@@ -0,0 +1,102 @@
+from pathlib import Path
+
+import pytest
+import yaml
+
+from analysis.solver import Solver, load_content
+
+
+def fuse_world(path: Path, delay: dict) -> Path:
+    """Сейф открывается взрывом через delay после того, как подожгли фитиль."""
+    path.mkdir()
+    files = {
+        "items.yaml": {
+            "fuse": {"name": "Фитиль", "description": "Короткий фитиль.", "consumable": True},
+            "gold": {"name": "Золото", "description": "Слиток.", "consumable": False},
+        },
+        "inventory.yaml": {"start_location": "vault", "items": [{"item": "fuse", "qty": 1}]},
+        "locations.yaml": {
+            "vault": {
+                "name": "Хранилище",
+                "description": "Хранилище с сейфом.",
+                "furniture": {
+                    "safe": {
+                        "kind": "container",
+                        "name": "Сейф",
+                        "description": "Стальной сейф.",
+                        "can_open": True,
+                        "can_lock": True,
+                        "is_container": True,
+                        "locked": True,
+                        "open": False,
+                        "contents": ["gold"],
+                    },
+                },
+                "exits": [{"to": "yard", "text": "Выйти во двор", "result_text": "Ты вышел во двор."}],
+            },
+            "yard": {
+                "name": "Двор",
+                "description": "Пустой двор.",
+                "exits": [{"to": "vault", "text": "Вернуться", "result_text": "Ты вернулся."}],
+            },
+        },
+        "choices.yaml": {
+            "choices": {
+                "light_fuse": {
+                    "text": "Поджечь фитиль",
+                    "conditions": [{"type": "has_item", "item": "fuse"}],
+                    "effects": [
+                        {"type": "consume_item", "item": "fuse"},
+                        {
+                            "type": "schedule_effect",
+                            "timer": "blast",
+                            **delay,
+                            "text": "Сейф взорвался.",
+                            "effects": [
+                                {"type": "unlock_container", "container": "safe"},
+                                {"type": "reveal_contents", "container": "safe"},
+                            ],
+                        },
+                    ],
+                },
+            },
+        },
+    }
+    for name, data in files.items():
+        (path / name).write_text(yaml.safe_dump(data, allow_unicode=True), encoding="utf-8")
+    return path
+
+
+def test_goal_behind_a_turn_timer(tmp_path: Path) -> None:
+    report = Solver(load_content(fuse_world(tmp_path / "world", {"after_ticks": 2})), goal="gold").solve()
+    assert report.goal_reachable and report.goal_path is not None
+    # взрыв - на втором ходу после поджога: нужен еще один выбор
+    assert report.goal_path[0] == "light_fuse" and len(report.goal_path) == 2
+    assert not report.dead_ends and not report.errors and not report.doomed
+
+
+def test_goal_behind_a_seconds_timer(tmp_path: Path) -> None:
+    report = Solver(load_content(fuse_world(tmp_path / "world", {"after_seconds": 30})), goal="gold").solve()
+    assert report.goal_path == ["light_fuse", "timer:blast"]
+    assert not report.doomed
+
+
+@pytest.mark.parametrize("delay", [{"after_ticks": 3}, {"after_seconds": 30}])
+def test_running_timer_is_part_of_the_state(tmp_path: Path, delay: dict) -> None:
+    report = Solver(load_content(fuse_world(tmp_path / "world", delay))).solve()
+    # с фитилем и после взрыва (сейф открыт или снова закрыт) - в обеих локациях; горящий
+    # фитиль в ходах - отдельное состояние на каждый оставшийся ход (2 и 1), в секундах - одно
+    expected = {"after_ticks": 2 + 2 * 2 + 2 * 2, "after_seconds": 2 + 2 + 2 * 2}
+    assert report.states == expected[next(iter(delay))]
+
+
+def test_failing_choice_is_reported_once(tmp_path: Path) -> None:
+    world = fuse_world(tmp_path / "world", {"after_ticks": 2})
+    choices = yaml.safe_load((world / "choices.yaml").read_text(encoding="utf-8"))
+    # доступен всегда, но после поджога фитиля уже нет
+    choices["choices"]["eat_fuse"] = {"text": "Съесть фитиль", "effects": [{"type": "consume_item", "item": "fuse"}]}
+    (world / "choices.yaml").write_text(yaml.safe_dump(choices, allow_unicode=True), encoding="utf-8")
+    report = Solver(load_content(world)).solve()
+    assert {error["choice"] for error in report.errors} == {"eat_fuse"}
+    assert report.unreachable_choices == []
+    assert 0 < report.collision_bound < 1e-15
@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+from timers import TimerWheel
+from timers.wheel import HORIZON, SLOTS
+
+
+def test_timers_fire_in_due_order() -> None:
+    wheel: TimerWheel[str] = TimerWheel()
+    wheel.insert("late", SLOTS * SLOTS + 5)
+    wheel.insert("soon", 3)
+    wheel.insert("now", 0)
+    wheel.insert("next_level", SLOTS + 1)
+    assert len(wheel) == 4
+    assert wheel.advance(2) == [("now", 0)]
+    assert wheel.advance(SLOTS + 1) == [("soon", 3), ("next_level", SLOTS + 1)]
+    assert wheel.advance(SLOTS * SLOTS + 4) == []
+    assert wheel.advance(SLOTS * SLOTS + 5) == [("late", SLOTS * SLOTS + 5)]
+    assert not wheel
+
+
+def test_insert_moves_and_cancel_removes() -> None:
+    wheel: TimerWheel[str] = TimerWheel(now=100)
+    wheel.insert("a", 110)
+    wheel.insert("a", 300)
+    wheel.insert("b", 120)
+    assert wheel.cancel("b") and not wheel.cancel("b") and "b" not in wheel
+    assert wheel.advance(200) == []
+    assert wheel.advance(300) == [("a", 300)]
+
+
+def test_timers_beyond_the_horizon_wait_in_overflow() -> None:
+    wheel: TimerWheel[int] = TimerWheel()
+    wheel.insert(1, HORIZON + 10)
+    wheel.insert(2, 3 * HORIZON)
+    assert set(wheel.overflow) == {1, 2}
+    assert wheel.advance(HORIZON) == []
+    assert wheel.advance(HORIZON + 10) == [(1, HORIZON + 10)]
+    # большой скачок времени отдает все, что истекло по дороге
+    assert wheel.advance(5 * HORIZON) == [(2, 3 * HORIZON)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_wheel_matches_a_sorted_list(seed: int) -> None:
+    rnd = random.Random(seed)
+    wheel: TimerWheel[int] = TimerWheel()
+    model: dict[int, int] = {}
+    now = 0
+    for _ in range(3000):
+        action = rnd.random()
+        key = rnd.randrange(200)
+        if action < 0.5:
+            # задержки всех уровней, изредка за горизонтом и в прошлом
+            delay = rnd.choice([rnd.randrange(-2, SLOTS), rnd.randrange(SLOTS ** 3), rnd.randrange(2 * HORIZON)])
+            wheel.insert(key, now + delay)
+            model[key] = now + delay
+        elif action < 0.6:
+            assert wheel.cancel(key) == (model.pop(key, None) is not None)
+        else:
+            now += rnd.choice([1, 1, 7, SLOTS, rnd.randrange(SLOTS ** 3)])
+            fired = wheel.advance(now)
+            expected = {k: due for k, due in model.items() if due <= now}
+            assert dict(fired) == expected and len(fired) == len(expected)
+            assert [due for _, due in fired] == sorted(expected.values())
+            for k in expected:
+                del model[k]
+        assert len(wheel) == len(model)
+
+
+def test_due_reports_every_level() -> None:
+    wheel: TimerWheel[str] = TimerWheel(now=10)
+    wheel.insert("past", 5)
+    wheel.insert("near", 12)
+    wheel.insert("far", 10 + HORIZON)
+    assert {key: wheel.due(key) for key in wheel} == {"past": 5, "near": 12, "far": 10 + HORIZON}
+    assert wheel.due("missing") is None
@@ -0,0 +1,143 @@
+import random
+import threading
+from contextlib import nullcontext
+from pathlib import Path
+
+import pytest
+from sqlalchemy import Engine, func, select
+
+from content_parts import GameContent
+from definitions import Fact, GameState
+from game import Game
+from storage import WriteBehindStore, make_engine, models
+from storage.write_behind import Batch
+
+
+def comparable(state: GameState) -> dict:
+    diff = state.diff()
+    diff["visited"] = sorted(diff["visited"])
+    return diff
+
+
+@pytest.fixture
+def engine() -> Engine:
+    engine = make_engine("sqlite://")
+    models.metadata.create_all(engine)
+    return engine
+
+
+def play(game: Game, rnd: random.Random, turns: int) -> None:
+    for _ in range(turns):
+        if rnd.random() < 0.1:
+            game.undo()
+        elif game.options:
+            game.tick(rnd.choice(list(game.options)))
+
+
+def test_flushed_sessions_load_back(generated: GameContent, engine: Engine) -> None:
+    store = WriteBehindStore(engine, generated)
+    rnd = random.Random(4)
+    games = {str(n): Game.new(generated) for n in range(6)}
+    for session_id, game in games.items():
+        store.track(session_id, game.state)
+        game.render_turn()
+    for _ in range(5):
+        for game in games.values():
+            play(game, rnd, 15)
+        store.flush()
+        for session_id, game in games.items():
+            loaded = store.load(session_id)
+            assert loaded is not None and comparable(loaded) == comparable(game.state)
+    assert store.flush() == 0
+
+
+def test_full_rewrite_visits_only_changes(
+    generated: GameContent, engine: Engine, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    store = WriteBehindStore(engine, generated)
+    game = Game.new(generated)
+    store.track("s", game.state)
+    game.render_turn()
+    play(game, random.Random(8), 30)
+    visited: list[str] = []
+    collect_fact = store._collect_fact
+
+    def spy(batch: Batch, session_id: str, state: GameState, fact: Fact, deleted: bool = False) -> None:
+        visited.append(fact[0])
+        collect_fact(batch, session_id, state, fact, deleted)
+
+    monkeypatch.setattr(store, "_collect_fact", spy)
+    # отмена - ANY_FACT, сессия переписывается целиком
+    game.undo()
+    batch = store.collect()
+    assert batch.full == ["s"]
+    objects = game.state.objects
+    assert visited.count("object") == len({*objects.changed_bits, *objects.contents.changed})
+    assert visited.count("location_items") == len(game.state.locations_items.contents.changed)
+    assert visited.count("object") < len(generated.defaults.object_ids)
+    store.write(batch)
+    loaded = store.load("s")
+    assert loaded is not None and comparable(loaded) == comparable(game.state)
+
+
+def test_failed_write_is_requeued(generated: GameContent, engine: Engine, monkeypatch: pytest.MonkeyPatch) -> None:
+    store = WriteBehindStore(engine, generated)
+    game = Game.new(generated)
+    store.track("s", game.state)
+    game.render_turn()
+    play(game, random.Random(2), 10)
+
+    def broken(batch: object) -> None:
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(store, "write", broken)
+    with pytest.raises(RuntimeError):
+        store.flush()
+    assert store.pending
+    monkeypatch.undo()
+    assert store.flush() == 1
+    with engine.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(models.sessions)) == 1
+    loaded = store.load("s")
+    assert loaded is not None and comparable(loaded) == comparable(game.state)
+
+
+def test_untracked_session_is_written_before_release(generated: GameContent, engine: Engine) -> None:
+    store = WriteBehindStore(engine, generated)
+    game = Game.new(generated)
+    store.track("s", game.state)
+    game.render_turn()
+    play(game, random.Random(3), 5)
+    store.untrack("s")
+    # отпущенная, но не записанная сессия берется из памяти
+    assert store.resume("s") is game.state
+    store.untrack("s")
+    store.flush()
+    assert "s" not in store.states and store.resume("s") is None
+    loaded = store.load("s")
+    assert loaded is not None and comparable(loaded) == comparable(game.state)
+
+
+def test_only_a_shared_connection_is_serialized(generated: GameContent, engine: Engine, tmp_path: Path) -> None:
+    assert isinstance(WriteBehindStore(engine, generated).db_lock, type(threading.Lock()))
+    # файловая база с пулом соединений - обращения идут параллельно
+    pooled = make_engine(f"sqlite:///{tmp_path / 'sessions.db'}")
+    models.metadata.create_all(pooled)
+    store = WriteBehindStore(pooled, generated)
+    assert isinstance(store.db_lock, nullcontext)
+    game = Game.new(generated)
+    store.track("s", game.state)
+    game.render_turn()
+    play(game, random.Random(5), 10)
+    store.flush()
+    loaded = store.load("s")
+    assert loaded is not None and comparable(loaded) == comparable(game.state)
+
+
+def test_reordered_default_items_are_not_written(generated: GameContent, engine: Engine) -> None:
+    store = WriteBehindStore(engine, generated)
+    state = GameState.from_content(generated)
+    lid = next(lid for lid, items in generated.defaults.location_items.items() if len(set(items)) > 1)
+    # значение из снимка: те же предметы, что по умолчанию, в другом порядке
+    state.locations_items.contents.changed[lid] = tuple(reversed(generated.defaults.location_items[lid]))
+    assert store._row(state, "location_items", lid) is None